@@ -60,10 +60,17 @@ class BaseCloud(metaclass=ABCMeta):
                 return
 
             if hasattr(concept,"local_path"):
-                self.file_sync.sync_up_dir(
-                    local=Path(concept.local_path),
-                    remote=Path(concept.path),
-                    recursive=concept.include_subdirectories)
+                if self.config.cloud.packed_upload:
+                    self.file_sync.sync_up_dir_packed(
+                        local=Path(concept.local_path),
+                        remote=Path(concept.path),
+                        recursive=concept.include_subdirectories,
+                        chunk_size=self.config.cloud.packed_upload_chunk_size * 1024 * 1024)
+                else:
+                    self.file_sync.sync_up_dir(
+                        local=Path(concept.local_path),
+                        remote=Path(concept.path),
+                        recursive=concept.include_subdirectories)
 
             if hasattr(concept.text,"local_prompt_path"):
                 self.file_sync.sync_up_file(local=Path(concept.text.local_prompt_path),remote=Path(concept.text.prompt_path))
@@ -28,6 +28,10 @@ class BaseFileSync(metaclass=ABCMeta):
     def sync_up_dir(self,local : Path,remote: Path,recursive: bool):
         pass
 
+    @abstractmethod
+    def sync_up_dir_packed(self,local : Path,remote : Path,recursive : bool,chunk_size : int):
+        pass
+
     @abstractmethod
     def sync_down_file(self,local : Path,remote : Path):
         pass
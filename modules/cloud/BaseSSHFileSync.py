@@ -1,17 +1,39 @@
+import json
+import os
 import shlex
+import tempfile
 from abc import abstractmethod
 from pathlib import Path
 
 from modules.cloud.BaseFileSync import BaseFileSync
+from modules.cloud.PackedUploadPlan import PackedUploadPlan
+from modules.cloud.RemoteManifest import RemoteManifest
 from modules.util.config.CloudConfig import CloudConfig, CloudSecretsConfig
 
 import fabric
 
 
 class BaseSSHFileSync(BaseFileSync):
+    #maximum number of paths passed to a single remote mkdir call:
+    MKDIR_BATCH_SIZE=200
+
     def __init__(self, config: CloudConfig, secrets: CloudSecretsConfig):
         super().__init__(config, secrets)
         self.sync_connection=fabric.Connection(host=secrets.host,port=secrets.port,user=secrets.user)
+        self._manifests={}
+
+    def _run_remote_command(self,cmd : str,warn : bool=False) -> str:
+        self.sync_connection.open()
+        return self.sync_connection.run(cmd,warn=warn,hide=True,in_stream=False).stdout
+
+    def invalidate_manifests(self,remote : Path | None=None):
+        #manifests of uploaded paths are cached, because only this sync changes them.
+        #call this if remote files were changed by something else:
+        if remote is None:
+            self._manifests={}
+        else:
+            self._manifests={root:manifest for root,manifest in self._manifests.items()
+                             if not manifest.covers(remote) and remote not in root.parents}
 
     def close(self):
         if self.sync_connection:
@@ -34,40 +56,98 @@ class BaseSSHFileSync(BaseFileSync):
         pass
 
     def sync_up_file(self,local : Path,remote : Path):
-        sync_info=self.__get_sync_info(remote)
-        if not self.__needs_upload(local=local,remote=remote,sync_info=sync_info):
+        manifest=self.__get_manifest(remote,cached=True)
+        if not self.__needs_upload(local=local,remote=remote,sync_info=manifest.files):
             return
 
-        self.sync_connection.open()
-        self.sync_connection.run(f'mkdir -p {shlex.quote(remote.parent.as_posix())}',in_stream=False)
+        if remote not in manifest.files and remote.parent not in manifest.directories:
+            self.__make_dirs([remote.parent])
         self.upload_file(local_file=local,remote_file=remote)
+        manifest.add_uploaded_file(local=local,remote=remote)
+
+    def sync_up_dir(self,local : Path,remote: Path,recursive: bool):
+        manifest=self.__get_manifest(remote,cached=True)
+
+        #plan all transfers first, so all directories can be created in one call:
+        dirs=[]
+        plan={}
+        for local_dir,remote_dir in self.__walk(local=local,remote=remote,recursive=recursive):
+            if remote_dir not in manifest.directories:
+                dirs.append(remote_dir)
+            files=[local_entry for local_entry in sorted(local_dir.iterdir())
+                   if local_entry.is_file()
+                   and self.__needs_upload(local=local_entry,remote=remote_dir/local_entry.name,sync_info=manifest.files)]
+            if len(files) > 0:
+                plan[remote_dir]=files
+
+        self.__make_dirs(dirs)
+        manifest.add_directories(dirs)
+
+        for remote_dir,files in plan.items():
+            self.upload_files(local_files=files,remote_dir=remote_dir)
+            for local_file in files:
+                manifest.add_uploaded_file(local=local_file,remote=remote_dir/local_file.name)
+
+    def sync_up_dir_packed(self,local : Path,remote : Path,recursive : bool,chunk_size : int):
+        #chunks and the content manifest of the last upload are stored next to the remote directory:
+        staging=remote.with_name(remote.name + '.upload')
+        marker='--chunks--'
+        output=self._run_remote_command(
+            f'mkdir -p {shlex.quote(staging.as_posix())} {shlex.quote(remote.as_posix())}'
+            f' && (cat {shlex.quote((staging / "manifest.json").as_posix())} 2>/dev/null; echo; echo {marker};'
+            f" find {shlex.quote(staging.as_posix())} -maxdepth 1 -name 'chunk_*.tar.gz' -printf '%f\\t%s\\n')")
+        manifest_output,chunk_output=output.split(marker + '\n',1)
+        remote_manifest=json.loads(manifest_output) if manifest_output.strip() else {}
+        remote_chunks={}
+        for line in chunk_output.splitlines():
+            sp=line.split('\t')
+            if len(sp) == 2:
+                remote_chunks[sp[0]]=int(sp[1])
 
+        plan=PackedUploadPlan(local=local,recursive=recursive,chunk_size=chunk_size)
+        changed_files=plan.changed_files(remote_manifest)
+        if len(changed_files) == 0:
+            return
 
-    def sync_up_dir(self,local : Path,remote: Path,recursive: bool,sync_info=None):
-        if sync_info is None:
-            sync_info=self.__get_sync_info(remote)
-        self.sync_connection.open()
-        self.sync_connection.run(f'mkdir -p {shlex.quote(remote.as_posix())}',in_stream=False)
-        files=[]
-        for local_entry in local.iterdir():
-            if local_entry.is_file():
-                remote_entry=remote/local_entry.name
-                if self.__needs_upload(local=local_entry,remote=remote_entry,sync_info=sync_info):
-                    files.append(local_entry)
-            elif recursive and local_entry.is_dir():
-                self.sync_up_dir(local=local_entry,remote=remote/local_entry.name,recursive=True,sync_info=sync_info)
-
-        self.upload_files(local_files=files,remote_dir=remote)
+        chunks=[]
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for files in plan.chunks(changed_files):
+                name=plan.chunk_name(files)
+                chunk_path=Path(temp_dir) / name
+                plan.write_chunk(files,chunk_path)
+                chunks.append((name,PackedUploadPlan.hash_file(chunk_path)))
+
+                #chunks are written deterministically, a chunk with the same name and size was completely uploaded before:
+                if remote_chunks.get(name) != chunk_path.stat().st_size:
+                    self.upload_file(local_file=chunk_path,remote_file=staging / name)
+                chunk_path.unlink()
+
+            manifest_path=Path(temp_dir) / 'manifest.json.new'
+            with manifest_path.open('w') as f:
+                json.dump(plan.manifest,f)
+            self.upload_file(local_file=manifest_path,remote_file=staging / manifest_path.name)
+
+        #verify and unpack everything in one step. Corrupt chunks are deleted, so they are sent again on the next try:
+        lines=[f'cd {shlex.quote(staging.as_posix())} || exit 1']
+        for name,sha256 in chunks:
+            lines.append(f'echo {shlex.quote(f"{sha256}  {name}")} | sha256sum -c --status'
+                         f' || {{ rm -f {name}; echo "corrupt chunk {name}" >&2; exit 1; }}')
+        for name,_ in chunks:
+            lines.append(f'tar -xzf {name} -C {shlex.quote(remote.as_posix())} || exit 1')
+        lines.append("mv manifest.json.new manifest.json && rm -f chunk_*.tar.gz")
+        self._run_remote_command('\n'.join(lines))
+        self.invalidate_manifests(remote)
 
     def sync_down_file(self,local : Path,remote : Path):
-        sync_info=self.__get_sync_info(remote)
+        sync_info=self.__get_manifest(remote,cached=False).files
         if not self.__needs_download(local=local,remote=remote,sync_info=sync_info):
             return
         local.parent.mkdir(parents=True,exist_ok=True)
         self.download_file(local_file=local,remote_file=remote)
 
     def sync_down_dir(self,local : Path,remote : Path,filter=None):
-        sync_info=self.__get_sync_info(remote)
+        #remote files are changed by training, so the manifest is always fetched again:
+        sync_info=self.__get_manifest(remote,cached=False).files_below(remote)
         dirs={}
         for remote_entry in sync_info:
             local_entry=local / remote_entry.relative_to(remote)
@@ -84,18 +164,30 @@ class BaseSSHFileSync(BaseFileSync):
             self.download_files(local_dir=dir,remote_files=files)
 
 
-    def __get_sync_info(self,remote : Path):
-        cmd = f'find {shlex.quote(remote.as_posix())} -type f -exec stat --printf "%n\\t%s\\t%Y\\n"' + ' {} \\;'
-        self.sync_connection.open()
-        result=self.sync_connection.run(cmd,warn=True,hide=True,in_stream=False)
-        info={}
-        for line in result.stdout.splitlines():
-            sp=line.split('\t')
-            info[Path(sp[0])]={
-                    'size': int(sp[1]),
-                    'mtime': int(sp[2])
-                }
-        return info
+    def __get_manifest(self,remote : Path,cached : bool) -> RemoteManifest:
+        if cached:
+            for manifest in self._manifests.values():
+                if manifest.covers(remote):
+                    return manifest
+
+        manifest=RemoteManifest.from_find_output(remote,self._run_remote_command(RemoteManifest.find_command(remote),warn=True))
+        self.invalidate_manifests(remote)
+        self._manifests[remote]=manifest
+        return manifest
+
+    def __make_dirs(self,dirs):
+        for i in range(0,len(dirs),self.MKDIR_BATCH_SIZE):
+            batch=dirs[i:i+self.MKDIR_BATCH_SIZE]
+            self._run_remote_command('mkdir -p ' + ' '.join(shlex.quote(dir.as_posix()) for dir in batch))
+
+    @staticmethod
+    def __walk(local : Path,remote : Path,recursive : bool):
+        if not recursive:
+            yield local,remote
+            return
+        for local_dir,_,_ in os.walk(local,followlinks=True):
+            local_dir=Path(local_dir)
+            yield local_dir,remote / local_dir.relative_to(local)
 
     @staticmethod
     def __needs_upload(local : Path,remote : Path,sync_info):
@@ -12,6 +12,7 @@ from modules.util.commands.TrainCommands import TrainCommands
 from modules.util.config.TrainConfig import TrainConfig
 from modules.util.enum.CloudAction import CloudAction
 from modules.util.enum.CloudFileSync import CloudFileSync
+from modules.util.MessageChannel import MessageChannel
 from modules.util.time_util import get_string_timestamp
 
 import fabric
@@ -23,11 +24,15 @@ class LinuxCloud(BaseCloud):
         self.connection=None
         self.callback_connection=None
         self.command_connection=None
+        self.message_channel=None
+        self.pending_commands=TrainCommands()
+        self.pending_commands_lock=threading.Lock()
         self.tensorboard_tunnel_stop=None
 
         name=config.cloud.run_id if config.cloud.detach_trainer else get_string_timestamp()
         self.callback_file=f'{config.cloud.remote_dir}/{name}.callback'
         self.command_pipe=f'{config.cloud.remote_dir}/{name}.command'
+        self.channel_port_file=f'{config.cloud.remote_dir}/{name}.port'
         self.config_file=f'{config.cloud.remote_dir}/{name}.json'
         self.exit_status_file=f'{config.cloud.remote_dir}/{name}.exit'
         self.log_file=f'{config.cloud.remote_dir}/{name}.log'
@@ -50,10 +55,15 @@ class LinuxCloud(BaseCloud):
 
             self.callback_connection=fabric.Connection(host=secrets.host,port=secrets.port,user=secrets.user)
 
-            self.command_connection=fabric.Connection(host=secrets.host,port=secrets.port,user=secrets.user)
-            #the command connection isn't used for long periods of time; prevent remote from closing it:
-            self.command_connection.open()
-            self.command_connection.transport.set_keepalive(30)
+            if config.message_channel:
+                #callbacks and commands share the message channel on the callback connection:
+                self.callback_connection.open()
+                self.callback_connection.transport.set_keepalive(30)
+            else:
+                self.command_connection=fabric.Connection(host=secrets.host,port=secrets.port,user=secrets.user)
+                #the command connection isn't used for long periods of time; prevent remote from closing it:
+                self.command_connection.open()
+                self.command_connection.transport.set_keepalive(30)
 
             match config.file_sync:
                 case CloudFileSync.NATIVE_SCP:
@@ -65,6 +75,8 @@ class LinuxCloud(BaseCloud):
             if self.connection:
                 self.connection.close()
                 self.connection=None
+            if self.callback_connection:
+                self.callback_connection.close()
             if self.command_connection:
                 self.command_connection.close()
             raise
@@ -73,6 +85,9 @@ class LinuxCloud(BaseCloud):
     def setup(self):
         super().setup()
         self.connection.run(f'mkfifo {shlex.quote(self.command_pipe)}',warn=True,hide=True,in_stream=False)
+        if not self.can_reattach():
+            #a port file left over from an earlier run with the same id would point to a closed port:
+            self.connection.run(f'rm -f {shlex.quote(self.channel_port_file)}',in_stream=False)
 
     def _install_onetrainer(self, update: bool=False):
         config=self.config.cloud
@@ -114,6 +129,9 @@ class LinuxCloud(BaseCloud):
     def close(self):
         if self.tensorboard_tunnel_stop is not None:
             self.tensorboard_tunnel_stop.set()
+        if self.message_channel:
+            self.message_channel.close()
+            self.message_channel=None
         if self.callback_connection:
             self.callback_connection.close()
         if self.command_connection:
@@ -151,6 +169,8 @@ class LinuxCloud(BaseCloud):
         cmd+=f' && {config.onetrainer_dir}/run-cmd.sh train_remote --config-path={shlex.quote(self.config_file)} \
                                                                    --callback-path={shlex.quote(self.callback_file)} \
                                                                    --command-path={shlex.quote(self.command_pipe)}'
+        if config.message_channel:
+            cmd+=f' --channel-port-path={shlex.quote(self.channel_port_file)}'
 
         if config.detach_trainer:
             self.connection.run(f'rm -f {self.exit_status_file}',in_stream=False)
@@ -179,6 +199,47 @@ class LinuxCloud(BaseCloud):
 
 
     def exec_callback(self,callbacks : TrainCallbacks):
+        if self.config.cloud.message_channel:
+            self.__receive_callbacks(callbacks)
+        else:
+            self.__read_callback_file(callbacks)
+            time.sleep(1)
+
+    def __open_message_channel(self):
+        #the trainer writes the port of the message channel after it has started:
+        self.callback_connection.open()
+        result=self.callback_connection.run(f'cat {shlex.quote(self.channel_port_file)}',warn=True,hide=True,in_stream=False)
+        if result.exited != 0:
+            return False
+
+        port,token=result.stdout.split()
+        channel=self.callback_connection.client.get_transport().open_channel(
+            'direct-tcpip',('localhost',int(port)),('localhost',0))
+        self.message_channel=MessageChannel(channel)
+        self.message_channel.send_token(bytes.fromhex(token))
+        self.__send_pending_commands()
+        return True
+
+    def __receive_callbacks(self,callbacks : TrainCallbacks):
+        if self.message_channel is None and not self.__open_message_channel():
+            time.sleep(1)
+            return
+
+        channel=self.message_channel
+        try:
+            #wait up to a second for the first callback, then process all that have arrived:
+            message=channel.receive(timeout=1.0)
+            while message is not None:
+                name,params=message
+                fun=getattr(callbacks,name)
+                fun(*params)
+                message=channel.receive(timeout=0)
+        except (EOFError,OSError):
+            #the trainer has exited or the connection was lost. Reopen it on the next call:
+            self.message_channel=None
+            channel.close()
+
+    def __read_callback_file(self,callbacks : TrainCallbacks):
         #callbacks are a file instead of a named pipe, because of the blocking behaviour of linux pipes:
         #writing to pipes on the cloud can slow down training, and would cause issues in case
         #of a detached cloud trainer.
@@ -215,6 +276,12 @@ class LinuxCloud(BaseCloud):
 
 
     def send_commands(self,commands : TrainCommands):
+        if self.config.cloud.message_channel:
+            with self.pending_commands_lock:
+                self.pending_commands.merge(commands)
+            self.__send_pending_commands()
+            return
+
         try:
             self.command_connection.open()
             in_file,out_file,err_file=self.command_connection.client.exec_command(
@@ -239,6 +306,22 @@ class LinuxCloud(BaseCloud):
             else:
                 raise
 
+    def __send_pending_commands(self):
+        #commands are sent once the message channel is open; until then they are merged into the pending commands:
+        channel=self.message_channel
+        if channel is None:
+            return
+        with self.pending_commands_lock:
+            commands=self.pending_commands
+            self.pending_commands=TrainCommands()
+        try:
+            channel.send(commands)
+        except OSError:
+            #keep the commands for the next channel. The callback thread notices the lost connection and reopens it:
+            with self.pending_commands_lock:
+                commands.merge(self.pending_commands)
+                self.pending_commands=commands
+
     def _upload_config_file(self,local : Path):
         self.file_sync.sync_up_file(local,Path(self.config_file))
 
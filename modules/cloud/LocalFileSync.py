@@ -0,0 +1,41 @@
+import shutil
+import subprocess
+from pathlib import Path
+
+from modules.cloud.BaseSSHFileSync import BaseSSHFileSync
+from modules.util.config.CloudConfig import CloudConfig, CloudSecretsConfig
+
+
+class LocalFileSync(BaseSSHFileSync):
+    """
+    Runs the remote commands of the SSH file sync in a local shell and copies files on the local file system.
+    This is a stand-in for a remote machine, to test and benchmark the sync logic without a connection.
+    """
+
+    def __init__(self, config: CloudConfig, secrets: CloudSecretsConfig):
+        super().__init__(config, secrets)
+        self.remote_command_count=0
+        self.transferred_file_count=0
+
+    def _run_remote_command(self,cmd : str,warn : bool=False) -> str:
+        self.remote_command_count+=1
+        result=subprocess.run(["sh","-c",cmd],capture_output=True,text=True)
+        if not warn:
+            result.check_returncode()
+        return result.stdout
+
+    def upload_files(self,local_files,remote_dir : Path):
+        for local_file in local_files:
+            self.upload_file(local_file=local_file,remote_file=remote_dir / local_file.name)
+
+    def download_files(self,local_dir : Path,remote_files):
+        for remote_file in remote_files:
+            self.download_file(local_file=local_dir / remote_file.name,remote_file=remote_file)
+
+    def upload_file(self,local_file: Path,remote_file: Path):
+        self.transferred_file_count+=1
+        shutil.copyfile(local_file,remote_file)
+
+    def download_file(self,local_file: Path,remote_file: Path):
+        self.transferred_file_count+=1
+        shutil.copyfile(remote_file,local_file)
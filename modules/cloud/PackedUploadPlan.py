@@ -0,0 +1,84 @@
+import gzip
+import hashlib
+import os
+import tarfile
+from pathlib import Path
+
+
+class PackedUploadPlan:
+    """
+    Plans the upload of a directory as compressed tar chunks. Every file is identified by the sha256 hash of its
+    contents, so only files that changed since the last upload are packed. Chunks are named after the files they
+    contain and are written deterministically, so a chunk that was already uploaded completely can be recognized by
+    its name and size when an interrupted upload is resumed.
+    """
+
+    def __init__(self, local: Path, recursive: bool, chunk_size: int):
+        self.local = local
+        self.chunk_size = chunk_size  # bytes
+        self.manifest = {}  # relative posix path -> {'sha256': str, 'size': int}
+
+        for file in self.__list_files(local, recursive):
+            self.manifest[file.relative_to(local).as_posix()] = {
+                'sha256': self.hash_file(file),
+                'size': file.stat().st_size,
+            }
+
+    @staticmethod
+    def __list_files(local: Path, recursive: bool) -> list[Path]:
+        if not recursive:
+            return sorted(entry for entry in local.iterdir() if entry.is_file())
+
+        files = []
+        for directory, _, file_names in os.walk(local, followlinks=True):
+            files += [Path(directory) / file_name for file_name in file_names]
+        return sorted(files)
+
+    @staticmethod
+    def hash_file(path: Path) -> str:
+        sha256 = hashlib.sha256()
+        with path.open('rb') as f:
+            while block := f.read(1024 * 1024):
+                sha256.update(block)
+        return sha256.hexdigest()
+
+    def changed_files(self, remote_manifest: dict) -> list[str]:
+        return [
+            name for name, info in self.manifest.items()
+            if name not in remote_manifest or remote_manifest[name].get('sha256') != info['sha256']
+        ]
+
+    def chunks(self, files: list[str]) -> list[list[str]]:
+        chunks = []
+        chunk = []
+        chunk_size = 0
+        for name in files:
+            size = self.manifest[name]['size']
+            if len(chunk) > 0 and chunk_size + size > self.chunk_size:
+                chunks.append(chunk)
+                chunk = []
+                chunk_size = 0
+            chunk.append(name)
+            chunk_size += size
+
+        if len(chunk) > 0:
+            chunks.append(chunk)
+        return chunks
+
+    def chunk_name(self, files: list[str]) -> str:
+        sha256 = hashlib.sha256()
+        for name in files:
+            sha256.update(f"{name}\t{self.manifest[name]['sha256']}\n".encode())
+        return f"chunk_{sha256.hexdigest()[:32]}.tar.gz"
+
+    def write_chunk(self, files: list[str], path: Path):
+        # image files barely compress, a fast level saves time without making the chunks much larger
+        with path.open('wb') as f, \
+                gzip.GzipFile(filename='', mode='wb', fileobj=f, mtime=0, compresslevel=1) as gz, \
+                tarfile.open(fileobj=gz, mode='w', format=tarfile.PAX_FORMAT) as tar:
+            for name in files:
+                with (self.local / name).open('rb') as data:
+                    tar_info = tar.gettarinfo(arcname=name, fileobj=data)
+                    tar_info.uid = tar_info.gid = 0
+                    tar_info.uname = tar_info.gname = ''
+                    tar.addfile(tar_info, data)
@@ -0,0 +1,61 @@
+import shlex
+import time
+from pathlib import Path
+
+
+class RemoteManifest:
+    """
+    Sizes and modification times of all files, and the list of directories, below a remote root path.
+    The whole manifest is fetched with a single find command.
+    """
+
+    def __init__(self, root: Path):
+        self.root = root
+        self.files = {}  # path -> {'size': int, 'mtime': int}
+        self.directories = set()
+
+    @staticmethod
+    def find_command(root: Path) -> str:
+        return (
+            f'find {shlex.quote(root.as_posix())}'
+            r" \( -type f -printf 'f\t%p\t%s\t%T@\n' \) -o \( -type d -printf 'd\t%p\n' \)"
+            ' 2>/dev/null'
+        )
+
+    @staticmethod
+    def from_find_output(root: Path, output: str) -> 'RemoteManifest':
+        manifest = RemoteManifest(root)
+        for line in output.splitlines():
+            sp = line.split('\t')
+            if sp[0] == 'f' and len(sp) == 4:
+                manifest.files[Path(sp[1])] = {
+                    'size': int(sp[2]),
+                    'mtime': int(float(sp[3])),
+                }
+            elif sp[0] == 'd' and len(sp) == 2:
+                manifest.directories.add(Path(sp[1]))
+        return manifest
+
+    def covers(self, path: Path) -> bool:
+        return path == self.root or self.root in path.parents
+
+    def files_below(self, path: Path) -> dict[Path, dict]:
+        if path == self.root:
+            return self.files
+        return {
+            file: info for file, info in self.files.items()
+            if file == path or path in file.parents
+        }
+
+    def add_directories(self, directories: list[Path]):
+        for directory in directories:
+            self.directories.add(directory)
+            self.directories.update(parent for parent in directory.parents if self.covers(parent))
+
+    def add_uploaded_file(self, local: Path, remote: Path):
+        # the remote modification time is the upload time, which is never older than the local file
+        self.files[remote] = {
+            'size': local.stat().st_size,
+            'mtime': max(local.stat().st_mtime, time.time()),
+        }
+        self.add_directories([remote.parent])
@@ -201,7 +201,7 @@ class HiDreamBaseDataLoader(
         modules = []
 
         if config.latent_caching:
-            modules.append(image_disk_cache)
+            modules.extend(self._cache_storage_modules(config, image_disk_cache, image_split_names))
 
         if config.latent_caching:
             sort_names = [x for x in sort_names if x not in image_aggregate_names]
@@ -211,7 +211,7 @@ class HiDreamBaseDataLoader(
                     or not config.train_text_encoder_2_or_embedding() \
                     or not config.train_text_encoder_3_or_embedding() \
                     or not config.train_text_encoder_4_or_embedding():
-                modules.append(text_disk_cache)
+                modules.extend(self._cache_storage_modules(config, text_disk_cache, text_split_names))
                 sort_names = [x for x in sort_names if x not in text_split_names]
 
         if len(sort_names) > 0:
@@ -134,14 +134,14 @@ class PixArtAlphaBaseDataLoader(
         modules = []
 
         if config.latent_caching:
-            modules.append(image_disk_cache)
+            modules.extend(self._cache_storage_modules(config, image_disk_cache, image_split_names))
 
         if config.latent_caching:
             sort_names = [x for x in sort_names if x not in image_aggregate_names]
             sort_names = [x for x in sort_names if x not in image_split_names]
 
             if not config.train_text_encoder_or_embedding():
-                modules.append(text_disk_cache)
+                modules.extend(self._cache_storage_modules(config, text_disk_cache, text_split_names))
                 sort_names = [x for x in sort_names if x not in text_split_names]
 
         if len(sort_names) > 0:
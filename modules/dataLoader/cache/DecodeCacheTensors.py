@@ -0,0 +1,29 @@
+from modules.util.cache_storage_util import decode_cache_tensor
+
+from mgds.PipelineModule import PipelineModule
+from mgds.pipelineModuleTypes.RandomAccessPipelineModule import RandomAccessPipelineModule
+
+
+class DecodeCacheTensors(
+    PipelineModule,
+    RandomAccessPipelineModule,
+):
+    def __init__(self, names: list[str]):
+        super().__init__()
+        self.names = names
+
+    def length(self) -> int:
+        return self._get_previous_length(self.names[0])
+
+    def get_inputs(self) -> list[str]:
+        return self.names
+
+    def get_outputs(self) -> list[str]:
+        return self.names
+
+    def get_item(self, variation: int, index: int, requested_name: str = None) -> dict:
+        names = [requested_name] if requested_name in self.names else self.names
+
+        return {
+            name: decode_cache_tensor(self._get_previous_item(variation, name, index)) for name in names
+        }
@@ -0,0 +1,34 @@
+from modules.util.cache_storage_util import encode_cache_tensor
+from modules.util.enum.DataType import DataType
+
+from mgds.PipelineModule import PipelineModule
+from mgds.pipelineModuleTypes.RandomAccessPipelineModule import RandomAccessPipelineModule
+
+
+class EncodeCacheTensors(
+    PipelineModule,
+    RandomAccessPipelineModule,
+):
+    def __init__(self, names: list[str], storage_dtype: DataType, compress: bool):
+        super().__init__()
+        self.names = names
+        self.storage_dtype = storage_dtype
+        self.compress = compress
+
+    def length(self) -> int:
+        return self._get_previous_length(self.names[0])
+
+    def get_inputs(self) -> list[str]:
+        return self.names
+
+    def get_outputs(self) -> list[str]:
+        return self.names
+
+    def get_item(self, variation: int, index: int, requested_name: str = None) -> dict:
+        names = [requested_name] if requested_name in self.names else self.names
+
+        return {
+            name: encode_cache_tensor(
+                self._get_previous_item(variation, name, index), self.storage_dtype, self.compress
+            ) for name in names
+        }
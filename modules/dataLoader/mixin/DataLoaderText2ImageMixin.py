@@ -2,11 +2,14 @@ import re
 from collections.abc import Callable
 
 import modules.util.multi_gpu_util as multi
+from modules.dataLoader.cache.DecodeCacheTensors import DecodeCacheTensors
+from modules.dataLoader.cache.EncodeCacheTensors import EncodeCacheTensors
 from modules.util import path_util
 from modules.util.config.TrainConfig import TrainConfig
 from modules.util.enum.DataType import DataType
 
 from mgds.OutputPipelineModule import OutputPipelineModule
+from mgds.PipelineModule import PipelineModule
 from mgds.pipelineModules.AspectBatchSorting import AspectBatchSorting
 from mgds.pipelineModules.AspectBucketing import AspectBucketing
 from mgds.pipelineModules.CalcAspect import CalcAspect
@@ -254,6 +257,28 @@ class DataLoaderText2ImageMixin:
 
         return modules
 
+    def _cache_storage_modules(self, config: TrainConfig, disk_cache: PipelineModule, split_names: list[str]) -> list:
+        # latents and text encoder outputs are stored with the configured precision, masks are always stored unchanged
+        names = [
+            name for name in split_names
+            if (name.startswith('latent_') or name.endswith(('_state', '_output'))) and 'mask' not in name
+        ]
+        if len(names) == 0:
+            return [disk_cache]
+
+        encode_cache_tensors = EncodeCacheTensors(names=names, storage_dtype=config.cache_dtype, compress=config.cache_compression)
+        decode_cache_tensors = DecodeCacheTensors(names=names)
+
+        modules = []
+
+        if config.cache_dtype != DataType.NONE or config.cache_compression:
+            modules.append(encode_cache_tensors)
+        modules.append(disk_cache)
+        # always decoded, so caches that were created with different settings can still be read
+        modules.append(decode_cache_tensors)
+
+        return modules
+
     def _output_modules_from_out_names(
             self,
             output_names: list[str | tuple[str, str]],
@@ -1,5 +1,5 @@
 from abc import ABCMeta, abstractmethod
-from contextlib import nullcontext
+from contextlib import ExitStack, contextmanager, nullcontext
 from uuid import uuid4
 
 from modules.module.EMAModule import EMAModuleWrapper
@@ -106,6 +106,13 @@ class BaseModel(metaclass=ABCMeta):
     def adapters(self) -> list[LoRAModuleWrapper]:
         pass
 
+    @contextmanager
+    def merged_adapters(self, compute_device: torch.device, backup_device: torch.device):
+        with ExitStack() as stack:
+            for adapter in self.adapters():
+                stack.enter_context(adapter.merged_into_module(compute_device, backup_device))
+            yield
+
     @staticmethod
     def _add_embeddings_to_prompt(
             additional_embeddings: list[BaseModelEmbedding],
@@ -7,13 +7,25 @@ from modules.model.BaseModel import BaseModel
 from modules.util.enum.ModelType import ModelType
 from modules.util.ModelNames import ModelNames
 from modules.util.ModelWeightDtypes import ModelWeightDtypes
+from modules.util.state_dict_util import load_state_dict
 from modules.util.TrainProgress import TrainProgress
 
-import torch
-
 
 class BaseModelLoader(metaclass=ABCMeta):
 
+    def __init__(self):
+        super().__init__()
+        self.max_parallel_loads = 1
+        self.host_memory_budget_bytes = None
+
+    def set_parallel_loading(self, max_parallel_loads: int, host_memory_budget_bytes: int | None = None):
+        """
+        Configures how many sub-modules (text encoders, vae, transformer) are loaded concurrently by the base model
+        loader. The host memory budget limits the estimated memory of the state dicts that are loaded at the same time.
+        """
+        self.max_parallel_loads = max(max_parallel_loads, 1)
+        self.host_memory_budget_bytes = host_memory_budget_bytes
+
     def _load_internal_state(
             self,
             model: BaseModel,
@@ -30,12 +42,11 @@ class BaseModelLoader(metaclass=ABCMeta):
 
         # optimizer
         with contextlib.suppress(FileNotFoundError):
-            model.optimizer_state_dict = torch.load(os.path.join(base_model_name, "optimizer", "optimizer.pt"),
-                                                    weights_only=True)
+            model.optimizer_state_dict = load_state_dict(os.path.join(base_model_name, "optimizer"), "optimizer")
 
         # ema
         with contextlib.suppress(FileNotFoundError):
-            model.ema_state_dict = torch.load(os.path.join(base_model_name, "ema", "ema.pt"), weights_only=True)
+            model.ema_state_dict = load_state_dict(os.path.join(base_model_name, "ema"), "ema")
 
         # meta
         model.train_progress = train_progress
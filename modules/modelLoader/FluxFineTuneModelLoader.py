@@ -35,7 +35,7 @@ class FluxFineTuneModelLoader(
             model_names: ModelNames,
             weight_dtypes: ModelWeightDtypes,
     ) -> FluxModel | None:
-        base_model_loader = FluxModelLoader()
+        base_model_loader = FluxModelLoader(self.max_parallel_loads, self.host_memory_budget_bytes)
         embedding_loader = FluxEmbeddingLoader()
 
         model = FluxModel(model_type=model_type)
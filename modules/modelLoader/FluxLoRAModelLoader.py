@@ -36,7 +36,7 @@ class FluxLoRAModelLoader(
             model_names: ModelNames,
             weight_dtypes: ModelWeightDtypes,
     ) -> FluxModel | None:
-        base_model_loader = FluxModelLoader()
+        base_model_loader = FluxModelLoader(self.max_parallel_loads, self.host_memory_budget_bytes)
         lora_model_loader = FluxLoRALoader()
         embedding_loader = FluxEmbeddingLoader()
 
@@ -33,7 +33,7 @@ class HiDreamFineTuneModelLoader(
             model_names: ModelNames,
             weight_dtypes: ModelWeightDtypes,
     ) -> HiDreamModel | None:
-        base_model_loader = HiDreamModelLoader()
+        base_model_loader = HiDreamModelLoader(self.max_parallel_loads, self.host_memory_budget_bytes)
         embedding_loader = HiDreamEmbeddingLoader()
 
         model = HiDreamModel(model_type=model_type)
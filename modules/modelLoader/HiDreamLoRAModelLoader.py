@@ -34,7 +34,7 @@ class HiDreamLoRAModelLoader(
             model_names: ModelNames,
             weight_dtypes: ModelWeightDtypes,
     ) -> HiDreamModel | None:
-        base_model_loader = HiDreamModelLoader()
+        base_model_loader = HiDreamModelLoader(self.max_parallel_loads, self.host_memory_budget_bytes)
         lora_model_loader = HiDreamLoRALoader()
         embedding_loader = HiDreamEmbeddingLoader()
 
@@ -32,7 +32,7 @@ class QwenFineTuneModelLoader(
             model_names: ModelNames,
             weight_dtypes: ModelWeightDtypes,
     ) -> QwenModel | None:
-        base_model_loader = QwenModelLoader()
+        base_model_loader = QwenModelLoader(self.max_parallel_loads, self.host_memory_budget_bytes)
         model = QwenModel(model_type=model_type)
 
         self._load_internal_data(model, model_names.base_model)
@@ -33,7 +33,7 @@ class QwenLoRAModelLoader(
             model_names: ModelNames,
             weight_dtypes: ModelWeightDtypes,
     ) -> QwenModel | None:
-        base_model_loader = QwenModelLoader()
+        base_model_loader = QwenModelLoader(self.max_parallel_loads, self.host_memory_budget_bytes)
         lora_model_loader = QwenLoRALoader()
 
         model = QwenModel(model_type=model_type)
@@ -23,8 +23,8 @@ from transformers import CLIPTextModel, CLIPTokenizer, T5EncoderModel, T5Tokeniz
 class FluxModelLoader(
     HFModelLoaderMixin,
 ):
-    def __init__(self):
-        super().__init__()
+    def __init__(self, max_parallel_loads: int = 1, host_memory_budget_bytes: int | None = None):
+        super().__init__(max_parallel_loads, host_memory_budget_bytes)
 
     def __load_internal(
             self,
@@ -94,62 +94,65 @@ class FluxModelLoader(
             subfolder="scheduler",
         )
 
-        if include_text_encoder_1:
-            text_encoder_1 = self._load_transformers_sub_module(
-                CLIPTextModel,
-                weight_dtypes.text_encoder,
-                weight_dtypes.train_dtype,
-                base_model_name,
-                "text_encoder",
-            )
-        else:
-            text_encoder_1 = None
+        with self._sub_module_load_pool() as pool:
+            if include_text_encoder_1:
+                text_encoder_1 = pool.submit(
+                    self._load_transformers_sub_module,
+                    CLIPTextModel,
+                    weight_dtypes.text_encoder,
+                    weight_dtypes.train_dtype,
+                    base_model_name,
+                    "text_encoder",
+                )
+            else:
+                text_encoder_1 = None
 
-        if include_text_encoder_2:
-            text_encoder_2 = self._load_transformers_sub_module(
-                T5EncoderModel,
-                weight_dtypes.text_encoder_2,
-                weight_dtypes.fallback_train_dtype,
-                base_model_name,
-                "text_encoder_2",
-            )
-        else:
-            text_encoder_2 = None
+            if include_text_encoder_2:
+                text_encoder_2 = pool.submit(
+                    self._load_transformers_sub_module,
+                    T5EncoderModel,
+                    weight_dtypes.text_encoder_2,
+                    weight_dtypes.fallback_train_dtype,
+                    base_model_name,
+                    "text_encoder_2",
+                )
+            else:
+                text_encoder_2 = None
 
-        if vae_model_name:
-            vae = self._load_diffusers_sub_module(
-                AutoencoderKL,
-                weight_dtypes.vae,
-                weight_dtypes.train_dtype,
-                vae_model_name,
-            )
-        else:
-            vae = self._load_diffusers_sub_module(
-                AutoencoderKL,
-                weight_dtypes.vae,
-                weight_dtypes.train_dtype,
-                base_model_name,
-                "vae",
-            )
+            if vae_model_name:
+                vae = pool.submit(
+                    self._load_diffusers_sub_module,
+                    AutoencoderKL,
+                    weight_dtypes.vae,
+                    weight_dtypes.train_dtype,
+                    vae_model_name,
+                )
+            else:
+                vae = pool.submit(
+                    self._load_diffusers_sub_module,
+                    AutoencoderKL,
+                    weight_dtypes.vae,
+                    weight_dtypes.train_dtype,
+                    base_model_name,
+                    "vae",
+                )
 
-        if transformer_model_name:
-            transformer = FluxTransformer2DModel.from_single_file(
-                transformer_model_name,
-                #avoid loading the transformer in float32:
-                torch_dtype = torch.bfloat16 if weight_dtypes.transformer.torch_dtype() is None else weight_dtypes.transformer.torch_dtype(),
-                quantization_config=GGUFQuantizationConfig(compute_dtype=torch.bfloat16) if weight_dtypes.transformer == DataType.GGUF else None,
-            )
-            transformer = self._convert_diffusers_sub_module_to_dtype(
-                transformer, weight_dtypes.transformer, weight_dtypes.train_dtype
-            )
-        else:
-            transformer = self._load_diffusers_sub_module(
-                FluxTransformer2DModel,
-                weight_dtypes.transformer,
-                weight_dtypes.train_dtype,
-                base_model_name,
-                "transformer",
-            )
+            if transformer_model_name:
+                transformer = pool.submit(self.__load_single_file_transformer, weight_dtypes, transformer_model_name)
+            else:
+                transformer = pool.submit(
+                    self._load_diffusers_sub_module,
+                    FluxTransformer2DModel,
+                    weight_dtypes.transformer,
+                    weight_dtypes.train_dtype,
+                    base_model_name,
+                    "transformer",
+                )
+
+            text_encoder_1 = text_encoder_1.result() if text_encoder_1 is not None else None
+            text_encoder_2 = text_encoder_2.result() if text_encoder_2 is not None else None
+            vae = vae.result()
+            transformer = transformer.result()
 
         model.model_type = model_type
         model.tokenizer_1 = tokenizer_1
@@ -160,6 +163,22 @@ class FluxModelLoader(
         model.vae = vae
         model.transformer = transformer
 
+    def __load_single_file_transformer(
+            self,
+            weight_dtypes: ModelWeightDtypes,
+            transformer_model_name: str,
+    ):
+        with self._single_file_sub_module_load(transformer_model_name):
+            transformer = FluxTransformer2DModel.from_single_file(
+                transformer_model_name,
+                #avoid loading the transformer in float32:
+                torch_dtype = torch.bfloat16 if weight_dtypes.transformer.torch_dtype() is None else weight_dtypes.transformer.torch_dtype(),
+                quantization_config=GGUFQuantizationConfig(compute_dtype=torch.bfloat16) if weight_dtypes.transformer == DataType.GGUF else None,
+            )
+            return self._convert_diffusers_sub_module_to_dtype(
+                transformer, weight_dtypes.transformer, weight_dtypes.train_dtype
+            )
+
     def __load_safetensors(
             self,
             model: FluxModel,
@@ -27,8 +27,8 @@ from transformers import (
 class HiDreamModelLoader(
     HFModelLoaderMixin,
 ):
-    def __init__(self):
-        super().__init__()
+    def __init__(self, max_parallel_loads: int = 1, host_memory_budget_bytes: int | None = None):
+        super().__init__(max_parallel_loads, host_memory_budget_bytes)
 
     def __load_internal(
             self,
@@ -116,82 +116,98 @@ class HiDreamModelLoader(
             subfolder="scheduler",
         )
 
-        if include_text_encoder_1:
-            text_encoder_1 = self._load_transformers_sub_module(
-                CLIPTextModelWithProjection,
-                weight_dtypes.text_encoder,
-                weight_dtypes.train_dtype,
-                base_model_name,
-                "text_encoder",
-            )
-        else:
-            text_encoder_1 = None
+        with self._sub_module_load_pool() as pool:
+            if include_text_encoder_1:
+                text_encoder_1 = pool.submit(
+                    self._load_transformers_sub_module,
+                    CLIPTextModelWithProjection,
+                    weight_dtypes.text_encoder,
+                    weight_dtypes.train_dtype,
+                    base_model_name,
+                    "text_encoder",
+                )
+            else:
+                text_encoder_1 = None
 
-        if include_text_encoder_2:
-            text_encoder_2 = self._load_transformers_sub_module(
-                CLIPTextModelWithProjection,
-                weight_dtypes.text_encoder_2,
-                weight_dtypes.train_dtype,
-                base_model_name,
-                "text_encoder_2",
-            )
-        else:
-            text_encoder_2 = None
+            if include_text_encoder_2:
+                text_encoder_2 = pool.submit(
+                    self._load_transformers_sub_module,
+                    CLIPTextModelWithProjection,
+                    weight_dtypes.text_encoder_2,
+                    weight_dtypes.train_dtype,
+                    base_model_name,
+                    "text_encoder_2",
+                )
+            else:
+                text_encoder_2 = None
+
+            if include_text_encoder_3:
+                text_encoder_3 = pool.submit(
+                    self._load_transformers_sub_module,
+                    T5EncoderModel,
+                    weight_dtypes.text_encoder_3,
+                    weight_dtypes.fallback_train_dtype,
+                    base_model_name,
+                    "text_encoder_3",
+                )
+            else:
+                text_encoder_3 = None
+
+            if include_text_encoder_4:
+                if text_encoder_4_model_name:
+                    text_encoder_4 = pool.submit(
+                        self._load_transformers_sub_module,
+                        LlamaForCausalLM,
+                        weight_dtypes.text_encoder_4,
+                        weight_dtypes.train_dtype,
+                        text_encoder_4_model_name,
+                    )
+                else:
+                    text_encoder_4 = pool.submit(
+                        self._load_transformers_sub_module,
+                        LlamaForCausalLM,
+                        weight_dtypes.text_encoder_4,
+                        weight_dtypes.train_dtype,
+                        base_model_name,
+                        "text_encoder_4",
+                    )
 
-        if include_text_encoder_3:
-            text_encoder_3 = self._load_transformers_sub_module(
-                T5EncoderModel,
-                weight_dtypes.text_encoder_3,
-                weight_dtypes.fallback_train_dtype,
-                base_model_name,
-                "text_encoder_3",
-            )
-        else:
-            text_encoder_3 = None
+            else:
+                text_encoder_4 = None
 
-        if include_text_encoder_4:
-            if text_encoder_4_model_name:
-                text_encoder_4 = self._load_transformers_sub_module(
-                    LlamaForCausalLM,
-                    weight_dtypes.text_encoder_4,
+            if vae_model_name:
+                vae = pool.submit(
+                    self._load_diffusers_sub_module,
+                    AutoencoderKL,
+                    weight_dtypes.vae,
                     weight_dtypes.train_dtype,
-                    text_encoder_4_model_name,
+                    vae_model_name,
                 )
             else:
-                text_encoder_4 = self._load_transformers_sub_module(
-                    LlamaForCausalLM,
-                    weight_dtypes.text_encoder_4,
+                vae = pool.submit(
+                    self._load_diffusers_sub_module,
+                    AutoencoderKL,
+                    weight_dtypes.vae,
                     weight_dtypes.train_dtype,
                     base_model_name,
-                    "text_encoder_4",
+                    "vae",
                 )
 
-        else:
-            text_encoder_4 = None
-
-        if vae_model_name:
-            vae = self._load_diffusers_sub_module(
-                AutoencoderKL,
-                weight_dtypes.vae,
-                weight_dtypes.train_dtype,
-                vae_model_name,
-            )
-        else:
-            vae = self._load_diffusers_sub_module(
-                AutoencoderKL,
-                weight_dtypes.vae,
+            transformer = pool.submit(
+                self._load_diffusers_sub_module,
+                HiDreamImageTransformer2DModel,
+                weight_dtypes.transformer,
                 weight_dtypes.train_dtype,
                 base_model_name,
-                "vae",
+                "transformer",
             )
 
-        transformer = self._load_diffusers_sub_module(
-            HiDreamImageTransformer2DModel,
-            weight_dtypes.transformer,
-            weight_dtypes.train_dtype,
-            base_model_name,
-            "transformer",
-        )
+            text_encoder_1 = text_encoder_1.result() if text_encoder_1 is not None else None
+            text_encoder_2 = text_encoder_2.result() if text_encoder_2 is not None else None
+            text_encoder_3 = text_encoder_3.result() if text_encoder_3 is not None else None
+            text_encoder_4 = text_encoder_4.result() if text_encoder_4 is not None else None
+            vae = vae.result()
+            transformer = transformer.result()
 
         model.model_type = model_type
         model.tokenizer_1 = tokenizer_1
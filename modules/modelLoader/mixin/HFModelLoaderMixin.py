@@ -1,8 +1,10 @@
 import json
 import os
 import re
+import threading
 import traceback
 from abc import ABCMeta
+from contextlib import contextmanager, nullcontext
 from itertools import repeat
 
 from modules.util.enum.DataType import DataType
@@ -12,19 +14,84 @@ from modules.util.quantization_util import (
     replace_linear_with_int8_layers,
     replace_linear_with_nf4_layers,
 )
+from modules.util.SubModuleLoadPool import SubModuleLoadPool
 
 import torch
 from torch import nn
 
-import accelerate
 import huggingface_hub
 from huggingface_hub.utils import EntryNotFoundError
 from safetensors.torch import load_file
 
+# accelerate.init_empty_weights() replaces torch.nn.Module.register_parameter for all threads. Sub-modules that are
+# loaded concurrently use an equivalent that only applies to the current thread. It is installed once, before any
+# model is loaded, so it always wraps the original function.
+_empty_weights_state = threading.local()
+_original_register_parameter = nn.Module.register_parameter
+
+
+def _register_parameter(module: nn.Module, name: str, param: nn.Parameter | None):
+    _original_register_parameter(module, name, param)
+    if param is not None and getattr(_empty_weights_state, "active", False):
+        param_cls = type(module._parameters[name])
+        kwargs = module._parameters[name].__dict__
+        kwargs["requires_grad"] = param.requires_grad
+        module._parameters[name] = param_cls(module._parameters[name].to(torch.device("meta")), **kwargs)
+
+
+nn.Module.register_parameter = _register_parameter
+
+
+@contextmanager
+def _empty_weights():
+    # like accelerate.init_empty_weights(), but only for the current thread
+    previous = getattr(_empty_weights_state, "active", False)
+    _empty_weights_state.active = True
+    try:
+        yield
+    finally:
+        _empty_weights_state.active = previous
+
+
+# from_single_file() uses accelerate.init_empty_weights() internally. while it is active, parameters created by other
+# threads are also moved to the meta device, so it can't run concurrently with another single file load or conversion
+_single_file_lock = threading.Lock()
+
 
 class HFModelLoaderMixin(metaclass=ABCMeta):
-    def __init__(self):
+    def __init__(self, max_parallel_loads: int = 1, host_memory_budget_bytes: int | None = None):
         super().__init__()
+        self.__max_parallel_loads = max(max_parallel_loads, 1)
+        self.__host_memory_budget_bytes = host_memory_budget_bytes
+        self.__load_pool = None
+
+    @contextmanager
+    def _sub_module_load_pool(self):
+        """
+        Creates a pool to submit independent sub-module loads to. All loads are finished when the context exits.
+        """
+        pool = SubModuleLoadPool(self.__max_parallel_loads, self.__host_memory_budget_bytes)
+        self.__load_pool = pool
+        try:
+            yield pool
+        finally:
+            pool.shutdown()
+            self.__load_pool = None
+
+    @contextmanager
+    def _single_file_sub_module_load(self, model_path: str):
+        """
+        Must be held while a sub-module is created with from_single_file() and converted to its weight dtype. Reserves
+        the memory of the file from the host memory budget. Other sub-module loads still run concurrently.
+        """
+        estimated_bytes = 2 * os.path.getsize(model_path) if os.path.isfile(model_path) else 0
+        with self.__reserve_memory(estimated_bytes), _single_file_lock:
+            yield
+
+    def __reserve_memory(self, num_bytes: int):
+        if self.__load_pool is None:
+            return nullcontext()
+        return self.__load_pool.reserve_memory(num_bytes)
 
     def __load_sub_module(
             self,
@@ -41,7 +108,7 @@ class HFModelLoaderMixin(metaclass=ABCMeta):
         if keep_in_fp32_modules is None:
             keep_in_fp32_modules = []
 
-        with accelerate.init_empty_weights():
+        with _empty_weights():
             if dtype.quantize_nf4():
                 replace_linear_with_nf4_layers(sub_module, keep_in_fp32_modules, copy_parameters=False)
             elif dtype.quantize_int8():
@@ -77,7 +144,6 @@ class HFModelLoaderMixin(metaclass=ABCMeta):
         else:
             safetensors_filenames = [model_filename]
 
-        state_dict = {}
         is_torch_pickle = False
 
         if is_local:
@@ -107,63 +173,68 @@ class HFModelLoaderMixin(metaclass=ABCMeta):
                 )]
                 is_torch_pickle = True
 
-        if is_torch_pickle:
-            for f in full_filenames:
-                file_state_dict = torch.load(f, weights_only=True)
-                while 'state_dict' in file_state_dict:
-                    file_state_dict = file_state_dict['state_dict']
-                state_dict |= file_state_dict
-        else:
-            for f in full_filenames:
-                state_dict |= load_file(f)
-
-        if hasattr(sub_module, '_fix_state_dict_keys_on_load'):
-            sub_module._fix_state_dict_keys_on_load(state_dict)
-
-        #TODO why is it necessary to iterate by key names from the state dict?
-        #why not iterate through the object model, like replace_linear_... does?
-        #would avoid key replacements as follows.
-
-        if hasattr(sub_module, "_checkpoint_conversion_mapping"): #required for loading the text encoder of Qwen
-            new_state_dict = {}
-            for k, v in state_dict.items():
-                new_k = k
-                for pattern, replacement in sub_module._checkpoint_conversion_mapping.items():
-                    new_k = re.sub(pattern, replacement, new_k)
-                new_state_dict[new_k] = v
-            state_dict = new_state_dict
-
-        for key, value in state_dict.items():
-            module = sub_module
-            tensor_name = key
-            module_name = None
-            key_splits = tensor_name.split(".")
-            for split in key_splits[:-1]:
-                module = getattr(module, split)
-                module_name = split
-            tensor_name = key_splits[-1]
-
-            is_buffer = tensor_name in module._buffers
-            if not is_buffer and tensor_name not in module._parameters:
-                continue
-            old_value = module._buffers[tensor_name] if is_buffer else module._parameters[tensor_name]
-
-            if torch.is_floating_point(old_value):
-                old_type = type(old_value)
-                if not is_quantized_parameter(module, tensor_name):
-                    if dtype.is_quantized() or module_name in keep_in_fp32_modules:
-                        value = value.to(dtype=train_dtype.torch_dtype())
-                    else:
-                        value = value.to(dtype=dtype.torch_dtype())
+        # the state dict is loaded in its original dtype, converted values are allocated while it is still alive
+        estimated_bytes = 2 * sum(os.path.getsize(f) for f in full_filenames)
+
+        with self.__reserve_memory(estimated_bytes):
+            state_dict = {}
+            if is_torch_pickle:
+                for f in full_filenames:
+                    file_state_dict = torch.load(f, weights_only=True)
+                    while 'state_dict' in file_state_dict:
+                        file_state_dict = file_state_dict['state_dict']
+                    state_dict |= file_state_dict
+            else:
+                for f in full_filenames:
+                    state_dict |= load_file(f)
+
+            if hasattr(sub_module, '_fix_state_dict_keys_on_load'):
+                sub_module._fix_state_dict_keys_on_load(state_dict)
+
+            #TODO why is it necessary to iterate by key names from the state dict?
+            #why not iterate through the object model, like replace_linear_... does?
+            #would avoid key replacements as follows.
+
+            if hasattr(sub_module, "_checkpoint_conversion_mapping"): #required for loading the text encoder of Qwen
+                new_state_dict = {}
+                for k, v in state_dict.items():
+                    new_k = k
+                    for pattern, replacement in sub_module._checkpoint_conversion_mapping.items():
+                        new_k = re.sub(pattern, replacement, new_k)
+                    new_state_dict[new_k] = v
+                state_dict = new_state_dict
+
+            for key, value in state_dict.items():
+                module = sub_module
+                tensor_name = key
+                module_name = None
+                key_splits = tensor_name.split(".")
+                for split in key_splits[:-1]:
+                    module = getattr(module, split)
+                    module_name = split
+                tensor_name = key_splits[-1]
+
+                is_buffer = tensor_name in module._buffers
+                if not is_buffer and tensor_name not in module._parameters:
+                    continue
+                old_value = module._buffers[tensor_name] if is_buffer else module._parameters[tensor_name]
+
+                if torch.is_floating_point(old_value):
+                    old_type = type(old_value)
+                    if not is_quantized_parameter(module, tensor_name):
+                        if dtype.is_quantized() or module_name in keep_in_fp32_modules:
+                            value = value.to(dtype=train_dtype.torch_dtype())
+                        else:
+                            value = value.to(dtype=dtype.torch_dtype())
 
-                new_value = old_type(value)
+                    new_value = old_type(value)
 
-                if is_buffer:
-                    module._buffers[tensor_name].data = new_value
-                else:
-                    module._parameters[tensor_name] = new_value
+                    if is_buffer:
+                        module._buffers[tensor_name].data = new_value
+                    else:
+                        module._parameters[tensor_name] = new_value
 
-        del state_dict
+            del state_dict
 
         return sub_module
 
@@ -187,7 +258,7 @@ class HFModelLoaderMixin(metaclass=ABCMeta):
             user_agent=user_agent,
         )
 
-        with accelerate.init_empty_weights():
+        with _empty_weights():
             sub_module = module_type(config)
 
         return self.__load_sub_module(
@@ -222,7 +293,7 @@ class HFModelLoaderMixin(metaclass=ABCMeta):
             user_agent=user_agent,
         )
 
-        with accelerate.init_empty_weights():
+        with _empty_weights():
             sub_module = module_type.from_config(config)
 
         return self.__load_sub_module(
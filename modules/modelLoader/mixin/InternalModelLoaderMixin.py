@@ -4,10 +4,9 @@ import os
 from abc import ABCMeta
 
 from modules.model.BaseModel import BaseModel
+from modules.util.state_dict_util import load_state_dict
 from modules.util.TrainProgress import TrainProgress
 
-import torch
-
 
 class InternalModelLoaderMixin(metaclass=ABCMeta):
     def __init__(self):
@@ -31,12 +30,11 @@ class InternalModelLoaderMixin(metaclass=ABCMeta):
 
             # optimizer
             with contextlib.suppress(FileNotFoundError):
-                model.optimizer_state_dict = torch.load(os.path.join(model_name, "optimizer", "optimizer.pt"),
-                                                        weights_only=True)
+                model.optimizer_state_dict = load_state_dict(os.path.join(model_name, "optimizer"), "optimizer")
 
             # ema
             with contextlib.suppress(FileNotFoundError):
-                model.ema_state_dict = torch.load(os.path.join(model_name, "ema", "ema.pt"), weights_only=True)
+                model.ema_state_dict = load_state_dict(os.path.join(model_name, "ema"), "ema")
 
             # meta
             model.train_progress = train_progress
@@ -22,8 +22,8 @@ from transformers import Qwen2_5_VLForConditionalGeneration, Qwen2Tokenizer
 class QwenModelLoader(
     HFModelLoaderMixin,
 ):
-    def __init__(self):
-        super().__init__()
+    def __init__(self, max_parallel_loads: int = 1, host_memory_budget_bytes: int | None = None):
+        super().__init__(max_parallel_loads, host_memory_budget_bytes)
 
     def __load_internal(
             self,
@@ -72,31 +72,66 @@ class QwenModelLoader(
             subfolder="scheduler",
         )
 
-        text_encoder = self._load_transformers_sub_module(
-            Qwen2_5_VLForConditionalGeneration,
-            weight_dtypes.text_encoder,
-            weight_dtypes.fallback_train_dtype,
-            base_model_name,
-            "text_encoder",
-        )
-
-        if vae_model_name: #TODO simplify
-            vae = self._load_diffusers_sub_module(
-                AutoencoderKLQwenImage,
-                weight_dtypes.vae,
-                weight_dtypes.train_dtype,
-                vae_model_name,
-            )
-        else:
-            vae = self._load_diffusers_sub_module(
-                AutoencoderKLQwenImage,
-                weight_dtypes.vae,
-                weight_dtypes.train_dtype,
+        with self._sub_module_load_pool() as pool:
+            text_encoder = pool.submit(
+                self._load_transformers_sub_module,
+                Qwen2_5_VLForConditionalGeneration,
+                weight_dtypes.text_encoder,
+                weight_dtypes.fallback_train_dtype,
                 base_model_name,
-                "vae",
+                "text_encoder",
             )
 
-        if transformer_model_name:
+            if vae_model_name: #TODO simplify
+                vae = pool.submit(
+                    self._load_diffusers_sub_module,
+                    AutoencoderKLQwenImage,
+                    weight_dtypes.vae,
+                    weight_dtypes.train_dtype,
+                    vae_model_name,
+                )
+            else:
+                vae = pool.submit(
+                    self._load_diffusers_sub_module,
+                    AutoencoderKLQwenImage,
+                    weight_dtypes.vae,
+                    weight_dtypes.train_dtype,
+                    base_model_name,
+                    "vae",
+                )
+
+            if transformer_model_name:
+                transformer = pool.submit(
+                    self.__load_single_file_transformer, weight_dtypes, base_model_name, transformer_model_name,
+                )
+            else:
+                transformer = pool.submit(
+                    self._load_diffusers_sub_module,
+                    QwenImageTransformer2DModel,
+                    weight_dtypes.transformer,
+                    weight_dtypes.train_dtype,
+                    base_model_name,
+                    "transformer",
+                )
+
+            text_encoder = text_encoder.result()
+            vae = vae.result()
+            transformer = transformer.result()
+
+        model.model_type = model_type
+        model.tokenizer = tokenizer
+        model.noise_scheduler = noise_scheduler
+        model.text_encoder = text_encoder
+        model.vae = vae
+        model.transformer = transformer
+
+    def __load_single_file_transformer(
+            self,
+            weight_dtypes: ModelWeightDtypes,
+            base_model_name: str,
+            transformer_model_name: str,
+    ):
+        with self._single_file_sub_module_load(transformer_model_name):
             transformer = QwenImageTransformer2DModel.from_single_file(
                 transformer_model_name,
                 config=base_model_name,
@@ -105,24 +140,9 @@ class QwenModelLoader(
                 torch_dtype = torch.bfloat16 if weight_dtypes.transformer.torch_dtype() is None else weight_dtypes.transformer.torch_dtype(),
                 quantization_config=GGUFQuantizationConfig(compute_dtype=torch.bfloat16) if weight_dtypes.transformer == DataType.GGUF else None,
             )
-            transformer = self._convert_diffusers_sub_module_to_dtype(
+            return self._convert_diffusers_sub_module_to_dtype(
                 transformer, weight_dtypes.transformer, weight_dtypes.train_dtype
             )
-        else:
-            transformer = self._load_diffusers_sub_module(
-                QwenImageTransformer2DModel,
-                weight_dtypes.transformer,
-                weight_dtypes.train_dtype,
-                base_model_name,
-                "transformer",
-            )
-
-        model.model_type = model_type
-        model.tokenizer = tokenizer
-        model.noise_scheduler = noise_scheduler
-        model.text_encoder = text_encoder
-        model.vae = vae
-        model.transformer = transformer
 
     def __load_safetensors(
             self,
@@ -1,14 +1,17 @@
 import io
 import os
 from abc import ABCMeta, abstractmethod
-from collections.abc import Callable
+from collections.abc import Callable, Hashable
 from pathlib import Path
+from typing import Any
 
 from modules.util.config.SampleConfig import SampleConfig
 from modules.util.enum.AudioFormat import AudioFormat
 from modules.util.enum.FileType import FileType
 from modules.util.enum.ImageFormat import ImageFormat
 from modules.util.enum.VideoFormat import VideoFormat
+from modules.util.PromptEmbeddingCache import PromptEmbeddingCache
+from modules.util.torch_util import torch_gc
 
 import torch
 from torchvision.io import write_video
@@ -60,6 +63,9 @@ class BaseModelSampler(metaclass=ABCMeta):
         self.train_device = train_device
         self.temp_device = temp_device
 
+        # set by the trainer if text encoder outputs can be reused between sampling rounds
+        self.prompt_embedding_cache: PromptEmbeddingCache | None = None
+
     @abstractmethod
     def sample(
             self,
@@ -73,6 +79,31 @@ class BaseModelSampler(metaclass=ABCMeta):
     ):
         pass
 
+    def _encode_prompt_cached(
+            self,
+            key: Hashable,
+            text_encoder_to: Callable[[torch.device], None],
+            encode: Callable[[], Any],
+    ) -> Any:
+        """
+        Returns the output of encode(), which must only depend on key and the text encoder weights. On a cache hit,
+        the text encoders are not moved to the train device.
+        """
+        if self.prompt_embedding_cache is not None:
+            output = self.prompt_embedding_cache.get(key, self.train_device)
+            if output is not None:
+                return output
+
+        text_encoder_to(self.train_device)
+        output = encode()
+        text_encoder_to(self.temp_device)
+        torch_gc()
+
+        if self.prompt_embedding_cache is not None:
+            self.prompt_embedding_cache.put(key, output)
+
+        return output
+
     @staticmethod
     def quantize_resolution(resolution: int, quantization: int) -> int:
         return round(resolution / quantization) * quantization
@@ -62,18 +62,17 @@ class ChromaSampler(BaseModelSampler):
             num_latent_channels = 16
 
             # prepare prompt
-            self.model.text_encoder_to(self.train_device)
-
-            combined_prompt_embedding, text_attention_mask = self.model.encode_text(
-                text=[prompt, negative_prompt],
-                batch_size = 2,
-                train_device=self.train_device,
-                text_encoder_layer_skip=text_encoder_layer_skip,
+            combined_prompt_embedding, text_attention_mask = self._encode_prompt_cached(
+                (prompt, negative_prompt, text_encoder_layer_skip),
+                self.model.text_encoder_to,
+                lambda: self.model.encode_text(
+                    text=[prompt, negative_prompt],
+                    batch_size = 2,
+                    train_device=self.train_device,
+                    text_encoder_layer_skip=text_encoder_layer_skip,
+                ),
             )
 
-            self.model.text_encoder_to(self.temp_device)
-            torch_gc()
-
             # prepare latent image
             latent_image = torch.randn(
                 size=(1, num_latent_channels, height // vae_scale_factor, width // vae_scale_factor),
@@ -69,20 +69,20 @@ class FluxSampler(BaseModelSampler):
             num_latent_channels = 16
 
             # prepare prompt
-            self.model.text_encoder_to(self.train_device)
-
-            prompt_embedding, pooled_prompt_embedding = self.model.encode_text(
-                text=prompt,
-                train_device=self.train_device,
-                text_encoder_1_layer_skip=text_encoder_1_layer_skip,
-                text_encoder_2_layer_skip=text_encoder_2_layer_skip,
-                text_encoder_2_sequence_length=text_encoder_2_sequence_length,
-                apply_attention_mask=transformer_attention_mask,
+            prompt_embedding, pooled_prompt_embedding = self._encode_prompt_cached(
+                (prompt, text_encoder_1_layer_skip, text_encoder_2_layer_skip, text_encoder_2_sequence_length,
+                 transformer_attention_mask),
+                self.model.text_encoder_to,
+                lambda: self.model.encode_text(
+                    text=prompt,
+                    train_device=self.train_device,
+                    text_encoder_1_layer_skip=text_encoder_1_layer_skip,
+                    text_encoder_2_layer_skip=text_encoder_2_layer_skip,
+                    text_encoder_2_sequence_length=text_encoder_2_sequence_length,
+                    apply_attention_mask=transformer_attention_mask,
+                ),
             )
 
-            self.model.text_encoder_to(self.temp_device)
-            torch_gc()
-
             # prepare latent image
             latent_image = torch.randn(
                 size=(1, num_latent_channels, height // vae_scale_factor, width // vae_scale_factor),
@@ -311,20 +311,20 @@ class FluxSampler(BaseModelSampler):
                 )
 
             # prepare prompt
-            self.model.text_encoder_to(self.train_device)
-
-            prompt_embedding, pooled_prompt_embedding = self.model.encode_text(
-                text=prompt,
-                train_device=self.train_device,
-                text_encoder_1_layer_skip=text_encoder_1_layer_skip,
-                text_encoder_2_layer_skip=text_encoder_2_layer_skip,
-                text_encoder_2_sequence_length=text_encoder_2_sequence_length,
-                apply_attention_mask=transformer_attention_mask,
+            prompt_embedding, pooled_prompt_embedding = self._encode_prompt_cached(
+                (prompt, text_encoder_1_layer_skip, text_encoder_2_layer_skip, text_encoder_2_sequence_length,
+                 transformer_attention_mask),
+                self.model.text_encoder_to,
+                lambda: self.model.encode_text(
+                    text=prompt,
+                    train_device=self.train_device,
+                    text_encoder_1_layer_skip=text_encoder_1_layer_skip,
+                    text_encoder_2_layer_skip=text_encoder_2_layer_skip,
+                    text_encoder_2_sequence_length=text_encoder_2_sequence_length,
+                    apply_attention_mask=transformer_attention_mask,
+                ),
             )
 
-            self.model.text_encoder_to(self.temp_device)
-            torch_gc()
-
             # prepare latent image
             latent_image = torch.randn(
                 size=(1, num_latent_channels, height // vae_scale_factor, width // vae_scale_factor),
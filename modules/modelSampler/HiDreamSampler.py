@@ -63,25 +63,29 @@ class HiDreamSampler(BaseModelSampler):
             num_latent_channels = 16
 
             # prepare prompt
-            self.model.text_encoder_to(self.train_device)
-
-            text_encoder_3_prompt_embedding, text_encoder_4_prompt_embedding, pooled_prompt_embedding = \
-                self.model.combine_text_encoder_output(
-                    *self.model.encode_text(
-                        text=prompt,
-                        train_device=self.train_device,
-                        text_encoder_3_layer_skip=text_encoder_3_layer_skip,
-                        apply_attention_mask=transformer_attention_mask,
-                    ))
-
-            negative_text_encoder_3_prompt_embedding, negative_text_encoder_4_prompt_embedding, negative_pooled_prompt_embedding = \
-                self.model.combine_text_encoder_output(
-                    *self.model.encode_text(
-                        text=negative_prompt,
-                        train_device=self.train_device,
-                        text_encoder_3_layer_skip=text_encoder_3_layer_skip,
-                        apply_attention_mask=transformer_attention_mask,
-                    ))
+            (
+                (text_encoder_3_prompt_embedding, text_encoder_4_prompt_embedding, pooled_prompt_embedding),
+                (negative_text_encoder_3_prompt_embedding, negative_text_encoder_4_prompt_embedding, negative_pooled_prompt_embedding),
+            ) = self._encode_prompt_cached(
+                (prompt, negative_prompt, text_encoder_3_layer_skip, transformer_attention_mask),
+                self.model.text_encoder_to,
+                lambda: (
+                    self.model.combine_text_encoder_output(
+                        *self.model.encode_text(
+                            text=prompt,
+                            train_device=self.train_device,
+                            text_encoder_3_layer_skip=text_encoder_3_layer_skip,
+                            apply_attention_mask=transformer_attention_mask,
+                        )),
+                    self.model.combine_text_encoder_output(
+                        *self.model.encode_text(
+                            text=negative_prompt,
+                            train_device=self.train_device,
+                            text_encoder_3_layer_skip=text_encoder_3_layer_skip,
+                            apply_attention_mask=transformer_attention_mask,
+                        )),
+                ),
+            )
 
             combined_text_encoder_3_prompt_embedding = torch.cat(
                 [negative_text_encoder_3_prompt_embedding, text_encoder_3_prompt_embedding], dim=0)
@@ -90,9 +94,6 @@ class HiDreamSampler(BaseModelSampler):
             combined_pooled_prompt_embedding = torch.cat(
                 [negative_pooled_prompt_embedding, pooled_prompt_embedding], dim=0)
 
-            self.model.text_encoder_to(self.temp_device)
-            torch_gc()
-
             # prepare latent image
             latent_image = torch.randn(
                 size=(1, num_latent_channels, height // vae_scale_factor, width // vae_scale_factor),
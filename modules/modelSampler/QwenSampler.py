@@ -63,19 +63,18 @@ class QwenSampler(BaseModelSampler):
             num_latent_channels = 16
 
             # prepare prompt
-            self.model.text_encoder_to(self.train_device)
-
             #unlike other models, Qwen benefits from CFG but is still quite good at CFG 1. Optimize for that:
             batch_size = 2 if cfg_scale > 1.0 else 1
-            combined_prompt_embedding, text_attention_mask = self.model.encode_text(
-                text=[prompt, negative_prompt] if cfg_scale > 1.0 else prompt,
-                batch_size=batch_size,
-                train_device=self.train_device,
+            combined_prompt_embedding, text_attention_mask = self._encode_prompt_cached(
+                (prompt, negative_prompt if cfg_scale > 1.0 else None),
+                self.model.text_encoder_to,
+                lambda: self.model.encode_text(
+                    text=[prompt, negative_prompt] if cfg_scale > 1.0 else prompt,
+                    batch_size=batch_size,
+                    train_device=self.train_device,
+                ),
             )
 
-            self.model.text_encoder_to(self.temp_device)
-            torch_gc()
-
             # prepare latent image
             latent_image = torch.randn(
                 size=(1, num_latent_channels, 1, height // vae_scale_factor, width // vae_scale_factor),
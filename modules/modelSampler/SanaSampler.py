@@ -61,26 +61,27 @@ class SanaSampler(BaseModelSampler):
             vae_scale_factor = self.pipeline.vae_scale_factor
 
             # prepare prompt
-            self.model.text_encoder_to(self.train_device)
-
-            prompt_embedding, tokens_attention_mask = self.model.encode_text(
-                text=prompt,
-                train_device=self.train_device,
-                text_encoder_layer_skip=text_encoder_layer_skip,
-            )
-
-            negative_prompt_embedding, negative_tokens_attention_mask = self.model.encode_text(
-                text=negative_prompt,
-                train_device=self.train_device,
-                text_encoder_layer_skip=text_encoder_layer_skip,
-            )
+            (prompt_embedding, tokens_attention_mask), (negative_prompt_embedding, negative_tokens_attention_mask) = \
+                self._encode_prompt_cached(
+                    (prompt, negative_prompt, text_encoder_layer_skip),
+                    self.model.text_encoder_to,
+                    lambda: (
+                        self.model.encode_text(
+                            text=prompt,
+                            train_device=self.train_device,
+                            text_encoder_layer_skip=text_encoder_layer_skip,
+                        ),
+                        self.model.encode_text(
+                            text=negative_prompt,
+                            train_device=self.train_device,
+                            text_encoder_layer_skip=text_encoder_layer_skip,
+                        ),
+                    ),
+                )
 
             combined_prompt_embedding = torch.cat([negative_prompt_embedding, prompt_embedding])
             combined_prompt_attention_mask = torch.cat([negative_tokens_attention_mask, tokens_attention_mask])
 
-            self.model.text_encoder_to(self.temp_device)
-            torch_gc()
-
             # prepare timesteps
             noise_scheduler.set_timesteps(diffusion_steps, device=self.train_device)
             timesteps = noise_scheduler.timesteps
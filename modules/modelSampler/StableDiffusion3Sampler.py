@@ -64,35 +64,37 @@ class StableDiffusion3Sampler(BaseModelSampler):
             vae_scale_factor = self.pipeline.vae_scale_factor
 
             # prepare prompt
-            self.model.text_encoder_to(self.train_device)
-
-            prompt_embedding, pooled_prompt_embedding = self.model.combine_text_encoder_output(
-                *self.model.encode_text(
-                    text=prompt,
-                    train_device=self.train_device,
-                    text_encoder_1_layer_skip=text_encoder_1_layer_skip,
-                    text_encoder_2_layer_skip=text_encoder_2_layer_skip,
-                    text_encoder_3_layer_skip=text_encoder_3_layer_skip,
-                    apply_attention_mask=transformer_attention_mask,
-                ))
-
-            negative_prompt_embedding, negative_pooled_prompt_embedding = self.model.combine_text_encoder_output(
-                *self.model.encode_text(
-                    text=negative_prompt,
-                    train_device=self.train_device,
-                    text_encoder_1_layer_skip=text_encoder_1_layer_skip,
-                    text_encoder_2_layer_skip=text_encoder_2_layer_skip,
-                    text_encoder_3_layer_skip=text_encoder_3_layer_skip,
-                    apply_attention_mask=transformer_attention_mask,
-                ))
+            (prompt_embedding, pooled_prompt_embedding), (negative_prompt_embedding, negative_pooled_prompt_embedding) = \
+                self._encode_prompt_cached(
+                    (prompt, negative_prompt, text_encoder_1_layer_skip, text_encoder_2_layer_skip,
+                     text_encoder_3_layer_skip, transformer_attention_mask),
+                    self.model.text_encoder_to,
+                    lambda: (
+                        self.model.combine_text_encoder_output(
+                            *self.model.encode_text(
+                                text=prompt,
+                                train_device=self.train_device,
+                                text_encoder_1_layer_skip=text_encoder_1_layer_skip,
+                                text_encoder_2_layer_skip=text_encoder_2_layer_skip,
+                                text_encoder_3_layer_skip=text_encoder_3_layer_skip,
+                                apply_attention_mask=transformer_attention_mask,
+                            )),
+                        self.model.combine_text_encoder_output(
+                            *self.model.encode_text(
+                                text=negative_prompt,
+                                train_device=self.train_device,
+                                text_encoder_1_layer_skip=text_encoder_1_layer_skip,
+                                text_encoder_2_layer_skip=text_encoder_2_layer_skip,
+                                text_encoder_3_layer_skip=text_encoder_3_layer_skip,
+                                apply_attention_mask=transformer_attention_mask,
+                            )),
+                    ),
+                )
 
             combined_prompt_embedding = torch.cat([negative_prompt_embedding, prompt_embedding], dim=0)
             combined_pooled_prompt_embedding = torch.cat(
                 [negative_pooled_prompt_embedding, pooled_prompt_embedding], dim=0)
 
-            self.model.text_encoder_to(self.temp_device)
-            torch_gc()
-
             # prepare timesteps
             noise_scheduler.set_timesteps(diffusion_steps, device=self.train_device)
             timesteps = noise_scheduler.timesteps
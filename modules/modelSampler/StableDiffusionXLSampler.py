@@ -35,6 +35,27 @@ class StableDiffusionXLSampler(BaseModelSampler):
         self.model_type = model_type
         self.pipeline = model.create_pipeline()
 
+    def __encode_prompt(
+            self,
+            prompt: str,
+            negative_prompt: str,
+            text_encoder_1_layer_skip: int,
+            text_encoder_2_layer_skip: int,
+    ):
+        def encode(text: str):
+            return self.model.combine_text_encoder_output(*self.model.encode_text(
+                text=text,
+                train_device=self.train_device,
+                text_encoder_1_layer_skip=text_encoder_1_layer_skip,
+                text_encoder_2_layer_skip=text_encoder_2_layer_skip,
+            ))
+
+        return self._encode_prompt_cached(
+            (prompt, negative_prompt, text_encoder_1_layer_skip, text_encoder_2_layer_skip),
+            self.model.text_encoder_to,
+            lambda: (encode(prompt), encode(negative_prompt)),
+        )
+
     @torch.no_grad()
     def __sample_base(
             self,
@@ -67,28 +88,12 @@ class StableDiffusionXLSampler(BaseModelSampler):
             vae_scale_factor = self.pipeline.vae_scale_factor
 
             # prepare prompt
-            self.model.text_encoder_to(self.train_device)
-
-            prompt_embedding, pooled_text_encoder_2_output = self.model.combine_text_encoder_output(*self.model.encode_text(
-                text=prompt,
-                train_device=self.train_device,
-                text_encoder_1_layer_skip=text_encoder_1_layer_skip,
-                text_encoder_2_layer_skip=text_encoder_2_layer_skip,
-            ))
-
-            negative_prompt_embedding, negative_pooled_text_encoder_2_output = self.model.combine_text_encoder_output(*self.model.encode_text(
-                text=negative_prompt,
-                train_device=self.train_device,
-                text_encoder_1_layer_skip=text_encoder_1_layer_skip,
-                text_encoder_2_layer_skip=text_encoder_2_layer_skip,
-            ))
+            (prompt_embedding, pooled_text_encoder_2_output), (negative_prompt_embedding, negative_pooled_text_encoder_2_output) = \
+                self.__encode_prompt(prompt, negative_prompt, text_encoder_1_layer_skip, text_encoder_2_layer_skip)
 
             combined_prompt_embedding = torch.cat([negative_prompt_embedding, prompt_embedding]) \
                 .to(dtype=self.model.train_dtype.torch_dtype())
 
-            self.model.text_encoder_to(self.temp_device)
-            torch_gc()
-
             # prepare timesteps
             noise_scheduler.set_timesteps(diffusion_steps, device=self.train_device)
             timesteps = noise_scheduler.timesteps
@@ -305,30 +310,12 @@ class StableDiffusionXLSampler(BaseModelSampler):
             torch_gc()
 
             # prepare prompt
-            self.model.text_encoder_to(self.train_device)
-
-            prompt_embedding, pooled_text_encoder_2_output = self.model.combine_text_encoder_output(
-                *self.model.encode_text(
-                    text=prompt,
-                    train_device=self.train_device,
-                    text_encoder_1_layer_skip=text_encoder_1_layer_skip,
-                    text_encoder_2_layer_skip=text_encoder_2_layer_skip,
-                ))
-
-            negative_prompt_embedding, negative_pooled_text_encoder_2_output = self.model.combine_text_encoder_output(
-                *self.model.encode_text(
-                    text=negative_prompt,
-                    train_device=self.train_device,
-                    text_encoder_1_layer_skip=text_encoder_1_layer_skip,
-                    text_encoder_2_layer_skip=text_encoder_2_layer_skip,
-                ))
+            (prompt_embedding, pooled_text_encoder_2_output), (negative_prompt_embedding, negative_pooled_text_encoder_2_output) = \
+                self.__encode_prompt(prompt, negative_prompt, text_encoder_1_layer_skip, text_encoder_2_layer_skip)
 
             combined_prompt_embedding = torch.cat([negative_prompt_embedding, prompt_embedding]) \
                 .to(dtype=self.model.train_dtype.torch_dtype())
 
-            self.model.text_encoder_to(self.temp_device)
-            torch_gc()
-
             # prepare timesteps
             noise_scheduler.set_timesteps(diffusion_steps, device=self.train_device)
             timesteps = noise_scheduler.timesteps
@@ -47,19 +47,23 @@ class WuerstchenSampler(BaseModelSampler):
             on_update_progress,
     ):
         # prepare prompt
-        self.model.prior_text_encoder_to(self.train_device)
-
-        prompt_embedding, pooled_prompt_embedding = self.model.encode_text(
-            text=prompt,
-            train_device=self.train_device,
-            text_encoder_layer_skip=text_encoder_layer_skip,
-        )
-
-        negative_prompt_embedding, pooled_negative_prompt_embedding = self.model.encode_text(
-            text=negative_prompt,
-            train_device=self.train_device,
-            text_encoder_layer_skip=text_encoder_layer_skip,
-        )
+        (prompt_embedding, pooled_prompt_embedding), (negative_prompt_embedding, pooled_negative_prompt_embedding) = \
+            self._encode_prompt_cached(
+                (prompt, negative_prompt, text_encoder_layer_skip),
+                self.model.prior_text_encoder_to,
+                lambda: (
+                    self.model.encode_text(
+                        text=prompt,
+                        train_device=self.train_device,
+                        text_encoder_layer_skip=text_encoder_layer_skip,
+                    ),
+                    self.model.encode_text(
+                        text=negative_prompt,
+                        train_device=self.train_device,
+                        text_encoder_layer_skip=text_encoder_layer_skip,
+                    ),
+                ),
+            )
 
         combined_prompt_embedding = torch.cat([negative_prompt_embedding, prompt_embedding]) \
             .to(dtype=self.model.prior_train_dtype.torch_dtype())
@@ -67,9 +71,6 @@ class WuerstchenSampler(BaseModelSampler):
             combined_pooled_prompt_embedding = torch.cat([pooled_negative_prompt_embedding, pooled_prompt_embedding]) \
                 .to(dtype=self.model.prior_train_dtype.torch_dtype())
 
-        self.model.prior_text_encoder_to(self.temp_device)
-        torch_gc()
-
         # prepare timesteps
         prior_noise_scheduler.set_timesteps(diffusion_steps, device=self.train_device)
         timesteps = prior_noise_scheduler.timesteps
@@ -157,39 +158,39 @@ class WuerstchenSampler(BaseModelSampler):
             on_update_progress,
     ):
         # prepare prompt
-        if self.model_type.is_wuerstchen_v2():
-            self.model.decoder_text_encoder_to(self.train_device)
-        elif self.model_type.is_stable_cascade():
-            self.model.prior_text_encoder_to(self.train_device)
-        tokenizer_output = decoder_tokenizer(
-            prompt,
-            padding='max_length',
-            truncation=True,
-            max_length=decoder_tokenizer.model_max_length,
-            return_tensors="pt",
-        )
-        tokens = tokenizer_output.input_ids.to(self.train_device)
-        tokens_attention_mask = tokenizer_output.attention_mask.to(self.train_device)
-
-        text_encoder_output = decoder_text_encoder(
-            tokens,
-            attention_mask=tokens_attention_mask,
-            return_dict=True,
-            output_hidden_states=True,
-        )
-        final_layer_norm = decoder_text_encoder.text_model.final_layer_norm
-        prompt_embedding = final_layer_norm(
-            text_encoder_output.hidden_states[-(1 + text_encoder_layer_skip)]
-        )
+        def encode_decoder_text():
+            tokenizer_output = decoder_tokenizer(
+                prompt,
+                padding='max_length',
+                truncation=True,
+                max_length=decoder_tokenizer.model_max_length,
+                return_tensors="pt",
+            )
+            tokens = tokenizer_output.input_ids.to(self.train_device)
+            tokens_attention_mask = tokenizer_output.attention_mask.to(self.train_device)
+
+            text_encoder_output = decoder_text_encoder(
+                tokens,
+                attention_mask=tokens_attention_mask,
+                return_dict=True,
+                output_hidden_states=True,
+            )
 
-        if self.model_type.is_stable_cascade():
-            prompt_embedding = text_encoder_output.text_embeds.unsqueeze(1)
+            if self.model_type.is_stable_cascade():
+                return text_encoder_output.text_embeds.unsqueeze(1)
 
-        if self.model_type.is_wuerstchen_v2():
-            self.model.decoder_text_encoder_to(self.temp_device)
-        elif self.model_type.is_stable_cascade():
-            self.model.prior_text_encoder_to(self.temp_device)
-        torch_gc()
+            final_layer_norm = decoder_text_encoder.text_model.final_layer_norm
+            return final_layer_norm(
+                text_encoder_output.hidden_states[-(1 + text_encoder_layer_skip)]
+            )
+
+        # the key of the decoder prompt has a different length than the key of the prior prompt
+        prompt_embedding = self._encode_prompt_cached(
+            (prompt, text_encoder_layer_skip),
+            self.model.decoder_text_encoder_to if self.model_type.is_wuerstchen_v2()
+            else self.model.prior_text_encoder_to,
+            encode_decoder_text,
+        )
 
         # prepare timesteps
         decoder_noise_scheduler.set_timesteps(10, device=self.train_device)
@@ -3,8 +3,7 @@ import os
 from abc import ABCMeta
 
 from modules.model.BaseModel import BaseModel
-
-import torch
+from modules.util.state_dict_util import save_state_dict
 
 
 class InternalModelSaverMixin(metaclass=ABCMeta):
@@ -23,12 +22,12 @@ class InternalModelSaverMixin(metaclass=ABCMeta):
         optimizer_state_dict["param_group_optimizer_mapping"] = \
             [str(model.train_config.optimizer.optimizer) for _ in model.param_group_mapping]
 
-        torch.save(optimizer_state_dict, os.path.join(destination, "optimizer", "optimizer.pt"))
+        save_state_dict(optimizer_state_dict, os.path.join(destination, "optimizer"), "optimizer")
 
         # ema
         if model.ema:
             os.makedirs(os.path.join(destination, "ema"), exist_ok=True)
-            torch.save(model.ema.state_dict(), os.path.join(destination, "ema", "ema.pt"))
+            save_state_dict(model.ema.state_dict(), os.path.join(destination, "ema"), "ema")
 
         # meta
         with open(os.path.join(destination, "meta.json"), "w") as meta_file:
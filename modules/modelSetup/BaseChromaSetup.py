@@ -51,9 +51,11 @@ class BaseChromaSetup(
         if config.gradient_checkpointing.enabled():
             model.transformer_offload_conductor = \
                 enable_checkpointing_for_chroma_transformer(model.transformer, config)
+            model.transformer_offload_conductor.set_offload_compression(config.transformer.offload_compression)
             if model.text_encoder is not None:
                 model.text_encoder_offload_conductor = \
                     enable_checkpointing_for_t5_encoder_layers(model.text_encoder, config)
+                model.text_encoder_offload_conductor.set_offload_compression(config.text_encoder.offload_compression)
 
         if config.force_circular_padding: #TODO useful for Chroma?
             apply_circular_padding_to_conv2d(model.vae)
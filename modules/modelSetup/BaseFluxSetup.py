@@ -50,11 +50,13 @@ class BaseFluxSetup(
         if config.gradient_checkpointing.enabled():
             model.transformer_offload_conductor = \
                 enable_checkpointing_for_flux_transformer(model.transformer, config)
+            model.transformer_offload_conductor.set_offload_compression(config.transformer.offload_compression)
             if model.text_encoder_1 is not None:
                 enable_checkpointing_for_clip_encoder_layers(model.text_encoder_1, config)
             if model.text_encoder_2 is not None:
                 model.text_encoder_2_offload_conductor = \
                     enable_checkpointing_for_t5_encoder_layers(model.text_encoder_2, config)
+                model.text_encoder_2_offload_conductor.set_offload_compression(config.text_encoder_2.offload_compression)
 
         if config.force_circular_padding:
             apply_circular_padding_to_conv2d(model.vae)
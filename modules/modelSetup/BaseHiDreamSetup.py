@@ -50,6 +50,7 @@ class BaseHiDreamSetup(
         if config.gradient_checkpointing.enabled():
             model.transformer_offload_conductor = \
                 enable_checkpointing_for_hi_dream_transformer(model.transformer, config)
+            model.transformer_offload_conductor.set_offload_compression(config.transformer.offload_compression)
             if model.text_encoder_1 is not None:
                 enable_checkpointing_for_clip_encoder_layers(model.text_encoder_1, config)
             if model.text_encoder_2 is not None:
@@ -57,9 +58,11 @@ class BaseHiDreamSetup(
             if model.text_encoder_3 is not None:
                 model.text_encoder_3_offload_conductor = \
                     enable_checkpointing_for_t5_encoder_layers(model.text_encoder_3, config)
+                model.text_encoder_3_offload_conductor.set_offload_compression(config.text_encoder_3.offload_compression)
             if model.text_encoder_4 is not None:
                 model.text_encoder_4_offload_conductor = \
                     enable_checkpointing_for_llama_encoder_layers(model.text_encoder_4, config)
+                model.text_encoder_4_offload_conductor.set_offload_compression(config.text_encoder_4.offload_compression)
 
         model.autocast_context, model.train_dtype = create_autocast_context(self.train_device, config.train_dtype, [
             config.weight_dtypes().transformer,
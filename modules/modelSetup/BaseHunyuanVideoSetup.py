@@ -51,9 +51,11 @@ class BaseHunyuanVideoSetup(
         if config.gradient_checkpointing.enabled():
             model.transformer_offload_conductor = \
                 enable_checkpointing_for_hunyuan_video_transformer(model.transformer, config)
+            model.transformer_offload_conductor.set_offload_compression(config.transformer.offload_compression)
             if model.text_encoder_1 is not None:
                 model.text_encoder_1_offload_conductor = \
                     enable_checkpointing_for_llama_encoder_layers(model.text_encoder_1, config)
+                model.text_encoder_1_offload_conductor.set_offload_compression(config.text_encoder.offload_compression)
             if model.text_encoder_2 is not None:
                 enable_checkpointing_for_clip_encoder_layers(model.text_encoder_2, config)
 
@@ -48,9 +48,11 @@ class BaseQwenSetup(
         if config.gradient_checkpointing.enabled():
             model.transformer_offload_conductor = \
                 enable_checkpointing_for_qwen_transformer(model.transformer, config)
+            model.transformer_offload_conductor.set_offload_compression(config.transformer.offload_compression)
             if model.text_encoder is not None:
                 model.text_encoder_offload_conductor = \
                     enable_checkpointing_for_qwen_encoder_layers(model.text_encoder, config)
+                model.text_encoder_offload_conductor.set_offload_compression(config.text_encoder.offload_compression)
 
         if config.force_circular_padding: #TODO useful for Qwen?
             apply_circular_padding_to_conv2d(model.vae)
@@ -55,8 +55,10 @@ class BaseSanaSetup(
             # model.vae.enable_gradient_checkpointing()
             model.transformer_offload_conductor = \
                 enable_checkpointing_for_sana_transformer(model.transformer, config)
+            model.transformer_offload_conductor.set_offload_compression(config.transformer.offload_compression)
             model.text_encoder_offload_conductor = \
                 enable_checkpointing_for_gemma_layers(model.text_encoder, config)
+            model.text_encoder_offload_conductor.set_offload_compression(config.text_encoder.offload_compression)
 
         if config.force_circular_padding:
             apply_circular_padding_to_conv2d(model.vae)
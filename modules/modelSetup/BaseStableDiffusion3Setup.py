@@ -49,6 +49,7 @@ class BaseStableDiffusion3Setup(
         if config.gradient_checkpointing.enabled():
             model.transformer_offload_conductor = \
                 enable_checkpointing_for_stable_diffusion_3_transformer(model.transformer, config)
+            model.transformer_offload_conductor.set_offload_compression(config.transformer.offload_compression)
             if model.text_encoder_1 is not None:
                 enable_checkpointing_for_clip_encoder_layers(model.text_encoder_1, config)
             if model.text_encoder_2 is not None:
@@ -56,6 +57,7 @@ class BaseStableDiffusion3Setup(
             if model.text_encoder_3 is not None:
                 model.text_encoder_3_offload_conductor = \
                     enable_checkpointing_for_t5_encoder_layers(model.text_encoder_3, config)
+                model.text_encoder_3_offload_conductor.set_offload_compression(config.text_encoder_3.offload_compression)
 
         if config.force_circular_padding:
             apply_circular_padding_to_conv2d(model.vae)
@@ -3,9 +3,11 @@ import math
 from abc import abstractmethod
 from collections import defaultdict
 from collections.abc import Mapping
+from contextlib import contextmanager
 from typing import Any
 
 from modules.module.oft_utils import OFTRotationModule
+from modules.module.quantized.mixin.QuantizedModuleMixin import QuantizedModuleMixin
 from modules.util.config.TrainConfig import TrainConfig
 from modules.util.enum.ModelType import PeftType
 from modules.util.ModuleFilter import ModuleFilter
@@ -26,6 +28,7 @@ class PeftBase(nn.Module):
     prefix: str
     layer_kwargs: dict  # Applied during the forward op() call.
     _initialized: bool  # Tracks whether we've created the layers or not.
+    _merge_backup: dict | None  # State of orig_module while the adapter is merged into it.
 
     def __init__(self, prefix: str, orig_module: nn.Module | None):
         super().__init__()
@@ -34,6 +37,7 @@ class PeftBase(nn.Module):
         self.is_applied = False
         self.layer_kwargs = {}
         self._initialized = False
+        self._merge_backup = None
 
         if orig_module is not None:
             match orig_module:
@@ -125,6 +129,62 @@ class PeftBase(nn.Module):
     def extract_from_module(self, base_module: nn.Module):
         pass
 
+    def merged_weight(self, orig_weight: Tensor) -> Tensor | None:
+        """Returns the weight of orig_module with the adapter merged into it.
+
+        orig_weight is the unquantized float32 weight of orig_module. Returns
+        None if the adapter can't be expressed as a weight change, in which
+        case the module keeps using the hooked forward pass.
+        """
+        return None
+
+    @torch.no_grad()
+    def merge_into_module(self, compute_device: torch.device, backup_device: torch.device) -> bool:
+        """Temporarily replaces the weight of orig_module with the merged weight.
+
+        The original weight is moved to backup_device and restored unchanged
+        by unmerge_from_module(). While merged, the hook is bypassed, so every
+        forward call only runs a single op. Only unquantized floating point
+        weights are merged.
+
+        Returns True if the module was merged.
+        """
+        if not self.is_applied or self._orig_module is None or self._merge_backup is not None:
+            return False
+
+        orig_module = self.orig_module
+        weight = orig_module.weight
+        if (isinstance(orig_module, QuantizedModuleMixin) and orig_module.is_quantized) \
+                or not weight.is_floating_point():
+            # quantizing the merged weight again would mostly erase the LoRA update
+            return False
+
+        merged_weight = self.merged_weight(weight.detach().to(device=compute_device, dtype=torch.float32))
+        if merged_weight is None:
+            return False
+
+        self._merge_backup = {
+            "weight": weight.data.to(device=backup_device),
+        }
+
+        weight.data = merged_weight.to(device=weight.device, dtype=weight.dtype)
+        del merged_weight
+
+        orig_module.forward = self.orig_forward
+        return True
+
+    @torch.no_grad()
+    def unmerge_from_module(self):
+        """Restores the exact state of orig_module from before merge_into_module()."""
+        if self._merge_backup is None:
+            return
+
+        orig_module = self.orig_module
+        orig_module.weight.data = self._merge_backup["weight"].to(device=orig_module.weight.device)
+
+        orig_module.forward = self.forward
+        self._merge_backup = None
+
     def create_layer(self) -> tuple[nn.Module, nn.Module]:
         """Generic helper function for creating a PEFT layer, like LoRA.
 
@@ -274,6 +334,14 @@ class LoHaModule(PeftBase):
         W = (W1 * W2) * (self.alpha / self.rank)
         return self.orig_forward(x) + self.op(x, W, bias=None, **self.layer_kwargs)
 
+    def merged_weight(self, orig_weight: Tensor) -> Tensor | None:
+        self.check_initialized()
+
+        device = orig_weight.device
+        W1 = self.make_weight(self.hada_w1_b.float().to(device), self.hada_w1_a.float().to(device))
+        W2 = self.make_weight(self.hada_w2_b.float().to(device), self.hada_w2_a.float().to(device))
+        return orig_weight + (W1 * W2) * (self.alpha.item() / self.rank)
+
     def apply_to_module(self):
         # TODO
         pass
@@ -325,6 +393,16 @@ class LoRAModule(PeftBase):
         ld = self.lora_up(self.dropout(self.lora_down(x)))
         return self.orig_forward(x) + ld * (self.alpha / self.rank)
 
+    def merged_weight(self, orig_weight: Tensor) -> Tensor | None:
+        self.check_initialized()
+
+        if self.layer_kwargs.get("groups", 1) != 1:
+            return None
+
+        device = orig_weight.device
+        W = self.make_weight(self.lora_down.weight.float().to(device), self.lora_up.weight.float().to(device))
+        return orig_weight + W * (self.alpha.item() / self.rank)
+
     def apply_to_module(self):
         # TODO
         pass
@@ -450,6 +528,28 @@ class OFTModule(PeftBase):
 
         return self.op(x, rotated_weight, self.orig_module.bias, **self.layer_kwargs)
 
+    def merged_weight(self, orig_weight: Tensor) -> Tensor | None:
+        self.check_initialized()
+
+        Q = self.oft_R.weight.float().to(orig_weight.device)
+        if self.coft:
+            Q = self.oft_R._project_batch(Q, coft_eps=self.coft_eps)
+        orth_rotate = self.oft_R._cayley_batch(
+            Q, self.oft_R.block_size, self.oft_R.use_cayley_neumann, self.oft_R.num_cayley_neumann_terms
+        )
+
+        if self.block_share:
+            orth_rotate = orth_rotate.repeat(self.rank, 1, 1)
+
+        weight_reshaped = orig_weight.reshape(orig_weight.shape[0], self.rank, self.oft_block_size)
+        if isinstance(self.orig_module, nn.Linear):
+            # rotating the input by R is the same as multiplying the weight with R transposed
+            rotated_weight_reshaped = torch.einsum("orc,rkc->ork", weight_reshaped, orth_rotate)
+        else:
+            rotated_weight_reshaped = torch.einsum("ork,rkc->orc", weight_reshaped, orth_rotate)
+
+        return rotated_weight_reshaped.reshape(orig_weight.shape)
+
     def apply_to_module(self):
         # TODO
         pass
@@ -522,6 +622,17 @@ class DoRAModule(LoRAModule):
         super().check_initialized()
         assert self.dora_scale is not None
 
+    def merged_weight(self, orig_weight: Tensor) -> Tensor | None:
+        self.check_initialized()
+
+        device = orig_weight.device
+        return self.__decomposed_weight(
+            orig_weight,
+            self.lora_down.weight.float().to(device),
+            self.lora_up.weight.float().to(device),
+            self.dora_scale.float().to(device),
+        )
+
     def forward(self, x, *args, **kwargs):
         self.check_initialized()
         A = self.lora_down.weight
@@ -533,8 +644,18 @@ class DoRAModule(LoRAModule):
             assert isinstance(self.orig_module, nn.Conv2d)
             orig_weight = self.orig_module.weight.detach().float()
 
-        WP = orig_weight + (self.make_weight(A, B) * (self.alpha / self.rank))
+        WP = self.__decomposed_weight(orig_weight, A, B, self.dora_scale)
         del orig_weight
+        # In the DoRA codebase (and thus the paper results), they perform
+        # dropout on the *input*, rather than between layers, so we duplicate
+        # that here.
+        return self.op(self.dropout(x),
+                       WP,
+                       self.orig_module.bias,
+                       **self.layer_kwargs)
+
+    def __decomposed_weight(self, orig_weight: Tensor, A: Tensor, B: Tensor, dora_scale: Tensor) -> Tensor:
+        WP = orig_weight + (self.make_weight(A, B) * (self.alpha / self.rank))
         # A norm should never really end up zero at any point, but epsilon just
         # to be safe if we underflow or something. Also, as per section 4.3 of
         # the paper, we treat the norm as a constant for the purposes of
@@ -554,14 +675,7 @@ class DoRAModule(LoRAModule):
                     .norm(dim=1, keepdim=True) \
                     .reshape(WP.shape[1], *[1] * self.dora_num_dims) \
                     .transpose(0, 1) + eps
-        WP = self.dora_scale * (WP / norm)
-        # In the DoRA codebase (and thus the paper results), they perform
-        # dropout on the *input*, rather than between layers, so we duplicate
-        # that here.
-        return self.op(self.dropout(x),
-                       WP,
-                       self.orig_module.bias,
-                       **self.layer_kwargs)
+        return dora_scale * (WP / norm)
 
 
 DummyLoRAModule = LoRAModule.make_dummy()
@@ -793,6 +907,28 @@ class LoRAModuleWrapper:
         for module in self.lora_modules.values():
             module.extract_from_module(base_module)
 
+    @contextmanager
+    def merged_into_module(self, compute_device: torch.device, backup_device: torch.device):
+        """
+        Temporarily merges the LoRA into the weights of the module, so each adapted layer only runs a single op.
+        The original weights are kept on backup_device and restored exactly when the context exits.
+
+        Args:
+            compute_device: the device used to calculate the merged weights
+            backup_device: the device used to store the original weights
+        """
+        merged_modules = []
+        try:
+            # extend() appends while iterating, so the modules merged before an error are still unmerged
+            merged_modules.extend(
+                module for module in self.lora_modules.values()
+                if module.merge_into_module(compute_device, backup_device)
+            )
+            yield
+        finally:
+            for module in reversed(merged_modules):
+                module.unmerge_from_module()
+
     def prune(self):
         """
         Removes all dummy modules
@@ -63,14 +63,18 @@ class CloudTrainer(BaseTrainer):
 
         self.stop_event=threading.Event()
 
+        def exec_callback():
+            #exec_callback waits for new callbacks itself:
+            try:
+                self.cloud.exec_callback(self.callbacks)
+            except Exception:
+                traceback.print_exc()
+                self.callbacks.on_update_status("error: check the console for more information")
+                time.sleep(1)
+
         def callback():
             while not self.stop_event.is_set():
-                try:
-                    self.cloud.exec_callback(self.callbacks)
-                except Exception:
-                    traceback.print_exc()
-                    self.callbacks.on_update_status("error: check the console for more information")
-                time.sleep(1)
+                exec_callback()
 
         self.callback_thread = threading.Thread(target=callback)
         self.callback_thread.start()
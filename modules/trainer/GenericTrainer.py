@@ -4,6 +4,7 @@ import json
 import math
 import os
 import shutil
+import time
 import traceback
 from collections.abc import Callable
 from pathlib import Path
@@ -17,6 +18,7 @@ from modules.modelSaver.BaseModelSaver import BaseModelSaver
 from modules.modelSetup.BaseModelSetup import BaseModelSetup
 from modules.trainer.BaseTrainer import BaseTrainer
 from modules.util import create, path_util
+from modules.util.BackupStore import BackupStore
 from modules.util.bf16_stochastic_rounding import set_seed as bf16_stochastic_rounding_set_seed
 from modules.util.callbacks.TrainCallbacks import TrainCallbacks
 from modules.util.commands.TrainCommands import TrainCommands
@@ -29,7 +31,11 @@ from modules.util.enum.FileType import FileType
 from modules.util.enum.ModelFormat import ModelFormat
 from modules.util.enum.TimeUnit import TimeUnit
 from modules.util.enum.TrainingMethod import TrainingMethod
+from modules.util.LayerOffloadConductor import LayerOffloadConductor
+from modules.util.MemoryReport import MemoryReport
 from modules.util.profiling_util import TorchMemoryRecorder, TorchProfiler
+from modules.util.PromptEmbeddingCache import PromptEmbeddingCache
+from modules.util.SamplingWorker import SamplingWorker, SamplingWorkerMessage
 from modules.util.time_util import get_string_timestamp
 from modules.util.torch_util import torch_gc
 from modules.util.TrainProgress import TrainProgress
@@ -64,6 +70,8 @@ class GenericTrainer(BaseTrainer):
 
     grad_hook_handles: list[RemovableHandle]
 
+    backup_store: BackupStore
+
     def __init__(self, config: TrainConfig, callbacks: TrainCallbacks, commands: TrainCommands):
         super().__init__(config, callbacks, commands)
 
@@ -77,6 +85,8 @@ class GenericTrainer(BaseTrainer):
         self.model = None
         self.one_step_trained = False
         self.grad_hook_handles = []
+        self.sampling_worker = None
+        self.backup_store = BackupStore(os.path.join(config.workspace_dir, "backup_store"))
 
     def start(self):
         if multi.is_master():
@@ -101,6 +111,15 @@ class GenericTrainer(BaseTrainer):
             last_backup_path = self.config.get_last_backup_path()
 
             if last_backup_path:
+                if BackupStore.is_deduplicated(last_backup_path):
+                    self.callbacks.on_update_status("restoring backup")
+                    # restored once by the master, the other ranks load the same files
+                    for _ in multi.master_first():
+                        if multi.is_master():
+                            last_backup_path = self.backup_store.restore_for_loading(last_backup_path)
+                        else:
+                            last_backup_path = self.backup_store.restored_path(last_backup_path)
+
                 if self.config.training_method == TrainingMethod.LORA:
                     model_names.lora = last_backup_path
                 elif self.config.training_method == TrainingMethod.EMBEDDING:
@@ -122,6 +141,10 @@ class GenericTrainer(BaseTrainer):
 
         self.callbacks.on_update_status("loading the model")
 
+        self.model_loader.set_parallel_loading(
+            self.config.model_loading_threads,
+            int(self.config.model_loading_memory_budget * (1024 ** 3)) if self.config.model_loading_memory_budget > 0 else None,
+        )
         self.model = self.model_loader.load(
             model_type=self.config.model_type,
             model_names=model_names,
@@ -134,6 +157,8 @@ class GenericTrainer(BaseTrainer):
         self.model_setup.setup_optimizations(self.model, self.config)
         self.model_setup.setup_train_device(self.model, self.config)
         self.model_setup.setup_model(self.model, self.config)
+        if multi.is_master():
+            self.__report_memory("after model setup", "memory/setup")
         self.model.to(self.temp_device)
         self.model.eval()
         torch_gc()
@@ -146,16 +171,32 @@ class GenericTrainer(BaseTrainer):
         self.model_saver = self.create_model_saver()
 
         self.model_sampler = self.create_model_sampler(self.model)
+        self.model_sampler.prompt_embedding_cache = PromptEmbeddingCache()
         self.previous_sample_time = -1
         self.sample_queue = []
 
         self.parameters = self.model.parameters.parameters()
 
+        if self.config.sampling_worker and multi.is_master():
+            self.callbacks.on_update_status("starting the sampling worker")
+            self.sampling_worker = SamplingWorker(
+                config=self.config,
+                model_names=model_names,
+                parameters=self.parameters,
+                ema_parameters=self.model.ema.ema_parameters if self.model.ema else None,
+            )
+
         if self.config.validation:
             self.validation_data_loader = self.create_data_loader(
                 self.model, self.model.train_progress, is_validation=True
             )
 
+    def __report_memory(self, stage: str, tensorboard_prefix: str):
+        report = MemoryReport()
+        report.add_model(self.model)
+        print(f"Memory usage {stage}:\n{report.format_table()}")
+        report.log_to_tensorboard(self.tensorboard, self.model.train_progress.global_step, tensorboard_prefix)
+
     def __save_config_to_workspace(self):
         path = path_util.canonical_join(self.config.workspace_dir, "config")
         os.makedirs(Path(path).absolute(), exist_ok=True)
@@ -171,7 +212,7 @@ class GenericTrainer(BaseTrainer):
         if os.path.isdir(self.config.cache_dir):
             for filename in os.listdir(self.config.cache_dir):
                 path = os.path.join(self.config.cache_dir, filename)
-                if os.path.isdir(path) and (filename.startswith('epoch-') or filename in ['image', 'text']):
+                if os.path.isdir(path) and (filename.startswith('epoch-') or filename in ['image', 'text', 'layer_offload']):
                     shutil.rmtree(path)
 
     def __prune_backups(self, backups_to_keep: int):
@@ -190,6 +231,17 @@ class GenericTrainer(BaseTrainer):
                 except Exception:
                     print(f"Could not delete old rolling backup {dirpath}")
 
+            # chunks that are not referenced by any remaining backup
+            if os.path.isdir(self.backup_store.store_path):
+                try:
+                    self.backup_store.prune([
+                        os.path.join(backup_dirpath, dirpath) for dirpath in os.listdir(backup_dirpath)
+                        if os.path.isdir(os.path.join(backup_dirpath, dirpath))
+                    ])
+                except Exception:
+                    traceback.print_exc()
+                    print("Could not prune the backup store")
+
         return
 
     def __enqueue_sample_during_training(self, fun: Callable):
@@ -267,12 +319,26 @@ class GenericTrainer(BaseTrainer):
 
                 torch_gc()
 
+    def __merged_adapters(self):
+        # merging the LoRA weights into the base weights skips the adapter branch in every forward call
+        if self.config.merge_lora_for_sampling():
+            return self.model.merged_adapters(self.train_device, self.temp_device)
+        return contextlib.nullcontext()
+
+    def __invalidate_prompt_embedding_cache(self):
+        # cached prompt embeddings are only valid as long as the text encoders and embeddings don't change
+        if self.config.train_any_text_encoder_or_embedding():
+            self.model_sampler.prompt_embedding_cache.invalidate()
+
     def __sample_during_training(
             self,
             train_progress: TrainProgress,
             train_device: torch.device,
             sample_params_list: list[SampleConfig] = None,
     ):
+        sample_start_time = time.perf_counter()
+        self.__invalidate_prompt_embedding_cache()
+
         # Special case for schedule-free optimizers.
         if self.config.optimizer.optimizer.is_schedule_free:
             torch.clear_autocast_cache()
@@ -299,32 +365,54 @@ class GenericTrainer(BaseTrainer):
                 print("Error during loading the sample definition file, proceeding without sampling")
                 sample_params_list = []
 
+        if self.config.sampling_worker:
+            # sampling is done out of band by the master process, the other processes skip it
+            if self.sampling_worker is not None and not self.sampling_worker.submit(
+                    train_progress=train_progress,
+                    sample_config_list=sample_params_list,
+                    is_custom_sample=is_custom_sample,
+                    parameters=self.parameters,
+                    ema_parameters=self.model.ema.ema_parameters if self.model.ema else None,
+                    non_ema_sampling=self.config.non_ema_sampling,
+            ):
+                print("The sampling worker stopped, proceeding without sampling")
+
+            # Special case for schedule-free optimizers.
+            if self.config.optimizer.optimizer.is_schedule_free:
+                torch.clear_autocast_cache()
+                self.model.optimizer.train()
+            return
+
         if self.model.ema:
             #the EMA model only exists in the master process, so EMA sampling is done on one GPU only
             #non-EMA sampling is done on all GPUs
             assert multi.is_master() and self.config.ema != EMAMode.OFF
             self.model.ema.copy_ema_to(self.parameters, store_temp=True)
+            self.__invalidate_prompt_embedding_cache()
 
-        self.__sample_loop(
-            train_progress=train_progress,
-            train_device=train_device,
-            sample_config_list=sample_params_list,
-            is_custom_sample=is_custom_sample,
-            ema_applied = self.config.ema != EMAMode.OFF
-        )
+        with self.__merged_adapters():
+            self.__sample_loop(
+                train_progress=train_progress,
+                train_device=train_device,
+                sample_config_list=sample_params_list,
+                is_custom_sample=is_custom_sample,
+                ema_applied = self.config.ema != EMAMode.OFF
+            )
 
         if self.model.ema:
             self.model.ema.copy_temp_to(self.parameters)
+            self.__invalidate_prompt_embedding_cache()
 
         # ema-less sampling, if ema is enabled:
         if self.config.ema != EMAMode.OFF and not is_custom_sample and self.config.non_ema_sampling:
-            self.__sample_loop(
-                train_progress=train_progress,
-                train_device=train_device,
-                sample_config_list=sample_params_list,
-                folder_postfix=" - no-ema",
-                ema_applied = False,
-            )
+            with self.__merged_adapters():
+                self.__sample_loop(
+                    train_progress=train_progress,
+                    train_device=train_device,
+                    sample_config_list=sample_params_list,
+                    folder_postfix=" - no-ema",
+                    ema_applied = False,
+                )
 
         self.model_setup.setup_train_device(self.model, self.config)
         # Special case for schedule-free optimizers.
@@ -334,6 +422,51 @@ class GenericTrainer(BaseTrainer):
 
         torch_gc()
 
+        if multi.is_master():
+            prompt_embedding_cache = self.model_sampler.prompt_embedding_cache
+            self.tensorboard.add_scalar(
+                "sampling/pause_time", time.perf_counter() - sample_start_time, train_progress.global_step)
+            self.tensorboard.add_scalar(
+                "sampling/prompt_embedding_cache_hits", prompt_embedding_cache.hits, train_progress.global_step)
+            self.tensorboard.add_scalar(
+                "sampling/prompt_embedding_cache_misses", prompt_embedding_cache.misses, train_progress.global_step)
+
+    def __process_sampling_worker_messages(self, timeout: float | None = None):
+        for message in self.sampling_worker.poll(timeout):
+            message_type = message[0]
+            if message_type == SamplingWorkerMessage.SAMPLE:
+                _, is_custom_sample, i, safe_prompt, global_step, sampler_output = message
+                if is_custom_sample:
+                    self.callbacks.on_sample_custom(sampler_output)
+                else:
+                    if self.config.samples_to_tensorboard and sampler_output.file_type == FileType.IMAGE:
+                        self.tensorboard.add_image(
+                            f"sample{str(i)} - {safe_prompt}", pil_to_tensor(sampler_output.data), global_step
+                        )
+                    self.callbacks.on_sample_default(sampler_output)
+            elif message_type == SamplingWorkerMessage.PROGRESS:
+                _, is_custom_sample, progress, max_progress = message
+                if is_custom_sample:
+                    self.callbacks.on_update_sample_custom_progress(progress, max_progress)
+                else:
+                    self.callbacks.on_update_sample_default_progress(progress, max_progress)
+            elif message_type == SamplingWorkerMessage.STATUS:
+                print(f"Sampling worker: {message[1]}")
+            elif message_type == SamplingWorkerMessage.DONE:
+                _, global_step, sample_time = message
+                self.tensorboard.add_scalar("sampling/worker_time", sample_time, global_step)
+            elif message_type == SamplingWorkerMessage.ERROR:
+                print(message[1])
+                print("Error during sampling, proceeding without sampling")
+
+    def __finish_sampling_worker(self):
+        self.callbacks.on_update_status("waiting for the sampling worker")
+        while self.sampling_worker.has_pending_jobs() and self.sampling_worker.is_alive():
+            self.__process_sampling_worker_messages(timeout=1.0)
+        self.__process_sampling_worker_messages()
+        self.sampling_worker.close()
+        self.sampling_worker = None
+
     def __validate(self, train_progress: TrainProgress):
         if self.__needs_validate(train_progress):
             self.validation_data_loader.get_data_set().start_next_epoch()
@@ -438,15 +571,28 @@ class GenericTrainer(BaseTrainer):
             if print_msg:
                 print_cb("Creating Backup " + backup_path)
 
-            self.model_saver.save(
-                self.model,
-                self.config.model_type,
-                ModelFormat.INTERNAL,
-                backup_path,
-                None,
-            )
+            # with deduplication, safetensors files are written into the backup store directly
+            with self.backup_store.stream_safetensors(backup_path) if self.config.deduplicate_backups \
+                    else contextlib.nullcontext():
+                self.model_saver.save(
+                    self.model,
+                    self.config.model_type,
+                    ModelFormat.INTERNAL,
+                    backup_path,
+                    None,
+                )
 
             self.__save_backup_config(backup_path)
+
+            if self.config.deduplicate_backups:
+                stats = self.backup_store.add(backup_path)
+                if print_msg:
+                    print_cb(f"Deduplicated backup: stored {stats.stored_bytes / (1024 * 1024):.1f} MB "
+                             f"of {stats.total_bytes / (1024 * 1024):.1f} MB, "
+                             f"wrote {stats.written_bytes / (1024 * 1024):.1f} MB in {stats.duration:.1f} s")
+                self.tensorboard.add_scalar("backup/stored_mb", stats.stored_bytes / (1024 * 1024), train_progress.global_step)
+                self.tensorboard.add_scalar("backup/written_mb", stats.written_bytes / (1024 * 1024), train_progress.global_step)
+                self.tensorboard.add_scalar("backup/time", stats.duration, train_progress.global_step)
         except Exception:
             traceback.print_exc()
             print("Could not save backup. Check your disk space!")
@@ -614,6 +760,13 @@ class GenericTrainer(BaseTrainer):
             return
 
         scaler = create_grad_scaler() if enable_grad_scaling(self.config.train_dtype, self.parameters) else None
+        if scaler and multi.state_owners:
+            raise ValueError("optimizer state sharding can not be used with gradient scaling")
+        multi.set_gradient_compression(
+            self.config.gradient_compression,
+            self.config.gradient_compression_rank,
+            self.config.gradient_compression_block_size,
+        )
 
         self.__apply_fused_back_pass(scaler)
 
@@ -675,6 +828,8 @@ class GenericTrainer(BaseTrainer):
                 batches = self.data_loader.get_data_loader()
             for batch in batches:
                 multi.sync_commands(self.commands)
+                if self.sampling_worker is not None:
+                    self.__process_sampling_worker_messages()
                 if self.commands.get_stop_command():
                     multi.warn_parameter_divergence(self.parameters, train_device)
 
@@ -705,13 +860,15 @@ class GenericTrainer(BaseTrainer):
                     self.__execute_sample_during_training()
                     backup = self.commands.get_and_reset_backup_command()
                     save = self.commands.get_and_reset_save_command()
-                    if multi.is_master() and (backup or save):
-                        self.model.to(self.temp_device)
-                        if backup:
-                            self.__backup(train_progress, True, step_tqdm.write)
-                        if save:
-                            self.__save(train_progress, True, step_tqdm.write)
-                        self.model_setup.setup_train_device(self.model, self.config)
+                    if backup or save:
+                        with multi.gathered_optimizer_state(self.model.optimizer):
+                            if multi.is_master():
+                                self.model.to(self.temp_device)
+                                if backup:
+                                    self.__backup(train_progress, True, step_tqdm.write)
+                                if save:
+                                    self.__save(train_progress, True, step_tqdm.write)
+                                self.model_setup.setup_train_device(self.model, self.config)
 
                 self.callbacks.on_update_status("Training ...")
 
@@ -766,17 +923,25 @@ class GenericTrainer(BaseTrainer):
                             scaler.update()
                         else:
                             if self.config.clip_grad_norm is not None:
-                                nn.utils.clip_grad_norm_(self.parameters, self.config.clip_grad_norm)
+                                multi.clip_grad_norm_(self.parameters, self.config.clip_grad_norm, train_device)
                             self.model.optimizer.step()
+                        multi.broadcast_sharded_parameters(train_device)
+
+                        if not self.one_step_trained and multi.is_master():
+                            # done before zero_grad, to include the gradients
+                            self.__report_memory("after the first optimizer step", "memory/first_step")
 
                         lr_scheduler.step()  # done before zero_grad, because some lr schedulers need gradients
                         self.model.optimizer.zero_grad(set_to_none=True)
                         has_gradient = False
+                        transferred_bytes = multi.get_and_reset_transferred_bytes()
 
                         if multi.is_master():
                             self.model_setup.report_to_tensorboard(
                                 self.model, self.config, lr_scheduler, self.tensorboard
                             )
+                            if self.config.multi_gpu:
+                                self.tensorboard.add_scalar("gradient_reduce/transferred_mb", transferred_bytes / (1024 * 1024), train_progress.global_step)
 
                             accumulated_loss_cpu = accumulated_loss.item()
                             if math.isnan(accumulated_loss_cpu):
@@ -827,41 +992,48 @@ class GenericTrainer(BaseTrainer):
                 return
 
     def end(self):
+        if self.sampling_worker is not None:
+            self.__finish_sampling_worker()
+
         if self.one_step_trained:
             self.model.to(self.temp_device)
 
-            if self.config.backup_before_save and multi.is_master():
-                self.__backup(self.model.train_progress)
+            with multi.gathered_optimizer_state(self.model.optimizer):
+                if self.config.backup_before_save and multi.is_master():
+                    self.__backup(self.model.train_progress)
 
-            # Special case for schedule-free optimizers.
-            if self.config.optimizer.optimizer.is_schedule_free:
-                torch.clear_autocast_cache()
-                self.model.optimizer.eval()
+                # Special case for schedule-free optimizers.
+                if self.config.optimizer.optimizer.is_schedule_free:
+                    torch.clear_autocast_cache()
+                    self.model.optimizer.eval()
 
-            if multi.is_master():
-                self.callbacks.on_update_status("Saving the final model")
-
-                if self.model.ema:
-                    self.model.ema.copy_ema_to(self.parameters, store_temp=False)
-                if os.path.isdir(self.config.output_model_destination) and self.config.output_model_format.is_single_file():
-                    save_path = os.path.join(
-                        self.config.output_model_destination,
-                        f"{self.config.save_filename_prefix}{get_string_timestamp()}{self.config.output_model_format.file_extension()}"
-                    )
-                else:
-                    save_path = self.config.output_model_destination
-                print("Saving " + save_path)
+                if multi.is_master():
+                    self.callbacks.on_update_status("Saving the final model")
 
-                self.model_saver.save(
-                    model=self.model,
-                    model_type=self.config.model_type,
-                    output_model_format=self.config.output_model_format,
-                    output_model_destination=save_path,
-                    dtype=self.config.output_dtype.torch_dtype()
-                )
+                    if self.model.ema:
+                        self.model.ema.copy_ema_to(self.parameters, store_temp=False)
+                    if os.path.isdir(self.config.output_model_destination) and self.config.output_model_format.is_single_file():
+                        save_path = os.path.join(
+                            self.config.output_model_destination,
+                            f"{self.config.save_filename_prefix}{get_string_timestamp()}{self.config.output_model_format.file_extension()}"
+                        )
+                    else:
+                        save_path = self.config.output_model_destination
+                    print("Saving " + save_path)
+
+                    self.model_saver.save(
+                        model=self.model,
+                        model_type=self.config.model_type,
+                        output_model_format=self.config.output_model_format,
+                        output_model_destination=save_path,
+                        dtype=self.config.output_dtype.torch_dtype()
+                    )
 
         if self.model is not None:
             self.model.to(self.temp_device)
+            for value in vars(self.model).values():
+                if isinstance(value, LayerOffloadConductor):
+                    value.release_disk_cache()
 
         if multi.is_master():
             self.tensorboard.close()
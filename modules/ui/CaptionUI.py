@@ -13,8 +13,10 @@ from modules.module.RembgModel import RembgModel
 from modules.module.WDModel import WDModel
 from modules.ui.GenerateCaptionsWindow import GenerateCaptionsWindow
 from modules.ui.GenerateMasksWindow import GenerateMasksWindow
-from modules.util import path_util
+from modules.util.BackgroundPrefetcher import BackgroundPrefetcher
 from modules.util.image_util import load_image
+from modules.util.ImageFileIndex import ImageFileIndex
+from modules.util.ThumbnailCache import ThumbnailCache
 from modules.util.torch_util import default_device, torch_gc
 from modules.util.ui import components
 from modules.util.ui.ui_utils import bind_mousewheel, set_window_icon
@@ -79,6 +81,9 @@ class CaptionUI(ctk.CTkToplevel):
         self.mask_editing_alpha = None
         self.prompt_var = None
         self.prompt_component = None
+        self.prefetch_radius = 4
+        self.thumbnail_cache = ThumbnailCache()
+        self.preview_prefetcher = BackgroundPrefetcher(self.__load_preview, max_cached_items=4 * self.prefetch_radius)
 
 
         self.title("OneTrainer")
@@ -212,6 +217,7 @@ class CaptionUI(ctk.CTkToplevel):
         component.bind("<Control-f>", self.fill_mask_editing_mode)
 
     def load_directory(self, include_subdirectories: bool = False):
+        self.preview_prefetcher.clear()
         self.scan_directory(include_subdirectories)
         self.file_list_column(self.bottom_frame)
 
@@ -223,28 +229,13 @@ class CaptionUI(ctk.CTkToplevel):
         self.prompt_component.focus_set()
 
     def scan_directory(self, include_subdirectories: bool = False):
-        def __is_supported_image_extension(filename):
-            name, ext = os.path.splitext(filename)
-            return path_util.is_supported_image_extension(ext) and not name.endswith("-masklabel") and not name.endswith("-condlabel")
-
         self.image_rel_paths = []
 
         if not self.dir or not os.path.isdir(self.dir):
             return
 
-        if include_subdirectories:
-            for root, _, files in os.walk(self.dir):
-                for filename in files:
-                    if __is_supported_image_extension(filename):
-                        self.image_rel_paths.append(
-                            os.path.relpath(os.path.join(root, filename), self.dir)
-                        )
-        else:
-            for _, filename in enumerate(os.listdir(self.dir)):
-                if __is_supported_image_extension(filename):
-                    self.image_rel_paths.append(
-                        os.path.relpath(os.path.join(self.dir, filename), self.dir)
-                    )
+        # the index is kept between scans, only modified directories are listed again
+        self.image_rel_paths = ImageFileIndex.get(self.dir, include_subdirectories).paths()
 
     def load_image(self):
         image_name = "resources/icons/icon.png"
@@ -260,31 +251,56 @@ class CaptionUI(ctk.CTkToplevel):
 
     def load_mask(self):
         if len(self.image_rel_paths) > 0 and self.current_image_index < len(self.image_rel_paths):
-            image_name = self.image_rel_paths[self.current_image_index]
-            mask_name = os.path.splitext(image_name)[0] + "-masklabel.png"
-            mask_name = os.path.join(self.dir, mask_name)
-
-            try:
-                return load_image(mask_name, convert_mode='RGB')
-            except Exception:
-                return None
+            return self.__load_mask(self.dir, self.image_rel_paths[self.current_image_index])
         else:
             return None
 
     def load_prompt(self):
         if len(self.image_rel_paths) > 0 and self.current_image_index < len(self.image_rel_paths):
-            image_name = self.image_rel_paths[self.current_image_index]
-            prompt_name = os.path.splitext(image_name)[0] + ".txt"
-            prompt_name = os.path.join(self.dir, prompt_name)
-
-            try:
-                with open(prompt_name, "r", encoding='utf-8') as f:
-                    return f.readlines()[0].strip()
-            except Exception:
-                return ""
+            return self.__load_prompt(self.dir, self.image_rel_paths[self.current_image_index])
         else:
             return ""
 
+    @staticmethod
+    def __load_mask(directory: str, image_rel_path: str):
+        mask_name = os.path.splitext(image_rel_path)[0] + "-masklabel.png"
+        mask_name = os.path.join(directory, mask_name)
+
+        try:
+            return load_image(mask_name, convert_mode='RGB')
+        except Exception:
+            return None
+
+    @staticmethod
+    def __load_prompt(directory: str, image_rel_path: str):
+        prompt_name = os.path.splitext(image_rel_path)[0] + ".txt"
+        prompt_name = os.path.join(directory, prompt_name)
+
+        try:
+            with open(prompt_name, "r", encoding='utf-8') as f:
+                return f.readlines()[0].strip()
+        except Exception:
+            return ""
+
+    def __load_preview(self, key: tuple[str, str]):
+        # called from the prefetch thread, must not access any UI state
+        directory, image_rel_path = key
+        pil_image, image_size = self.thumbnail_cache.get(os.path.join(directory, image_rel_path), self.image_size)
+        return pil_image, image_size, self.__load_mask(directory, image_rel_path), self.__load_prompt(directory, image_rel_path)
+
+    def __preview_key(self, index: int) -> tuple[str, str]:
+        return self.dir, self.image_rel_paths[index]
+
+    def __prefetch_neighbours(self, index: int):
+        keys = []
+        for distance in range(1, self.prefetch_radius + 1):
+            # the next images first, that's the usual direction
+            keys.extend(
+                self.__preview_key(neighbour) for neighbour in [index + distance, index - distance]
+                if 0 <= neighbour < len(self.image_rel_paths)
+            )
+        self.preview_prefetcher.prefetch(keys)
+
     def previous_image(self, event):
         if len(self.image_rel_paths) > 0 and (self.current_image_index - 1) >= 0:
             self.switch_image(self.current_image_index - 1)
@@ -302,17 +318,12 @@ class CaptionUI(ctk.CTkToplevel):
         if index >= 0:
             self.image_labels[index].configure(text_color="#FF0000")
 
-            self.pil_image = self.load_image()
-            self.pil_mask = self.load_mask()
-            prompt = self.load_prompt()
-
-            self.image_width = self.pil_image.width
-            self.image_height = self.pil_image.height
-            scale = self.image_size / max(self.pil_image.height, self.pil_image.width)
-            height = int(self.pil_image.height * scale)
-            width = int(self.pil_image.width * scale)
-
-            self.pil_image = self.pil_image.resize((width, height), Image.Resampling.LANCZOS)
+            # the image is already scaled to the display size, image_width and image_height are the original size
+            self.pil_image, (self.image_width, self.image_height), pil_mask, prompt = \
+                self.preview_prefetcher.get(self.__preview_key(index))
+            # the mask is edited in place, keep the cached mask unchanged
+            self.pil_mask = pil_mask.copy() if pil_mask is not None else None
+            self.__prefetch_neighbours(index)
 
             self.refresh_image()
             self.prompt_var.set(prompt)
@@ -473,6 +484,8 @@ class CaptionUI(ctk.CTkToplevel):
             if self.pil_mask:
                 self.pil_mask.save(mask_name)
 
+            self.preview_prefetcher.invalidate(self.__preview_key(self.current_image_index))
+
     def draw_mask_editing_mode(self, *args):
         self.mask_editing_mode = 'draw'
 
@@ -498,11 +511,13 @@ class CaptionUI(ctk.CTkToplevel):
     def open_mask_window(self):
         dialog = GenerateMasksWindow(self, self.dir, self.config_ui_data["include_subdirectories"])
         self.wait_window(dialog)
+        self.preview_prefetcher.clear()
         self.switch_image(self.current_image_index)
 
     def open_caption_window(self):
         dialog = GenerateCaptionsWindow(self, self.dir, self.config_ui_data["include_subdirectories"])
         self.wait_window(dialog)
+        self.preview_prefetcher.clear()
         self.switch_image(self.current_image_index)
 
     def open_in_explorer(self):
@@ -569,4 +584,5 @@ class CaptionUI(ctk.CTkToplevel):
 
     def destroy(self):
         self._release_models()
+        self.preview_prefetcher.close()
         super().destroy()
@@ -72,6 +72,17 @@ class CloudTab:
                          tooltip="Instead of starting tensorboard locally, make a TCP tunnel to a tensorboard on the cloud")
         components.switch(self.frame, 8, 1, self.ui_state, "cloud.tensorboard_tunnel")
 
+        components.label(self.frame, 9, 0, "Packed upload",
+                         tooltip="Upload the concepts as compressed chunks and unpack them on the cloud. Only files that changed since the last upload are sent, and an interrupted upload resumes with the chunks that are missing. Recommended for datasets with many small files.")
+        components.switch(self.frame, 9, 1, self.ui_state, "cloud.packed_upload")
+        components.label(self.frame, 10, 0, "Packed chunk size",
+                         tooltip="Maximum size of the uncompressed files in one upload chunk, in MB")
+        components.entry(self.frame, 10, 1, self.ui_state, "cloud.packed_upload_chunk_size")
+
+        components.label(self.frame, 11, 0, "Message channel",
+                         tooltip="Stream progress, samples and commands through a persistent connection to the cloud trainer, instead of polling for them. Disable if the OneTrainer version on the cloud doesn't support it.")
+        components.switch(self.frame, 11, 1, self.ui_state, "cloud.message_channel")
+
 
 
         components.label(self.frame, 1, 2, "Remote Directory",
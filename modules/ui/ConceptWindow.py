@@ -9,11 +9,13 @@ import time
 import traceback
 
 from modules.util import concept_stats, path_util
+from modules.util.BackgroundPrefetcher import BackgroundPrefetcher
 from modules.util.config.ConceptConfig import ConceptConfig
 from modules.util.config.TrainConfig import TrainConfig
 from modules.util.enum.BalancingStrategy import BalancingStrategy
 from modules.util.enum.ConceptType import ConceptType
-from modules.util.image_util import load_image
+from modules.util.ImageFileIndex import ImageFileIndex
+from modules.util.ThumbnailCache import ThumbnailCache
 from modules.util.ui import components
 from modules.util.ui.ui_utils import set_window_icon
 from modules.util.ui.UIState import UIState
@@ -91,6 +93,10 @@ class ConceptWindow(ctk.CTkToplevel):
         self.text_ui_state = text_ui_state
         self.image_preview_file_index = 0
         self.preview_augmentations = ctk.BooleanVar(self, True)
+        # augmentations are previewed on a downscaled image, loading the full resolution is too slow for large images
+        self.preview_image_size = 1024
+        self.thumbnail_cache = ThumbnailCache()
+        self.preview_prefetcher = BackgroundPrefetcher(self.__load_preview_image)
 
         self.title("Concept")
         self.geometry("800x700")
@@ -602,32 +608,40 @@ class ConceptWindow(ctk.CTkToplevel):
         except UnicodeDecodeError:
             return "[Invalid file encoding. This should not happen, please report this issue]"
 
+    def __load_preview_image(self, image_path: str):
+        # called from the prefetch thread
+        image, _ = self.thumbnail_cache.get(image_path, self.preview_image_size)
+
+        mask_path = path_util.canonical_join(os.path.splitext(image_path)[0] + "-masklabel.png")
+        mask = None
+        if os.path.isfile(mask_path):
+            mask, _ = self.thumbnail_cache.get(mask_path, self.preview_image_size, convert_mode='L')
+            if mask.size != image.size:
+                mask = mask.resize(image.size, Image.Resampling.BILINEAR)
+
+        return image, mask
+
     def __get_preview_image(self):
         preview_image_path = "resources/icons/icon.png"
-        file_index = -1
-        glob_pattern = "**/*.*" if self.concept.include_subdirectories else "*.*"
+        prefetch_paths = []
 
         concept_path = self.get_concept_path(self.concept.path)
         if concept_path:
-            for path in pathlib.Path(concept_path).glob(glob_pattern):
-                extension = os.path.splitext(path)[1]
-                if path.is_file() and path_util.is_supported_image_extension(extension) \
-                        and not path.name.endswith("-masklabel.png") and not path.name.endswith("-condlabel.png"):
-                    preview_image_path = path_util.canonical_join(concept_path, path)
-                    file_index += 1
-                    if file_index == self.image_preview_file_index:
-                        break
-
-        image = load_image(preview_image_path, 'RGB')
-        image_tensor = functional.to_tensor(image)
+            # the index is shared and only lists modified directories again, instead of globbing on every click
+            image_paths = ImageFileIndex.get(concept_path, self.concept.include_subdirectories).paths()
+            if len(image_paths) > 0:
+                index = self.image_preview_file_index = min(self.image_preview_file_index, len(image_paths) - 1)
+                preview_image_path = path_util.canonical_join(concept_path, image_paths[index])
+                prefetch_paths = [
+                    path_util.canonical_join(concept_path, path)
+                    for path in image_paths[index + 1:index + 4] + image_paths[max(index - 1, 0):index]
+                ]
+
+        image, mask = self.preview_prefetcher.get(preview_image_path)
+        self.preview_prefetcher.prefetch(prefetch_paths)
 
-        splitext = os.path.splitext(preview_image_path)
-        preview_mask_path = path_util.canonical_join(splitext[0] + "-masklabel.png")
-        if not os.path.isfile(preview_mask_path):
-            preview_mask_path = None
-
-        if preview_mask_path:
-            mask = Image.open(preview_mask_path).convert("L")
+        image_tensor = functional.to_tensor(image)
+        if mask is not None:
             mask_tensor = functional.to_tensor(mask)
         else:
             mask_tensor = torch.ones((1, image_tensor.shape[1], image_tensor.shape[2]))
@@ -923,3 +937,7 @@ class ConceptWindow(ctk.CTkToplevel):
 
     def __ok(self):
         self.destroy()
+
+    def destroy(self):
+        self.preview_prefetcher.close()
+        super().destroy()
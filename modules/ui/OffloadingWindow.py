@@ -2,6 +2,7 @@ from modules.util.config.TrainConfig import TrainConfig
 from modules.util.enum.GradientCheckpointingMethod import (
     GradientCheckpointingMethod,
 )
+from modules.util.enum.OffloadCompression import OffloadCompression
 from modules.util.ui import components
 from modules.util.ui.ui_utils import set_window_icon
 from modules.util.ui.UIState import UIState
@@ -68,6 +69,26 @@ class OffloadingWindow(ctk.CTkToplevel):
                          tooltip="Enables offloading of individual layers during training to reduce VRAM usage. Increases training time and uses more RAM. Only available if checkpointing is set to CPU_OFFLOADED. values between 0 and 1, 0=disabled")
         components.entry(frame, 3, 1, self.ui_state, "layer_offload_fraction")
 
+        # layer offloading disk cache
+        components.label(frame, 4, 0, "Offload Frozen Layers To Disk",
+                         tooltip="Stores offloaded frozen layers in memory-mapped files in the cache directory instead of RAM. Layers are read ahead into a small RAM buffer before they are needed. Reduces RAM usage, but needs a fast local disk")
+        components.switch(frame, 4, 1, self.ui_state, "layer_offload_disk_cache")
+
+        components.label(frame, 5, 0, "Disk Prefetch Layers",
+                         tooltip="Number of layers that are read ahead from the disk cache into RAM")
+        components.entry(frame, 5, 1, self.ui_state, "layer_offload_disk_prefetch_layers")
+
+        # layer offloading compression
+        components.label(frame, 6, 0, "Transformer Offload Compression",
+                         tooltip="Stores offloaded frozen transformer layers in a blockwise quantized format in RAM. They are decompressed after the transfer to the train device. Halves RAM usage and transfer volume, but slightly reduces the precision of the frozen weights. Not available for fine-tuning, because the frozen weights would be saved with the reduced precision")
+        components.options(frame, 6, 1, [str(x) for x in list(OffloadCompression)], self.ui_state,
+                           "transformer.offload_compression")
+
+        # layer offloading plan
+        components.label(frame, 7, 0, "Layer Offload Plan",
+                         tooltip="A json file with offload plans written by save_offload_plans(). Each offloaded model part uses the plan that was created for its layers instead of the layer offload fraction. Layer offloading must still be enabled")
+        components.file_entry(frame, 7, 1, self.ui_state, "layer_offload_plan", allow_model_files=False)
+
         frame.pack(fill="both", expand=1)
         return frame
 
@@ -11,6 +11,7 @@ from modules.modelSampler.BaseModelSampler import (
 )
 from modules.ui.SampleFrame import SampleFrame
 from modules.util import create
+from modules.util.BackupStore import BackupStore
 from modules.util.callbacks.TrainCallbacks import TrainCallbacks
 from modules.util.commands.TrainCommands import TrainCommands
 from modules.util.config.SampleConfig import SampleConfig
@@ -113,6 +114,10 @@ class SampleWindow(ctk.CTkToplevel):
             last_backup_path = self.initial_train_config.get_last_backup_path()
 
             if last_backup_path:
+                if BackupStore.is_deduplicated(last_backup_path):
+                    backup_store = BackupStore(os.path.join(self.initial_train_config.workspace_dir, "backup_store"))
+                    last_backup_path = backup_store.restore_for_loading(last_backup_path)
+
                 if self.initial_train_config.training_method == TrainingMethod.LORA:
                     model_names.lora = last_backup_path
                 elif self.initial_train_config.training_method == TrainingMethod.EMBEDDING:
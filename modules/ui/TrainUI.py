@@ -33,6 +33,7 @@ from modules.util.callbacks.TrainCallbacks import TrainCallbacks
 from modules.util.commands.TrainCommands import TrainCommands
 from modules.util.config.TrainConfig import TrainConfig
 from modules.util.enum.DataType import DataType
+from modules.util.enum.GradientCompression import GradientCompression
 from modules.util.enum.GradientReducePrecision import GradientReducePrecision
 from modules.util.enum.ImageFormat import ImageFormat
 from modules.util.enum.ModelType import ModelType
@@ -296,6 +297,14 @@ class TrainUI(ctk.CTk):
                          tooltip="Number of threads used for the data loader. Increase if your GPU has room during caching, decrease if it's going out of memory during caching.")
         components.entry(frame, 10, 1, self.ui_state, "dataloader_threads")
 
+        components.label(frame, 10, 2, "Model Loading Threads",
+                         tooltip="Number of model parts (text encoders, VAE, transformer) that are loaded at the same time. Loading several parts at once can reduce the start up time, but needs more RAM.")
+        components.entry(frame, 10, 3, self.ui_state, "model_loading_threads")
+
+        components.label(frame, 11, 2, "Model Loading RAM Budget (GB)",
+                         tooltip="The maximum estimated RAM used by model parts that are loaded at the same time, in gigabytes. 0 means no limit.")
+        components.entry(frame, 11, 3, self.ui_state, "model_loading_memory_budget")
+
         components.label(frame, 11, 0, "Train Device",
                          tooltip="The device used for training. Can be \"cuda\", \"cuda:0\", \"cuda:1\" etc. Default:\"cuda\". Must be \"cuda\" for multi-GPU training.")
         components.entry(frame, 11, 1, self.ui_state, "train_device")
@@ -331,6 +340,30 @@ class TrainUI(ctk.CTk):
                          tooltip="The device used to temporarily offload models while they are not used. Default:\"cpu\"")
         components.entry(frame, 15, 1, self.ui_state, "temp_device")
 
+        components.label(frame, 15, 2, "Shard Optimizer State",
+                         tooltip="Multi-GPU: Each GPU only keeps the optimizer state of a part of the parameters, and updates only these parameters. "
+                                 "Reduces VRAM usage for full finetuning with optimizers such as Adam. Only supported by optimizers that support Fused Back Pass, "
+                                 "except Prodigy and schedule-free optimizers")
+        components.switch(frame, 15, 3, self.ui_state, "optimizer_state_sharding")
+
+        components.label(frame, 16, 0, "Gradient Compression",
+                         tooltip="Multi-GPU: Compress gradients before they are reduced between GPUs. Useful if the bandwidth between GPUs is low, for example between nodes or over PCIe. "
+                                 "The compression error is added to the gradient of the next step.\n"
+                                 "POWER_SGD (experimental): Low rank approximation of each gradient matrix. In a small benchmark (3 ranks, width 256 MLP, 60 AdamW steps) rank 4 ended at a test loss of 0.935 instead of 0.703, "
+                                 "with a per step gradient error of up to 2.56x and an accumulated error of 0.29. Rank 32 reached 0.78. Prefer INT8 unless the bandwidth is very low\n"
+                                 "INT8, FLOAT8: Blockwise quantization, a quarter of the bandwidth of float32",
+                         wide_tooltip=True)
+        components.options(frame, 16, 1, [str(x) for x in list(GradientCompression)], self.ui_state,
+                           "gradient_compression")
+
+        components.label(frame, 16, 2, "PowerSGD Rank",
+                         tooltip="Multi-GPU: The rank of the gradient approximation of POWER_SGD. Higher values are more precise, but need more bandwidth")
+        components.entry(frame, 16, 3, self.ui_state, "gradient_compression_rank")
+
+        components.label(frame, 17, 0, "Quantization Block Size",
+                         tooltip="Multi-GPU: The number of values that share a scale in INT8 and FLOAT8 gradient compression")
+        components.entry(frame, 17, 1, self.ui_state, "gradient_compression_block_size")
+
         frame.pack(fill="both", expand=1)
         return frame
 
@@ -360,6 +393,21 @@ class TrainUI(ctk.CTk):
                          tooltip="Clears the cache directory before starting to train. Only disable this if you want to continue using the same cached data. Disabling this can lead to errors, if other settings are changed during a restart")
         components.switch(frame, 2, 1, self.ui_state, "clear_cache_before_training")
 
+        # cache data type
+        components.label(frame, 3, 0, "Cache Data Type",
+                         tooltip="The data type used to store latents and text encoder outputs in the cache. float8 is stored with one scale per tensor. Lower precision reduces the cache size and disk reads, but also reduces precision. Empty keeps the data type of the encoder")
+        components.options_kv(frame, 3, 1, [
+            ("", DataType.NONE),
+            ("float16", DataType.FLOAT_16),
+            ("bfloat16", DataType.BFLOAT_16),
+            ("float8", DataType.FLOAT_8),
+        ], self.ui_state, "cache_dtype")
+
+        # cache compression
+        components.label(frame, 4, 0, "Cache Compression",
+                         tooltip="Losslessly compresses latents and text encoder outputs in the cache. This works best for text encoder outputs with many padding tokens. Decompression is done by the data loader threads")
+        components.switch(frame, 4, 1, self.ui_state, "cache_compression")
+
         frame.pack(fill="both", expand=1)
         return frame
 
@@ -410,6 +458,18 @@ class TrainUI(ctk.CTk):
                          tooltip="Whether to include sample images in the Tensorboard output.")
         components.switch(sub_frame, 0, 3, self.ui_state, "samples_to_tensorboard")
 
+        components.label(sub_frame, 0, 4, "Sampling Worker",
+                         tooltip="Samples in a separate process while training continues. The worker loads a second copy of the model on the sampling worker device and receives a snapshot of the trained weights for every sample.")
+        components.switch(sub_frame, 0, 5, self.ui_state, "sampling_worker")
+
+        components.label(sub_frame, 0, 6, "Sampling Worker Device",
+                         tooltip="The device used by the sampling worker, for example \"cuda:1\" or \"cpu\"")
+        components.entry(sub_frame, 0, 7, self.ui_state, "sampling_worker_device")
+
+        components.label(sub_frame, 1, 0, "Merged LoRA Sampling",
+                         tooltip="Temporarily merges the LoRA weights into the model weights during sampling. This speeds up sampling, the original weights are restored afterwards. Not used with quantized weights or with disk or compressed layer offloading.")
+        components.switch(sub_frame, 1, 1, self.ui_state, "merged_lora_sampling")
+
         # table
         frame = ctk.CTkFrame(master=master, corner_radius=0)
         frame.grid(row=1, column=0, sticky="nsew")
@@ -447,6 +507,12 @@ class TrainUI(ctk.CTk):
                          tooltip="Create a full backup before saving the final model")
         components.switch(frame, 2, 1, self.ui_state, "backup_before_save")
 
+        # deduplicate backups
+        components.label(frame, 2, 3, "Deduplicate Backups",
+                         tooltip="Only store the parts of a backup that changed since the previous backups, for example to avoid saving frozen model parts again. "
+                                 "Deduplicated backups are restored to <workspace>/backup_store before they are loaded")
+        components.switch(frame, 2, 4, self.ui_state, "deduplicate_backups")
+
         # save after
         components.label(frame, 3, 0, "Save Every",
                          tooltip="The interval used when automatically saving the model during training")
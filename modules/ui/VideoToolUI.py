@@ -1,20 +1,18 @@
 import concurrent.futures
-import math
 import os
 import pathlib
-import random
 import shlex
 import subprocess
 import threading
 import webbrowser
 from tkinter import filedialog
 
+from modules.util import video_util
 from modules.util.path_util import SUPPORTED_VIDEO_EXTENSIONS
 from modules.util.ui import components
 
 import customtkinter as ctk
 import cv2
-import scenedetect
 
 
 class VideoToolUI(ctk.CTkToplevel):
@@ -357,53 +355,6 @@ class VideoToolUI(ctk.CTkToplevel):
             print(f'Found {len(input_videos)} videos to process')
             return input_videos
 
-    def __get_random_aspect(self, height : int, width : int, variation: float) -> tuple[int, int, int, int]:
-        if variation == 0:
-            return 0, height, 0, width
-
-        old_aspect = height/width
-        variation_scaled = old_aspect*variation
-        if old_aspect > 1.2:
-            new_aspect = min(4.0, max(1.0, random.triangular(old_aspect-(variation_scaled*1.5), old_aspect+(variation_scaled/2), old_aspect)))
-        elif old_aspect < 0.85:
-            new_aspect = max(0.25, min(1.0, random.triangular(old_aspect-(variation_scaled/2), old_aspect+(variation_scaled*1.5), old_aspect)))
-        else:
-            new_aspect = random.triangular(old_aspect-variation_scaled, old_aspect+variation_scaled)
-
-        new_aspect = round(new_aspect, 2)
-        if new_aspect > old_aspect:
-            new_height = int(height)
-            new_width = int(width*(old_aspect/new_aspect))
-        elif new_aspect < old_aspect:
-            new_height = int(height*(new_aspect/old_aspect))
-            new_width = int(width)
-        else:
-            new_height = int(height)
-            new_width = int(width)
-
-        position_x = random.randint(0, width-new_width)
-        position_y = random.randint(0, height-new_height)
-        #print(new_aspect)
-        #print(position_y, new_height, position_x, new_width)
-        return position_y, new_height, position_x, new_width
-
-    def find_main_contour(self, frame):
-        frame_grayscale = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        _, frame_thresh = cv2.threshold(frame_grayscale, 15, 255, cv2.THRESH_BINARY)
-        frame_contours, _ = cv2.findContours(frame_thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        if frame_contours:
-            frame_maincontour = max(frame_contours, key=cv2.contourArea)
-            x1, y1, w1, h1 = cv2.boundingRect(frame_maincontour)
-        else:   #fallback if no contours detected
-            x1 = 0
-            y1 = 0
-            h1, w1, _ = frame.shape
-        if not frame_contours or h1 < 10 or w1 < 10:  #if bounding box did not detect the correct area, likely due to black frame
-            x1 = 0
-            y1 = 0
-            h1, w1, _ = frame.shape
-        return x1, y1, w1, h1
-
     def __extract_clips_button(self, batch_mode: bool):
         t = threading.Thread(target = self.__extract_clips_multi, args = [batch_mode])
         t.daemon = True
@@ -436,153 +387,33 @@ class VideoToolUI(ctk.CTkToplevel):
         if len(input_videos) == 0:  # exit if no paths found
             return
 
-        with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
-            for video_path in input_videos:
-                if self.output_subdir_clip_entry.get() and batch_mode:
-                    output_directory = os.path.join(self.clip_output_entry.get(),
-                                                    os.path.splitext(os.path.relpath(video_path, self.clip_list_entry.get()))[0])
-                elif self.output_subdir_clip_entry.get() and not batch_mode:
-                    output_directory = os.path.join(self.clip_output_entry.get(),
-                                                    os.path.splitext(os.path.basename(video_path))[0])
-                else:
-                    output_directory = self.clip_output_entry.get()
+        jobs = []
+        for video_path in input_videos:
+            if self.output_subdir_clip_entry.get() and batch_mode:
+                output_directory = os.path.join(self.clip_output_entry.get(),
+                                                os.path.splitext(os.path.relpath(video_path, self.clip_list_entry.get()))[0])
+            elif self.output_subdir_clip_entry.get() and not batch_mode:
+                output_directory = os.path.join(self.clip_output_entry.get(),
+                                                os.path.splitext(os.path.basename(video_path))[0])
+            else:
+                output_directory = self.clip_output_entry.get()
 
-                if batch_mode:
-                    executor.submit(self.__extract_clips,
-                                    str(video_path), "00:00:00", "99:99:99", max_length, self.split_at_cuts.get(),
-                                    self.clip_bordercrop_entry.get(), crop_variation, target_fps, output_directory)
-                else:
-                    executor.submit(self.__extract_clips,
-                                    str(video_path), str(self.clip_time_start_entry.get()), str(self.clip_time_end_entry.get()), max_length, self.split_at_cuts.get(),
-                                    self.clip_bordercrop_entry.get(), crop_variation, target_fps, output_directory)
+            if batch_mode:
+                jobs.append((str(video_path), "00:00:00", "99:99:99", max_length, self.split_at_cuts.get(),
+                             self.clip_bordercrop_entry.get(), crop_variation, target_fps, output_directory))
+            else:
+                jobs.append((str(video_path), str(self.clip_time_start_entry.get()), str(self.clip_time_end_entry.get()), max_length, self.split_at_cuts.get(),
+                             self.clip_bordercrop_entry.get(), crop_variation, target_fps, output_directory))
+
+        # every video is decoded once in its own process, all clips of a video are written during that pass
+        clip_count = sum(video_util.run_in_process_pool(video_util.extract_clips, jobs))
+        print(f'{clip_count} clips extracted')
 
         if batch_mode:
             print(f'Clip extraction from all videos in {self.clip_list_entry.get()} complete')
         else:
             print(f'Clip extraction from {self.clip_single_entry.get()} complete')
 
-    def __extract_clips(self, video_path: str, timestamp_min: str, timestamp_max: str, max_length: float,
-                        split_at_cuts: bool, remove_borders : bool, crop_variation: float, target_fps: int, output_dir: str):
-        video = cv2.VideoCapture(video_path)
-        fps = video.get(cv2.CAP_PROP_FPS) or 0.0
-        if fps <= 0:
-            print(f'Warning: Could not read FPS for "{os.path.basename(video_path)}". Falling back to 30 FPS.') # fallback to some sane FPS value
-            fps = 30.0
-        max_length_frames = int(max_length * fps)   #convert max length from seconds to frames
-        min_length_frames = max(int(0.25*fps), 1)   #minimum clip length of 1/4 second or 1 frame
-        total_frames = int(video.get(cv2.CAP_PROP_FRAME_COUNT)) or 0
-        timestamp_max_frame = int(sum(int(x) * 60 ** i for i, x in enumerate(reversed(timestamp_max.split(':')))) * fps)
-        timestamp_max_frame = min(timestamp_max_frame, max(total_frames - 1, 0))
-        timestamp_min_frame = int(sum(int(x) * 60 ** i for i, x in enumerate(reversed(timestamp_min.split(':')))) * fps)
-        timestamp_min_frame = min(timestamp_min_frame, timestamp_max_frame)
-
-        if split_at_cuts:
-            #use scenedetect to find cuts, based on start/end frame number
-            timecode_list = scenedetect.detect(
-                str(video_path),
-                scenedetect.AdaptiveDetector(),
-                start_time=int(timestamp_min_frame),
-                end_time=int(timestamp_max_frame))
-            scene_list = [(x[0].get_frames(), x[1].get_frames()) for x in timecode_list]
-            if len(scene_list) == 0:
-                scene_list = [(timestamp_min_frame, timestamp_max_frame)]    # use start/end frames if no scenes detected
-        else:
-            scene_list = [(timestamp_min_frame, timestamp_max_frame)]  # default if not using cuts, start and end of time range
-
-        scene_list_split = []
-        for scene in scene_list:
-            length = scene[1]-scene[0]
-            if length > max_length_frames:  #check for any scenes longer than max length
-                n = math.ceil(length/max_length_frames) #divide into n new scenes
-                new_length = int(length/n)
-                new_splits = range(scene[0], scene[1]+min_length_frames, new_length)   #divide clip into closest chunks to max_length
-                for i, _n in enumerate(new_splits[:-1]):
-                    if new_splits[i+1] - new_splits[i] > min_length_frames:
-                        scene_list_split += [(new_splits[i], new_splits[i+1])]
-            else:
-                if length > (min_length_frames+2):
-                    scene_list_split += [(scene[0]+1, scene[1]-1)]      #trim first and last frame from detected scenes to avoid transition artifacts
-
-        print(f'Video "{os.path.basename(video_path)}" being split into {len(scene_list_split)} clips in {output_dir}...')
-
-        with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
-            for scene in scene_list_split:
-                executor.submit(self.__save_clip, scene, video_path, target_fps, remove_borders, crop_variation, output_dir)
-
-        video.release()
-
-    def __save_clip(self, scene : tuple[int, int], video_path : str, target_fps : int, remove_borders : bool, crop_variation : float, output_dir : str):
-        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-        basename, ext = os.path.splitext(os.path.basename(video_path))
-        video = cv2.VideoCapture(str(video_path))
-        fps = video.get(cv2.CAP_PROP_FPS) or 0.0
-        if fps <= 0:
-            print(f'Warning: Could not read FPS for "{os.path.basename(video_path)}". Falling back to 30 FPS.')
-            fps = 30.0
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
-        output_name = f'{output_dir}{os.sep}{basename}_{scene[0]}-{scene[1]}'
-        output_ext = ".mp4"
-
-        video.set(cv2.CAP_PROP_POS_FRAMES, (scene[1] + scene[0])//2)
-        frame_number = int(video.get(cv2.CAP_PROP_POS_FRAMES))
-        success, frame = video.read()
-        if not success or frame is None:
-            print(f'Failed to read frame from "{os.path.basename(video_path)}" at {int(frame_number)}. Skipping clip.')
-            video.release()
-            return
-
-        #crop out borders of frame - blends five random frames from the scene to get "average" image
-        #helps prevent incorrect cropping when sampled frame may be all black or otherwise detect incorrect border
-        if remove_borders:
-            frame_blend = frame
-            for i in range(5):  # blend 5 random frames to get average
-                random_frame = random.randint(scene[0], scene[1])
-                video.set(cv2.CAP_PROP_POS_FRAMES, random_frame)
-                success, frame = video.read()
-                if not success or frame is None:
-                    continue
-                a = 1/(i+1)
-                b = 1-a
-                frame_blend = cv2.addWeighted(frame, a, frame_blend, b, 0)
-            x1, y1, w1, h1 = self.find_main_contour(frame_blend)
-        else:
-            x1 = 0
-            y1 = 0
-            h1, w1, _ = frame.shape
-
-        y2, h2, x2, w2 = self.__get_random_aspect(h1, w1, crop_variation)
-        writer = cv2.VideoWriter(output_name+output_ext, fourcc, fps, (w2, h2))
-        video.set(cv2.CAP_PROP_POS_FRAMES, scene[0])
-        frame_number = int(video.get(cv2.CAP_PROP_POS_FRAMES))
-        success, frame = video.read()
-
-        while success and (frame_number < scene[1]):    # loop through frames within each scene
-            frame_trimmed = frame[y1:y1+h1, x1:x1+w1]   # cut out black borders if applicable
-            writer.write(frame_trimmed[y2:y2+h2, x2:x2+w2]) # save frame with random crop variation if applicable
-            success, frame = video.read()
-            frame_number += 1
-        writer.release()
-        video.release()
-
-        if target_fps > 0: # use ffmpeg to change to set framerate - saves copy and deletes original
-            if int(round(fps)) == target_fps:
-                # Already at desired fps; skip re-encode.
-                return
-            cmd = [
-                "ffmpeg", "-y",
-                "-i", f"{output_name}{output_ext}",
-                "-filter:v", f"fps={target_fps}",
-                "-an",
-                f"{output_name}_{target_fps}fps{output_ext}",
-            ]
-            proc = subprocess.run(cmd, stderr=subprocess.DEVNULL, stdout=subprocess.DEVNULL)
-            if proc.returncode == 0:
-                try:
-                    os.remove(output_name + output_ext)
-                except OSError:
-                    print(f"Failed to remove conversion placeholder {output_name + output_ext}, remove manually or check folder permissions.")
-
     def __extract_images_button(self, batch_mode : bool):
         t = threading.Thread(target = self.__extract_images_multi, args = [batch_mode])
         t.daemon = True
@@ -615,103 +446,32 @@ class VideoToolUI(ctk.CTkToplevel):
         if len(input_videos) == 0:  #exit if no paths found
             return
 
-        with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
-            for video_path in input_videos:
-                if self.output_subdir_img_entry.get() and batch_mode:
-                    output_directory = os.path.join(self.image_output_entry.get(),
-                                                    os.path.splitext(os.path.relpath(video_path, self.image_list_entry.get()))[0])
-                elif self.output_subdir_img_entry.get() and not batch_mode:
-                    output_directory = os.path.join(self.image_output_entry.get(),
-                                                    os.path.splitext(os.path.basename(video_path))[0])
-                else:
-                    output_directory = self.image_output_entry.get()
+        jobs = []
+        for video_path in input_videos:
+            if self.output_subdir_img_entry.get() and batch_mode:
+                output_directory = os.path.join(self.image_output_entry.get(),
+                                                os.path.splitext(os.path.relpath(video_path, self.image_list_entry.get()))[0])
+            elif self.output_subdir_img_entry.get() and not batch_mode:
+                output_directory = os.path.join(self.image_output_entry.get(),
+                                                os.path.splitext(os.path.basename(video_path))[0])
+            else:
+                output_directory = self.image_output_entry.get()
+
+            if batch_mode:
+                jobs.append((str(video_path), "00:00:00", "99:99:99", capture_rate,
+                             blur_threshold, self.image_bordercrop.get(), crop_variation, output_directory))
+            else:
+                jobs.append((str(video_path), str(self.image_time_start_entry.get()), str(self.image_time_end_entry.get()), capture_rate,
+                             blur_threshold, self.image_bordercrop.get(), crop_variation, output_directory))
+
+        image_count = sum(video_util.run_in_process_pool(video_util.extract_frames, jobs))
+        print(f'{image_count} images extracted')
 
-                if batch_mode:
-                    executor.submit(self.__save_frames,
-                                    str(video_path), "00:00:00", "99:99:99", capture_rate,
-                                    blur_threshold, self.image_bordercrop.get(), crop_variation, output_directory)
-                else:
-                    executor.submit(self.__save_frames,
-                                    str(video_path), str(self.image_time_start_entry.get()), str(self.image_time_end_entry.get()), capture_rate,
-                                    blur_threshold, self.image_bordercrop.get(), crop_variation, output_directory)
         if batch_mode:
             print(f'Image extraction from all videos in {self.image_list_entry.get()} complete')
         else:
             print(f'Image extraction from {self.image_single_entry.get()} complete')
 
-    def __save_frames(self, video_path: str, timestamp_min: str, timestamp_max: str, capture_rate: float,
-                      blur_threshold: float, remove_borders : bool, crop_variation: float, output_dir: str):
-        video = cv2.VideoCapture(video_path)
-        fps = video.get(cv2.CAP_PROP_FPS) or 0.0
-        if fps <= 0:
-            print(f'Warning: Could not read FPS for "{os.path.basename(video_path)}". Falling back to 30 FPS.')
-            fps = 30.0
-        if capture_rate <= 0:
-            print("Images/sec must be > 0.")
-            video.release()
-            return
-        image_rate = max(int(fps / capture_rate), 1)   # frames between captures (min 1)
-        total_frames = int(video.get(cv2.CAP_PROP_FRAME_COUNT)) or 0
-        timestamp_max_frame = int(sum(int(x) * 60 ** i for i, x in enumerate(reversed(timestamp_max.split(':')))) * fps)
-        timestamp_max_frame = min(timestamp_max_frame, max(total_frames - 1, 0))
-        timestamp_min_frame = int(sum(int(x) * 60 ** i for i, x in enumerate(reversed(timestamp_min.split(':')))) * fps)
-        timestamp_min_frame = min(timestamp_min_frame, timestamp_max_frame)
-        frame_range = range(timestamp_min_frame, timestamp_max_frame, image_rate)
-        frame_list = []
-
-        for n in frame_range:
-            frame = abs(int(random.triangular(n-(image_rate/2), n+(image_rate/2))))     #random triangular distribution around center
-            frame = max(0, min(frame, max(total_frames - 1, 0)))
-            frame_list.append(frame)
-
-        print(f'Video "{os.path.basename(video_path)}" will be split into {len(frame_list)} images in {output_dir}...')
-
-        output_list = []
-        for f in frame_list:
-            video.set(cv2.CAP_PROP_POS_FRAMES, f)
-            success, frame = video.read()
-            if success and frame is not None:
-                frame_grayscale = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-                frame_sharpness = cv2.Laplacian(frame_grayscale, cv2.CV_64F).var()  #get sharpness of greyscale pic
-                output_list.append((f, frame_sharpness))
-
-        if not output_list:
-            print(f'No frames extracted from {os.path.basename(video_path)} in the selected range.')
-            video.release()
-            return
-
-        output_list_sorted = sorted(output_list, key=lambda x: x[1])
-        cutoff = int(blur_threshold*len(output_list_sorted))     #calculate cutoff as portion of total frames
-        output_list_cut = output_list_sorted[cutoff:]            # keep all frames above cutoff
-        print(f'{cutoff} blurriest images have been dropped from {os.path.basename(video_path)}')
-
-        basename, ext = os.path.splitext(os.path.basename(video_path))
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
-
-        for f in output_list_cut:
-            filename = f'{output_dir}{os.sep}{basename}_{f[0]}.jpg'
-            video.set(cv2.CAP_PROP_POS_FRAMES, f[0])
-            success, frame = video.read()
-
-            #crop out borders of frame
-            if remove_borders and success and frame is not None:
-                x1, y1, w1, h1 = self.find_main_contour(frame)
-                frame_cropped = frame[y1:y1+h1, x1:x1+w1]
-            else:
-                frame_cropped = frame if success and frame is not None else None
-                if frame_cropped is not None:
-                    x1 = 0
-                    y1 = 0
-                    h1, w1, _ = frame_cropped.shape
-
-            y2, h2, x2, w2 = self.__get_random_aspect(h1, w1, crop_variation)
-            #print(y1, h1, x1, w1, ":", y2, h2, x2, w2)
-
-            if success and frame is not None:
-                cv2.imwrite(filename, frame_cropped[y2:y2+h2, x2:x2+w2])    #save images
-        video.release()
-
     def __download_button(self, batch_mode: bool):
         t = threading.Thread(target = self.__download_multi, args = [batch_mode])
         t.daemon = True
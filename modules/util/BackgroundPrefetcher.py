@@ -0,0 +1,96 @@
+import threading
+import traceback
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+from typing import Any
+
+
+class BackgroundPrefetcher:
+    """
+    Loads items on a background thread before they are requested, and keeps the most recently used items in memory.
+    The UI thread calls prefetch() with the keys it will probably need next, for example the neighbours of the
+    current image, in order of priority. get() returns a loaded item immediately, waits if the item is currently
+    being loaded, and otherwise loads it on the calling thread.
+    """
+
+    def __init__(self, load: Callable[[Hashable], Any], max_cached_items: int = 16):
+        self.__load = load
+        self.max_cached_items = max_cached_items
+
+        self.__condition = threading.Condition()
+        self.__cache = OrderedDict()
+        self.__pending_keys = []
+        self.__loading_key = None
+        self.__generation = 0
+        self.__closed = False
+
+        self.__thread = threading.Thread(target=self.__prefetch_loop, daemon=True)
+        self.__thread.start()
+
+    def get(self, key: Hashable) -> Any:
+        with self.__condition:
+            self.__condition.wait_for(lambda: self.__loading_key != key)
+            if key in self.__cache:
+                self.__cache.move_to_end(key)
+                return self.__cache[key]
+            generation = self.__generation
+
+        item = self.__load(key)
+        self.__put(key, item, generation)
+        return item
+
+    def prefetch(self, keys: list[Hashable]):
+        with self.__condition:
+            # replaces earlier requests, they are most likely not needed anymore.
+            # leave room for the current item, so prefetching never evicts it:
+            self.__pending_keys = [key for key in keys[:self.max_cached_items - 1] if key not in self.__cache]
+            self.__condition.notify_all()
+
+    def invalidate(self, key: Hashable):
+        with self.__condition:
+            self.__cache.pop(key, None)
+            self.__generation += 1
+
+    def clear(self):
+        with self.__condition:
+            self.__cache.clear()
+            self.__pending_keys = []
+            self.__generation += 1
+
+    def close(self):
+        # waits for at most one item that is currently being loaded
+        with self.__condition:
+            self.__closed = True
+            self.__condition.notify_all()
+        self.__thread.join()
+
+    def __put(self, key: Hashable, item: Any, generation: int):
+        with self.__condition:
+            # items loaded before an invalidation can be outdated
+            if generation == self.__generation:
+                self.__cache[key] = item
+                self.__cache.move_to_end(key)
+                while len(self.__cache) > self.max_cached_items:
+                    self.__cache.popitem(last=False)
+
+    def __prefetch_loop(self):
+        while True:
+            with self.__condition:
+                self.__condition.wait_for(lambda: self.__closed or len(self.__pending_keys) > 0)
+                if self.__closed:
+                    return
+                key = self.__pending_keys.pop(0)
+                if key in self.__cache:
+                    continue
+                self.__loading_key = key
+                generation = self.__generation
+
+            try:
+                item = self.__load(key)
+                self.__put(key, item, generation)
+            except Exception:
+                traceback.print_exc()  # get() loads the item again and raises the error to the caller
+            finally:
+                with self.__condition:
+                    self.__loading_key = None
+                    self.__condition.notify_all()
@@ -0,0 +1,289 @@
+import hashlib
+import json
+import os
+import shutil
+import struct
+import sys
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+from modules.util.state_dict_util import SAFETENSORS_DTYPES
+
+import torch
+
+import safetensors.torch
+
+MANIFEST_FILE_NAME = "backup_manifest.json"
+
+SAFETENSORS_DTYPE_NAMES = {dtype: name for name, dtype in SAFETENSORS_DTYPES.items()}
+
+
+@dataclass
+class BackupStoreStats:
+    total_bytes: int  # size of all files in the backup, including the streamed files
+    stored_bytes: int  # bytes of new chunks, the manifest, and files that are too small to be chunked
+    written_bytes: int  # all bytes written to the disk: the files the saver wrote, the new chunks and the manifest
+    duration: float  # seconds spent in add()
+
+
+class BackupStore:
+    """
+    A content-addressed chunk store for backups. Large files of a backup are split into fixed size chunks, which are
+    saved once under their sha256 hash. The files are then replaced by a manifest that lists the chunks of each file.
+    Chunks of files that did not change since a previous backup, like frozen model components, are only stored once.
+
+    Files are split at fixed offsets. This works well for safetensors files, because a tensor that did not change is
+    written to the same offset in every backup.
+
+    While the saver runs inside stream_safetensors(), safetensors files of the backup are not written to the backup
+    directory. They are serialized directly into chunks, and only chunks that are not in the store yet are written.
+    All other files are written by the saver and moved into the store by add().
+    """
+
+    def __init__(
+            self,
+            store_path: str,
+            chunk_size: int = 16 * 1024 * 1024,
+            min_file_size: int = 1024 * 1024,
+    ):
+        self.store_path = store_path
+        self.chunk_size = chunk_size
+        self.min_file_size = min_file_size
+
+        self.__streamed_files = {}  # relative path -> manifest entry of the files written by stream_safetensors()
+        self.__streamed_chunk_bytes = 0
+
+    @staticmethod
+    def is_deduplicated(backup_path: str) -> bool:
+        return os.path.isfile(os.path.join(backup_path, MANIFEST_FILE_NAME))
+
+    def __chunk_path(self, chunk_hash: str) -> str:
+        return os.path.join(self.store_path, "chunks", chunk_hash[:2], chunk_hash)
+
+    def __write_chunk(self, chunk_hash: str, data: bytes | memoryview) -> bool:
+        chunk_path = self.__chunk_path(chunk_hash)
+        if os.path.exists(chunk_path):
+            return False
+
+        os.makedirs(os.path.dirname(chunk_path), exist_ok=True)
+        # written to a temporary file first, so an interrupted backup never leaves a broken chunk
+        temp_path = f"{chunk_path}.tmp"
+        with open(temp_path, "wb") as chunk_file:
+            chunk_file.write(data)
+        os.replace(temp_path, chunk_path)
+        return True
+
+    def __add_chunk(self, data: bytes | memoryview, chunks: list[str]) -> int:
+        chunk_hash = hashlib.sha256(data).hexdigest()
+        chunks.append(chunk_hash)
+        return len(data) if self.__write_chunk(chunk_hash, data) else 0
+
+    def __stream_safetensors_file(self, tensors: dict[str, torch.Tensor], metadata: dict[str, str] | None) -> dict:
+        # the safetensors layout: the header size, a json header padded to 8 bytes, then the data of all tensors. they
+        # are ordered by element size, so every tensor is aligned
+        keys = sorted(tensors, key=lambda key: (-tensors[key].element_size(), key))
+        header = {} if metadata is None else {"__metadata__": metadata}
+        offset = 0
+        for key in keys:
+            tensor = tensors[key]
+            num_bytes = tensor.numel() * tensor.element_size()
+            header[key] = {
+                "dtype": SAFETENSORS_DTYPE_NAMES[tensor.dtype],
+                "shape": list(tensor.shape),
+                "data_offsets": [offset, offset + num_bytes],
+            }
+            offset += num_bytes
+        header_bytes = json.dumps(header, separators=(",", ":")).encode("utf-8")
+        header_bytes += b" " * (-len(header_bytes) % 8)
+
+        chunks = []
+        # the file is assembled in a single chunk sized buffer
+        buffer = memoryview(bytearray(self.chunk_size))
+        buffer_bytes = 0
+        for data in [struct.pack("<Q", len(header_bytes)) + header_bytes] + [
+            tensors[key].detach().to(device="cpu").contiguous().reshape(-1).view(dtype=torch.uint8).numpy()
+            for key in keys
+        ]:
+            data = memoryview(data)
+            position = 0
+            while position < len(data):
+                num_bytes = min(len(data) - position, self.chunk_size - buffer_bytes)
+                buffer[buffer_bytes:buffer_bytes + num_bytes] = data[position:position + num_bytes]
+                buffer_bytes += num_bytes
+                position += num_bytes
+                if buffer_bytes == self.chunk_size:
+                    self.__streamed_chunk_bytes += self.__add_chunk(buffer, chunks)
+                    buffer_bytes = 0
+        if buffer_bytes > 0:
+            self.__streamed_chunk_bytes += self.__add_chunk(buffer[:buffer_bytes], chunks)
+
+        return {
+            "size": 8 + len(header_bytes) + offset,
+            "chunks": chunks,
+        }
+
+    @contextmanager
+    def stream_safetensors(self, backup_path: str) -> Iterator[None]:
+        """
+        Redirects safetensors.torch.save_file() into the store for all files inside backup_path, including calls from
+        modules that imported save_file directly. Call add() afterwards to write the manifest of the backup.
+        """
+        original_save_file = safetensors.torch.save_file
+        backup_path = os.path.abspath(backup_path)
+
+        def save_file(tensors: dict[str, torch.Tensor], filename, metadata: dict[str, str] | None = None):
+            relative_path = os.path.relpath(os.path.abspath(filename), backup_path)
+            if relative_path.startswith(os.pardir) \
+                    or any(tensor.dtype not in SAFETENSORS_DTYPE_NAMES for tensor in tensors.values()):
+                return original_save_file(tensors, filename, metadata)
+            self.__streamed_files[relative_path.replace(os.sep, "/")] = \
+                self.__stream_safetensors_file(tensors, metadata)
+            return None
+
+        patched_attributes = []
+        for module in list(sys.modules.values()):
+            try:
+                attributes = list(vars(module).items())
+            except TypeError:
+                continue
+            for name, value in attributes:
+                if value is original_save_file:
+                    setattr(module, name, save_file)
+                    patched_attributes.append((module, name))
+
+        self.__streamed_files = {}
+        self.__streamed_chunk_bytes = 0
+        try:
+            yield
+        finally:
+            for module, name in patched_attributes:
+                setattr(module, name, original_save_file)
+
+    def add(self, backup_path: str) -> BackupStoreStats:
+        """
+        Moves all large files of a backup directory into the store, and writes a manifest into the directory. The
+        manifest also lists the files that were streamed into the store by stream_safetensors().
+        """
+        start_time = time.perf_counter()
+        total_bytes = 0
+        small_file_bytes = 0
+        chunk_bytes = 0
+        files = {}
+
+        for dirpath, _, filenames in os.walk(backup_path):
+            for filename in sorted(filenames):
+                path = os.path.join(dirpath, filename)
+                size = os.path.getsize(path)
+                total_bytes += size
+                if size < self.min_file_size:
+                    small_file_bytes += size
+                    continue
+
+                chunks = []
+                with open(path, "rb") as file:
+                    while data := file.read(self.chunk_size):
+                        chunk_bytes += self.__add_chunk(data, chunks)
+
+                files[os.path.relpath(path, backup_path).replace(os.sep, "/")] = {
+                    "size": size,
+                    "chunks": chunks,
+                }
+
+        # the files the saver wrote to the disk, they are deleted after the manifest is written
+        disk_bytes = total_bytes
+        chunked_files = list(files)
+
+        for relative_path, file_info in self.__streamed_files.items():
+            files[relative_path] = file_info
+            total_bytes += file_info["size"]
+        chunk_bytes += self.__streamed_chunk_bytes
+        self.__streamed_files = {}
+        self.__streamed_chunk_bytes = 0
+
+        os.makedirs(backup_path, exist_ok=True)
+        manifest_path = os.path.join(backup_path, MANIFEST_FILE_NAME)
+        with open(manifest_path, "w") as manifest_file:
+            json.dump({
+                "chunk_size": self.chunk_size,
+                "files": files,
+            }, manifest_file)
+        manifest_bytes = os.path.getsize(manifest_path)
+
+        for relative_path in chunked_files:
+            os.remove(os.path.join(backup_path, relative_path))
+
+        return BackupStoreStats(
+            total_bytes=total_bytes,
+            stored_bytes=small_file_bytes + chunk_bytes + manifest_bytes,
+            written_bytes=disk_bytes + chunk_bytes + manifest_bytes,
+            duration=time.perf_counter() - start_time,
+        )
+
+    def restore(self, backup_path: str, destination: str):
+        """
+        Writes the complete backup, including the files that were moved into the store, to the destination directory.
+        """
+        with open(os.path.join(backup_path, MANIFEST_FILE_NAME), "r") as manifest_file:
+            manifest = json.load(manifest_file)
+
+        shutil.copytree(
+            backup_path, destination, ignore=shutil.ignore_patterns(MANIFEST_FILE_NAME), dirs_exist_ok=True
+        )
+
+        for relative_path, file_info in manifest["files"].items():
+            path = os.path.join(destination, *relative_path.split("/"))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as file:
+                for chunk_hash in file_info["chunks"]:
+                    with open(self.__chunk_path(chunk_hash), "rb") as chunk_file:
+                        file.write(chunk_file.read())
+            if os.path.getsize(path) != file_info["size"]:
+                raise RuntimeError(f"restored file {path} does not have the expected size")
+
+    def restored_path(self, backup_path: str) -> str:
+        return os.path.join(self.store_path, "restored", os.path.basename(os.path.normpath(backup_path)))
+
+    def restore_for_loading(self, backup_path: str) -> str:
+        """
+        Restores a backup into the store directory, and returns the path of the restored backup. Previously restored
+        backups are deleted. With multiple GPUs, only one rank may call this.
+        """
+        destination = self.restored_path(backup_path)
+        if os.path.isdir(os.path.dirname(destination)):
+            shutil.rmtree(os.path.dirname(destination))
+
+        self.restore(backup_path, destination)
+        return destination
+
+    def reference_counts(self, backup_paths: list[str]) -> dict[str, int]:
+        reference_counts = {}
+        for backup_path in backup_paths:
+            if not self.is_deduplicated(backup_path):
+                continue
+            with open(os.path.join(backup_path, MANIFEST_FILE_NAME), "r") as manifest_file:
+                manifest = json.load(manifest_file)
+            for file_info in manifest["files"].values():
+                for chunk_hash in file_info["chunks"]:
+                    reference_counts[chunk_hash] = reference_counts.get(chunk_hash, 0) + 1
+        return reference_counts
+
+    def prune(self, backup_paths: list[str]) -> int:
+        """
+        Deletes all chunks that are not referenced by any of the given backups. Returns the number of deleted bytes.
+        """
+        reference_counts = self.reference_counts(backup_paths)
+
+        deleted_bytes = 0
+        chunks_path = os.path.join(self.store_path, "chunks")
+        if os.path.isdir(chunks_path):
+            for dirpath, _, filenames in os.walk(chunks_path):
+                for filename in filenames:
+                    # also deletes temporary files of interrupted backups
+                    if reference_counts.get(filename, 0) == 0:
+                        path = os.path.join(dirpath, filename)
+                        deleted_bytes += os.path.getsize(path)
+                        os.remove(path)
+
+        return deleted_bytes
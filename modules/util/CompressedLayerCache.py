@@ -0,0 +1,133 @@
+from modules.util.enum.OffloadCompression import OffloadCompression
+from modules.util.quantization_util import dequantize_blockwise_, quantize_blockwise
+from modules.util.torch_util import pin_tensor_, unpin_tensor_
+
+import torch
+
+
+def ceil_16(number: int) -> int:
+    return number + (16 - (number % 16)) % 16
+
+
+class _CompressedTensor:
+    def __init__(
+            self,
+            dtype: torch.dtype,
+            shape: torch.Size,
+            data: torch.Tensor,
+            scale: torch.Tensor | None,
+    ):
+        self.dtype = dtype
+        self.shape = shape
+        self.data = data  # quantized data, or the raw tensor if scale is None
+        self.scale = scale
+
+
+class CompressedLayerCache:
+    """
+    Keeps a compressed copy of frozen offloaded layers in (pinned) host memory. Weights are stored as blockwise
+    quantized values with one scale per block. Only the compressed data is transferred to the train device, where it
+    is dequantized into the layer allocation. Tensors that can't be compressed (biases, already quantized weights) are
+    stored unchanged.
+    """
+
+    def __init__(
+            self,
+            compression: OffloadCompression,
+            pin_memory: bool,
+            block_size: int = 128,
+    ):
+        self.__compression = compression
+        self.__pin_memory = pin_memory
+        self.__block_size = block_size
+
+        self.__layer_buffers = {}  # layer_index -> host buffer
+        self.__layer_tensors = {}  # layer_index -> list of _CompressedTensor
+
+        # statistics
+        self.original_bytes = 0
+        self.compressed_bytes = 0
+
+    def has_layer(self, layer_index: int) -> bool:
+        return layer_index in self.__layer_tensors
+
+    def __is_compressible(self, tensor: torch.Tensor) -> bool:
+        return tensor.dim() >= 2 and tensor.dtype in [torch.float32, torch.float16, torch.bfloat16]
+
+    def write_layer(self, layer_index: int, tensors: list[torch.Tensor], device: torch.device):
+        compressed_tensors = []
+        for tensor in tensors:
+            if self.__is_compressible(tensor):
+                data, scale = quantize_blockwise(
+                    tensor.to(device=device), self.__compression.torch_dtype(), self.__block_size)
+                compressed_tensors.append(_CompressedTensor(tensor.dtype, tensor.shape, data, scale))
+            else:
+                compressed_tensors.append(_CompressedTensor(tensor.dtype, tensor.shape, tensor.detach(), None))
+
+        # pack everything into a single host buffer, so only one allocation needs to be pinned
+        num_bytes = 0
+        for t in compressed_tensors:
+            num_bytes = ceil_16(num_bytes) + t.data.numel() * t.data.element_size()
+            if t.scale is not None:
+                num_bytes = ceil_16(num_bytes) + t.scale.numel() * t.scale.element_size()
+
+        buffer = torch.zeros((max(num_bytes, 1),), dtype=torch.uint8, device="cpu")
+        if self.__pin_memory:
+            pin_tensor_(buffer)
+
+        offset = 0
+
+        def pack(source: torch.Tensor) -> torch.Tensor:
+            nonlocal offset
+            offset = ceil_16(offset)
+            source_bytes = source.numel() * source.element_size()
+            packed = buffer[offset:offset + source_bytes].view(dtype=source.dtype).view(size=source.shape)
+            packed.copy_(source)
+            offset += source_bytes
+            return packed
+
+        for t in compressed_tensors:
+            t.data = pack(t.data)
+            if t.scale is not None:
+                t.scale = pack(t.scale)
+
+        self.__layer_buffers[layer_index] = buffer
+        self.__layer_tensors[layer_index] = compressed_tensors
+
+        self.original_bytes += sum(t.numel() * t.element_size() for t in tensors)
+        self.compressed_bytes += num_bytes
+
+    def get_buffers(self) -> list[torch.Tensor]:
+        return list(self.__layer_buffers.values())
+
+    def placeholder_tensors(self, layer_index: int) -> list[torch.Tensor]:
+        # zero-stride tensors with the original shape. they don't hold any memory while the layer is offloaded
+        return [
+            torch.zeros((1,), dtype=t.dtype, device="cpu").expand(t.shape)
+            for t in self.__layer_tensors[layer_index]
+        ]
+
+    def load_(self, layer_index: int, targets: list[torch.Tensor], non_blocking: bool = False):
+        for target, t in zip(targets, self.__layer_tensors[layer_index], strict=True):
+            if t.scale is None:
+                target.copy_(t.data, non_blocking=non_blocking)
+            else:
+                dequantize_blockwise_(target, t.data, t.scale, non_blocking=non_blocking)
+
+    def decompressed_tensors(self, layer_index: int, device: torch.device) -> list[torch.Tensor]:
+        targets = [
+            torch.empty(t.shape, dtype=t.dtype, device=device)
+            for t in self.__layer_tensors[layer_index]
+        ]
+        self.load_(layer_index, targets)
+        return targets
+
+    def clear(self):
+        if self.__pin_memory:
+            for buffer in self.__layer_buffers.values():
+                unpin_tensor_(buffer)
+
+        self.__layer_buffers = {}
+        self.__layer_tensors = {}
+        self.original_bytes = 0
+        self.compressed_bytes = 0
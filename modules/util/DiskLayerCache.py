@@ -0,0 +1,339 @@
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+
+from modules.util.torch_util import pin_tensor_, unpin_tensor_
+
+import torch
+
+import numpy as np
+
+
+def ceil_4096(number: int) -> int:
+    return number + (4096 - (number % 4096)) % 4096
+
+
+def tensor_fingerprint(tensor: torch.Tensor, num_samples: int = 4096) -> str:
+    # hashes the dtype, shape and an evenly spaced sample of the data. reading the full tensor would take about as long
+    # as writing it to disk again
+    flat = tensor.detach().reshape(-1)
+    sample = flat[::max(flat.numel() // num_samples, 1)].to(device="cpu").contiguous()
+    sha256 = hashlib.sha256(f"{tensor.dtype}{list(tensor.shape)}".encode())
+    sha256.update(sample.view(dtype=torch.uint8).numpy().tobytes())
+    return sha256.hexdigest()
+
+
+class _StagingSlot:
+    def __init__(self, num_bytes: int, pin_memory: bool):
+        self.buffer = torch.zeros((num_bytes,), dtype=torch.uint8)
+        if pin_memory:
+            pin_tensor_(self.buffer)
+
+        self.layer_index = None
+        self.ready = threading.Event()
+        self.consumed = False
+        self.last_used = 0
+
+        # recorded after the staged tensors were copied to the train device. the buffer can't be reused before that
+        self.transfer_event = None
+
+    def wait_transfer(self):
+        if self.transfer_event is not None:
+            self.transfer_event.synchronize()
+            self.transfer_event = None
+
+
+class DiskLayerCache:
+    """
+    A third offloading tier for frozen layers. The offloaded tensors of each layer are written to a file in
+    cache_dir and memory-mapped. A read-ahead thread copies layers that will be needed soon from the mapped files
+    into a small number of (pinned) host staging buffers. This reduces the RAM needed for offloading to a few layers,
+    independent of the model size.
+
+    Each layer file is stored together with a key that identifies its contents. Files from earlier runs are reused if
+    their key matches.
+    """
+
+    def __init__(
+            self,
+            cache_dir: str,
+            num_staging_slots: int,
+            pin_memory: bool,
+    ):
+        self.__cache_dir = cache_dir
+        self.__num_staging_slots = max(num_staging_slots, 1)
+        self.__pin_memory = pin_memory
+
+        self.__layer_tensor_metadata = {}  # layer_index -> list of (offset, num_bytes, dtype, shape)
+        self.__layer_bytes = {}  # layer_index -> file size
+        self.__mapped_files = {}  # layer_index -> np.memmap
+
+        self.__slots = []
+        self.__layer_slot_map = {}
+        self.__lock = threading.Lock()
+        self.__usage_counter = 0
+
+        self.__read_queue = queue.Queue()
+        self.__read_thread = None
+
+        # statistics
+        self.stall_time = 0.0
+        self.read_time = 0.0
+        self.read_bytes = 0
+        self.prefetch_hits = 0
+        self.prefetch_misses = 0
+        self.reused_bytes = 0
+
+    def has_layer(self, layer_index: int) -> bool:
+        return layer_index in self.__layer_tensor_metadata
+
+    def write_layer(self, layer_index: int, tensors: list[torch.Tensor], key: str):
+        os.makedirs(self.__cache_dir, exist_ok=True)
+
+        if self.__map_existing_layer(layer_index, key):
+            return
+
+        # the key file is written last, an interrupted write is never reused
+        key_path = self.__key_path(layer_index)
+        if os.path.exists(key_path):
+            os.remove(key_path)
+
+        metadata = []
+        offset = 0
+        path = self.__layer_path(layer_index)
+        with open(path, "wb") as f:
+            for tensor in tensors:
+                data = tensor.detach().to(device="cpu").contiguous().view(dtype=torch.uint8).flatten().numpy()
+                num_bytes = data.nbytes
+                aligned_offset = ceil_4096(offset)
+                if aligned_offset > offset:
+                    f.write(b"\0" * (aligned_offset - offset))
+                f.write(memoryview(data))
+                metadata.append((aligned_offset, num_bytes, tensor.dtype, tensor.shape))
+                offset = aligned_offset + num_bytes
+
+        with open(key_path, "w") as f:
+            json.dump({
+                "key": key,
+                "size": offset,
+                "tensors": [
+                    [tensor_offset, tensor_bytes, str(dtype).removeprefix("torch."), list(shape)]
+                    for tensor_offset, tensor_bytes, dtype, shape in metadata
+                ],
+            }, f)
+
+        self.__layer_tensor_metadata[layer_index] = metadata
+        self.__layer_bytes[layer_index] = offset
+        self.__mapped_files[layer_index] = np.memmap(path, dtype=np.uint8, mode='c', shape=(max(offset, 1),))
+
+    def __map_existing_layer(self, layer_index: int, key: str) -> bool:
+        path = self.__layer_path(layer_index)
+        key_path = self.__key_path(layer_index)
+        if not os.path.exists(path) or not os.path.exists(key_path):
+            return False
+
+        try:
+            with open(key_path) as f:
+                stored = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if stored.get("key") != key or os.path.getsize(path) != stored["size"]:
+            return False
+
+        metadata = [
+            (offset, num_bytes, getattr(torch, dtype), torch.Size(shape))
+            for offset, num_bytes, dtype, shape in stored["tensors"]
+        ]
+        self.__layer_tensor_metadata[layer_index] = metadata
+        self.__layer_bytes[layer_index] = stored["size"]
+        self.__mapped_files[layer_index] = np.memmap(path, dtype=np.uint8, mode='c', shape=(max(stored["size"], 1),))
+        self.reused_bytes += stored["size"]
+        return True
+
+    def mapped_tensors(self, layer_index: int) -> list[torch.Tensor]:
+        mapped_file = torch.from_numpy(self.__mapped_files[layer_index])
+        return [
+            mapped_file[offset:offset + num_bytes].view(dtype=dtype).view(size=shape)
+            for offset, num_bytes, dtype, shape in self.__layer_tensor_metadata[layer_index]
+        ]
+
+    def prefetch(self, layer_indices: list[int]):
+        """
+        Schedules reading the given layers into staging buffers, in the given order. Layers that are already staged
+        or in flight are skipped. Unconsumed prefetched layers are never evicted.
+        """
+        self.__ensure_started()
+
+        for layer_index in layer_indices:
+            with self.__lock:
+                if layer_index in self.__layer_slot_map:
+                    continue
+
+                slot = self.__acquire_slot(layer_index)
+                if slot is None:
+                    break
+
+            self.__read_queue.put(slot)
+
+    def get_tensors(self, layer_index: int) -> list[torch.Tensor]:
+        """
+        Returns host tensors of a layer that can be copied to the train device. The slot of the returned tensors can
+        only be reused after release() was called.
+        """
+        self.__ensure_started()
+
+        with self.__lock:
+            slot = self.__layer_slot_map.get(layer_index)
+            if slot is None:
+                slot = self.__acquire_slot(layer_index)
+                is_hit = False
+            else:
+                is_hit = True
+
+        if slot is None:
+            # all staging buffers are in use, read directly from the mapped file
+            self.prefetch_misses += 1
+            return self.mapped_tensors(layer_index)
+
+        start_time = time.perf_counter()
+        if is_hit:
+            slot.ready.wait()
+        else:
+            self.__read_slot(slot)
+        self.stall_time += time.perf_counter() - start_time
+
+        if is_hit:
+            self.prefetch_hits += 1
+        else:
+            self.prefetch_misses += 1
+
+        with self.__lock:
+            slot.consumed = True
+            self.__usage_counter += 1
+            slot.last_used = self.__usage_counter
+
+        return [
+            slot.buffer[offset:offset + num_bytes].view(dtype=dtype).view(size=shape)
+            for offset, num_bytes, dtype, shape in self.__layer_tensor_metadata[layer_index]
+        ]
+
+    def release(self, layer_index: int, transfer_event=None):
+        with self.__lock:
+            slot = self.__layer_slot_map.get(layer_index)
+            if slot is not None:
+                slot.transfer_event = transfer_event
+
+    def resident_bytes(self) -> int:
+        return sum(slot.buffer.shape[0] for slot in self.__slots)
+
+    def stored_bytes(self) -> int:
+        return sum(self.__layer_bytes.values())
+
+    def reset_statistics(self):
+        self.stall_time = 0.0
+        self.read_time = 0.0
+        self.read_bytes = 0
+        self.prefetch_hits = 0
+        self.prefetch_misses = 0
+
+    def deallocate_cache(self):
+        self.__stop()
+
+        with self.__lock:
+            for slot in self.__slots:
+                slot.wait_transfer()
+                if self.__pin_memory:
+                    unpin_tensor_(slot.buffer)
+            self.__slots = []
+            self.__layer_slot_map = {}
+
+    def clear(self):
+        self.deallocate_cache()
+
+        for layer_index in list(self.__mapped_files.keys()):
+            path = self.__layer_path(layer_index)
+            del self.__mapped_files[layer_index]
+            if os.path.exists(path):
+                os.remove(path)
+
+        self.__layer_tensor_metadata = {}
+        self.__layer_bytes = {}
+        self.remove_unused_files()
+
+    def remove_unused_files(self):
+        """
+        Deletes all files in cache_dir that don't belong to a layer of this cache, for example layers that were frozen
+        in an earlier run.
+        """
+        if not os.path.isdir(self.__cache_dir):
+            return
+
+        used_files = set()
+        for layer_index in self.__mapped_files:
+            used_files.add(os.path.basename(self.__layer_path(layer_index)))
+            used_files.add(os.path.basename(self.__key_path(layer_index)))
+
+        for file_name in os.listdir(self.__cache_dir):
+            if file_name not in used_files:
+                os.remove(os.path.join(self.__cache_dir, file_name))
+
+        if len(os.listdir(self.__cache_dir)) == 0:
+            os.rmdir(self.__cache_dir)
+
+    def __layer_path(self, layer_index: int) -> str:
+        return os.path.join(self.__cache_dir, f"layer_{layer_index}.bin")
+
+    def __key_path(self, layer_index: int) -> str:
+        return os.path.join(self.__cache_dir, f"layer_{layer_index}.json")
+
+    def __acquire_slot(self, layer_index: int) -> _StagingSlot | None:
+        # must be called while holding the lock
+        if len(self.__slots) < self.__num_staging_slots:
+            slot_bytes = max(self.__layer_bytes.values())
+            slot = _StagingSlot(slot_bytes, self.__pin_memory)
+            self.__slots.append(slot)
+        else:
+            evictable_slots = [s for s in self.__slots if s.consumed and s.ready.is_set()]
+            if len(evictable_slots) == 0:
+                return None
+            slot = min(evictable_slots, key=lambda s: s.last_used)
+            self.__layer_slot_map.pop(slot.layer_index, None)
+
+        slot.layer_index = layer_index
+        slot.consumed = False
+        slot.ready.clear()
+        self.__layer_slot_map[layer_index] = slot
+        return slot
+
+    def __read_slot(self, slot: _StagingSlot):
+        slot.wait_transfer()
+
+        start_time = time.perf_counter()
+        layer_index = slot.layer_index
+        num_bytes = self.__layer_bytes[layer_index]
+        slot.buffer[:num_bytes].copy_(torch.from_numpy(self.__mapped_files[layer_index][:num_bytes]))
+        self.read_time += time.perf_counter() - start_time
+        self.read_bytes += num_bytes
+
+        slot.ready.set()
+
+    def __read_loop(self):
+        while True:
+            slot = self.__read_queue.get()
+            if slot is None:
+                return
+            self.__read_slot(slot)
+
+    def __ensure_started(self):
+        if self.__read_thread is None:
+            self.__read_thread = threading.Thread(target=self.__read_loop, daemon=True)
+            self.__read_thread.start()
+
+    def __stop(self):
+        if self.__read_thread is not None:
+            self.__read_queue.put(None)
+            self.__read_thread.join()
+            self.__read_thread = None
@@ -0,0 +1,152 @@
+import math
+
+from modules.util.enum.GradientCompression import GradientCompression
+from modules.util.PendingReduce import PendingReduce
+from modules.util.quantization_util import dequantize_blockwise_, quantize_blockwise
+
+import torch
+
+
+class GradientCompressor:
+    """
+    Sums gradients of all ranks using less communication than an all-reduce in float32.
+
+    POWER_SGD: each gradient matrix is approximated by a low rank product P @ Q.T, and only P and Q are reduced. Q is
+        reused in the next step, which makes a single power iteration per step sufficient. Tensors that can't be
+        compressed by the given rank, such as biases, are reduced without compression. This mode is experimental.
+        In gradient_compression_benchmark (3 ranks, width 256, 60 steps), rank 4 ends at a test loss of 0.935 instead
+        of 0.703, with a per step gradient error of up to 2.56x and an accumulated error of 0.29. More power
+        iterations, uncompressed warmup steps or a local error feedback term don't change this much. Only a higher
+        rank does (rank 32: 0.78, at the bandwidth of INT8).
+    INT8, FLOAT8: the gradient is split into one chunk per rank. Each rank receives its chunk from all other ranks in
+        blockwise quantized form, sums it, and sends the quantized sum back to all other ranks.
+
+    Compression errors are kept in error feedback buffers, and added to the gradient of the next step. This way, no
+    part of the gradient is lost.
+    """
+
+    def __init__(
+            self,
+            compression: GradientCompression,
+            rank: int = 4,
+            block_size: int = 256,
+    ):
+        self.__compression = compression
+        self.__rank = rank
+        self.__block_size = block_size
+
+        self.__errors = {}  # parameter -> float32 error feedback buffer of the local gradient
+        self.__chunk_errors = {}  # parameter -> float32 error feedback buffer of the summed chunk of this rank
+        self.__qs = {}  # parameter -> PowerSGD Q matrix
+
+    def reduce(self, param: torch.Tensor, grad: torch.Tensor, async_op: bool) -> PendingReduce:
+        if self.__compression == GradientCompression.POWER_SGD:
+            if grad.dim() < 2:
+                return self.__reduce_uncompressed(grad, async_op)
+            rows = grad.shape[0]
+            columns = grad.numel() // rows
+            if (rows + columns) * min(self.__rank, rows, columns) >= rows * columns:
+                return self.__reduce_uncompressed(grad, async_op)
+            return self.__reduce_power_sgd(param, grad, async_op)
+        else:
+            return self.__reduce_quantized(param, grad, async_op)
+
+    @staticmethod
+    def __all_reduce_bytes(tensor: torch.Tensor) -> int:
+        # bytes sent by each rank in a ring all-reduce
+        world_size = torch.distributed.get_world_size()
+        return 2 * (world_size - 1) * tensor.numel() * tensor.element_size() // world_size
+
+    def __compensate(self, param: torch.Tensor, grad: torch.Tensor) -> torch.Tensor:
+        error = self.__errors.get(param)
+        if error is None:
+            error = torch.zeros(grad.shape, dtype=torch.float32, device=grad.device)
+            self.__errors[param] = error
+        # like the uncompressed all-reduce, this can modify a float32 grad in place
+        return grad.float().add_(error)
+
+    def __reduce_uncompressed(self, grad: torch.Tensor, async_op: bool) -> PendingReduce:
+        grad = grad.float()
+        work = torch.distributed.all_reduce(grad, op=torch.distributed.ReduceOp.SUM, async_op=async_op)
+        return PendingReduce(work, lambda: grad, self.__all_reduce_bytes(grad))
+
+    def __quantize(self, tensor: torch.Tensor, parts: int) -> tuple[torch.Tensor, torch.Tensor]:
+        # returns the quantized values and scales of each part packed into one row of bytes, and the dequantized tensor
+        quantized, scale = quantize_blockwise(tensor, self.__compression.torch_dtype(), self.__block_size)
+        dequantized = torch.empty_like(tensor)
+        dequantize_blockwise_(dequantized, quantized, scale)
+        packed = torch.cat([
+            quantized.view(dtype=torch.uint8).view(parts, -1),
+            scale.view(parts, -1).view(dtype=torch.uint8),
+        ], dim=1)
+        return packed, dequantized
+
+    def __dequantize(self, packed: torch.Tensor, chunk_numel: int) -> torch.Tensor:
+        quantized = packed[:, :chunk_numel].reshape(-1, self.__block_size).view(dtype=self.__compression.torch_dtype())
+        scale = packed[:, chunk_numel:].contiguous().view(dtype=torch.float32).flatten()
+        dequantized = torch.empty((packed.shape[0], chunk_numel), dtype=torch.float32, device=packed.device)
+        dequantize_blockwise_(dequantized, quantized, scale)
+        return dequantized
+
+    def __reduce_quantized(self, param: torch.Tensor, grad: torch.Tensor, async_op: bool) -> PendingReduce:
+        world_size = torch.distributed.get_world_size()
+        compensated = self.__compensate(param, grad).flatten()
+
+        # chunks are aligned to blocks, so every block belongs to one rank
+        chunk_numel = math.ceil(compensated.numel() / (world_size * self.__block_size)) * self.__block_size
+        padded = torch.nn.functional.pad(compensated, (0, chunk_numel * world_size - compensated.numel()))
+        send_buffer, dequantized = self.__quantize(padded, world_size)
+        torch.sub(compensated, dequantized[:compensated.numel()], out=self.__errors[param].view(-1))
+        del compensated, padded, dequantized
+
+        receive_buffer = torch.empty_like(send_buffer)
+        work = torch.distributed.all_to_all_single(receive_buffer, send_buffer, async_op=async_op)
+
+        def finish() -> torch.Tensor:
+            chunk = self.__dequantize(receive_buffer, chunk_numel).sum(dim=0)
+
+            chunk_error = self.__chunk_errors.get(param)
+            if chunk_error is None:
+                chunk_error = torch.zeros_like(chunk)
+                self.__chunk_errors[param] = chunk_error
+            chunk.add_(chunk_error)
+            chunk_buffer, dequantized_chunk = self.__quantize(chunk, 1)
+            torch.sub(chunk, dequantized_chunk, out=chunk_error)
+
+            gathered_buffer = torch.empty((world_size, chunk_buffer.shape[1]), dtype=torch.uint8, device=grad.device)
+            torch.distributed.all_gather(list(gathered_buffer.unbind(0)), chunk_buffer[0])
+            return self.__dequantize(gathered_buffer, chunk_numel).flatten()[:grad.numel()].view(grad.shape)
+
+        # the all-to-all and the all-gather both send world_size - 1 of world_size chunks
+        transferred_bytes = 2 * (world_size - 1) * send_buffer.numel() // world_size
+        return PendingReduce(work, finish, transferred_bytes, finish_communicates=True)
+
+    def __reduce_power_sgd(self, param: torch.Tensor, grad: torch.Tensor, async_op: bool) -> PendingReduce:
+        compensated = self.__compensate(param, grad)
+        matrix = compensated.view(compensated.shape[0], -1)
+
+        q = self.__qs.get(param)
+        if q is None:
+            # must be the same in all ranks
+            generator = torch.Generator().manual_seed(0)
+            q = torch.randn((matrix.shape[1], min(self.__rank, *matrix.shape)), generator=generator)
+            q = q.to(device=matrix.device)
+        p = matrix @ q
+        work = torch.distributed.all_reduce(p, op=torch.distributed.ReduceOp.SUM, async_op=async_op)
+
+        def finish() -> torch.Tensor:
+            # the reduced p is the same in all ranks, so the orthogonal basis is the same as well
+            orthogonal_p = torch.linalg.qr(p).Q
+            q = matrix.T @ orthogonal_p
+            torch.distributed.all_reduce(q, op=torch.distributed.ReduceOp.SUM)
+            self.__qs[param] = q
+
+            result = orthogonal_p @ q.T
+            # the error is the difference to the mean approximation, which is what the optimizer uses
+            torch.sub(matrix, result, alpha=1.0 / torch.distributed.get_world_size(),
+                      out=self.__errors[param].view_as(matrix))
+            return result.view(grad.shape)
+
+        return PendingReduce(
+            work, finish, self.__all_reduce_bytes(p) + self.__all_reduce_bytes(q), finish_communicates=True
+        )
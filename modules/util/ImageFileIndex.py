@@ -0,0 +1,101 @@
+import os
+import threading
+
+from modules.util import path_util
+
+
+class ImageFileIndex:
+    """
+    Sorted relative paths of the supported image files in a directory, excluding masks and conditioning images.
+
+    Indexes are shared between windows through get(). A refresh stats every indexed directory, but only lists the
+    directories that were modified since the previous refresh, so refreshing a large concept is cheap.
+    """
+
+    __indexes = {}
+    __indexes_lock = threading.Lock()
+
+    def __init__(self, directory: str, include_subdirectories: bool):
+        self.directory = directory
+        self.include_subdirectories = include_subdirectories
+
+        self.__lock = threading.Lock()
+        self.__directories = {}  # relative directory -> (mtime_ns, image file names, subdirectory names)
+        self.__paths = []
+
+        self.refresh()
+
+    @staticmethod
+    def get(directory: str, include_subdirectories: bool) -> 'ImageFileIndex':
+        key = (os.path.abspath(directory), include_subdirectories)
+        with ImageFileIndex.__indexes_lock:
+            index = ImageFileIndex.__indexes.get(key)
+            if index is None:
+                index = ImageFileIndex(directory, include_subdirectories)
+                ImageFileIndex.__indexes[key] = index
+                return index
+
+        index.refresh()
+        return index
+
+    @staticmethod
+    def is_supported_image(filename: str) -> bool:
+        name, extension = os.path.splitext(filename)
+        return path_util.is_supported_image_extension(extension) \
+            and not name.endswith("-masklabel") and not name.endswith("-condlabel")
+
+    def paths(self) -> list[str]:
+        return self.__paths
+
+    def __len__(self) -> int:
+        return len(self.__paths)
+
+    def refresh(self) -> bool:
+        """
+        Updates the index from the file system. Returns True if the list of images changed.
+        """
+        with self.__lock:
+            directories = {}
+            changed = False
+
+            pending = [""]
+            while pending:
+                relative_directory = pending.pop()
+                try:
+                    mtime = os.stat(os.path.join(self.directory, relative_directory)).st_mtime_ns
+                except OSError:
+                    continue
+
+                entry = self.__directories.get(relative_directory)
+                if entry is None or entry[0] != mtime:
+                    entry = self.__list_directory(relative_directory, mtime)
+                    changed = True
+                directories[relative_directory] = entry
+
+                if self.include_subdirectories:
+                    pending += [os.path.join(relative_directory, name) for name in entry[2]]
+
+            if changed or directories.keys() != self.__directories.keys():
+                self.__paths = sorted(
+                    os.path.join(relative_directory, filename)
+                    for relative_directory, (_, filenames, _) in directories.items()
+                    for filename in filenames
+                )
+                changed = True
+
+            self.__directories = directories
+            return changed
+
+    def __list_directory(self, relative_directory: str, mtime: int) -> tuple[int, list[str], list[str]]:
+        filenames = []
+        subdirectories = []
+        try:
+            with os.scandir(os.path.join(self.directory, relative_directory)) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirectories.append(entry.name)
+                    elif entry.is_file() and self.is_supported_image(entry.name):
+                        filenames.append(entry.name)
+        except OSError:
+            pass
+        return mtime, filenames, subdirectories
@@ -1,9 +1,16 @@
+import hashlib
 import math
+import os
 import random
 from typing import Any
 
+from modules.util.CompressedLayerCache import CompressedLayerCache
 from modules.util.config.TrainConfig import TrainConfig
-from modules.util.quantization_util import get_offload_tensor_bytes, offload_quantized
+from modules.util.DiskLayerCache import DiskLayerCache, tensor_fingerprint
+from modules.util.enum.OffloadCompression import OffloadCompression
+from modules.util.enum.TrainingMethod import TrainingMethod
+from modules.util.LayerOffloadPlanner import LayerOffloadPlan, LayerOffloadStrategy, load_offload_strategies
+from modules.util.quantization_util import get_offload_tensor_bytes, get_offload_tensors, offload_quantized
 from modules.util.torch_util import (
     create_stream_context,
     device_equals,
@@ -279,6 +286,9 @@ class StaticActivationAllocator:
 
         self.__max_allocated_bytes = max(self.__max_allocated_bytes, self.__allocated_bytes)
 
+    def get_cache_tensors(self) -> list[torch.Tensor]:
+        return list(self.__cache_tensors)
+
     def allocate_like(self, source_tensor: torch.Tensor) -> torch.Tensor:
         num_bytes = source_tensor.element_size() * source_tensor.numel()
         cache_tensor = self.__cache_tensors[self.__current_cache_tensor]
@@ -373,154 +383,6 @@ class SyncEvent:
             return f"event({self.__log_msg}, done={self.__torch_event.query()})"
 
 
-class LayerOffloadStrategy:
-    def __init__(
-            self,
-            layers: list[nn.Module],
-            layer_offload_fraction: float,
-    ):
-        layer_bytes = [sum([get_offload_tensor_bytes(x) for x in layer.modules()]) for layer in layers]
-        total_bytes = sum(layer_bytes)
-        target_loaded_bytes = int(total_bytes * (1.0 - layer_offload_fraction))
-
-        # calculate min number of loaded layers at the start
-        self.initial_loaded_layers = self.__get_layers_below(
-            layer_bytes=layer_bytes,
-            start_layer=0,
-            max_bytes=target_loaded_bytes,
-            is_forward=True,
-            is_cyclic=False,
-        )
-
-        # the offloading strategy has 3 cases:
-        # case 1, forward pass, followed by a backward pass:
-        #     do not offload the last layers, they will be needed immediately
-        # case 2, forward pass,  followed by another forward pass:
-        #     start loading the first layers when executing the last layers
-        # case 3, backward pass:
-        #     same as case 1, but in reversed order
-
-        # calculate a list of loaded layers before execution of each layer
-        self.forward_backward_loaded_layers = [self.__get_layers_below(
-            layer_bytes=layer_bytes,
-            start_layer=i,
-            max_bytes=target_loaded_bytes,
-            is_forward=True,
-            is_cyclic=False,
-        ) for i in range(len(layers))]
-
-        self.forward_forward_loaded_layers = [self.__get_layers_below(
-            layer_bytes=layer_bytes,
-            start_layer=i,
-            max_bytes=target_loaded_bytes,
-            is_forward=True,
-            is_cyclic=True,
-        ) for i in range(len(layers))]
-
-        self.backward_forward_loaded_layers = [self.__get_layers_below(
-            layer_bytes=layer_bytes,
-            start_layer=i,
-            max_bytes=target_loaded_bytes,
-            is_forward=False,
-            is_cyclic=False,
-        ) for i in range(len(layers))]
-
-        all_loaded_layers = self.forward_backward_loaded_layers \
-                            + self.forward_forward_loaded_layers \
-                            + self.backward_forward_loaded_layers
-
-        self.max_loaded_bytes = max(sum([layer_bytes[i] for i in loaded_layers]) for loaded_layers in all_loaded_layers)
-        min_loaded_bytes = min(sum([layer_bytes[i] for i in loaded_layers]) for loaded_layers in all_loaded_layers)
-        self.max_offloaded_bytes = total_bytes - min_loaded_bytes + max(layer_bytes)
-
-    @staticmethod
-    def __get_layers_below(
-            layer_bytes: list[int],
-            start_layer: int,
-            max_bytes: int,
-            is_forward: bool,
-            is_cyclic: bool,
-    ) -> list[int]:
-        accumulator = 0
-        layers = []
-        if is_forward and is_cyclic:
-            for i in range(start_layer, len(layer_bytes)):
-                accumulator += layer_bytes[i]
-                if accumulator > max_bytes and len(layers) >= 2:
-                    break
-                layers.append(i)
-            for i in range(start_layer):
-                accumulator += layer_bytes[i]
-                if accumulator > max_bytes and len(layers) >= 2:
-                    break
-                layers.append(i)
-        elif is_forward and not is_cyclic:
-            for i in range(start_layer, len(layer_bytes)):
-                accumulator += layer_bytes[i]
-                if accumulator > max_bytes and len(layers) >= 2:
-                    break
-                layers.append(i)
-            for i in range(start_layer - 1, -1, -1):
-                accumulator += layer_bytes[i]
-                if accumulator > max_bytes and len(layers) >= 2:
-                    break
-                layers.append(i)
-        else:
-            for i in range(start_layer, -1, -1):
-                accumulator += layer_bytes[i]
-                if accumulator > max_bytes and len(layers) >= 2:
-                    break
-                layers.append(i)
-            for i in range(start_layer + 1, len(layer_bytes)):
-                accumulator += layer_bytes[i]
-                if accumulator > max_bytes and len(layers) >= 2:
-                    break
-                layers.append(i)
-        return sorted(layers)
-
-    def get_layers_to_offload(
-            self,
-            layer_index: int,
-            is_forward: bool,
-            is_next_forward: bool,
-            loaded_layers: list[int],
-    ) -> list[int]:
-        layers = []
-        if is_forward and is_next_forward:
-            layers = sorted([i for i in loaded_layers if i not in self.forward_forward_loaded_layers[layer_index]])
-        if is_forward and not is_next_forward:
-            layers = sorted([i for i in loaded_layers if i not in self.forward_backward_loaded_layers[layer_index]])
-        if not is_forward:
-            layers = sorted([i for i in loaded_layers if i not in self.backward_forward_loaded_layers[layer_index]],
-                            reverse=True)
-
-        if is_forward:
-            return [x for x in layers if x >= layer_index] + [x for x in layers if x < layer_index]
-        else:
-            return [x for x in layers if x < layer_index] + [x for x in layers if x >= layer_index]
-
-    def get_layers_to_load(
-            self,
-            layer_index: int,
-            is_forward: bool,
-            is_next_forward: bool,
-            loaded_layers: list[int],
-    ) -> list[int]:
-        layers = []
-        if is_forward and is_next_forward:
-            layers = sorted([i for i in self.forward_forward_loaded_layers[layer_index] if i not in loaded_layers])
-        if is_forward and not is_next_forward:
-            layers = sorted([i for i in self.forward_backward_loaded_layers[layer_index] if i not in loaded_layers])
-        if not is_forward:
-            layers = sorted([i for i in self.backward_forward_loaded_layers[layer_index] if i not in loaded_layers],
-                            reverse=True)
-
-        if is_forward:
-            return [x for x in layers if x >= layer_index] + [x for x in layers if x < layer_index]
-        else:
-            return [x for x in layers if x < layer_index] + [x for x in layers if x >= layer_index]
-
-
 class LayerOffloadConductor:
     __module: nn.Module
 
@@ -544,6 +406,12 @@ class LayerOffloadConductor:
     __train_device_layer_allocator: StaticLayerAllocator
     __temp_device_layer_allocator: StaticLayerAllocator
     __temp_device_activations_allocator: StaticActivationAllocator
+    __disk_cache: DiskLayerCache | None
+    __disk_layers: set[int]
+    __num_disk_prefetch_layers: int
+    __compressed_cache: CompressedLayerCache | None
+    __compressed_layers: set[int]
+    __saves_frozen_layers: bool
 
     __layer_train_event_map: list[SyncEvent]
     __layer_transfer_event_map: list[SyncEvent]
@@ -552,7 +420,8 @@ class LayerOffloadConductor:
     __call_index_layer_index_map: dict[int, int]
     __activations_transfer_event_map: dict[int, SyncEvent]
 
-    __offload_strategy = LayerOffloadStrategy | None
+    __offload_strategy: LayerOffloadStrategy | None
+    __planned_strategies: list[LayerOffloadStrategy]
     __is_forward_pass: bool
     __keep_graph: bool
 
@@ -595,6 +464,22 @@ class LayerOffloadConductor:
         self.__temp_device_layer_allocator = StaticLayerAllocator(self.__temp_device)
         self.__temp_device_activations_allocator = StaticActivationAllocator(self.__temp_device)
 
+        if self.__offload_layers and config.layer_offload_disk_cache:
+            self.__disk_cache = DiskLayerCache(
+                cache_dir=os.path.join(config.cache_dir, "layer_offload", self.__disk_cache_name(module, config)),
+                num_staging_slots=config.layer_offload_disk_prefetch_layers,
+                pin_memory=self.__temp_device.type == "cpu",
+            )
+        else:
+            self.__disk_cache = None
+        self.__disk_layers = set()
+        self.__num_disk_prefetch_layers = config.layer_offload_disk_prefetch_layers
+
+        self.__compressed_cache = None
+        self.__compressed_layers = set()
+        # fine-tunes save the complete model, including the frozen layers
+        self.__saves_frozen_layers = config.training_method in [TrainingMethod.FINE_TUNE, TrainingMethod.FINE_TUNE_VAE]
+
         self.__layer_train_event_map = []
         self.__layer_transfer_event_map = []
 
@@ -603,6 +488,10 @@ class LayerOffloadConductor:
         self.__activations_transfer_event_map = {}
 
         self.__offload_strategy = None
+        if self.__offload_layers and config.layer_offload_plan:
+            self.__planned_strategies = load_offload_strategies(config.layer_offload_plan)
+        else:
+            self.__planned_strategies = []
         self.__is_forward_pass = False
         self.__keep_graph = False
 
@@ -616,6 +505,78 @@ class LayerOffloadConductor:
     def layer_offload_activated(self) -> bool:
         return self.__offload_layers
 
+    def get_disk_cache(self) -> DiskLayerCache | None:
+        return self.__disk_cache
+
+    def release_disk_cache(self):
+        # stops the read-ahead thread and frees the staging buffers. files of layers used in this run are kept, so
+        # the next run with the same model can reuse them
+        if self.__disk_cache is not None:
+            self.__disk_cache.deallocate_cache()
+            self.__disk_cache.remove_unused_files()
+
+    @staticmethod
+    def __disk_cache_name(module: nn.Module, config: TrainConfig) -> str:
+        # stable between runs. the contents of each layer file are checked separately before reuse
+        model_name_hash = hashlib.sha256(config.base_model_name.encode()).hexdigest()[:16]
+        return f"{type(module).__name__}_{model_name_hash}"
+
+    def get_compressed_cache(self) -> CompressedLayerCache | None:
+        return self.__compressed_cache
+
+    def set_offload_compression(self, compression: OffloadCompression):
+        # only applied to frozen layers. must be called before the model is moved to the train device
+        if self.__compressed_cache is not None:
+            self.__compressed_cache.clear()
+
+        if self.__offload_layers and compression != OffloadCompression.NONE and self.__saves_frozen_layers:
+            # the frozen layers are restored from the compressed copy, the exact weights are not kept
+            raise RuntimeError('offload compression can not be used for fine tuning, because the frozen layers would '
+                               'be saved with reduced precision')
+
+        if self.__offload_layers and compression != OffloadCompression.NONE:
+            self.__compressed_cache = CompressedLayerCache(
+                compression=compression,
+                pin_memory=self.__temp_device.type == "cpu",
+            )
+        else:
+            self.__compressed_cache = None
+        self.__compressed_layers = set()
+
+    def get_layer_bytes(self) -> list[int]:
+        return [sum([get_offload_tensor_bytes(x) for x in layer.modules()]) for layer in self.__layers]
+
+    def get_cache_tensors(self) -> dict[str, list[torch.Tensor]]:
+        # layer caches are allocated on first use, tensors that are not allocated yet are not returned
+        caches = {
+            "layer cache": [
+                x for x in self.__train_device_layer_allocator.cache_tensors
+                + self.__temp_device_layer_allocator.cache_tensors
+                if x is not None
+            ],
+            "activation cache": self.__temp_device_activations_allocator.get_cache_tensors(),
+        }
+        if self.__compressed_cache is not None:
+            caches["compressed layer cache"] = self.__compressed_cache.get_buffers()
+        return caches
+
+    def set_offload_plan(self, plan: LayerOffloadPlan | None):
+        # the plan is applied the next time the model is moved to the train device
+        self.__planned_strategies = [plan.strategy] if plan is not None else []
+        if plan is not None:
+            self.__layer_offload_fraction = plan.layer_offload_fraction
+
+    def __create_offload_strategy(self) -> LayerOffloadStrategy:
+        layer_bytes = self.get_layer_bytes()
+        for strategy in self.__planned_strategies:
+            if strategy.layer_bytes == layer_bytes:
+                return strategy
+
+        if len(self.__planned_strategies) > 0:
+            print(f"No layer offload plan matches the layers of {type(self.__module).__name__}, "
+                  f"using a layer offload fraction of {self.__layer_offload_fraction}")
+        return LayerOffloadStrategy(layer_bytes, self.__layer_offload_fraction)
+
     def to(self, device: torch.device):
         torch_gc()
 
@@ -629,12 +590,21 @@ class LayerOffloadConductor:
             self.__train_device_layer_allocator.deallocate_cache()
             self.__temp_device_layer_allocator.deallocate_cache()
             self.__temp_device_activations_allocator.deallocate_cache()
+            if self.__disk_cache is not None:
+                self.__disk_cache.deallocate_cache()
 
             self.__module_to_device_except_layers(self.__temp_device)
             for layer_index, layer in enumerate(self.__layers):
+                if layer_index in self.__disk_layers:
+                    # frozen layers are not copied back into RAM, they are mapped from the disk cache instead
+                    self.__replace_layer_tensors(layer_index, self.__disk_cache.mapped_tensors(layer_index))
+                elif layer_index in self.__compressed_layers:
+                    self.__replace_layer_tensors(
+                        layer_index, self.__compressed_cache.decompressed_tensors(layer_index, self.__temp_device))
                 self.__layers[layer_index].to(self.__temp_device)
-                for module in layer.modules():
-                    offload_quantized(module, self.__temp_device, allocator=clone_tensor_allocator)
+                if layer_index not in self.__disk_layers and layer_index not in self.__compressed_layers:
+                    for module in layer.modules():
+                        offload_quantized(module, self.__temp_device, allocator=clone_tensor_allocator)
                 self.__layer_device_map[layer_index] = None
 
             self.__is_active = False
@@ -642,12 +612,15 @@ class LayerOffloadConductor:
         elif device_equals(device, self.__train_device):
             log("to train device")
 
-            self.__offload_strategy = LayerOffloadStrategy(self.__layers, self.__layer_offload_fraction)
+            self.__offload_strategy = self.__create_offload_strategy()
+
+            self.__update_frozen_layers()
 
             self.__train_device_layer_allocator.allocate_cache(
                 self.__layers, self.__offload_strategy.max_loaded_bytes)
-            self.__temp_device_layer_allocator.allocate_cache(
-                self.__layers, self.__offload_strategy.max_offloaded_bytes)
+            temp_device_bytes = self.__get_temp_device_bytes()
+            if temp_device_bytes > 0:
+                self.__temp_device_layer_allocator.allocate_cache(self.__layers, temp_device_bytes)
             self.__module_to_device_except_layers(self.__train_device)
 
             # move all layers to the train device, then move offloadable tensors back to the temp device
@@ -659,9 +632,20 @@ class LayerOffloadConductor:
                     if layer_index in self.__offload_strategy.initial_loaded_layers:
                         allocator = self.__train_device_layer_allocator.get_allocator(
                             layer_index, allocate_forward=True)
-                        for module in layer.modules():
-                            offload_quantized(module, self.__train_device, allocator=allocator.allocate_like)
+                        if layer_index in self.__compressed_layers:
+                            # use the decompressed weights from the start to keep results consistent
+                            self.__load_compressed_layer(layer_index, allocator, non_blocking=False)
+                        else:
+                            for module in layer.modules():
+                                offload_quantized(module, self.__train_device, allocator=allocator.allocate_like)
                         self.__layer_device_map[layer_index] = self.__train_device
+                    elif layer_index in self.__disk_layers:
+                        self.__replace_layer_tensors(layer_index, self.__disk_cache.mapped_tensors(layer_index))
+                        self.__layer_device_map[layer_index] = self.__temp_device
+                    elif layer_index in self.__compressed_layers:
+                        self.__replace_layer_tensors(
+                            layer_index, self.__compressed_cache.placeholder_tensors(layer_index))
+                        self.__layer_device_map[layer_index] = self.__temp_device
                     else:
                         allocator = self.__temp_device_layer_allocator.get_allocator(layer_index, allocate_forward=True)
                         for module in layer.modules():
@@ -761,6 +745,16 @@ class LayerOffloadConductor:
             ):
                 self.__schedule_layer_to(i, self.__train_device, is_forward=self.__is_forward_pass)
 
+            if self.__disk_cache is not None:
+                self.__disk_cache.prefetch([
+                    i for i in self.__offload_strategy.get_layers_to_prefetch(
+                        layer_index=layer_index,
+                        is_forward=self.__is_forward_pass,
+                        is_next_forward=not self.__keep_graph,
+                        num_steps=self.__num_disk_prefetch_layers,
+                    ) if i in self.__disk_layers
+                ])
+
         return activations
 
     def after_layer(self, layer_index: int, call_index: int, activations: Any):
@@ -783,6 +777,65 @@ class LayerOffloadConductor:
             event = SyncEvent(self.__train_stream.record_event(), f"train on {self.__train_device}")
             self.__layer_train_event_map[layer_index] = event
 
+    def __get_layer_offload_tensors(self, layer_index: int) -> list[torch.Tensor]:
+        return [t for module in self.__layers[layer_index].modules() for t in get_offload_tensors(module)]
+
+    def __replace_layer_tensors(self, layer_index: int, tensors: list[torch.Tensor]):
+        for target, source in zip(self.__get_layer_offload_tensors(layer_index), tensors, strict=True):
+            target.data = source
+
+    def __load_compressed_layer(
+            self,
+            layer_index: int,
+            allocator: StaticLayerTensorAllocator | None,
+            non_blocking: bool,
+    ):
+        targets = []
+        for tensor in self.__get_layer_offload_tensors(layer_index):
+            if allocator is not None:
+                targets.append(allocator.allocate_like(tensor))
+            else:
+                targets.append(torch.empty(tensor.shape, dtype=tensor.dtype, device=self.__train_device))
+
+        self.__compressed_cache.load_(layer_index, targets, non_blocking=non_blocking)
+        self.__replace_layer_tensors(layer_index, targets)
+
+    def __update_frozen_layers(self):
+        # only frozen layers can be stored on disk or compressed, trained layers change after every optimizer step
+        self.__disk_layers = set()
+        self.__compressed_layers = set()
+
+        if self.__disk_cache is None and self.__compressed_cache is None:
+            return
+
+        layer_names = {id(module): name for name, module in self.__module.named_modules()}
+        for layer_index in range(len(self.__layers)):
+            tensors = self.__get_layer_offload_tensors(layer_index)
+            if len(tensors) == 0 or any(t.requires_grad for t in tensors):
+                continue
+
+            if self.__disk_cache is not None:
+                if not self.__disk_cache.has_layer(layer_index):
+                    key = "|".join([layer_names.get(id(self.__layers[layer_index]), str(layer_index))]
+                                   + [tensor_fingerprint(t) for t in tensors])
+                    self.__disk_cache.write_layer(layer_index, tensors, key)
+                self.__disk_layers.add(layer_index)
+            else:
+                if not self.__compressed_cache.has_layer(layer_index):
+                    self.__compressed_cache.write_layer(layer_index, tensors, self.__train_device)
+                self.__compressed_layers.add(layer_index)
+
+    def __get_temp_device_bytes(self) -> int:
+        frozen_layers = self.__disk_layers | self.__compressed_layers
+        if len(frozen_layers) == 0:
+            return self.__offload_strategy.max_offloaded_bytes
+
+        layer_bytes = self.__offload_strategy.layer_bytes
+        ram_layer_bytes = sum(b for i, b in enumerate(layer_bytes) if i not in frozen_layers)
+        if ram_layer_bytes == 0:
+            return 0
+        return min(self.__offload_strategy.max_offloaded_bytes, ram_layer_bytes + max(layer_bytes))
+
     def __get_loaded_layers(self) -> list[int]:
         return [i for i in range(len(self.__layers)) if device_equals(self.__layer_device_map[i], self.__train_device)]
 
@@ -872,6 +925,14 @@ class LayerOffloadConductor:
                         self.__deferred_layers.append(layer_index)
                         return
 
+        if layer_index in self.__disk_layers:
+            self.__schedule_disk_layer_to(layer_index, device, is_forward)
+            return
+
+        if layer_index in self.__compressed_layers:
+            self.__schedule_compressed_layer_to(layer_index, device, is_forward)
+            return
+
         with create_stream_context(self.__layer_transfer_stream):
             self.__wait_layer_train(layer_index)
             layer = self.__layers[layer_index]
@@ -889,6 +950,67 @@ class LayerOffloadConductor:
 
             self.__layer_device_map[layer_index] = device
 
+    def __schedule_disk_layer_to(
+            self,
+            layer_index: int,
+            device: torch.device,
+            is_forward: bool,
+    ):
+        with create_stream_context(self.__layer_transfer_stream):
+            self.__wait_layer_train(layer_index)
+
+            if device_equals(device, self.__train_device):
+                allocator = self.__train_device_layer_allocator.get_allocator(layer_index, is_forward)
+                allocator_fn = allocator.allocate_like if allocator is not None else None
+
+                self.__replace_layer_tensors(layer_index, self.__disk_cache.get_tensors(layer_index))
+                for module in self.__layers[layer_index].modules():
+                    offload_quantized(module, device, non_blocking=self.__async_transfer, allocator=allocator_fn)
+            else:
+                # the layer is frozen, its data is still available on disk
+                self.__replace_layer_tensors(layer_index, self.__disk_cache.mapped_tensors(layer_index))
+                self.__train_device_layer_allocator.deallocate_layer(layer_index, deallocate_forward=is_forward)
+
+            if self.__async_transfer:
+                event = SyncEvent(self.__layer_transfer_stream.record_event(), f"transfer to {device}")
+                self.__layer_transfer_event_map[layer_index] = event
+                if device_equals(device, self.__train_device):
+                    self.__disk_cache.release(layer_index, self.__layer_transfer_stream.record_event())
+                log(f"schedule disk layer {layer_index} to {str(device)}, {event}")
+            else:
+                if device_equals(device, self.__train_device):
+                    self.__disk_cache.release(layer_index)
+                log(f"schedule disk layer {layer_index} to {str(device)}")
+
+            self.__layer_device_map[layer_index] = device
+
+    def __schedule_compressed_layer_to(
+            self,
+            layer_index: int,
+            device: torch.device,
+            is_forward: bool,
+    ):
+        with create_stream_context(self.__layer_transfer_stream):
+            self.__wait_layer_train(layer_index)
+
+            if device_equals(device, self.__train_device):
+                # only the compressed data is transferred, it is decompressed on the train device
+                allocator = self.__train_device_layer_allocator.get_allocator(layer_index, is_forward)
+                self.__load_compressed_layer(layer_index, allocator, non_blocking=self.__async_transfer)
+            else:
+                # the layer is frozen, the compressed copy is still up to date
+                self.__replace_layer_tensors(layer_index, self.__compressed_cache.placeholder_tensors(layer_index))
+                self.__train_device_layer_allocator.deallocate_layer(layer_index, deallocate_forward=is_forward)
+
+            if self.__async_transfer:
+                event = SyncEvent(self.__layer_transfer_stream.record_event(), f"transfer to {device}")
+                self.__layer_transfer_event_map[layer_index] = event
+                log(f"schedule compressed layer {layer_index} to {str(device)}, {event}")
+            else:
+                log(f"schedule compressed layer {layer_index} to {str(device)}")
+
+            self.__layer_device_map[layer_index] = device
+
     def __schedule_deferred_layers_to_temp(
             self,
             except_layer: int,
@@ -0,0 +1,489 @@
+import json
+
+
+class LayerOffloadStrategy:
+    def __init__(
+            self,
+            layer_bytes: list[int],
+            layer_offload_fraction: float,
+    ):
+        self.layer_bytes = list(layer_bytes)
+        self.layer_offload_fraction = layer_offload_fraction
+
+        total_bytes = sum(layer_bytes)
+        target_loaded_bytes = int(total_bytes * (1.0 - layer_offload_fraction))
+
+        # calculate min number of loaded layers at the start
+        self.initial_loaded_layers = self.__get_layers_below(
+            layer_bytes=layer_bytes,
+            start_layer=0,
+            max_bytes=target_loaded_bytes,
+            is_forward=True,
+            is_cyclic=False,
+        )
+
+        # the offloading strategy has 3 cases:
+        # case 1, forward pass, followed by a backward pass:
+        #     do not offload the last layers, they will be needed immediately
+        # case 2, forward pass,  followed by another forward pass:
+        #     start loading the first layers when executing the last layers
+        # case 3, backward pass:
+        #     same as case 1, but in reversed order
+
+        # calculate a list of loaded layers before execution of each layer
+        self.forward_backward_loaded_layers = [self.__get_layers_below(
+            layer_bytes=layer_bytes,
+            start_layer=i,
+            max_bytes=target_loaded_bytes,
+            is_forward=True,
+            is_cyclic=False,
+        ) for i in range(len(layer_bytes))]
+
+        self.forward_forward_loaded_layers = [self.__get_layers_below(
+            layer_bytes=layer_bytes,
+            start_layer=i,
+            max_bytes=target_loaded_bytes,
+            is_forward=True,
+            is_cyclic=True,
+        ) for i in range(len(layer_bytes))]
+
+        self.backward_forward_loaded_layers = [self.__get_layers_below(
+            layer_bytes=layer_bytes,
+            start_layer=i,
+            max_bytes=target_loaded_bytes,
+            is_forward=False,
+            is_cyclic=False,
+        ) for i in range(len(layer_bytes))]
+
+        all_loaded_layers = self.forward_backward_loaded_layers \
+                            + self.forward_forward_loaded_layers \
+                            + self.backward_forward_loaded_layers
+
+        self.max_loaded_bytes = max(sum([layer_bytes[i] for i in loaded_layers]) for loaded_layers in all_loaded_layers)
+        min_loaded_bytes = min(sum([layer_bytes[i] for i in loaded_layers]) for loaded_layers in all_loaded_layers)
+        self.max_offloaded_bytes = total_bytes - min_loaded_bytes + max(layer_bytes)
+
+    @staticmethod
+    def __get_layers_below(
+            layer_bytes: list[int],
+            start_layer: int,
+            max_bytes: int,
+            is_forward: bool,
+            is_cyclic: bool,
+    ) -> list[int]:
+        accumulator = 0
+        layers = []
+        if is_forward and is_cyclic:
+            for i in range(start_layer, len(layer_bytes)):
+                accumulator += layer_bytes[i]
+                if accumulator > max_bytes and len(layers) >= 2:
+                    break
+                layers.append(i)
+            for i in range(start_layer):
+                accumulator += layer_bytes[i]
+                if accumulator > max_bytes and len(layers) >= 2:
+                    break
+                layers.append(i)
+        elif is_forward and not is_cyclic:
+            for i in range(start_layer, len(layer_bytes)):
+                accumulator += layer_bytes[i]
+                if accumulator > max_bytes and len(layers) >= 2:
+                    break
+                layers.append(i)
+            for i in range(start_layer - 1, -1, -1):
+                accumulator += layer_bytes[i]
+                if accumulator > max_bytes and len(layers) >= 2:
+                    break
+                layers.append(i)
+        else:
+            for i in range(start_layer, -1, -1):
+                accumulator += layer_bytes[i]
+                if accumulator > max_bytes and len(layers) >= 2:
+                    break
+                layers.append(i)
+            for i in range(start_layer + 1, len(layer_bytes)):
+                accumulator += layer_bytes[i]
+                if accumulator > max_bytes and len(layers) >= 2:
+                    break
+                layers.append(i)
+        return sorted(layers)
+
+    def get_layers_to_offload(
+            self,
+            layer_index: int,
+            is_forward: bool,
+            is_next_forward: bool,
+            loaded_layers: list[int],
+    ) -> list[int]:
+        layers = []
+        if is_forward and is_next_forward:
+            layers = sorted([i for i in loaded_layers if i not in self.forward_forward_loaded_layers[layer_index]])
+        if is_forward and not is_next_forward:
+            layers = sorted([i for i in loaded_layers if i not in self.forward_backward_loaded_layers[layer_index]])
+        if not is_forward:
+            layers = sorted([i for i in loaded_layers if i not in self.backward_forward_loaded_layers[layer_index]],
+                            reverse=True)
+
+        if is_forward:
+            return [x for x in layers if x >= layer_index] + [x for x in layers if x < layer_index]
+        else:
+            return [x for x in layers if x < layer_index] + [x for x in layers if x >= layer_index]
+
+    def get_layers_to_load(
+            self,
+            layer_index: int,
+            is_forward: bool,
+            is_next_forward: bool,
+            loaded_layers: list[int],
+    ) -> list[int]:
+        layers = []
+        if is_forward and is_next_forward:
+            layers = sorted([i for i in self.forward_forward_loaded_layers[layer_index] if i not in loaded_layers])
+        if is_forward and not is_next_forward:
+            layers = sorted([i for i in self.forward_backward_loaded_layers[layer_index] if i not in loaded_layers])
+        if not is_forward:
+            layers = sorted([i for i in self.backward_forward_loaded_layers[layer_index] if i not in loaded_layers],
+                            reverse=True)
+
+        if is_forward:
+            return [x for x in layers if x >= layer_index] + [x for x in layers if x < layer_index]
+        else:
+            return [x for x in layers if x < layer_index] + [x for x in layers if x >= layer_index]
+
+    def get_layers_to_prefetch(
+            self,
+            layer_index: int,
+            is_forward: bool,
+            is_next_forward: bool,
+            num_steps: int,
+    ) -> list[int]:
+        """
+        Returns the layers that will be loaded during the next num_steps layer executions, in loading order.
+        """
+        num_layers = len(self.layer_bytes)
+
+        if is_forward and is_next_forward:
+            loaded_layers_map = self.forward_forward_loaded_layers
+            steps = [(layer_index + i) % num_layers for i in range(1, num_steps + 1)]
+        elif is_forward:
+            loaded_layers_map = self.forward_backward_loaded_layers
+            steps = list(range(layer_index + 1, min(layer_index + num_steps + 1, num_layers)))
+        else:
+            loaded_layers_map = self.backward_forward_loaded_layers
+            steps = list(range(layer_index - 1, max(layer_index - num_steps - 1, -1), -1))
+
+        loaded_layers = list(loaded_layers_map[layer_index])
+        layers = []
+        for step in steps:
+            for i in self.get_layers_to_load(step, is_forward, is_next_forward, loaded_layers):
+                if i not in layers:
+                    layers.append(i)
+            loaded_layers = list(loaded_layers_map[step])
+        return layers
+
+
+class LayerOffloadSimulationResult:
+    compute_time: float  # seconds spent executing layers
+    stall_time: float  # seconds the train stream waited for layer transfers
+    transfer_time: float  # seconds the transfer stream was busy
+    transferred_bytes: int
+    peak_loaded_bytes: int  # max bytes of layers resident on the train device
+    peak_offloaded_bytes: int  # max bytes of layers resident on the temp device
+
+    def __init__(self):
+        self.compute_time = 0.0
+        self.stall_time = 0.0
+        self.transfer_time = 0.0
+        self.transferred_bytes = 0
+        self.peak_loaded_bytes = 0
+        self.peak_offloaded_bytes = 0
+
+    @property
+    def total_time(self) -> float:
+        return self.compute_time + self.stall_time
+
+    def __repr__(self) -> str:
+        return (
+            f"LayerOffloadSimulationResult(compute_time={self.compute_time:.4f}, stall_time={self.stall_time:.4f}, "
+            f"transferred_bytes={self.transferred_bytes:_}, peak_loaded_bytes={self.peak_loaded_bytes:_}, "
+            f"peak_offloaded_bytes={self.peak_offloaded_bytes:_})"
+        )
+
+
+class LayerOffloadSimulator:
+    """
+    Replays the scheduling decisions of LayerOffloadConductor on a simple two-stream timeline model.
+
+    The train stream executes layers in order. The transfer stream copies layers between the temp device and the
+    train device. A layer transfer can only start after the previous transfer finished and after the last execution
+    of that layer finished. A layer can only be executed after its transfer to the train device finished.
+    """
+
+    def __init__(
+            self,
+            strategy: LayerOffloadStrategy,
+            forward_times: list[float],
+            backward_times: list[float] | None,
+            load_bandwidth: float,
+            offload_bandwidth: float | None = None,
+            async_transfer: bool = True,
+    ):
+        self.__strategy = strategy
+        self.__layer_bytes = strategy.layer_bytes
+        self.__forward_times = forward_times
+        # with checkpointing, the backward pass recomputes the forward pass of each layer
+        self.__backward_times = backward_times if backward_times is not None else [3.0 * t for t in forward_times]
+        self.__load_bandwidth = load_bandwidth
+        self.__offload_bandwidth = offload_bandwidth if offload_bandwidth is not None else load_bandwidth
+        self.__async_transfer = async_transfer
+
+        if len(self.__forward_times) != len(self.__layer_bytes) \
+                or len(self.__backward_times) != len(self.__layer_bytes):
+            raise ValueError("layer times and layer bytes must have the same length")
+
+    def simulate_forward_backward(self, warmup_steps: int = 1) -> LayerOffloadSimulationResult:
+        """
+        A training step: a forward pass that keeps the graph, followed by a backward pass.
+        """
+        num_layers = len(self.__layer_bytes)
+        passes = [
+            ([(i, True) for i in range(num_layers)], False),
+            ([(i, False) for i in reversed(range(num_layers))], True),
+        ]
+        return self.__simulate(passes, warmup_steps)
+
+    def simulate_forward_forward(self, warmup_steps: int = 1) -> LayerOffloadSimulationResult:
+        """
+        Repeated forward passes without a backward pass, for example during sampling or validation.
+        """
+        num_layers = len(self.__layer_bytes)
+        passes = [
+            ([(i, True) for i in range(num_layers)], True),
+        ]
+        return self.__simulate(passes, warmup_steps)
+
+    def simulate_backward(self, warmup_steps: int = 1) -> LayerOffloadSimulationResult:
+        """
+        Only the backward part of a training step. The forward pass is still simulated to reach the same
+        loaded layers, but it is not included in the result.
+        """
+        num_layers = len(self.__layer_bytes)
+        passes = [
+            ([(i, True) for i in range(num_layers)], False),
+            ([(i, False) for i in reversed(range(num_layers))], True),
+        ]
+        return self.__simulate(passes, warmup_steps, measured_pass_indices=[1])
+
+    def __sync_time(self, train_time: float) -> float:
+        # synchronous transfers can only start after all previously scheduled work on the train stream
+        return 0.0 if self.__async_transfer else train_time
+
+    def __simulate(
+            self,
+            passes: list[tuple[list[tuple[int, bool]], bool]],
+            warmup_steps: int,
+            measured_pass_indices: list[int] | None = None,
+    ) -> LayerOffloadSimulationResult:
+        num_layers = len(self.__layer_bytes)
+
+        loaded_layers = set(self.__strategy.initial_loaded_layers)
+        layer_ready_time = [0.0] * num_layers
+        layer_train_end_time = [0.0] * num_layers
+        train_time = 0.0
+        transfer_time = 0.0
+
+        result = LayerOffloadSimulationResult()
+
+        for step in range(warmup_steps + 1):
+            for pass_index, (pass_layers, is_next_forward) in enumerate(passes):
+                measure = step == warmup_steps \
+                          and (measured_pass_indices is None or pass_index in measured_pass_indices)
+
+                for layer_index, is_forward in pass_layers:
+                    # wait for the transfer of the current layer
+                    if layer_ready_time[layer_index] > train_time:
+                        if measure:
+                            result.stall_time += layer_ready_time[layer_index] - train_time
+                        train_time = layer_ready_time[layer_index]
+
+                    to_offload = self.__strategy.get_layers_to_offload(
+                        layer_index, is_forward, is_next_forward, sorted(loaded_layers))
+                    for i in to_offload:
+                        start_time = max(transfer_time, layer_train_end_time[i], self.__sync_time(train_time))
+                        duration = self.__layer_bytes[i] / self.__offload_bandwidth
+                        transfer_time = start_time + duration
+                        loaded_layers.discard(i)
+                        layer_ready_time[i] = transfer_time
+                        if measure:
+                            result.transfer_time += duration
+                            result.transferred_bytes += self.__layer_bytes[i]
+
+                    to_load = self.__strategy.get_layers_to_load(
+                        layer_index, is_forward, is_next_forward, sorted(loaded_layers))
+                    for i in to_load:
+                        start_time = max(transfer_time, layer_train_end_time[i], self.__sync_time(train_time))
+                        duration = self.__layer_bytes[i] / self.__load_bandwidth
+                        transfer_time = start_time + duration
+                        loaded_layers.add(i)
+                        layer_ready_time[i] = transfer_time
+                        if measure:
+                            result.transfer_time += duration
+                            result.transferred_bytes += self.__layer_bytes[i]
+
+                    if not self.__async_transfer and transfer_time > train_time:
+                        # without async transfers, all copies are executed on the train stream
+                        if measure:
+                            result.stall_time += transfer_time - train_time
+                        train_time = transfer_time
+
+                    if layer_ready_time[layer_index] > train_time:
+                        if measure:
+                            result.stall_time += layer_ready_time[layer_index] - train_time
+                        train_time = layer_ready_time[layer_index]
+
+                    layer_time = self.__forward_times[layer_index] if is_forward \
+                        else self.__backward_times[layer_index]
+                    train_time += layer_time
+                    layer_train_end_time[layer_index] = train_time
+
+                    if measure:
+                        result.compute_time += layer_time
+                        loaded_bytes = sum(self.__layer_bytes[i] for i in loaded_layers)
+                        result.peak_loaded_bytes = max(result.peak_loaded_bytes, loaded_bytes)
+                        result.peak_offloaded_bytes = max(
+                            result.peak_offloaded_bytes, sum(self.__layer_bytes) - loaded_bytes)
+
+        return result
+
+
+class LayerOffloadPlan:
+    layer_offload_fraction: float
+    strategy: LayerOffloadStrategy
+    forward_backward: LayerOffloadSimulationResult
+    forward_forward: LayerOffloadSimulationResult
+    backward: LayerOffloadSimulationResult
+
+    def __init__(
+            self,
+            strategy: LayerOffloadStrategy,
+            forward_backward: LayerOffloadSimulationResult,
+            forward_forward: LayerOffloadSimulationResult,
+            backward: LayerOffloadSimulationResult,
+    ):
+        self.layer_offload_fraction = strategy.layer_offload_fraction
+        self.strategy = strategy
+        self.forward_backward = forward_backward
+        self.forward_forward = forward_forward
+        self.backward = backward
+
+    @property
+    def max_loaded_bytes(self) -> int:
+        return self.strategy.max_loaded_bytes
+
+    @property
+    def max_offloaded_bytes(self) -> int:
+        return self.strategy.max_offloaded_bytes
+
+    def __repr__(self) -> str:
+        return (
+            f"LayerOffloadPlan(layer_offload_fraction={self.layer_offload_fraction:.2f}, "
+            f"stall_time={self.forward_backward.stall_time:.4f}, "
+            f"max_loaded_bytes={self.max_loaded_bytes:_}, max_offloaded_bytes={self.max_offloaded_bytes:_})"
+        )
+
+
+class LayerOffloadPlanner:
+    """
+    Chooses a layer_offload_fraction for LayerOffloadConductor without running on the train device.
+
+    Per layer byte sizes can be taken from LayerOffloadConductor.get_layer_bytes(). Compute times can be measured or
+    estimated. Bandwidths are given in bytes per second.
+    """
+
+    def __init__(
+            self,
+            layer_bytes: list[int],
+            forward_times: list[float],
+            load_bandwidth: float,
+            offload_bandwidth: float | None = None,
+            backward_times: list[float] | None = None,
+            async_transfer: bool = True,
+    ):
+        self.__layer_bytes = list(layer_bytes)
+        self.__forward_times = list(forward_times)
+        self.__backward_times = list(backward_times) if backward_times is not None else None
+        self.__load_bandwidth = load_bandwidth
+        self.__offload_bandwidth = offload_bandwidth
+        self.__async_transfer = async_transfer
+
+    def evaluate(self, layer_offload_fraction: float) -> LayerOffloadPlan:
+        strategy = LayerOffloadStrategy(self.__layer_bytes, layer_offload_fraction)
+        simulator = LayerOffloadSimulator(
+            strategy=strategy,
+            forward_times=self.__forward_times,
+            backward_times=self.__backward_times,
+            load_bandwidth=self.__load_bandwidth,
+            offload_bandwidth=self.__offload_bandwidth,
+            async_transfer=self.__async_transfer,
+        )
+
+        return LayerOffloadPlan(
+            strategy=strategy,
+            forward_backward=simulator.simulate_forward_backward(),
+            forward_forward=simulator.simulate_forward_forward(),
+            backward=simulator.simulate_backward(),
+        )
+
+    def evaluate_all(self, fractions: list[float] | None = None) -> list[LayerOffloadPlan]:
+        if fractions is None:
+            fractions = [i / 20.0 for i in range(20)]
+        return [self.evaluate(fraction) for fraction in fractions]
+
+    def plan(
+            self,
+            max_loaded_bytes: int | None = None,
+            max_stall_fraction: float = 0.05,
+            fractions: list[float] | None = None,
+    ) -> LayerOffloadPlan:
+        """
+        Returns the plan with the highest offload fraction that stalls the training step for at most
+        max_stall_fraction of its compute time. If max_loaded_bytes is set, only plans that fit into that budget are
+        considered, and the plan with the lowest stall time is returned if none of them meets the stall target.
+        """
+        plans = self.evaluate_all(fractions)
+
+        if max_loaded_bytes is not None:
+            fitting_plans = [p for p in plans if p.max_loaded_bytes <= max_loaded_bytes]
+            if len(fitting_plans) == 0:
+                raise ValueError(f"no offload plan fits into {max_loaded_bytes:_} bytes")
+            plans = fitting_plans
+
+        acceptable_plans = [
+            p for p in plans
+            if p.forward_backward.stall_time <= p.forward_backward.compute_time * max_stall_fraction
+        ]
+
+        if len(acceptable_plans) > 0:
+            return max(acceptable_plans, key=lambda p: p.layer_offload_fraction)
+
+        return min(plans, key=lambda p: (p.forward_backward.stall_time, -p.layer_offload_fraction))
+
+
+def save_offload_plans(path: str, plans: list[LayerOffloadPlan]):
+    """
+    Writes plans to a json file that can be selected with the layer_offload_plan setting. Each offloaded module uses the
+    plan that was created for its layer sizes.
+    """
+    with open(path, "w") as f:
+        json.dump([{
+            "layer_offload_fraction": plan.layer_offload_fraction,
+            "layer_bytes": plan.strategy.layer_bytes,
+            "stall_time": plan.forward_backward.stall_time,
+            "compute_time": plan.forward_backward.compute_time,
+        } for plan in plans], f, indent=4)
+
+
+def load_offload_strategies(path: str) -> list[LayerOffloadStrategy]:
+    with open(path, "r") as f:
+        plans = json.load(f)
+    return [LayerOffloadStrategy(plan["layer_bytes"], plan["layer_offload_fraction"]) for plan in plans]
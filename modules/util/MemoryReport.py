@@ -0,0 +1,148 @@
+from dataclasses import dataclass
+
+from modules.model.BaseModel import BaseModel
+from modules.util.LayerOffloadConductor import LayerOffloadConductor
+from modules.util.quantization_util import is_quantized_parameter
+
+import torch
+from torch import Tensor, nn
+from torch.utils.tensorboard import SummaryWriter
+
+from diffusers.quantizers.gguf.utils import GGUFLinear
+
+
+@dataclass
+class MemoryReportEntry:
+    component: str
+    name: str
+    device: str
+    num_bytes: int
+
+
+def tensor_bytes(tensor: Tensor) -> int:
+    num_bytes = tensor.numel() * tensor.element_size()
+    if tensor.device.type != "meta":
+        # expanded tensors, like the placeholders of compressed layers, only hold the memory of their storage
+        num_bytes = min(num_bytes, tensor.untyped_storage().nbytes())
+    return num_bytes
+
+
+class MemoryReport:
+    """
+    A breakdown of the memory used by a model and its training state, by component, name and device. Every tensor is
+    only counted once, in the first component it is added to. Tensors that are views into a layer or activation cache
+    are counted as part of that cache. Only tensor sizes are read, so this also works for tensors on the meta device.
+    """
+
+    def __init__(self):
+        self.entries = []
+        self.__seen_tensors = set()
+        self.__cache_storages = set()
+
+    def add_bytes(self, component: str, name: str, device: torch.device | str, num_bytes: int):
+        device = str(device)
+        for entry in self.entries:
+            if entry.component == component and entry.name == name and entry.device == device:
+                entry.num_bytes += num_bytes
+                return
+        self.entries.append(MemoryReportEntry(component, name, device, num_bytes))
+
+    def add_tensor(self, component: str, name: str, tensor: Tensor | None):
+        if tensor is None or id(tensor) in self.__seen_tensors:
+            return
+        self.__seen_tensors.add(id(tensor))
+
+        if tensor.device.type != "meta" \
+                and (tensor.device, tensor.untyped_storage().data_ptr()) in self.__cache_storages:
+            return
+
+        self.add_bytes(component, name, tensor.device, tensor_bytes(tensor))
+
+    def add_cache_tensor(self, component: str, name: str, tensor: Tensor):
+        if id(tensor) in self.__seen_tensors:
+            return
+        self.__seen_tensors.add(id(tensor))
+
+        if tensor.device.type != "meta":
+            self.__cache_storages.add((tensor.device, tensor.untyped_storage().data_ptr()))
+        self.add_bytes(component, name, tensor.device, tensor_bytes(tensor))
+
+    def add_module(self, name: str, module: nn.Module):
+        for sub_module in module.modules():
+            tensors = list(sub_module.named_parameters(recurse=False)) + list(sub_module.named_buffers(recurse=False))
+            for tensor_name, tensor in tensors:
+                if is_quantized_parameter(sub_module, tensor_name) \
+                        or (isinstance(sub_module, GGUFLinear) and tensor_name == "weight"):
+                    self.add_tensor("quantized weights", name, tensor)
+                else:
+                    self.add_tensor("weights", name, tensor)
+
+    def add_model(self, model: BaseModel):
+        # caches first, so offloaded layers are not counted again
+        for name, value in vars(model).items():
+            if isinstance(value, LayerOffloadConductor):
+                for cache_name, cache_tensors in value.get_cache_tensors().items():
+                    for tensor in cache_tensors:
+                        self.add_cache_tensor(cache_name, name.removesuffix("_offload_conductor"), tensor)
+
+        # trainable parameters before the modules, so they are not counted as weights of the modules they belong to
+        groups = model.parameters.groups() if model.parameters is not None else []
+        for group in groups:
+            for parameter in group.parameters:
+                self.add_tensor("trainable parameters", group.display_name, parameter)
+        for group in groups:
+            for parameter in group.parameters:
+                self.add_tensor("gradients", group.display_name, parameter.grad)
+
+        if model.optimizer is not None:
+            group_names = [group.display_name for group in groups]
+            for i, param_group in enumerate(model.optimizer.param_groups):
+                name = group_names[i] if len(group_names) == len(model.optimizer.param_groups) else f"group {i}"
+                for parameter in param_group["params"]:
+                    for value in model.optimizer.state.get(parameter, {}).values():
+                        if isinstance(value, Tensor):
+                            self.add_tensor("optimizer state", name, value)
+
+        ema = getattr(model, "ema", None)
+        if ema is not None:
+            for parameter in ema.ema_parameters:
+                self.add_tensor("ema", "ema", parameter)
+
+        for name, value in vars(model).items():
+            if isinstance(value, nn.Module):
+                self.add_module(name, value)
+
+    def totals(self) -> dict[str, int]:
+        totals = {}
+        for entry in self.entries:
+            totals[entry.device] = totals.get(entry.device, 0) + entry.num_bytes
+        return totals
+
+    def format_table(self) -> str:
+        rows = [("component", "name", "device", "MiB")]
+        rows += [
+            (entry.component, entry.name, entry.device, f"{entry.num_bytes / (1024 * 1024):.1f}")
+            for entry in self.entries
+        ]
+        rows += [
+            ("total", "", device, f"{num_bytes / (1024 * 1024):.1f}")
+            for device, num_bytes in self.totals().items()
+        ]
+
+        widths = [max(len(row[i]) for row in rows) for i in range(4)]
+        lines = []
+        for i, row in enumerate(rows):
+            lines.append("  ".join(
+                value.rjust(width) if column == 3 else value.ljust(width)
+                for column, (value, width) in enumerate(zip(row, widths, strict=True))
+            ).rstrip())
+            if i == 0 or i == len(self.entries):
+                lines.append("  ".join("-" * width for width in widths))
+        return "\n".join(lines)
+
+    def log_to_tensorboard(self, tensorboard: SummaryWriter, global_step: int, prefix: str = "memory"):
+        for entry in self.entries:
+            tag = f"{prefix}/{entry.component}/{entry.name}/{entry.device}".replace(" ", "_")
+            tensorboard.add_scalar(tag, entry.num_bytes / (1024 * 1024), global_step)
+        for device, num_bytes in self.totals().items():
+            tensorboard.add_scalar(f"{prefix}/total/{device}", num_bytes / (1024 * 1024), global_step)
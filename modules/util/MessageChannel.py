@@ -0,0 +1,92 @@
+import hmac
+import pickle
+import select
+import struct
+import threading
+import time
+
+
+class MessageChannel:
+    """
+    Sends and receives pickled messages over a stream transport, like a socket or an SSH channel. Every message is
+    framed by a 4 byte length prefix, so a message is never read partially.
+
+    Unpickling can execute arbitrary code, so the receiving side of a connection that other users can open must call
+    verify_token() before it receives any message. The connecting side sends the token with send_token().
+    """
+
+    __HEADER = struct.Struct('>I')
+    __RECEIVE_SIZE = 64 * 1024
+
+    def __init__(self, transport):
+        self.transport = transport  # needs sendall(), recv(), fileno() and close()
+        self.__send_lock = threading.Lock()
+        self.__receive_buffer = bytearray()
+        self.__closed = False
+
+    def send_token(self, token: bytes):
+        self.transport.sendall(token)
+
+    def verify_token(self, token: bytes, timeout: float) -> bool:
+        """
+        Reads len(token) raw bytes and compares them to token. Returns False if they don't match or don't arrive
+        within timeout seconds.
+        """
+        deadline = time.monotonic() + timeout
+        while len(self.__receive_buffer) < len(token):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not select.select([self.transport], [], [], remaining)[0]:
+                return False
+            data = self.transport.recv(len(token) - len(self.__receive_buffer))
+            if not data:
+                return False
+            self.__receive_buffer += data
+
+        received_token = bytes(self.__receive_buffer[:len(token)])
+        del self.__receive_buffer[:len(token)]
+        return hmac.compare_digest(received_token, token)
+
+    def send(self, message):
+        data = pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL)
+        with self.__send_lock:
+            # sendall blocks while the receiver doesn't keep up, which is the backpressure of the channel
+            self.transport.sendall(self.__HEADER.pack(len(data)) + data)
+
+    def receive(self, timeout: float | None = None):
+        """
+        Returns the next message, or None if no complete message arrived within timeout seconds.
+        Raises EOFError if the other side closed the channel.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            message = self.__pop_message()
+            if message is not None:
+                return message[0]
+
+            if deadline is not None:
+                # wait with select instead of a transport timeout, which would also apply to concurrent sends
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not select.select([self.transport], [], [], remaining)[0]:
+                    return None
+
+            data = self.transport.recv(self.__RECEIVE_SIZE)
+            if not data:
+                raise EOFError("message channel closed")
+            self.__receive_buffer += data
+
+    def __pop_message(self):
+        header_size = self.__HEADER.size
+        if len(self.__receive_buffer) < header_size:
+            return None
+        length, = self.__HEADER.unpack_from(self.__receive_buffer)
+        if len(self.__receive_buffer) < header_size + length:
+            return None
+
+        data = bytes(self.__receive_buffer[header_size:header_size + length])
+        del self.__receive_buffer[:header_size + length]
+        return (pickle.loads(data),)  # wrapped, to tell a None message apart from no message
+
+    def close(self):
+        if not self.__closed:
+            self.__closed = True
+            self.transport.close()
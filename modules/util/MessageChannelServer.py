@@ -0,0 +1,186 @@
+import contextlib
+import os
+import secrets
+import socket
+import threading
+from collections import deque
+
+from modules.util.commands.TrainCommands import TrainCommands
+from modules.util.MessageChannel import MessageChannel
+
+
+class MessageChannelServer:
+    """
+    Remote side of the message channel between a cloud trainer and its client. Listens on a local TCP port, which the
+    client reaches through its SSH connection, streams callbacks to the client and merges the commands it receives
+    into the train commands.
+
+    Callbacks are buffered in a bounded queue and sent by a background thread, so training never waits for the
+    client. Progress and status updates replace the previous update of the same kind that is still queued, and if the
+    queue is full the oldest callback is dropped. While no client is connected, for example because it is detached,
+    callbacks keep accumulating this way until a client connects.
+
+    The port can be opened by every user of the remote machine. The port file also contains a random token and can
+    only be read by the user running the trainer. A client must send the token before anything it sends is unpickled.
+    """
+
+    TOKEN_BYTES = 32
+    TOKEN_TIMEOUT = 10.0
+
+    COALESCED_CALLBACKS = {
+        "on_update_train_progress",
+        "on_update_status",
+        "on_update_sample_default_progress",
+        "on_update_sample_custom_progress",
+    }
+
+    def __init__(self, port_path: str, commands: TrainCommands, max_queued_callbacks: int = 64):
+        self.port_path = port_path
+        self.commands = commands
+        self.max_queued_callbacks = max_queued_callbacks
+
+        self.__condition = threading.Condition()
+        self.__queue = deque()  # (name, params)
+        self.__sending = False
+        self.__client = None
+        self.__client_thread = None
+        self.__closed = False
+        self.__server_socket = None
+        self.__token = secrets.token_bytes(self.TOKEN_BYTES)
+
+    def start(self):
+        self.__server_socket = socket.create_server(('localhost', 0))
+        port = self.__server_socket.getsockname()[1]
+
+        # the client reads the port and token from this file, write it atomically and only readable by this user
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self.port_path + '.write')
+        fd = os.open(self.port_path + '.write', os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            f.write(f"{port}\n{self.__token.hex()}")
+        os.replace(self.port_path + '.write', self.port_path)
+
+        threading.Thread(target=self.__accept_loop, daemon=True).start()
+        threading.Thread(target=self.__send_loop, daemon=True).start()
+
+    def send_callback(self, name: str, *params):
+        with self.__condition:
+            if name in self.COALESCED_CALLBACKS:
+                for entry in self.__queue:
+                    if entry[0] == name:
+                        self.__queue.remove(entry)
+                        break
+            self.__queue.append((name, params))
+            while len(self.__queue) > self.max_queued_callbacks:
+                self.__queue.popleft()
+            self.__condition.notify_all()
+
+    def has_client(self) -> bool:
+        with self.__condition:
+            return self.__client is not None
+
+    def close(self, timeout: float = 30.0) -> bool:
+        """
+        Stops the server after sending the queued callbacks to the connected client, waiting up to timeout seconds.
+        Returns True if all callbacks were sent.
+        """
+        with self.__condition:
+            self.__condition.wait_for(
+                lambda: self.__client is None or (len(self.__queue) == 0 and not self.__sending),
+                timeout=timeout,
+            )
+            delivered = len(self.__queue) == 0 and not self.__sending
+            self.__closed = True
+            client = self.__client
+            client_thread = self.__client_thread
+            self.__condition.notify_all()
+
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self.port_path)
+        self.__server_socket.close()
+
+        if client is not None:
+            # signal the end of the stream, then wait until the client has read it and closed its side
+            with contextlib.suppress(OSError):
+                client.transport.shutdown(socket.SHUT_WR)
+            client_thread.join(timeout=timeout)
+            client.close()
+
+        return delivered
+
+    def __accept_loop(self):
+        while True:
+            try:
+                client_socket, _ = self.__server_socket.accept()
+            except OSError:
+                return  # the server socket was closed
+
+            client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            client = MessageChannel(client_socket)
+            threading.Thread(target=self.__receive_loop, args=(client,), daemon=True).start()
+
+    def __receive_loop(self, client: MessageChannel):
+        # a connection that doesn't send the token never replaces the connected client
+        try:
+            is_authenticated = client.verify_token(self.__token, self.TOKEN_TIMEOUT)
+        except OSError:
+            is_authenticated = False
+        if not is_authenticated:
+            client.close()
+            return
+
+        with self.__condition:
+            if self.__closed:
+                client.close()
+                return
+            # only one client at a time, a reattached client replaces the previous one
+            previous_client = self.__client
+            self.__client = client
+            self.__client_thread = threading.current_thread()
+            self.__condition.notify_all()
+
+        if previous_client is not None:
+            previous_client.close()
+
+        try:
+            while True:
+                self.commands.merge(client.receive())
+        except (EOFError, OSError):
+            pass
+
+        with self.__condition:
+            if self.__client is client:
+                self.__client = None
+            self.__condition.notify_all()
+
+    def __send_loop(self):
+        while True:
+            with self.__condition:
+                self.__condition.wait_for(
+                    lambda: self.__closed or (self.__client is not None and len(self.__queue) > 0),
+                )
+                if self.__closed:
+                    return
+                client = self.__client
+                entry = self.__queue.popleft()
+                self.__sending = True
+
+            try:
+                client.send(entry)
+                sent = True
+            except OSError:
+                sent = False
+
+            if not sent:
+                client.close()
+
+            with self.__condition:
+                self.__sending = False
+                if not sent:
+                    if self.__client is client:
+                        self.__client = None
+                    # put the callback back, unless a newer update of the same kind was queued in the meantime
+                    if entry[0] not in self.COALESCED_CALLBACKS \
+                            or all(queued[0] != entry[0] for queued in self.__queue):
+                        self.__queue.appendleft(entry)
+                self.__condition.notify_all()
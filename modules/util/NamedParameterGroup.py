@@ -29,6 +29,9 @@ class NamedParameterGroupCollection:
     def add_group(self, group: NamedParameterGroup):
         self.__groups.append(group)
 
+    def groups(self) -> list[NamedParameterGroup]:
+        return list(self.__groups)
+
     def parameters(self) -> list[Parameter]:
         return [p for group in self.__groups for p in group.parameters]
 
@@ -0,0 +1,242 @@
+from modules.util.torch_util import create_stream_context
+
+import torch
+
+
+class OptimizerStateOffloader:
+    """
+    Keeps the state tensors of an optimizer in (pinned) host memory, and only moves them to the train device while
+    they are used. The optimizer is patched, so nothing changes for the caller:
+
+    step(): the state of each param group is moved to the train device just before the group is updated, and moved
+        back afterwards. The state of the next group is transferred while the current group is updated.
+    step_parameter(): used by the fused back pass. The state of each parameter is moved to the train device before the
+        update. The order of updates in the previous step is recorded, and the state of the next parameter in that
+        order is transferred while the current parameter is updated. Optimizers like CAME also call step_parameter()
+        from their own step(). In that case, the state was already loaded by step() and is used as is.
+
+    On CUDA, transfers are done on a separate stream. On other devices, they are synchronous copies. This also works
+    if the train device and the temp device are both the CPU, in that case only the behavior is simulated.
+    """
+
+    def __init__(
+            self,
+            optimizer: torch.optim.Optimizer,
+            train_device: torch.device,
+            temp_device: torch.device,
+            step_groups_separately: bool = True,
+    ):
+        self.__optimizer = optimizer
+        self.__train_device = train_device
+        self.__temp_device = temp_device
+        # adaptive optimizers calculate statistics over all groups, they need the whole state in a single step
+        self.__step_groups_separately = step_groups_separately
+        self.__pin_memory = temp_device.type == "cpu" and torch.cuda.is_available()
+
+        if train_device.type == "cuda":
+            self.__train_stream = torch.cuda.current_stream(train_device)
+            self.__transfer_stream = torch.cuda.Stream(train_device)
+        else:
+            self.__train_stream = None
+            self.__transfer_stream = None
+
+        self.__host_tensors = {}  # (parameter, state key) -> state tensor on the temp device
+        self.__loaded = {}  # parameter -> (transfer event or None, bytes on the train device)
+        self.__next_parameters = {}  # parameter -> parameter updated after it in the previous step
+        self.__previous_parameter = None
+        self.__in_step = False
+
+        self.device_state_bytes = 0
+        self.max_device_state_bytes = 0
+        self.transferred_bytes = 0
+
+        for group in optimizer.param_groups:
+            for parameter in group["params"]:
+                self.__loaded[parameter] = (None, 0)
+                self.__offload(parameter)
+
+        self.__step = optimizer.step
+        self.__step_parameter = getattr(optimizer, "step_parameter", None)
+        self.__state_dict = optimizer.state_dict
+        self.__patch()
+
+    def __patch(self):
+        offloader = self
+        optimizer_type = type(self.__optimizer)
+
+        # patched as methods of the optimizer, because lr schedulers wrap optimizer.step.__func__
+        def step(optimizer, closure=None):
+            return offloader.step(closure)
+
+        def state_dict(optimizer):
+            offloader.synchronize()
+            return offloader.__state_dict()
+
+        self.__optimizer.step = step.__get__(self.__optimizer, optimizer_type)
+        self.__optimizer.state_dict = state_dict.__get__(self.__optimizer, optimizer_type)
+
+        if self.__step_parameter is not None:
+            def step_parameter(optimizer, p, group, i):
+                offloader.step_parameter(p, group, i)
+
+            self.__optimizer.step_parameter = step_parameter.__get__(self.__optimizer, optimizer_type)
+
+    @staticmethod
+    def __is_state_tensor(value) -> bool:
+        # scalar tensors like the step count of torch optimizers are small, and some optimizers expect them on the CPU
+        return isinstance(value, torch.Tensor) and value.dim() > 0
+
+    def __load(self, parameter: torch.Tensor):
+        if parameter in self.__loaded:
+            return
+
+        state = self.__optimizer.state.get(parameter)
+        num_bytes = 0
+        event = None
+        if state:
+            if self.__transfer_stream is not None:
+                # the host tensors can still be written by the train stream, for example after loading a state dict
+                self.__transfer_stream.wait_stream(self.__train_stream)
+            with create_stream_context(self.__transfer_stream):
+                for key, value in state.items():
+                    if self.__is_state_tensor(value) and value is self.__host_tensors.get((parameter, key)):
+                        # always a copy, even if the temp device is the train device
+                        device_value = torch.empty_like(value, device=self.__train_device)
+                        device_value.copy_(value, non_blocking=True)
+                        state[key] = device_value
+                        num_bytes += value.numel() * value.element_size()
+                if self.__transfer_stream is not None:
+                    event = self.__transfer_stream.record_event()
+
+        self.__loaded[parameter] = (event, num_bytes)
+        self.device_state_bytes += num_bytes
+        self.transferred_bytes += num_bytes
+        self.max_device_state_bytes = max(self.max_device_state_bytes, self.device_state_bytes)
+
+    def __wait(self, parameter: torch.Tensor):
+        event, num_bytes = self.__loaded[parameter]
+        if event is not None:
+            self.__train_stream.wait_event(event)
+            for value in self.__optimizer.state[parameter].values():
+                if self.__is_state_tensor(value):
+                    # allocated on the transfer stream, but used and freed on the train stream
+                    value.record_stream(self.__train_stream)
+            self.__loaded[parameter] = (None, num_bytes)
+
+    def __offload(self, parameter: torch.Tensor):
+        if parameter not in self.__loaded:
+            return
+
+        _, num_bytes = self.__loaded.pop(parameter)
+        self.device_state_bytes -= num_bytes
+
+        state = self.__optimizer.state.get(parameter)
+        if not state:
+            return
+
+        if self.__transfer_stream is not None:
+            self.__transfer_stream.wait_stream(self.__train_stream)
+        with create_stream_context(self.__transfer_stream):
+            for key, value in state.items():
+                if not self.__is_state_tensor(value):
+                    continue
+
+                host_value = self.__host_tensors.get((parameter, key))
+                if value is host_value:
+                    continue
+                if host_value is None or host_value.shape != value.shape or host_value.dtype != value.dtype:
+                    host_value = torch.empty(
+                        value.shape, dtype=value.dtype, device=self.__temp_device, pin_memory=self.__pin_memory
+                    )
+                    self.__host_tensors[(parameter, key)] = host_value
+
+                host_value.copy_(value, non_blocking=True)
+                if self.__transfer_stream is not None:
+                    value.record_stream(self.__transfer_stream)
+                state[key] = host_value
+                self.transferred_bytes += value.numel() * value.element_size()
+
+    def __load_group(self, group: dict):
+        for parameter in group["params"]:
+            self.__load(parameter)
+
+    def __wait_group(self, group: dict):
+        for parameter in group["params"]:
+            self.__wait(parameter)
+
+    def __offload_group(self, group: dict):
+        for parameter in group["params"]:
+            self.__offload(parameter)
+
+    def synchronize(self):
+        # waits until all transfers to the temp device are done, before the host tensors are read
+        if self.__transfer_stream is not None:
+            self.__transfer_stream.synchronize()
+
+    def step(self, closure=None):
+        self.__in_step = True
+        try:
+            return self.__step_groups(closure)
+        finally:
+            self.__in_step = False
+
+    def __step_groups(self, closure=None):
+        param_groups = self.__optimizer.param_groups
+
+        if not self.__step_groups_separately:
+            for group in param_groups:
+                self.__load_group(group)
+            for group in param_groups:
+                self.__wait_group(group)
+            loss = self.__step(closure)
+            for group in param_groups:
+                self.__offload_group(group)
+            return loss
+
+        loss = None
+        if closure is not None:
+            with torch.enable_grad():
+                loss = closure()
+
+        try:
+            for i, group in enumerate(param_groups):
+                self.__load_group(group)
+                if i + 1 < len(param_groups):
+                    self.__load_group(param_groups[i + 1])
+                self.__wait_group(group)
+
+                self.__optimizer.param_groups = [group]
+                self.__step()
+                self.__optimizer.param_groups = param_groups
+
+                self.__offload_group(group)
+        finally:
+            self.__optimizer.param_groups = param_groups
+
+        return loss
+
+    def step_parameter(self, parameter: torch.Tensor, group: dict, i: int):
+        if self.__in_step:
+            # called by the step() of the optimizer. offloading other parameters here would also offload the group that
+            # step() prefetched
+            self.__step_parameter(parameter, group, i)
+            return
+
+        if self.__previous_parameter is not None:
+            self.__next_parameters[self.__previous_parameter] = parameter
+        self.__previous_parameter = parameter
+
+        # drop wrong predictions, for example if a parameter did not receive a gradient in this step
+        for loaded_parameter in list(self.__loaded):
+            if loaded_parameter is not parameter:
+                self.__offload(loaded_parameter)
+
+        self.__load(parameter)
+        next_parameter = self.__next_parameters.get(parameter)
+        if next_parameter is not None:
+            self.__load(next_parameter)
+        self.__wait(parameter)
+
+        self.__step_parameter(parameter, group, i)
+
+        self.__offload(parameter)
@@ -0,0 +1,34 @@
+from collections.abc import Callable
+
+import torch
+
+
+class PendingReduce:
+    """
+    A gradient reduce operation that was started, but not necessarily finished. wait() finishes the operation and
+    returns the summed gradient of all ranks. If finishing starts another collective operation, all ranks must finish
+    their pending operations in the same order. Then is_completed() is always False, so the operation is only
+    finished when all ranks wait for it.
+    """
+
+    def __init__(
+            self,
+            work: torch.distributed.Work | None,
+            finish: Callable[[], torch.Tensor],
+            transferred_bytes: int,
+            finish_communicates: bool = False,
+    ):
+        self.__work = work
+        self.__finish = finish
+        self.__finish_communicates = finish_communicates
+        self.transferred_bytes = transferred_bytes  # bytes sent by this rank
+
+    def is_completed(self) -> bool:
+        if self.__finish_communicates:
+            return False
+        return self.__work is None or self.__work.is_completed()
+
+    def wait(self) -> torch.Tensor:
+        if self.__work is not None:
+            self.__work.wait()
+        return self.__finish()
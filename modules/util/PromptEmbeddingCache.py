@@ -0,0 +1,62 @@
+from collections import OrderedDict
+from collections.abc import Hashable
+from typing import Any
+
+import torch
+
+
+class PromptEmbeddingCache:
+    """
+    An LRU cache of text encoder outputs used during sampling. Entries are keyed by the prompt and every setting that
+    changes the encoding (layer skip, sequence length, attention mask). The version is part of every key, so all
+    entries become invalid after invalidate() is called, for example after the text encoder or embedding weights
+    changed.
+    """
+
+    def __init__(
+            self,
+            max_entries: int = 64,
+            storage_device: torch.device | None = None,
+    ):
+        self.__max_entries = max_entries
+        self.__storage_device = storage_device if storage_device is not None else torch.device("cpu")
+        self.__entries = OrderedDict()
+
+        self.version = 0
+
+        # statistics
+        self.hits = 0
+        self.misses = 0
+
+    def invalidate(self):
+        self.version += 1
+        self.__entries.clear()
+
+    def get(self, key: Hashable, device: torch.device) -> Any | None:
+        key = (self.version, key)
+        value = self.__entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+
+        self.__entries.move_to_end(key)
+        self.hits += 1
+        return self.__to_device(value, device)
+
+    def put(self, key: Hashable, value: Any):
+        key = (self.version, key)
+        self.__entries[key] = self.__to_device(value, self.__storage_device)
+        self.__entries.move_to_end(key)
+
+        while len(self.__entries) > self.__max_entries:
+            self.__entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    def __to_device(self, value: Any, device: torch.device) -> Any:
+        if isinstance(value, torch.Tensor):
+            return value.detach().to(device=device)
+        if isinstance(value, tuple | list):
+            return type(value)(self.__to_device(v, device) for v in value)
+        return value
@@ -0,0 +1,294 @@
+import contextlib
+import copy
+import os
+import queue
+import time
+import traceback
+
+from modules.modelSampler.BaseModelSampler import ModelSamplerOutput
+from modules.util import create, path_util
+from modules.util.config.SampleConfig import SampleConfig
+from modules.util.config.TrainConfig import TrainConfig
+from modules.util.enum.EMAMode import EMAMode
+from modules.util.ModelNames import ModelNames
+from modules.util.PromptEmbeddingCache import PromptEmbeddingCache
+from modules.util.SharedTensorSnapshot import SharedTensorSnapshot
+from modules.util.time_util import get_string_timestamp
+from modules.util.torch_util import torch_gc
+from modules.util.TrainProgress import TrainProgress
+
+import torch
+from torch import Tensor
+
+
+class SamplingWorkerMessage:
+    SAMPLE = "sample"
+    PROGRESS = "progress"
+    STATUS = "status"
+    DONE = "done"
+    ERROR = "error"
+
+
+class SamplingWorker:
+    """
+    Samples in a separate process while training continues. The worker loads its own copy of the model on a
+    secondary device. Before every sampling job, the trainable parameters (and the EMA parameters, if enabled) are
+    captured into shared memory snapshots, which the worker copies into its model before sampling.
+
+    A new job can only be submitted after the worker has copied the snapshot of the previous job. If sampling takes
+    longer than the sampling interval, training waits for the worker instead of queueing an unbounded number of
+    snapshots.
+    """
+
+    def __init__(
+            self,
+            config: TrainConfig,
+            model_names: ModelNames,
+            parameters: list[Tensor],
+            ema_parameters: list[Tensor] | None,
+    ):
+        self.__snapshot = SharedTensorSnapshot(parameters)
+        self.__ema_snapshot = SharedTensorSnapshot(ema_parameters) if ema_parameters is not None else None
+
+        context = torch.multiprocessing.get_context("spawn")
+        self.__job_queue = context.Queue()
+        self.__result_queue = context.Queue()
+        self.__snapshot_consumed = context.Event()
+        self.__snapshot_consumed.set()
+        self.__pending_jobs = 0
+
+        self.__process = context.Process(
+            target=SamplingWorker._worker_process,
+            args=(
+                config.to_pack_dict(secrets=True),
+                model_names,
+                config.sampling_worker_device,
+                self.__snapshot,
+                self.__ema_snapshot,
+                self.__job_queue,
+                self.__result_queue,
+                self.__snapshot_consumed,
+            ),
+            daemon=True,
+        )
+        self.__process.start()
+
+    def is_alive(self) -> bool:
+        return self.__process.is_alive()
+
+    def has_pending_jobs(self) -> bool:
+        return self.__pending_jobs > 0
+
+    def submit(
+            self,
+            train_progress: TrainProgress,
+            sample_config_list: list[SampleConfig],
+            is_custom_sample: bool,
+            parameters: list[Tensor],
+            ema_parameters: list[Tensor] | None,
+            non_ema_sampling: bool,
+    ) -> bool:
+        # wait until the worker has copied the previous snapshot
+        while not self.__snapshot_consumed.wait(timeout=1.0):
+            if not self.is_alive():
+                return False
+        if not self.is_alive():
+            return False
+        self.__snapshot_consumed.clear()
+
+        self.__snapshot.capture(parameters)
+        if self.__ema_snapshot is not None:
+            self.__ema_snapshot.capture(ema_parameters)
+
+        self.__job_queue.put({
+            "global_step": train_progress.global_step,
+            "filename_string": train_progress.filename_string(),
+            "sample_configs": [sample_config.to_dict() for sample_config in sample_config_list],
+            "is_custom_sample": is_custom_sample,
+            "non_ema_sampling": non_ema_sampling,
+        })
+        self.__pending_jobs += 1
+        return True
+
+    def poll(self, timeout: float | None = None) -> list[tuple]:
+        """
+        Returns all messages sent by the worker. If timeout is set, waits up to timeout seconds for the first message.
+        """
+        messages = []
+        try:
+            if timeout is not None:
+                messages.append(self.__result_queue.get(timeout=timeout))
+            while True:
+                messages.append(self.__result_queue.get_nowait())
+        except queue.Empty:
+            pass
+
+        for message in messages:
+            if message[0] == SamplingWorkerMessage.DONE:
+                self.__pending_jobs -= 1
+        return messages
+
+    def close(self, timeout: float = 30.0):
+        if self.is_alive():
+            self.__job_queue.put(None)
+            self.__process.join(timeout=timeout)
+        if self.is_alive():
+            self.__process.terminate()
+            self.__process.join()
+
+    @staticmethod  # must be static and not use __ prefix, otherwise the pickling done by torch.multiprocessing fails
+    def _worker_process(
+            config_dict: dict,
+            model_names: ModelNames,
+            device: str,
+            snapshot: SharedTensorSnapshot,
+            ema_snapshot: SharedTensorSnapshot | None,
+            job_queue,
+            result_queue,
+            snapshot_consumed,
+    ):
+        config = TrainConfig.default_values().from_dict(config_dict)
+        config.train_device = device
+        config.ema = EMAMode.OFF  # the EMA weights are part of the snapshot
+        train_device = torch.device(device)
+        temp_device = torch.device("cpu")
+
+        try:
+            result_queue.put((SamplingWorkerMessage.STATUS, "loading the sampling model"))
+
+            model_loader = create.create_model_loader(config.model_type, config.training_method)
+            model_setup = create.create_model_setup(
+                config.model_type, train_device, temp_device, config.training_method, config.debug_mode,
+            )
+            model = model_loader.load(
+                model_type=config.model_type,
+                model_names=model_names,
+                weight_dtypes=config.weight_dtypes(),
+            )
+            model.train_config = config
+
+            model_setup.setup_optimizations(model, config)
+            model_setup.setup_train_device(model, config)
+            model_setup.setup_model(model, config)
+            model.to(temp_device)
+            model.eval()
+            model.optimizer = None  # the sampling model is never trained
+            torch_gc()
+
+            model_sampler = create.create_model_sampler(
+                train_device, temp_device, model, config.model_type, config.training_method,
+            )
+            model_sampler.prompt_embedding_cache = PromptEmbeddingCache()
+            parameters = model.parameters.parameters()
+        except Exception:
+            result_queue.put((SamplingWorkerMessage.ERROR, traceback.format_exc()))
+            return
+
+        while True:
+            job = job_queue.get()
+            if job is None:
+                break
+
+            sample_config_list = [
+                SampleConfig.default_values().from_dict(sample_config) for sample_config in job["sample_configs"]
+            ]
+            is_custom_sample = job["is_custom_sample"]
+
+            # copy the snapshots before releasing them for the next job
+            with torch.no_grad():
+                if ema_snapshot is not None:
+                    ema_snapshot.copy_to(parameters)
+                    non_ema_parameters = snapshot.clone() \
+                        if job["non_ema_sampling"] and not is_custom_sample else None
+                else:
+                    snapshot.copy_to(parameters)
+                    non_ema_parameters = None
+            snapshot_consumed.set()
+
+            start_time = time.perf_counter()
+
+            model_sampler.prompt_embedding_cache.invalidate()
+            with SamplingWorker.__merged_adapters(config, model, train_device, temp_device):
+                SamplingWorker.__sample_loop(
+                    config, job, model, model_sampler, sample_config_list, is_custom_sample, "", result_queue,
+                )
+
+            if non_ema_parameters is not None:
+                with torch.no_grad():
+                    for parameter, non_ema_parameter in zip(parameters, non_ema_parameters, strict=True):
+                        parameter.data.copy_(non_ema_parameter.to(device=parameter.device))
+                del non_ema_parameters
+
+                if config.train_any_text_encoder_or_embedding():
+                    model_sampler.prompt_embedding_cache.invalidate()
+                with SamplingWorker.__merged_adapters(config, model, train_device, temp_device):
+                    SamplingWorker.__sample_loop(
+                        config, job, model, model_sampler, sample_config_list, is_custom_sample, " - no-ema",
+                        result_queue,
+                    )
+
+            torch_gc()
+            result_queue.put((SamplingWorkerMessage.DONE, job["global_step"], time.perf_counter() - start_time))
+
+    @staticmethod
+    def __merged_adapters(config: TrainConfig, model, train_device: torch.device, temp_device: torch.device):
+        if config.merge_lora_for_sampling():
+            return model.merged_adapters(train_device, temp_device)
+        return contextlib.nullcontext()
+
+    @staticmethod
+    def __sample_loop(
+            config: TrainConfig,
+            job: dict,
+            model,
+            model_sampler,
+            sample_config_list: list[SampleConfig],
+            is_custom_sample: bool,
+            folder_postfix: str,
+            result_queue,
+    ):
+        for i, sample_config in enumerate(sample_config_list):
+            if not sample_config.enabled:
+                continue
+
+            try:
+                safe_prompt = path_util.safe_filename(sample_config.prompt)
+
+                if is_custom_sample:
+                    sample_dir = os.path.join(config.workspace_dir, "samples", "custom")
+                else:
+                    sample_dir = os.path.join(config.workspace_dir, "samples", f"{str(i)} - {safe_prompt}{folder_postfix}")
+
+                sample_path = os.path.join(
+                    sample_dir,
+                    f"{config.save_filename_prefix}{get_string_timestamp()}-training-sample-{job['filename_string']}"
+                )
+
+                def on_sample(sampler_output: ModelSamplerOutput, i=i, safe_prompt=safe_prompt):
+                    result_queue.put((
+                        SamplingWorkerMessage.SAMPLE, is_custom_sample, i, safe_prompt, job["global_step"],
+                        sampler_output,
+                    ))
+
+                def on_update_progress(progress: int, max_progress: int):
+                    result_queue.put((SamplingWorkerMessage.PROGRESS, is_custom_sample, progress, max_progress))
+
+                model.to(model_sampler.temp_device)
+                model.eval()
+
+                sample_config = copy.copy(sample_config)
+                sample_config.from_train_config(config)
+
+                model_sampler.sample(
+                    sample_config=sample_config,
+                    destination=sample_path,
+                    image_format=config.sample_image_format,
+                    video_format=config.sample_video_format,
+                    audio_format=config.sample_audio_format,
+                    on_sample=on_sample,
+                    on_update_progress=on_update_progress,
+                )
+            except Exception:
+                result_queue.put((SamplingWorkerMessage.ERROR, traceback.format_exc()))
+
+            torch_gc()
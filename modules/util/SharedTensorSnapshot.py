@@ -0,0 +1,48 @@
+from collections.abc import Iterable
+
+import torch
+from torch import Tensor
+
+
+class SharedTensorSnapshot:
+    """
+    A copy of a fixed list of tensors in shared CPU memory. The buffers are allocated once and overwritten by every
+    capture, so the snapshot can be passed to another process through torch.multiprocessing without any further
+    serialization. Only the shapes and dtypes of the initial tensors are used, later captures must match them.
+    """
+
+    def __init__(self, tensors: Iterable[Tensor]):
+        self.tensors = [
+            torch.empty(tensor.shape, dtype=tensor.dtype, device="cpu").share_memory_()
+            for tensor in tensors
+        ]
+        self.__version = torch.zeros((1,), dtype=torch.int64).share_memory_()
+
+    @property
+    def version(self) -> int:
+        return int(self.__version.item())
+
+    def nbytes(self) -> int:
+        return sum(tensor.numel() * tensor.element_size() for tensor in self.tensors)
+
+    @torch.no_grad()
+    def capture(self, tensors: Iterable[Tensor]):
+        tensors = list(tensors)
+        if len(tensors) != len(self.tensors):
+            raise ValueError(f"expected {len(self.tensors)} tensors, got {len(tensors)}")
+
+        for buffer, tensor in zip(self.tensors, tensors, strict=True):
+            buffer.copy_(tensor.detach())
+        self.__version.add_(1)
+
+    @torch.no_grad()
+    def copy_to(self, tensors: Iterable[Tensor]):
+        tensors = list(tensors)
+        if len(tensors) != len(self.tensors):
+            raise ValueError(f"expected {len(self.tensors)} tensors, got {len(tensors)}")
+
+        for buffer, tensor in zip(self.tensors, tensors, strict=True):
+            tensor.data.copy_(buffer.to(device=tensor.device))
+
+    def clone(self) -> list[Tensor]:
+        return [buffer.clone() for buffer in self.tensors]
@@ -0,0 +1,72 @@
+import threading
+from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+
+
+class HostMemoryBudget:
+    """
+    Limits the host memory used by concurrent loads. A request that is larger than the whole budget is only granted
+    if nothing else is in use, so it can never dead lock.
+    """
+
+    def __init__(self, budget_bytes: int):
+        self.__budget_bytes = budget_bytes
+        self.__used_bytes = 0
+        self.__condition = threading.Condition()
+
+    def acquire(self, num_bytes: int):
+        with self.__condition:
+            self.__condition.wait_for(
+                lambda: self.__used_bytes == 0 or self.__used_bytes + num_bytes <= self.__budget_bytes
+            )
+            self.__used_bytes += num_bytes
+
+    def release(self, num_bytes: int):
+        with self.__condition:
+            self.__used_bytes -= num_bytes
+            self.__condition.notify_all()
+
+    @contextmanager
+    def reserve(self, num_bytes: int):
+        self.acquire(num_bytes)
+        try:
+            yield
+        finally:
+            self.release(num_bytes)
+
+
+class SubModuleLoadPool:
+    """
+    Loads independent sub-modules of a model concurrently. If max_workers is 1, every load is executed immediately in
+    the calling thread, which keeps the sequential behaviour.
+    """
+
+    def __init__(self, max_workers: int, host_memory_budget_bytes: int | None):
+        self.__executor = ThreadPoolExecutor(max_workers=max_workers) if max_workers > 1 else None
+        self.__memory_budget = HostMemoryBudget(host_memory_budget_bytes) \
+            if host_memory_budget_bytes is not None and host_memory_budget_bytes > 0 else None
+
+    def submit(self, fun: Callable, *args, **kwargs) -> Future:
+        if self.__executor is not None:
+            return self.__executor.submit(fun, *args, **kwargs)
+
+        future = Future()
+        try:
+            future.set_result(fun(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    @contextmanager
+    def reserve_memory(self, num_bytes: int):
+        if self.__memory_budget is None:
+            yield
+        else:
+            with self.__memory_budget.reserve(num_bytes):
+                yield
+
+    def shutdown(self):
+        if self.__executor is not None:
+            # cancel loads that were not started yet, if a previous load failed
+            self.__executor.shutdown(wait=True, cancel_futures=True)
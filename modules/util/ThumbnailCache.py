@@ -0,0 +1,112 @@
+import contextlib
+import hashlib
+import os
+import threading
+
+from modules.util.image_util import load_image
+
+from PIL import Image
+from PIL.PngImagePlugin import PngInfo
+
+
+class ThumbnailCache:
+    """
+    Caches downscaled copies of images on disk. A cached thumbnail is identified by the path, size and modification
+    time of the source image, so it is recreated when the source changes. The size of the source image is stored in
+    the thumbnail, because callers like the mask editor need it.
+
+    The cache is limited to max_bytes. If it grows larger, the least recently used thumbnails are deleted until it is
+    at prune_fraction of the limit. Reading a thumbnail updates its modification time to mark it as recently used.
+    """
+
+    def __init__(
+            self,
+            cache_dir: str = os.path.join("workspace-cache", "thumbnails"),
+            max_bytes: int = 1024 ** 3,
+            prune_fraction: float = 0.9,
+    ):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.prune_fraction = prune_fraction
+
+        self.__lock = threading.Lock()
+        self.__total_bytes = None  # counted when the first thumbnail is written
+
+    def get(self, path: str, max_size: int, convert_mode: str = 'RGB') -> tuple[Image.Image, tuple[int, int]]:
+        """
+        Returns the image at path scaled so that its longer side is max_size, and the size of the original image.
+        """
+        stat = os.stat(path)
+        key = hashlib.sha1(
+            f"{os.path.abspath(path)}\t{stat.st_size}\t{stat.st_mtime_ns}\t{max_size}\t{convert_mode}".encode()
+        ).hexdigest()
+        cache_path = os.path.join(self.cache_dir, key[:2], f"{key}.png")
+
+        try:
+            thumbnail = Image.open(cache_path)
+            thumbnail.load()
+            width, height = thumbnail.text['original_size'].split('x')
+            with contextlib.suppress(OSError):
+                os.utime(cache_path)
+            return thumbnail, (int(width), int(height))
+        except (OSError, KeyError, ValueError):
+            pass
+
+        image = load_image(path, convert_mode=convert_mode)
+        scale = max_size / max(image.width, image.height)
+        thumbnail = image.resize((int(image.width * scale), int(image.height * scale)), Image.Resampling.LANCZOS)
+
+        pnginfo = PngInfo()
+        pnginfo.add_text('original_size', f"{image.width}x{image.height}")
+        try:
+            # write to a temporary file first, the same thumbnail can be created by several threads at once
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            temp_path = f"{cache_path}.{os.getpid()}-{threading.get_ident()}.tmp"
+            thumbnail.save(temp_path, format='PNG', pnginfo=pnginfo, compress_level=1)
+            os.replace(temp_path, cache_path)
+            self.__add_bytes(os.path.getsize(cache_path))
+        except OSError:
+            pass  # the cache is optional
+
+        return thumbnail, image.size
+
+    def size_bytes(self) -> int:
+        return sum(size for _, _, size in self.__cache_files())
+
+    def __cache_files(self) -> list[tuple[str, float, int]]:
+        # (path, modification time, size) of every thumbnail
+        files = []
+        for root, _, file_names in os.walk(self.cache_dir):
+            for file_name in file_names:
+                if not file_name.endswith(".png"):
+                    continue
+                path = os.path.join(root, file_name)
+                with contextlib.suppress(OSError):
+                    stat = os.stat(path)
+                    files.append((path, stat.st_mtime, stat.st_size))
+        return files
+
+    def __add_bytes(self, num_bytes: int):
+        with self.__lock:
+            if self.__total_bytes is None:
+                # the first count already includes the new thumbnail
+                self.__total_bytes = self.size_bytes()
+            else:
+                self.__total_bytes += num_bytes
+
+            if self.__total_bytes > self.max_bytes:
+                self.__prune()
+
+    def __prune(self):
+        # must be called while holding the lock. other processes can write to the same directory, so the files are
+        # counted again
+        files = sorted(self.__cache_files(), key=lambda file: file[1])
+        total_bytes = sum(size for _, _, size in files)
+        target_bytes = self.max_bytes * self.prune_fraction
+        for path, _, size in files:
+            if total_bytes <= target_bytes:
+                break
+            with contextlib.suppress(OSError):
+                os.remove(path)
+                total_bytes -= size
+        self.__total_bytes = total_bytes
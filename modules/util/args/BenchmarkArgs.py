@@ -0,0 +1,57 @@
+import argparse
+from typing import Any
+
+from modules.util.args.BaseArgs import BaseArgs
+from modules.util.benchmark.benchmark_suite import COMPONENT_BENCHMARKS
+from modules.util.benchmark.tiny_model_benchmark import TINY_MODEL_FACTORIES, TINY_MODEL_TRAINING_METHODS
+
+
+class BenchmarkArgs(BaseArgs):
+    model_types: list[str]
+    training_methods: list[str]
+    component_benchmarks: list[str]
+    steps: int
+    batch_size: int
+    output_path: str
+    baseline_path: str
+    regression_threshold: float
+
+    def __init__(self, data: list[(str, Any, type, bool)]):
+        super().__init__(data)
+
+    @staticmethod
+    def parse_args() -> 'BenchmarkArgs':
+        parser = argparse.ArgumentParser(description="One Trainer Benchmark Script.")
+
+        # @formatter:off
+
+        parser.add_argument("--model-types", type=str, nargs="+", required=False, default=[str(x) for x in TINY_MODEL_FACTORIES], dest="model_types", help="The model types to benchmark. A tiny checkpoint of each model type is trained with its model loader, setup, data loader and sampler", choices=[str(x) for x in TINY_MODEL_FACTORIES])
+        parser.add_argument("--training-methods", type=str, nargs="+", required=False, default=[str(x) for x in TINY_MODEL_TRAINING_METHODS], dest="training_methods", help="The training methods to benchmark", choices=[str(x) for x in TINY_MODEL_TRAINING_METHODS])
+        parser.add_argument("--component-benchmarks", type=str, nargs="*", required=False, default=[], dest="component_benchmarks", help="Additional component benchmarks to run", choices=list(COMPONENT_BENCHMARKS))
+        parser.add_argument("--steps", type=int, required=False, default=5, dest="steps", help="The number of measured training steps for each model")
+        parser.add_argument("--batch-size", type=int, required=False, default=2, dest="batch_size", help="The batch size")
+        parser.add_argument("--output-path", type=str, required=False, default="benchmark.json", dest="output_path", help="The path to the output json file")
+        parser.add_argument("--baseline-path", type=str, required=False, default=None, dest="baseline_path", help="The results of a previous run to compare against")
+        parser.add_argument("--regression-threshold", type=float, required=False, default=0.25, dest="regression_threshold", help="The relative slowdown compared to the baseline that counts as a regression")
+
+        # @formatter:on
+
+        args = BenchmarkArgs.default_values()
+        args.from_dict(vars(parser.parse_args()))
+        return args
+
+    @staticmethod
+    def default_values() -> 'BenchmarkArgs':
+        data = []
+
+        # name, default value, data type, nullable
+        data.append(("model_types", [str(x) for x in TINY_MODEL_FACTORIES], list[str], False))
+        data.append(("training_methods", [str(x) for x in TINY_MODEL_TRAINING_METHODS], list[str], False))
+        data.append(("component_benchmarks", [], list[str], False))
+        data.append(("steps", 5, int, False))
+        data.append(("batch_size", 2, int, False))
+        data.append(("output_path", "benchmark.json", str, False))
+        data.append(("baseline_path", None, str, True))
+        data.append(("regression_threshold", 0.25, float, False))
+
+        return BenchmarkArgs(data)
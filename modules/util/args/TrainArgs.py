@@ -21,6 +21,7 @@ class TrainArgs(BaseArgs):
         parser.add_argument("--secrets-path", type=str, required=False, dest="secrets_path", help="The path to the secrets file")
         parser.add_argument("--callback-path", type=str, required=False, dest="callback_path", help="The path to the callback pickle file")
         parser.add_argument("--command-path", type=str, required=False, dest="command_path", help="The path to the command pickle file")
+        parser.add_argument("--channel-port-path", type=str, required=False, dest="channel_port_path", help="The path to the file that receives the port of the message channel")
 
         # @formatter:on
 
@@ -37,5 +38,6 @@ class TrainArgs(BaseArgs):
         data.append(("secrets_path", None, str, True))
         data.append(("callback_path", None, str, True))
         data.append(("command_path", None, str, True))
+        data.append(("channel_port_path", None, str, True))
 
         return TrainArgs(data)
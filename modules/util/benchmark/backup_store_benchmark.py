@@ -0,0 +1,145 @@
+import json
+import os
+import tempfile
+import time
+
+from modules.util.BackupStore import BackupStore
+
+import torch
+
+from safetensors.torch import load_file, save_file
+
+
+def __random_tensors(prefix: str, count: int, width: int, generator: torch.Generator) -> dict[str, torch.Tensor]:
+    return {
+        f"{prefix}.{i}.weight": torch.randn((width, width), generator=generator, dtype=torch.float32)
+        .to(dtype=torch.bfloat16)
+        for i in range(count)
+    }
+
+
+def __write_backup(
+        backup_path: str,
+        frozen: dict[str, torch.Tensor],
+        trained: dict[str, torch.Tensor],
+        step: int,
+) -> dict[str, dict[str, torch.Tensor]]:
+    # the layout of an internal backup of a fine-tune: frozen model parts, trained model parts and the optimizer.
+    # returns the tensors of each safetensors file
+    files = {
+        "vae/diffusion_pytorch_model.safetensors": frozen,
+        "transformer/diffusion_pytorch_model.safetensors": trained,
+        "optimizer/optimizer-00001-of-00001.safetensors": {key: value.float() * 0.1 for key, value in trained.items()},
+    }
+    for relative_path, tensors in files.items():
+        path = os.path.join(backup_path, *relative_path.split("/"))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        save_file(tensors, path, metadata={"format": "pt"})
+    with open(os.path.join(backup_path, "meta.json"), "w") as meta_file:
+        json.dump({"train_progress": {"global_step": step}}, meta_file)
+    return files
+
+
+def __is_restored(restored_path: str, files: dict[str, dict[str, torch.Tensor]], step: int) -> bool:
+    for relative_path, tensors in files.items():
+        restored = load_file(os.path.join(restored_path, *relative_path.split("/")))
+        if restored.keys() != tensors.keys() or any(not torch.equal(restored[key], tensors[key]) for key in tensors):
+            return False
+    with open(os.path.join(restored_path, "meta.json"), "r") as meta_file:
+        return json.load(meta_file)["train_progress"]["global_step"] == step
+
+
+def __directory_bytes(directory: str) -> int:
+    return sum(
+        os.path.getsize(os.path.join(dirpath, filename))
+        for dirpath, _, filenames in os.walk(directory)
+        for filename in filenames
+    )
+
+
+def __run(
+        stream: bool,
+        backups: int,
+        rolling_backup_count: int,
+        frozen_tensors: int,
+        trained_tensors: int,
+        width: int,
+) -> dict:
+    generator = torch.Generator().manual_seed(42)
+    frozen = __random_tensors("frozen", frozen_tensors, width, generator)
+    trained = __random_tensors("trained", trained_tensors, width, generator)
+
+    results = {
+        "total_bytes": [],
+        "stored_bytes": [],
+        "written_bytes": [],
+        "backup_time": [],
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        store = BackupStore(os.path.join(directory, "backup_store"))
+        backup_paths = []
+        backup_files = []
+
+        for step in range(backups):
+            # one training step changes all trained tensors
+            trained = {key: value + 0.01 for key, value in trained.items()}
+
+            backup_path = os.path.join(directory, "backup", f"backup-{step}")
+            start_time = time.perf_counter()
+            if stream:
+                with store.stream_safetensors(backup_path):
+                    backup_files.append(__write_backup(backup_path, frozen, trained, step))
+            else:
+                backup_files.append(__write_backup(backup_path, frozen, trained, step))
+            stats = store.add(backup_path)
+            results["backup_time"].append(time.perf_counter() - start_time)
+
+            results["total_bytes"].append(stats.total_bytes)
+            results["stored_bytes"].append(stats.stored_bytes)
+            results["written_bytes"].append(stats.written_bytes)
+            backup_paths.append(backup_path)
+
+        results["store_bytes_before_prune"] = __directory_bytes(store.store_path)
+
+        for backup_path in backup_paths[:-rolling_backup_count]:
+            for dirpath, _, filenames in os.walk(backup_path, topdown=False):
+                for filename in filenames:
+                    os.remove(os.path.join(dirpath, filename))
+                os.rmdir(dirpath)
+
+        start_time = time.perf_counter()
+        results["pruned_bytes"] = store.prune(backup_paths[-rolling_backup_count:])
+        results["prune_time"] = time.perf_counter() - start_time
+        results["store_bytes_after_prune"] = __directory_bytes(store.store_path)
+        results["full_backups_bytes_after_prune"] = sum(results["total_bytes"][-rolling_backup_count:])
+
+        results["restore_time"] = []
+        results["restored_identical"] = []
+        for step in range(backups - rolling_backup_count, backups):
+            start_time = time.perf_counter()
+            restored_path = store.restore_for_loading(backup_paths[step])
+            results["restore_time"].append(time.perf_counter() - start_time)
+            results["restored_identical"].append(__is_restored(restored_path, backup_files[step], step))
+
+    return results
+
+
+def benchmark_backup_store(
+        backups: int = 4,
+        rolling_backup_count: int = 2,
+        frozen_tensors: int = 16,
+        trained_tensors: int = 8,
+        width: int = 1024,
+) -> dict:
+    """
+    Writes several backups of a simulated fine-tune, where the frozen part of the model is the same in every backup
+    and the trained part and the optimizer state change. Each backup is added to a backup store, once with the
+    safetensors files streamed into the store, and once after the files were written to the backup directory. Reports
+    the total size, the bytes kept in the store, all bytes written to the disk, and the time needed to write and add
+    each backup. Then all backups except the last rolling_backup_count are deleted and pruned, and the remaining
+    backups are restored and loaded. They must contain the same tensors.
+    """
+    return {
+        "streamed": __run(True, backups, rolling_backup_count, frozen_tensors, trained_tensors, width),
+        "written_first": __run(False, backups, rolling_backup_count, frozen_tensors, trained_tensors, width),
+    }
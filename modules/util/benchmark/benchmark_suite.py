@@ -0,0 +1,90 @@
+from collections.abc import Callable
+
+from modules.util.benchmark.fused_loss_benchmark import benchmark_fused_loss
+from modules.util.benchmark.import_time_benchmark import benchmark_entry_point_imports, check_lazy_imports
+from modules.util.benchmark.lora_merge_benchmark import benchmark_merged_lora
+from modules.util.benchmark.optimizer_benchmark import LORA_PARAMETER_SHAPES, benchmark_optimizer_step
+from modules.util.benchmark.optimizer_offload_benchmark import benchmark_optimizer_offload
+from modules.util.benchmark.tiny_model_benchmark import benchmark_tiny_model
+from modules.util.enum.ModelType import ModelType
+from modules.util.enum.TrainingMethod import TrainingMethod
+
+import torch
+
+COMPONENT_BENCHMARKS: dict[str, Callable[[], dict]] = {
+    "lora_merge": benchmark_merged_lora,
+    "optimizer_step": lambda: benchmark_optimizer_step("adamw", LORA_PARAMETER_SHAPES),
+    "optimizer_offload": benchmark_optimizer_offload,
+    "fused_loss": lambda: benchmark_fused_loss(compile=False),
+    "entry_point_imports": benchmark_entry_point_imports,
+}
+
+
+def run_benchmark_suite(
+        model_types: list[ModelType],
+        training_methods: list[TrainingMethod],
+        component_benchmarks: list[str],
+        steps: int = 5,
+        batch_size: int = 2,
+        print_cb: Callable[[str], None] = print,
+) -> dict:
+    """
+    Runs the tiny model benchmark for every combination of model type and training method, and the selected
+    component benchmarks. Returns the results together with the torch version and thread count, because timings are
+    only comparable between runs on the same setup.
+
+    Before any benchmark, it asserts that importing modules.util.create does not import model specific modules. Model
+    specific imports would be attributed to the first benchmarked model type.
+    """
+    print_cb("checking lazy imports of modules.util.create")
+    check_lazy_imports("modules.util.create")
+
+    results = {
+        "torch_version": torch.__version__,
+        "num_threads": torch.get_num_threads(),
+        "tiny_models": {},
+        "components": {},
+    }
+
+    for model_type in model_types:
+        for training_method in training_methods:
+            print_cb(f"benchmarking {model_type} {training_method}")
+            results["tiny_models"][f"{model_type}/{training_method}"] = \
+                benchmark_tiny_model(model_type, training_method, steps, batch_size)
+
+    for name in component_benchmarks:
+        print_cb(f"benchmarking {name}")
+        results["components"][name] = COMPONENT_BENCHMARKS[name]()
+
+    return results
+
+
+def __flatten(results: dict, prefix: str = "") -> dict[str, float]:
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat |= __flatten(value, f"{prefix}{key}/")
+        elif isinstance(value, int | float) and not isinstance(value, bool):
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+def find_regressions(results: dict, baseline: dict, threshold: float) -> list[str]:
+    """
+    Compares all timings (keys ending in "_time") that exist in both results. A timing is a regression if it is
+    more than threshold (relative) slower than the baseline.
+    """
+    results = __flatten(results)
+    baseline = __flatten(baseline)
+
+    regressions = []
+    for key, value in results.items():
+        baseline_value = baseline.get(key)
+        if not key.endswith("_time") or baseline_value is None or baseline_value <= 0:
+            continue
+        if value > baseline_value * (1 + threshold):
+            regressions.append(
+                f"{key}: {baseline_value * 1000:.2f} ms -> {value * 1000:.2f} ms "
+                f"(+{(value / baseline_value - 1) * 100:.0f}%)"
+            )
+    return regressions
@@ -0,0 +1,138 @@
+import os
+import tempfile
+import time
+
+from modules.util.benchmark.optimizer_benchmark import create_adamw
+from modules.util.benchmark.tiny_model_benchmark import (
+    NUM_TEXT_TOKENS,
+    POOLED_DIM,
+    TEXT_DIM,
+    create_tiny_stable_diffusion_3,
+)
+from modules.util.cache_storage_util import decode_cache_tensor, encode_cache_tensor
+from modules.util.enum.DataType import DataType
+
+import torch
+from torch import Tensor
+
+STORAGE_CONFIGS = [
+    (DataType.NONE, False),
+    (DataType.NONE, True),
+    (DataType.FLOAT_16, False),
+    (DataType.BFLOAT_16, False),
+    (DataType.BFLOAT_16, True),
+    (DataType.FLOAT_8, False),
+    (DataType.FLOAT_8, True),
+]
+
+
+def __create_sample(
+        generator: torch.Generator,
+        latent_shape: tuple[int, ...],
+        text_shape: tuple[int, int],
+        num_text_tokens: int,
+        dtype: torch.dtype,
+) -> dict[str, Tensor]:
+    # text encoder outputs are padded to a fixed length. all padding positions hold the same vector
+    text = torch.randn(text_shape, generator=generator)
+    text[num_text_tokens:] = torch.randn((text_shape[1],), generator=generator)
+    return {
+        "latent_image": torch.randn(latent_shape, generator=generator).to(dtype=dtype),
+        "text_encoder_hidden_state": text.to(dtype=dtype),
+    }
+
+
+def __encode(sample: dict[str, Tensor], storage_dtype: DataType, compress: bool) -> dict:
+    return {name: encode_cache_tensor(value, storage_dtype, compress) for name, value in sample.items()}
+
+
+def __decode(sample: dict) -> dict[str, Tensor]:
+    return {name: decode_cache_tensor(value) for name, value in sample.items()}
+
+
+def __train(samples: list[dict[str, Tensor]], steps: int) -> float:
+    # trains the tiny SD3 model from the same initialization on the decoded samples, returns the mean loss
+    generator = torch.Generator().manual_seed(42)
+    torch.manual_seed(42)
+    tiny_model = create_tiny_stable_diffusion_3(generator)
+    optimizer = create_adamw(list(tiny_model.denoiser.parameters()), foreach=True)
+
+    losses = []
+    for step in range(steps):
+        sample = samples[step % len(samples)]
+        latent = sample["latent_image"].unsqueeze(0).float()
+        batch = {
+            "text_encoder_output": sample["text_encoder_hidden_state"].unsqueeze(0).float(),
+            "pooled_text_encoder_output": torch.zeros((1, POOLED_DIM)),
+        }
+        noise = torch.randn(latent.shape, generator=generator)
+        timestep = torch.rand((1,), generator=generator)
+        predicted = tiny_model.predict(tiny_model.denoiser, batch, latent * (1 - timestep) + noise * timestep, timestep)
+        loss = (predicted - (noise - latent)).pow(2).mean()
+        loss.backward()
+        optimizer.step()
+        optimizer.zero_grad(set_to_none=True)
+        losses.append(loss.item())
+
+    return sum(losses) / len(losses)
+
+
+def benchmark_cache_storage(
+        num_samples: int = 8,
+        latent_shape: tuple[int, ...] = (16, 128, 128),
+        text_shape: tuple[int, int] = (512, 4096),
+        num_text_tokens: int = 77,
+        dtype: torch.dtype = torch.bfloat16,
+        train_steps: int = 50,
+) -> dict:
+    """
+    Writes a cache of latents and padded text encoder hidden states (by default of a 1024x1024 image with a 16
+    channel VAE and a 512 token T5 caption) with every storage config, and reads it back with decoding. Reports the
+    cache size, the read and decode time per sample and the relative error of the decoded tensors. Reads are measured
+    with a warm page cache, so a disk-bound data loader gains more than the measured time suggests. Then a tiny SD3
+    model is trained on a small cache with each storage config. The mean training loss is compared to the loss with
+    unchanged storage.
+    """
+    generator = torch.Generator().manual_seed(42)
+    samples = [__create_sample(generator, latent_shape, text_shape, num_text_tokens, dtype) for _ in range(num_samples)]
+    train_samples = [
+        __create_sample(generator, (4, 16, 16), (NUM_TEXT_TOKENS, TEXT_DIM), NUM_TEXT_TOKENS // 2, dtype)
+        for _ in range(4)
+    ]
+
+    results = {}
+    reference_loss = None
+    with tempfile.TemporaryDirectory() as directory:
+        for storage_dtype, compress in STORAGE_CONFIGS:
+            name = f"{storage_dtype}{'_compressed' if compress else ''}".lower()
+            cache_dir = os.path.join(directory, name)
+            os.makedirs(cache_dir)
+
+            start_time = time.perf_counter()
+            for i, sample in enumerate(samples):
+                torch.save(__encode(sample, storage_dtype, compress), os.path.join(cache_dir, f"{i}.pt"))
+            results[f"{name}_write_time"] = (time.perf_counter() - start_time) / num_samples
+            results[f"{name}_cache_bytes"] = sum(
+                os.path.getsize(os.path.join(cache_dir, file_name)) for file_name in os.listdir(cache_dir))
+
+            start_time = time.perf_counter()
+            decoded = [
+                __decode(torch.load(os.path.join(cache_dir, f"{i}.pt"), weights_only=True))
+                for i in range(num_samples)
+            ]
+            results[f"{name}_read_time"] = (time.perf_counter() - start_time) / num_samples
+
+            for key in ["latent_image", "text_encoder_hidden_state"]:
+                results[f"{name}_{key}_relative_error"] = max(
+                    ((d[key].float() - s[key].float()).norm() / s[key].float().norm()).item()
+                    for d, s in zip(decoded, samples, strict=True)
+                )
+
+            loss = __train(
+                [__decode(__encode(sample, storage_dtype, compress)) for sample in train_samples], train_steps)
+            if reference_loss is None:
+                reference_loss = loss
+            results[f"{name}_mean_loss"] = loss
+            results[f"{name}_loss_difference"] = loss - reference_loss
+
+    return results
@@ -0,0 +1,134 @@
+import os
+import tempfile
+import time
+from pathlib import Path
+
+from modules.cloud.LocalFileSync import LocalFileSync
+from modules.util.config.CloudConfig import CloudConfig, CloudSecretsConfig
+
+
+def __write_tree(root: Path, num_dirs: int, files_per_dir: int, file_size: int):
+    for i in range(num_dirs):
+        directory = root / f"dir_{i}" / "sub"
+        directory.mkdir(parents=True, exist_ok=True)
+        for j in range(files_per_dir):
+            (directory / f"file_{j}.txt").write_bytes(os.urandom(file_size))
+
+
+def __tree_contents(root: Path) -> dict[Path, bytes]:
+    return {path.relative_to(root): path.read_bytes() for path in root.rglob("*") if path.is_file()}
+
+
+def benchmark_file_sync(
+        num_dirs: int = 20,
+        files_per_dir: int = 50,
+        file_size: int = 256,
+) -> dict:
+    """
+    Uploads a synthetic directory tree to a local directory standing in for the remote machine, syncs it again
+    without changes, and downloads it back. Reports the number of remote commands and transferred files of each pass,
+    and checks that the contents match.
+    """
+    config = CloudConfig.default_values()
+    secrets = CloudSecretsConfig.default_values()
+    secrets.host = "localhost"
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        local = Path(directory) / "local"
+        remote = Path(directory) / "remote"
+        downloaded = Path(directory) / "downloaded"
+        __write_tree(local, num_dirs, files_per_dir, file_size)
+
+        file_sync = LocalFileSync(config, secrets)
+        for name, sync in [
+            ("upload", lambda: file_sync.sync_up_dir(local=local, remote=remote, recursive=True)),
+            ("upload_unchanged", lambda: file_sync.sync_up_dir(local=local, remote=remote, recursive=True)),
+            ("download", lambda: file_sync.sync_down_dir(local=downloaded, remote=remote)),
+        ]:
+            file_sync.remote_command_count = 0
+            file_sync.transferred_file_count = 0
+            start_time = time.perf_counter()
+            sync()
+            results[name] = {
+                "time": time.perf_counter() - start_time,
+                "remote_commands": file_sync.remote_command_count,
+                "transferred_files": file_sync.transferred_file_count,
+            }
+        file_sync.close()
+
+        local_contents = __tree_contents(local)
+        results["contents_match"] = local_contents == __tree_contents(remote) == __tree_contents(downloaded)
+
+    return results
+
+
+class _InterruptedUpload(Exception):
+    pass
+
+
+def benchmark_packed_upload(
+        num_dirs: int = 20,
+        files_per_dir: int = 50,
+        file_size: int = 4096,
+        chunk_size: int = 256 * 1024,
+) -> dict:
+    """
+    Uploads a synthetic directory tree as packed chunks to a local directory standing in for the remote machine.
+    The first upload is interrupted halfway and resumed, then a single file is changed and uploaded again.
+    Reports the number of remote commands and transferred files of each pass, and checks that the contents match.
+    """
+    config = CloudConfig.default_values()
+    secrets = CloudSecretsConfig.default_values()
+    secrets.host = "localhost"
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        local = Path(directory) / "local"
+        remote = Path(directory) / "remote"
+        __write_tree(local, num_dirs, files_per_dir, file_size)
+
+        file_sync = LocalFileSync(config, secrets)
+        upload_file = file_sync.upload_file
+        uploads_before_interrupt = max(num_dirs * files_per_dir * file_size // chunk_size // 2, 1)
+
+        def interrupting_upload_file(local_file: Path, remote_file: Path):
+            if file_sync.transferred_file_count >= uploads_before_interrupt:
+                raise _InterruptedUpload
+            upload_file(local_file=local_file, remote_file=remote_file)
+
+        def interrupted_sync():
+            file_sync.upload_file = interrupting_upload_file
+            try:
+                file_sync.sync_up_dir_packed(local=local, remote=remote, recursive=True, chunk_size=chunk_size)
+            except _InterruptedUpload:
+                pass
+            finally:
+                file_sync.upload_file = upload_file
+
+        def sync():
+            file_sync.sync_up_dir_packed(local=local, remote=remote, recursive=True, chunk_size=chunk_size)
+
+        def change_one_file_and_sync():
+            (local / "dir_0" / "sub" / "file_0.txt").write_bytes(os.urandom(file_size))
+            sync()
+
+        for name, sync_fun in [
+            ("interrupted", interrupted_sync),
+            ("resumed", sync),
+            ("one_file_changed", change_one_file_and_sync),
+        ]:
+            file_sync.remote_command_count = 0
+            file_sync.transferred_file_count = 0
+            start_time = time.perf_counter()
+            sync_fun()
+            results[name] = {
+                "time": time.perf_counter() - start_time,
+                "remote_commands": file_sync.remote_command_count,
+                "transferred_files": file_sync.transferred_file_count,
+            }
+        file_sync.close()
+
+        results["contents_match"] = __tree_contents(local) == __tree_contents(remote)
+
+    return results
@@ -0,0 +1,118 @@
+import os
+import tempfile
+import time
+
+from modules.util.DiskLayerCache import DiskLayerCache, tensor_fingerprint
+from modules.util.LayerOffloadPlanner import LayerOffloadStrategy
+
+import torch
+
+
+def __read_memory_status(key: str) -> int:
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith(f"{key}:"):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def __drop_page_cache(cache_dir: str):
+    # the files were just written, so they are still in the page cache. without this, reads never touch the disk
+    for file_name in os.listdir(cache_dir):
+        fd = os.open(os.path.join(cache_dir, file_name), os.O_RDONLY)
+        try:
+            os.fsync(fd)
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+
+
+def __run_passes(
+        cache: DiskLayerCache,
+        strategy: LayerOffloadStrategy,
+        num_prefetch_layers: int,
+        layer_time: float,
+        passes: int,
+) -> float:
+    # forward passes like during sampling. every layer is copied out of the cache, like the copy to the train device,
+    # and compute on the train device is emulated with a sleep
+    num_layers = len(strategy.layer_bytes)
+    start_time = time.perf_counter()
+    for _ in range(passes):
+        for layer_index in range(num_layers):
+            if num_prefetch_layers > 0:
+                cache.prefetch(strategy.get_layers_to_prefetch(
+                    layer_index, is_forward=True, is_next_forward=True, num_steps=num_prefetch_layers))
+            for tensor in cache.get_tensors(layer_index):
+                tensor.clone()
+            cache.release(layer_index)
+            time.sleep(layer_time)
+    return (time.perf_counter() - start_time) / passes
+
+
+def benchmark_disk_layer_cache(
+        num_layers: int = 16,
+        layer_bytes: int = 32 * 1024 * 1024,
+        layer_time: float = 0.01,
+        num_prefetch_layers: int = 4,
+        passes: int = 3,
+) -> dict:
+    """
+    Measures the disk offloading tier on the CPU with file-backed layers. Every layer is written to a DiskLayerCache in
+    a temporary directory, the page cache of the files is dropped, and the layers are read in the order the offload
+    strategy loads them. Reports the time the consumer stalled with and without read-ahead, and the RAM held by the
+    staging buffers compared to keeping every offloaded layer in RAM.
+    """
+    generator = torch.Generator().manual_seed(42)
+    layers = [
+        [torch.empty((layer_bytes // 4,)).normal_(generator=generator)]
+        for _ in range(num_layers)
+    ]
+    strategy = LayerOffloadStrategy([layer_bytes] * num_layers, layer_offload_fraction=1.0)
+
+    results = {
+        "ram_offload_bytes": num_layers * layer_bytes,
+        "compute_time": num_layers * layer_time,
+    }
+
+    with tempfile.TemporaryDirectory() as directory:
+        cache_dir = os.path.join(directory, "layers")
+        cache = DiskLayerCache(cache_dir, num_staging_slots=num_prefetch_layers, pin_memory=False)
+
+        start_time = time.perf_counter()
+        for layer_index, tensors in enumerate(layers):
+            cache.write_layer(layer_index, tensors, tensor_fingerprint(tensors[0]))
+        results["write_time"] = time.perf_counter() - start_time
+
+        del tensors
+        layers.clear()
+
+        for name, prefetch_layers in [("no_prefetch", 0), ("prefetch", num_prefetch_layers)]:
+            __drop_page_cache(cache_dir)
+            cache.reset_statistics()
+            memory_before = __read_memory_status("RssAnon")
+
+            pass_time = __run_passes(cache, strategy, prefetch_layers, layer_time, passes)
+
+            results[f"{name}_pass_time"] = pass_time
+            results[f"{name}_stall_time"] = cache.stall_time / passes
+            results[f"{name}_read_throughput"] = cache.read_bytes / cache.read_time if cache.read_time > 0 else 0.0
+            results[f"{name}_prefetch_hits"] = cache.prefetch_hits
+            results[f"{name}_resident_bytes"] = cache.resident_bytes()
+            results[f"{name}_anonymous_memory_bytes"] = __read_memory_status("RssAnon") - memory_before
+
+            cache.deallocate_cache()
+
+        # a second cache on the same directory, like the next training run
+        reused_cache = DiskLayerCache(cache_dir, num_staging_slots=num_prefetch_layers, pin_memory=False)
+        start_time = time.perf_counter()
+        for layer_index in range(num_layers):
+            tensors = cache.mapped_tensors(layer_index)
+            reused_cache.write_layer(layer_index, tensors, tensor_fingerprint(tensors[0]))
+        results["reuse_time"] = time.perf_counter() - start_time
+        results["reused_bytes"] = reused_cache.reused_bytes
+
+        reused_cache.clear()
+        cache.clear()
+
+    return results
@@ -0,0 +1,158 @@
+import ctypes
+import gc
+import time
+
+from modules.util.loss.fused_loss import fused_losses
+from modules.util.loss.masked_loss import masked_losses_with_prior
+
+import torch
+import torch.nn.functional as F
+from torch import Tensor
+
+# the latents of two 13 frame 720x1280 videos, with the 16 channel 8x VAE of video models
+VIDEO_LATENT_SHAPE = (2, 16, 13, 90, 160)
+
+STRENGTHS = {
+    "mse_strength": 1.0,
+    "mae_strength": 0.5,
+    "log_cosh_strength": 0.25,
+    "huber_strength": 0.5,
+    "huber_delta": 1.0,
+}
+
+
+def __log_cosh_loss(pred: Tensor, target: Tensor) -> Tensor:
+    diff = pred - target
+    return diff + F.softplus(-2.0 * diff) \
+        - torch.log(torch.full(size=diff.size(), fill_value=2.0, dtype=torch.float32, device=diff.device))
+
+
+def __separate_losses(
+        predicted: Tensor,
+        target: Tensor,
+        prior_target: Tensor | None,
+        mask: Tensor | None,
+        mse_strength: float,
+        mae_strength: float,
+        log_cosh_strength: float,
+        huber_strength: float,
+        huber_delta: float,
+        unmasked_weight: float = 0.0,
+        normalize_masked_area_loss: bool = False,
+        masked_prior_preservation_weight: float = 0.0,
+) -> Tensor:
+    # how the loss terms were calculated before they were fused: separate conversions and tensors for each term
+    mean_dim = list(range(1, predicted.ndim))
+    terms = [
+        (mse_strength, lambda p, t: F.mse_loss(p, t, reduction='none')),
+        (mae_strength, lambda p, t: F.l1_loss(p, t, reduction='none')),
+        (log_cosh_strength, __log_cosh_loss),
+        (huber_strength, lambda p, t: F.huber_loss(p, t, reduction='none', delta=huber_delta)),
+    ]
+
+    losses = 0
+    for strength, loss_fun in terms:
+        if strength == 0:
+            continue
+        if mask is None:
+            losses += loss_fun(predicted.to(dtype=torch.float32), target.to(dtype=torch.float32)) \
+                          .mean(mean_dim) * strength
+        else:
+            losses += masked_losses_with_prior(
+                losses=loss_fun(predicted.to(dtype=torch.float32), target.to(dtype=torch.float32)),
+                prior_losses=loss_fun(predicted.to(dtype=torch.float32), prior_target.to(dtype=torch.float32))
+                if prior_target is not None else None,
+                mask=mask.to(dtype=torch.float32),
+                unmasked_weight=unmasked_weight,
+                normalize_masked_area_loss=normalize_masked_area_loss,
+                masked_prior_preservation_weight=masked_prior_preservation_weight,
+            ).mean(mean_dim) * strength
+    return losses
+
+
+def __read_memory_status(key: str) -> int:
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith(f"{key}:"):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def __run(loss_fun, inputs: dict, steps: int) -> tuple[Tensor, float, int]:
+    # warmup, and compilation for the compiled function
+    losses = loss_fun(**inputs)
+
+    # returns freed memory to the system, so memory reused from previous runs is counted again. then resets the peak
+    # resident memory of the process (Linux only)
+    gc.collect()
+    ctypes.CDLL("libc.so.6").malloc_trim(0)
+    with open("/proc/self/clear_refs", "w") as clear_refs:
+        clear_refs.write("5")
+    memory_before = __read_memory_status("VmRSS")
+
+    start_time = time.perf_counter()
+    for _ in range(steps):
+        losses = loss_fun(**inputs)
+    step_time = (time.perf_counter() - start_time) / steps
+
+    return losses, step_time, __read_memory_status("VmHWM") - memory_before
+
+
+def __gradient(loss_fun, inputs: dict) -> Tensor:
+    # the gradient of the summed per-sample losses with respect to the prediction, in float32
+    predicted = inputs["predicted"].to(dtype=torch.float32).requires_grad_()
+    loss_fun(**(inputs | {"predicted": predicted})).sum().backward()
+    return predicted.grad
+
+
+def benchmark_fused_loss(
+        shape: tuple[int, ...] = VIDEO_LATENT_SHAPE,
+        steps: int = 5,
+        compile: bool = True,
+) -> dict:
+    """
+    Compares the separately calculated MSE, MAE, log-cosh and Huber losses with the fused loss on bf16 latents on the
+    CPU, without a mask, and with a mask and prior preservation. Reports the time per evaluation, the peak memory used
+    in addition to the inputs, the largest relative difference of the per-sample losses, and the largest difference of
+    the gradients with respect to the prediction, relative to the largest gradient. If compile is True, the fused loss
+    is also evaluated with torch.compile. The peak memory can only be measured on Linux.
+    """
+    generator = torch.Generator().manual_seed(42)
+    predicted = torch.randn(shape, generator=generator).to(dtype=torch.bfloat16)
+    target = torch.randn(shape, generator=generator).to(dtype=torch.bfloat16)
+    prior_target = torch.randn(shape, generator=generator).to(dtype=torch.bfloat16)
+    mask = (torch.rand((shape[0], 1, *shape[2:]), generator=generator) > 0.5).to(dtype=torch.bfloat16)
+
+    cases = {
+        "unmasked": dict(predicted=predicted, target=target, prior_target=None, mask=None, **STRENGTHS),
+        "masked": dict(
+            predicted=predicted, target=target, prior_target=prior_target, mask=mask, **STRENGTHS,
+            unmasked_weight=0.1, normalize_masked_area_loss=True, masked_prior_preservation_weight=0.5,
+        ),
+    }
+    implementations = {
+        "separate": __separate_losses,
+        "fused": fused_losses,
+    }
+    if compile:
+        implementations["compiled"] = torch.compile(fused_losses)
+
+    results = {"num_elements": predicted.numel()}
+    for case_name, inputs in cases.items():
+        reference = None
+        reference_gradient = None
+        for implementation_name, loss_fun in implementations.items():
+            losses, step_time, peak_memory = __run(loss_fun, inputs, steps)
+            results[f"{case_name}_{implementation_name}_step_time"] = step_time
+            results[f"{case_name}_{implementation_name}_peak_memory"] = peak_memory
+            gradient = __gradient(loss_fun, inputs)
+            if reference is None:
+                reference = losses
+                reference_gradient = gradient
+            else:
+                results[f"{case_name}_{implementation_name}_max_relative_difference"] = \
+                    ((losses - reference).abs() / reference.abs()).max().item()
+                results[f"{case_name}_{implementation_name}_max_gradient_difference"] = \
+                    ((gradient - reference_gradient).abs().max() / reference_gradient.abs().max()).item()
+
+    return results
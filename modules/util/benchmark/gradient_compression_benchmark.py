@@ -0,0 +1,157 @@
+import os
+import tempfile
+import time
+
+import modules.util.multi_gpu_util as multi
+from modules.util.enum.GradientCompression import GradientCompression
+from modules.util.enum.GradientReducePrecision import GradientReducePrecision
+
+import torch
+
+
+def __create_model(width: int, depth: int) -> torch.nn.Module:
+    generator = torch.Generator().manual_seed(42)
+    layers = []
+    for i in range(depth):
+        layer = torch.nn.Linear(width, width)
+        with torch.no_grad():
+            layer.weight.copy_(torch.randn(layer.weight.shape, generator=generator) / width ** 0.5)
+            layer.bias.zero_()
+        layers.append(layer)
+        if i < depth - 1:
+            layers.append(torch.nn.GELU())
+    return torch.nn.Sequential(*layers)
+
+
+def __mean_gradients(parameters: list[torch.nn.Parameter]) -> torch.Tensor:
+    # the exact mean gradient of all ranks, reduced in float32 without compression
+    grads = torch.cat([p.grad.detach().float().flatten() for p in parameters])
+    torch.distributed.all_reduce(grads, op=torch.distributed.ReduceOp.SUM)
+    return grads / torch.distributed.get_world_size()
+
+
+def train_process(
+        rank: int,
+        world_size: int,
+        directory: str,
+        compression: GradientCompression,
+        async_op: bool,
+        steps: int,
+        width: int,
+        depth: int,
+):
+    # must be public and on module level, otherwise the pickling done by torch.multiprocessing fails
+    torch.distributed.init_process_group(
+        backend='gloo', init_method=f"file://{os.path.join(directory, 'init')}", rank=rank, world_size=world_size
+    )
+    try:
+        multi.set_gradient_compression(compression, rank=4, block_size=256)
+        model = __create_model(width, depth)
+        parameters = list(model.parameters())
+        optimizer = torch.optim.AdamW(parameters, lr=1e-3)
+
+        # a random linear map as target, every rank trains on different samples
+        target = torch.randn((width, width), generator=torch.Generator().manual_seed(0)) / width ** 0.5
+        generator = torch.Generator().manual_seed(rank + 1)
+        inputs = [torch.randn(64, width, generator=generator) for _ in range(steps)]
+        test_inputs = torch.randn(256, width, generator=torch.Generator().manual_seed(1000))
+
+        multi.get_and_reset_transferred_bytes()
+        gradient_errors = []
+        reference_sum = None
+        reduced_sum = None
+        reference_time = 0.0
+        start_time = time.perf_counter()
+        for x in inputs:
+            torch.nn.functional.mse_loss(model(x), x @ target).backward()
+
+            reference_start_time = time.perf_counter()
+            reference = __mean_gradients(parameters)
+            reference_time += time.perf_counter() - reference_start_time
+
+            if async_op:
+                multi.reduce_grads_mean(
+                    parameters, GradientReducePrecision.FLOAT_32, async_op=True, max_buffer=4 * 1024 * 1024
+                )
+                multi.finish_async(GradientReducePrecision.FLOAT_32)
+            else:
+                multi.reduce_grads_mean(parameters, GradientReducePrecision.FLOAT_32)
+
+            reference_start_time = time.perf_counter()
+            reduced = torch.cat([p.grad.detach().float().flatten() for p in parameters])
+            gradient_errors.append(((reduced - reference).norm() / reference.norm()).item())
+            reference_sum = reference if reference_sum is None else reference_sum + reference
+            reduced_sum = reduced if reduced_sum is None else reduced_sum + reduced
+            reference_time += time.perf_counter() - reference_start_time
+
+            optimizer.step()
+            optimizer.zero_grad(set_to_none=True)
+        step_time = (time.perf_counter() - start_time - reference_time) / steps
+
+        with torch.no_grad():
+            test_loss = torch.nn.functional.mse_loss(model(test_inputs), test_inputs @ target).item()
+
+        torch.save({
+            "step_time": step_time,
+            "transferred_bytes_per_step": multi.get_and_reset_transferred_bytes() / steps,
+            "test_loss": test_loss,
+            "gradient_errors": gradient_errors,
+            "accumulated_gradient_error": ((reduced_sum - reference_sum).norm() / reference_sum.norm()).item(),
+            "parameters": [p.detach() for p in parameters],
+        }, os.path.join(directory, f"rank_{rank}.pt"))
+    finally:
+        multi.set_gradient_compression(GradientCompression.NONE, 0, 0)
+        torch.distributed.destroy_process_group()
+
+
+def __run(
+        world_size: int,
+        compression: GradientCompression,
+        async_op: bool,
+        steps: int,
+        width: int,
+        depth: int,
+) -> list[dict]:
+    with tempfile.TemporaryDirectory() as directory:
+        torch.multiprocessing.spawn(
+            train_process,
+            args=(world_size, directory, compression, async_op, steps, width, depth),
+            nprocs=world_size,
+        )
+        return [torch.load(os.path.join(directory, f"rank_{rank}.pt")) for rank in range(world_size)]
+
+
+def benchmark_gradient_compression(
+        world_size: int = 3,
+        steps: int = 100,
+        width: int = 512,
+        depth: int = 3,
+) -> dict:
+    """
+    Trains a small MLP on a regression task in several gloo processes on the CPU, once for each gradient compression
+    mode, with the synchronous and the asynchronous reduce. Reports the bytes sent by each rank per step, the step time
+    and the test loss after training, which should be close to the uncompressed test loss. Parameters must be the same
+    on all ranks.
+
+    In every step, the reduced gradient is compared to the exact mean gradient. Reports the largest relative error of
+    a single step, and the relative error of the sum of all reduced gradients. With error feedback, the compression
+    error of a step is added to the next step, so the error of the sum stays much smaller than the error of a step.
+    """
+    results = {}
+    for compression in GradientCompression:
+        for async_op in [False, True]:
+            rank_results = __run(world_size, compression, async_op, steps, width, depth)
+            name = f"{compression}_{'async' if async_op else 'sync'}"
+            results[name] = {
+                "transferred_bytes_per_step": rank_results[0]["transferred_bytes_per_step"],
+                "step_time": max(r["step_time"] for r in rank_results),
+                "test_loss": rank_results[0]["test_loss"],
+                "max_gradient_error": max(max(r["gradient_errors"]) for r in rank_results),
+                "accumulated_gradient_error": max(r["accumulated_gradient_error"] for r in rank_results),
+                "rank_difference": max((
+                    (a - b).abs().max().item()
+                    for r in rank_results[1:]
+                    for a, b in zip(rank_results[0]["parameters"], r["parameters"], strict=True)
+                ), default=0.0),
+            }
+    return results
@@ -0,0 +1,108 @@
+import os
+import pathlib
+import tempfile
+import time
+
+from modules.util import path_util
+from modules.util.BackgroundPrefetcher import BackgroundPrefetcher
+from modules.util.image_util import load_image
+from modules.util.ImageFileIndex import ImageFileIndex
+from modules.util.ThumbnailCache import ThumbnailCache
+
+from PIL import Image
+
+
+def __create_concept(directory: str, file_count: int, image_count: int, image_size: int):
+    gradient = Image.linear_gradient('L').resize((image_size, image_size))
+    image = Image.merge('RGB', [gradient, gradient.transpose(Image.Transpose.ROTATE_90), gradient])
+    for i in range(file_count):
+        path = os.path.join(directory, f"image_{i:06}.png")
+        if i < image_count:
+            image.save(path, compress_level=1)
+        else:
+            # never opened during navigation, only listed
+            open(path, 'wb').close()
+        with open(os.path.join(directory, f"image_{i:06}.txt"), 'w') as f:
+            f.write(f"caption {i}")
+
+
+def __glob_nth_image(directory: str, n: int) -> str:
+    # how the concept window used to find the preview image
+    file_index = -1
+    for path in pathlib.Path(directory).glob("*.*"):
+        if path_util.is_supported_image_extension(path.suffix) and not path.name.endswith("-masklabel.png"):
+            file_index += 1
+            if file_index == n:
+                return str(path)
+    return ""
+
+
+def __load_resized(path: str, size: int) -> Image.Image:
+    image = load_image(path, convert_mode='RGB')
+    scale = size / max(image.width, image.height)
+    return image.resize((int(image.width * scale), int(image.height * scale)), Image.Resampling.LANCZOS)
+
+
+def benchmark_image_navigation(
+        file_count: int = 20000,
+        steps: int = 30,
+        image_size: int = 2048,
+        preview_size: int = 850,
+        step_interval: float = 0.1,
+        prefetch_radius: int = 4,
+) -> dict:
+    """
+    Steps through a synthetic concept directory one image at a time, the way the caption editor and the concept
+    window navigate, without any UI. Compares globbing and loading the full image on every step with the shared file
+    index, the thumbnail cache and neighbour prefetching. step_interval is the time the user spends on each image.
+    Latencies are the mean time per step until the preview image is available. Also checks that the size limit of
+    the thumbnail cache holds.
+    """
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        concept_dir = os.path.join(directory, "concept")
+        os.makedirs(concept_dir)
+        __create_concept(concept_dir, file_count, steps + prefetch_radius + 1, image_size)
+
+        start_time = time.perf_counter()
+        for step in range(steps):
+            # the glob order is arbitrary, load the same image as the other runs to compare the same work
+            __glob_nth_image(concept_dir, step)
+            __load_resized(os.path.join(concept_dir, f"image_{step:06}.png"), preview_size)
+        results["glob_and_load_latency"] = (time.perf_counter() - start_time) / steps
+
+        thumbnail_cache = ThumbnailCache(os.path.join(directory, "thumbnails"))
+
+        def load(path: str):
+            return thumbnail_cache.get(path, preview_size)
+
+        start_time = time.perf_counter()
+        ImageFileIndex.get(concept_dir, False)
+        results["index_build_time"] = time.perf_counter() - start_time
+
+        for name in ["prefetch_cold_latency", "prefetch_warm_latency"]:
+            # cold: thumbnails are created on the fly, warm: thumbnails are read from the disk cache
+            prefetcher = BackgroundPrefetcher(load, max_cached_items=4 * prefetch_radius)
+            latency = 0.0
+            for step in range(steps):
+                start_time = time.perf_counter()
+                paths = ImageFileIndex.get(concept_dir, False).paths()
+                prefetcher.get(os.path.join(concept_dir, paths[step]))
+                latency += time.perf_counter() - start_time
+
+                prefetcher.prefetch([os.path.join(concept_dir, path) for path in paths[step + 1:step + 1 + prefetch_radius]])
+                time.sleep(step_interval)
+            prefetcher.close()
+            results[name] = latency / steps
+
+        # a cache that only has room for a few thumbnails keeps the most recently used ones
+        results["thumbnail_cache_bytes"] = thumbnail_cache.size_bytes()
+        max_bytes = results["thumbnail_cache_bytes"] * 4 // steps
+        bounded_cache = ThumbnailCache(os.path.join(directory, "bounded_thumbnails"), max_bytes=max_bytes)
+        for step in range(steps):
+            bounded_cache.get(os.path.join(concept_dir, f"image_{step:06}.png"), preview_size)
+        results["bounded_thumbnail_cache_bytes"] = bounded_cache.size_bytes()
+        results["bounded_thumbnail_cache_max_bytes"] = max_bytes
+
+    results["speedup"] = results["glob_and_load_latency"] / results["prefetch_warm_latency"]
+    return results
@@ -0,0 +1,144 @@
+import os
+import subprocess
+import sys
+
+# modules that should only be imported after the model type is known
+MODEL_SPECIFIC_MODULE_PREFIXES = [
+    "modules.modelLoader.",
+    "modules.modelSaver.",
+    "modules.modelSetup.",
+    "modules.modelSampler.",
+    "modules.dataLoader.",
+    "modules.model.",
+]
+
+# modules that every model needs
+SHARED_MODULES = [
+    "modules.modelLoader.BaseModelLoader",
+    "modules.modelSaver.BaseModelSaver",
+    "modules.modelSetup.BaseModelSetup",
+    "modules.modelSampler.BaseModelSampler",
+    "modules.dataLoader.BaseDataLoader",
+    "modules.dataLoader.mixin.DataLoaderMgdsMixin",
+    "modules.model.BaseModel",
+]
+
+# scripts that start training, sampling, conversion or one of the UIs. they should only import the modules of the
+# selected model once it is known
+ENTRY_POINT_SCRIPTS = [
+    "scripts/train.py",
+    "scripts/sample.py",
+    "scripts/convert_model.py",
+    "scripts/train_ui.py",
+    "scripts/caption_ui.py",
+    "scripts/convert_model_ui.py",
+    "scripts/video_tool_ui.py",
+]
+
+
+class ImportTimeResult:
+    def __init__(
+            self,
+            total_time: float,
+            module_times: dict[str, float],
+    ):
+        self.total_time = total_time  # seconds
+        self.module_times = module_times  # module name -> cumulative seconds
+
+    def unexpected_model_modules(self) -> list[str]:
+        return sorted(
+            name for name in self.module_times
+            if any(name.startswith(prefix) for prefix in MODEL_SPECIFIC_MODULE_PREFIXES)
+            and not any(name.startswith(shared) for shared in SHARED_MODULES)
+        )
+
+
+def __run_importtime(name: str, code: str, cwd: str | None, env: dict[str, str] | None = None) -> ImportTimeResult:
+    # runs code in a fresh interpreter with "python -X importtime" and parses the per-module timings. the total time is
+    # the sum of the top level imports
+    if cwd is None:
+        cwd = os.getcwd()
+
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=cwd,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+
+    module_times = {}
+    total_time = 0.0
+    other_lines = []
+    for line in process.stderr.splitlines():
+        # format: "import time: self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "|" not in line:
+            other_lines.append(line)
+            continue
+        _, cumulative, module_name = line.removeprefix("import time:").split("|", 2)
+        cumulative = cumulative.strip()
+        if not cumulative.isdigit():
+            continue
+        # nested imports are indented by two spaces per level
+        is_top_level = not module_name.removeprefix(" ").startswith(" ")
+        module_name = module_name.strip()
+        module_times[module_name] = int(cumulative) / 1_000_000
+        if is_top_level:
+            total_time += module_times[module_name]
+
+    if process.returncode != 0:
+        raise RuntimeError(f"importing {name} failed:\n" + "\n".join(other_lines[-10:]))
+
+    return ImportTimeResult(total_time, module_times)
+
+
+def measure_import_time(module_name: str, cwd: str | None = None) -> ImportTimeResult:
+    """
+    Imports a module in a fresh interpreter and returns the per-module import timings.
+    """
+    return __run_importtime(module_name, f"import {module_name}", cwd)
+
+
+def measure_script_import_time(script_path: str, cwd: str | None = None) -> ImportTimeResult:
+    """
+    Runs the top level of a script in a fresh interpreter without calling its main() function, and returns the
+    per-module import timings.
+    """
+    # like "python scripts/train.py", the directory of the script is the first entry of sys.path
+    env = os.environ.copy()
+    env["PYTHONPATH"] = os.pathsep.join(
+        [os.path.dirname(os.path.abspath(os.path.join(cwd or os.getcwd(), script_path)))]
+        + ([env["PYTHONPATH"]] if env.get("PYTHONPATH") else [])
+    )
+    return __run_importtime(
+        script_path, f"import runpy; runpy.run_path({script_path!r}, run_name='__import_check__')", cwd, env)
+
+
+def __check_result(name: str, result: ImportTimeResult) -> ImportTimeResult:
+    unexpected_modules = result.unexpected_model_modules()
+    if len(unexpected_modules) > 0:
+        raise RuntimeError(f"importing {name} also imported model specific modules: {unexpected_modules}")
+    return result
+
+
+def check_lazy_imports(module_name: str = "modules.util.create", cwd: str | None = None) -> ImportTimeResult:
+    """
+    Fails if importing module_name imports any model specific loader, saver, setup, sampler or data loader.
+    """
+    return __check_result(module_name, measure_import_time(module_name, cwd))
+
+
+def benchmark_entry_point_imports(scripts: list[str] | None = None, cwd: str | None = None) -> dict:
+    """
+    Regression guard for the entry points. Fails if starting any of the scripts imports model specific modules before
+    the model type is known, and reports the import time of each script.
+    """
+    if scripts is None:
+        scripts = ENTRY_POINT_SCRIPTS
+
+    results = {}
+    for script_path in scripts:
+        result = __check_result(script_path, measure_script_import_time(script_path, cwd))
+        name = os.path.splitext(os.path.basename(script_path))[0]
+        results[f"{name}_import_time"] = result.total_time
+    return results
@@ -0,0 +1,122 @@
+import gc
+import os
+import tempfile
+import time
+
+from modules.util import state_dict_util
+
+import torch
+
+
+def __create_optimizer(num_parameters: int, width: int, seed: int) -> torch.optim.Optimizer:
+    generator = torch.Generator().manual_seed(seed)
+    parameters = [torch.nn.Parameter(torch.empty(width, width).normal_(generator=generator)) for _ in range(num_parameters)]
+    return torch.optim.AdamW(parameters, lr=1e-3)
+
+
+def __create_state_dict(num_parameters: int, width: int) -> dict:
+    # an optimizer state with the same layout as a trained AdamW state, filled with random values
+    optimizer = __create_optimizer(num_parameters, width, seed=1)
+    generator = torch.Generator().manual_seed(2)
+    for parameter in optimizer.param_groups[0]["params"]:
+        optimizer.state[parameter] = {
+            "step": torch.tensor(100.0),
+            "exp_avg": torch.empty_like(parameter).normal_(generator=generator),
+            "exp_avg_sq": torch.empty_like(parameter).uniform_(generator=generator),
+        }
+    state_dict = optimizer.state_dict()
+    state_dict["param_group_mapping"] = ["group"]
+    state_dict["param_group_optimizer_mapping"] = ["ADAMW"]
+    return state_dict
+
+
+def __read_memory_status(key: str) -> int:
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith(f"{key}:"):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def __directory_bytes(directory: str) -> int:
+    return sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+
+
+def __resume(directory: str, num_parameters: int, width: int) -> tuple[dict, float, float, int]:
+    # parameters are created before the measurement, like the model during a real resume
+    optimizer = __create_optimizer(num_parameters, width, seed=3)
+    gc.collect()
+
+    # resets the peak resident memory of the process (Linux only)
+    with open("/proc/self/clear_refs", "w") as clear_refs:
+        clear_refs.write("5")
+    memory_before = __read_memory_status("VmRSS")
+
+    start_time = time.perf_counter()
+    state_dict = state_dict_util.load_state_dict(directory, "optimizer")
+    load_time = time.perf_counter() - start_time
+
+    state_dict.pop("param_group_mapping")
+    state_dict.pop("param_group_optimizer_mapping")
+    optimizer.load_state_dict(state_dict)
+    del state_dict
+    resume_time = time.perf_counter() - start_time
+
+    peak_memory = __read_memory_status("VmHWM") - memory_before
+    return optimizer.state_dict(), load_time, resume_time, peak_memory
+
+
+def benchmark_internal_state(
+        num_parameters: int = 16,
+        width: int = 2048,
+        max_shard_bytes: int = 128 * 1024 * 1024,
+) -> dict:
+    """
+    Saves an AdamW optimizer state dict once with torch.save and once as memory-mapped safetensors shards, then
+    resumes an optimizer from both files on the CPU. Reports the save time, file size, load time of the state dict,
+    resume time including optimizer.load_state_dict and the peak resident memory during resume. Memory-mapped tensors
+    are only read when they are first used or moved to the train device, so they don't count towards the peak memory
+    until then. The peak memory can only be measured on Linux.
+    """
+    results = {}
+    resumed = {}
+    with tempfile.TemporaryDirectory() as directory:
+        state_dict = __create_state_dict(num_parameters, width)
+        results["state_bytes"] = sum(
+            value.numel() * value.element_size()
+            for state in state_dict["state"].values()
+            for value in state.values()
+        )
+
+        for name in ["torch", "safetensors"]:
+            format_directory = os.path.join(directory, name)
+            os.makedirs(format_directory)
+
+            start_time = time.perf_counter()
+            if name == "torch":
+                torch.save(state_dict, os.path.join(format_directory, "optimizer.pt"))
+            else:
+                state_dict_util.save_state_dict(state_dict, format_directory, "optimizer", max_shard_bytes)
+            results[f"{name}_save_time"] = time.perf_counter() - start_time
+            results[f"{name}_file_bytes"] = __directory_bytes(format_directory)
+
+        del state_dict
+        gc.collect()
+
+        for name in ["torch", "safetensors"]:
+            resumed_state_dict, load_time, resume_time, peak_memory = \
+                __resume(os.path.join(directory, name), num_parameters, width)
+            results[f"{name}_load_time"] = load_time
+            results[f"{name}_resume_time"] = resume_time
+            results[f"{name}_resume_peak_memory"] = peak_memory
+            resumed[name] = resumed_state_dict
+
+        results["max_state_difference"] = max(
+            (a[key] - b[key]).abs().max().item()
+            for a, b in zip(resumed["torch"]["state"].values(), resumed["safetensors"]["state"].values(), strict=True)
+            for key in ["step", "exp_avg", "exp_avg_sq"]
+        )
+        results["param_groups_equal"] = resumed["torch"]["param_groups"] == resumed["safetensors"]["param_groups"]
+        del resumed
+
+    return results
@@ -0,0 +1,136 @@
+import os
+import queue
+import tempfile
+import threading
+import time
+
+from modules.util.LayerOffloadPlanner import (
+    LayerOffloadPlanner,
+    LayerOffloadSimulator,
+    LayerOffloadStrategy,
+    load_offload_strategies,
+    save_offload_plans,
+)
+
+
+def __emulate_forward_backward(
+        strategy: LayerOffloadStrategy,
+        forward_times: list[float],
+        backward_times: list[float],
+        load_bandwidth: float,
+        warmup_steps: int,
+) -> float:
+    # executes the same schedule as LayerOffloadSimulator.simulate_forward_backward() with a real transfer thread.
+    # compute and transfers are emulated with sleeps. returns the measured stall time of the last step
+    num_layers = len(strategy.layer_bytes)
+    layer_ready_events = [threading.Event() for _ in range(num_layers)]
+    for event in layer_ready_events:
+        event.set()
+
+    transfer_queue = queue.Queue()
+
+    def __transfer_loop():
+        while True:
+            job = transfer_queue.get()
+            if job is None:
+                return
+            layer_index, duration = job
+            time.sleep(duration)
+            layer_ready_events[layer_index].set()
+
+    transfer_thread = threading.Thread(target=__transfer_loop, daemon=True)
+    transfer_thread.start()
+
+    loaded_layers = set(strategy.initial_loaded_layers)
+    passes = [
+        ([(i, True) for i in range(num_layers)], False),
+        ([(i, False) for i in reversed(range(num_layers))], True),
+    ]
+
+    stall_time = 0.0
+    for _ in range(warmup_steps + 1):
+        stall_time = 0.0
+        for pass_layers, is_next_forward in passes:
+            for layer_index, is_forward in pass_layers:
+                start_time = time.perf_counter()
+                layer_ready_events[layer_index].wait()
+                stall_time += time.perf_counter() - start_time
+
+                to_offload = strategy.get_layers_to_offload(
+                    layer_index, is_forward, is_next_forward, sorted(loaded_layers))
+                for i in to_offload:
+                    loaded_layers.discard(i)
+                    layer_ready_events[i].clear()
+                    transfer_queue.put((i, strategy.layer_bytes[i] / load_bandwidth))
+
+                to_load = strategy.get_layers_to_load(
+                    layer_index, is_forward, is_next_forward, sorted(loaded_layers))
+                for i in to_load:
+                    loaded_layers.add(i)
+                    layer_ready_events[i].clear()
+                    transfer_queue.put((i, strategy.layer_bytes[i] / load_bandwidth))
+
+                start_time = time.perf_counter()
+                layer_ready_events[layer_index].wait()
+                stall_time += time.perf_counter() - start_time
+
+                time.sleep(forward_times[layer_index] if is_forward else backward_times[layer_index])
+
+    transfer_queue.put(None)
+    transfer_thread.join()
+    return stall_time
+
+
+def benchmark_layer_offload_planner(
+        num_layers: int = 12,
+        layer_bytes: int = 64 * 1024 * 1024,
+        forward_time: float = 0.004,
+        load_bandwidth: float = 12e9,
+        fractions: list[float] | None = None,
+        warmup_steps: int = 1,
+) -> dict:
+    """
+    Checks the offload simulator on the CPU. The schedule of the offload strategy is executed with a real transfer
+    thread, and compute and transfer times are emulated with sleeps. The measured stall time is compared to the
+    stall time predicted by the simulator for each offload fraction. The default link bandwidth is in the range of
+    PCIe 4.0, so high offload fractions stall. Also reports the plan the planner chooses, and checks that it is loaded
+    unchanged from a plan file.
+    """
+    if fractions is None:
+        fractions = [0.0, 0.25, 0.5, 0.75, 0.9]
+
+    # alternating large and small layers, like attention and feed forward blocks with different sizes
+    all_layer_bytes = [layer_bytes if i % 2 == 0 else layer_bytes // 2 for i in range(num_layers)]
+    forward_times = [forward_time if i % 2 == 0 else forward_time / 2 for i in range(num_layers)]
+    backward_times = [3.0 * t for t in forward_times]
+
+    results = {}
+    for fraction in fractions:
+        strategy = LayerOffloadStrategy(all_layer_bytes, fraction)
+        simulator = LayerOffloadSimulator(strategy, forward_times, backward_times, load_bandwidth)
+        simulated = simulator.simulate_forward_backward(warmup_steps)
+        measured_stall_time = __emulate_forward_backward(
+            strategy, forward_times, backward_times, load_bandwidth, warmup_steps)
+
+        name = f"fraction_{fraction:.2f}"
+        results[f"{name}_compute_time"] = simulated.compute_time
+        results[f"{name}_simulated_stall_time"] = simulated.stall_time
+        results[f"{name}_measured_stall_time"] = measured_stall_time
+        results[f"{name}_max_loaded_bytes"] = strategy.max_loaded_bytes
+        results[f"{name}_peak_loaded_bytes"] = simulated.peak_loaded_bytes
+
+    planner = LayerOffloadPlanner(all_layer_bytes, forward_times, load_bandwidth, backward_times=backward_times)
+    plan = planner.plan()
+    results["planned_layer_offload_fraction"] = plan.layer_offload_fraction
+    results["planned_stall_time"] = plan.forward_backward.stall_time
+    results["planned_max_loaded_bytes"] = plan.max_loaded_bytes
+
+    # the plan file that is loaded through the layer_offload_plan setting
+    with tempfile.TemporaryDirectory() as directory:
+        plan_path = os.path.join(directory, "layer_offload_plan.json")
+        save_offload_plans(plan_path, [plan])
+        loaded_strategy = load_offload_strategies(plan_path)[0]
+    results["plan_file_matches"] = loaded_strategy.forward_backward_loaded_layers \
+        == plan.strategy.forward_backward_loaded_layers and loaded_strategy.max_loaded_bytes == plan.max_loaded_bytes
+
+    return results
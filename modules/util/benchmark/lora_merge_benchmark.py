@@ -0,0 +1,80 @@
+import time
+
+from modules.module.LoRAModule import LoRAModuleWrapper
+from modules.util.config.TrainConfig import TrainConfig
+from modules.util.enum.ModelType import PeftType
+
+import torch
+from torch import nn
+
+
+def __create_tiny_model(width: int, depth: int) -> nn.Module:
+    layers = []
+    for _ in range(depth):
+        layers += [nn.Linear(width, width), nn.GELU()]
+    return nn.Sequential(*layers)
+
+
+def benchmark_merged_lora(
+        peft_type: PeftType = PeftType.LORA,
+        decompose: bool = False,
+        width: int = 512,
+        depth: int = 8,
+        batch_size: int = 64,
+        steps: int = 30,
+        rank: int = 16,
+) -> dict:
+    """
+    Compares the hooked forward pass of a tiny LoRA model with the merged forward pass on the CPU, similar to a
+    denoising loop with the given number of steps. Also checks that the model weights and the hooked outputs are
+    bit-exact after the merged weights are removed again.
+    """
+    torch.manual_seed(42)
+
+    config = TrainConfig.default_values()
+    config.peft_type = peft_type
+    config.lora_decompose = decompose
+    config.lora_rank = rank
+    config.lora_alpha = rank
+    config.train_device = "cpu"
+
+    model = __create_tiny_model(width, depth).eval()
+    lora = LoRAModuleWrapper(model, "lora_tiny", config)
+    with torch.no_grad():
+        for parameter in lora.parameters():
+            # adapters are initialized as a no-op, make them change the output
+            parameter.add_(torch.randn_like(parameter) * 0.01)
+    lora.hook_to_module()
+    lora.to(dtype=torch.float32)
+
+    x = torch.randn((batch_size, width))
+    state_before = {key: value.clone() for key, value in model.state_dict().items()}
+
+    with torch.no_grad():
+        hooked_output = model(x)
+        start_time = time.perf_counter()
+        for _ in range(steps):
+            model(x)
+        hooked_time = time.perf_counter() - start_time
+
+        with lora.merged_into_module(torch.device("cpu"), torch.device("cpu")):
+            merged_output = model(x)
+            start_time = time.perf_counter()
+            for _ in range(steps):
+                model(x)
+            merged_time = time.perf_counter() - start_time
+
+        restored_output = model(x)
+
+    state_after = model.state_dict()
+    restored_exactly = state_before.keys() == state_after.keys() \
+        and all(torch.equal(state_before[key], state_after[key]) for key in state_before) \
+        and torch.equal(hooked_output, restored_output)
+
+    return {
+        "hooked_time": hooked_time,
+        "merged_time": merged_time,
+        "speedup": hooked_time / merged_time,
+        "max_difference": (hooked_output - merged_output).abs().max().item(),
+        "restored_exactly": restored_exactly,
+    }
@@ -0,0 +1,125 @@
+import os
+import socket
+import tempfile
+import time
+
+from modules.util.commands.TrainCommands import TrainCommands
+from modules.util.MessageChannel import MessageChannel
+from modules.util.MessageChannelServer import MessageChannelServer
+
+
+def __connect(port_path: str, send_token: bool = True) -> MessageChannel:
+    # a loopback connection takes the place of the SSH channel
+    with open(port_path) as f:
+        port, token = f.read().split()
+    channel = MessageChannel(socket.create_connection(('localhost', int(port))))
+    if send_token:
+        channel.send_token(bytes.fromhex(token))
+    return channel
+
+
+def __is_rejected(port_path: str, token: bytes | None, commands: TrainCommands) -> bool:
+    # connects like another user of the remote machine, who can't read the token, and sends a stop command
+    channel = __connect(port_path, send_token=False)
+    if token is not None:
+        channel.send_token(token)
+    stop_commands = TrainCommands()
+    stop_commands.stop()
+    channel.send(stop_commands)
+    try:
+        # the server closes the connection instead of answering
+        channel.receive(timeout=10.0)
+        is_closed = False
+    except (EOFError, OSError):
+        is_closed = True
+    channel.close()
+    return is_closed and not commands.get_stop_command()
+
+
+def __wait_for(condition, timeout: float = 10.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise TimeoutError("condition not reached")
+        time.sleep(0.001)
+
+
+def benchmark_message_channel(
+        round_trips: int = 200,
+        detached_progress_updates: int = 10000,
+        detached_samples: int = 100,
+        max_queued_callbacks: int = 64,
+) -> dict:
+    """
+    Runs the remote side of the message channel and connects to it through a loopback socket. Measures the latency
+    of callbacks and commands, and how many callbacks are buffered while the client is detached. Also checks that
+    connections without the token from the port file are closed before anything they send is unpickled.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        port_path = os.path.join(directory, "channel.port")
+        commands = TrainCommands()
+        server = MessageChannelServer(port_path, commands, max_queued_callbacks)
+        server.start()
+
+        with open(port_path) as f:
+            port_file_mode = os.stat(f.fileno()).st_mode & 0o777
+        rejected = __is_rejected(port_path, None, commands) \
+            and __is_rejected(port_path, bytes(MessageChannelServer.TOKEN_BYTES), commands)
+
+        # callback latency, with a connected client
+        client = __connect(port_path)
+        __wait_for(server.has_client)
+        start_time = time.perf_counter()
+        for i in range(round_trips):
+            server.send_callback("on_update_status", f"status {i}")
+            if client.receive(timeout=10.0) != ("on_update_status", (f"status {i}",)):
+                raise RuntimeError("unexpected callback")
+        callback_latency = (time.perf_counter() - start_time) / round_trips
+
+        # command latency
+        start_time = time.perf_counter()
+        for _ in range(round_trips):
+            sent_commands = TrainCommands()
+            sent_commands.backup()
+            client.send(sent_commands)
+            __wait_for(commands.get_and_reset_backup_command)
+        command_latency = (time.perf_counter() - start_time) / round_trips
+
+        # detach, keep training, and reattach
+        client.close()
+        __wait_for(lambda: not server.has_client())
+        start_time = time.perf_counter()
+        for i in range(detached_progress_updates):
+            server.send_callback("on_update_train_progress", i)
+            if i % (detached_progress_updates // detached_samples) == 0:
+                server.send_callback("on_sample_default", f"sample {i}")
+        send_time = (time.perf_counter() - start_time) / (detached_progress_updates + detached_samples)
+
+        client = __connect(port_path)
+        received = []
+        while (message := client.receive(timeout=0.5)) is not None:
+            received.append(message)
+
+        stop_commands = TrainCommands()
+        stop_commands.stop()
+        client.send(stop_commands)
+        __wait_for(commands.get_stop_command)
+
+        server.send_callback("on_update_status", "stopped")
+        final_message = client.receive(timeout=10.0)
+        client.close()
+        delivered = server.close()
+
+    progress_updates = [params[0] for name, params in received if name == "on_update_train_progress"]
+    return {
+        "callback_latency": callback_latency,
+        "command_latency": command_latency,
+        "detached_send_time": send_time,
+        "reattached_callbacks": len(received),
+        "reattached_progress_updates": len(progress_updates),
+        "latest_progress_received": progress_updates == [detached_progress_updates - 1],
+        "stop_received": commands.get_stop_command() and final_message == ("on_update_status", ("stopped",)),
+        "delivered": delivered,
+        "unauthenticated_rejected": rejected and not server.has_client(),
+        "port_file_private": port_file_mode == 0o600,
+    }
@@ -0,0 +1,104 @@
+import os
+import tempfile
+import time
+
+from modules.modelLoader.mixin.HFModelLoaderMixin import HFModelLoaderMixin
+from modules.util.enum.DataType import DataType
+
+import torch
+
+from diffusers import AutoencoderKL, FluxTransformer2DModel
+from transformers import CLIPTextConfig, CLIPTextModel, T5Config, T5EncoderModel
+
+from safetensors.torch import save_file
+
+
+def __save_sub_modules(directory: str, width: int):
+    # the sub-modules of a flux model, with the hidden sizes scaled down to width
+    torch.manual_seed(42)
+    CLIPTextModel(CLIPTextConfig(
+        hidden_size=width, intermediate_size=4 * width, num_hidden_layers=4, num_attention_heads=4,
+    )).save_pretrained(os.path.join(directory, "text_encoder"))
+    text_encoder_2 = T5EncoderModel(T5Config(
+        d_model=width, d_ff=4 * width, d_kv=width // 8, num_layers=8, num_heads=8,
+    ))
+    text_encoder_2.save_pretrained(os.path.join(directory, "text_encoder_2"))
+    # save_pretrained() drops the tied embedding, but the released t5 checkpoints contain it
+    save_file(
+        {key: value.clone() for key, value in text_encoder_2.state_dict().items()},
+        os.path.join(directory, "text_encoder_2", "model.safetensors"),
+    )
+    AutoencoderKL(
+        block_out_channels=(width // 8, width // 4), latent_channels=16,
+        down_block_types=("DownEncoderBlock2D",) * 2, up_block_types=("UpDecoderBlock2D",) * 2,
+    ).save_pretrained(os.path.join(directory, "vae"))
+    FluxTransformer2DModel(
+        num_layers=4, num_single_layers=8, attention_head_dim=width // 8, num_attention_heads=8,
+        joint_attention_dim=width, pooled_projection_dim=width,
+        axes_dims_rope=(width // 32, width // 64 * 3, width // 64 * 3),
+    ).save_pretrained(os.path.join(directory, "transformer"))
+
+
+def __load_sub_modules(loader: HFModelLoaderMixin, directory: str, dtype: DataType) -> list[torch.nn.Module]:
+    # submits the sub-modules like FluxModelLoader
+    with loader._sub_module_load_pool() as pool:
+        futures = [
+            pool.submit(loader._load_transformers_sub_module, CLIPTextModel, dtype, DataType.FLOAT_32,
+                        directory, "text_encoder"),
+            pool.submit(loader._load_transformers_sub_module, T5EncoderModel, dtype, DataType.FLOAT_32,
+                        directory, "text_encoder_2"),
+            pool.submit(loader._load_diffusers_sub_module, AutoencoderKL, dtype, DataType.FLOAT_32,
+                        directory, "vae"),
+            pool.submit(loader._load_diffusers_sub_module, FluxTransformer2DModel, dtype, DataType.FLOAT_32,
+                        directory, "transformer"),
+        ]
+        return [future.result() for future in futures]
+
+
+def __state_dicts_equal(a: torch.nn.Module, b: torch.nn.Module) -> bool:
+    a_state_dict = a.state_dict()
+    b_state_dict = b.state_dict()
+    return a_state_dict.keys() == b_state_dict.keys() and all(
+        a_state_dict[key].device == b_state_dict[key].device and torch.equal(a_state_dict[key], b_state_dict[key])
+        for key in a_state_dict
+    )
+
+
+def benchmark_model_loading(
+        width: int = 512,
+        max_workers: list[int] | None = None,
+        host_memory_budget_bytes: int | None = None,
+        dtype: DataType = DataType.BFLOAT_16,
+) -> dict:
+    """
+    Saves scaled down flux sub-modules (both text encoders, vae and transformer) to a temporary directory, then loads
+    them through HFModelLoaderMixin with each number of workers, like FluxModelLoader does. Reports the load time and
+    checks that every parallel load produces the same weights as the sequential load, with no weights left on the meta
+    device.
+    """
+    if max_workers is None:
+        max_workers = [1, 2, 4]
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        __save_sub_modules(directory, width)
+        results["checkpoint_bytes"] = sum(
+            os.path.getsize(os.path.join(root, file_name))
+            for root, _, file_names in os.walk(directory)
+            for file_name in file_names
+        )
+
+        reference = __load_sub_modules(HFModelLoaderMixin(), directory, dtype)
+
+        for workers in max_workers:
+            loader = HFModelLoaderMixin(workers, host_memory_budget_bytes)
+            start_time = time.perf_counter()
+            sub_modules = __load_sub_modules(loader, directory, dtype)
+            results[f"workers_{workers}_load_time"] = time.perf_counter() - start_time
+            results[f"workers_{workers}_equal"] = all(
+                __state_dicts_equal(a, b) and all(p.device.type != "meta" for p in a.parameters())
+                for a, b in zip(sub_modules, reference, strict=True)
+            )
+            del sub_modules
+
+    return results
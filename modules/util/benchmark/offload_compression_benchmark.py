@@ -0,0 +1,87 @@
+import time
+
+from modules.util.CompressedLayerCache import CompressedLayerCache
+from modules.util.enum.OffloadCompression import OffloadCompression
+
+import torch
+
+# the linear layers of one block of a 3B parameter transformer
+TRANSFORMER_LAYER_SHAPES = [(3072, 3072)] * 4 + [(12288, 3072), (3072, 12288)]
+
+
+def __load(cache: CompressedLayerCache | None, weights: list[torch.Tensor], targets: list[torch.Tensor]):
+    if cache is None:
+        for target, weight in zip(targets, weights, strict=True):
+            target.copy_(weight)
+    else:
+        cache.load_(0, targets)
+
+
+def benchmark_offload_compression(
+        shapes: list[tuple[int, int]] | None = None,
+        dtype: torch.dtype = torch.bfloat16,
+        device: torch.device | None = None,
+        repeats: int = 5,
+) -> dict:
+    """
+    Compares the compressed offloading formats with uncompressed offloading on the weights of a transformer block.
+    Reports the stored bytes, the time to load a layer into the train device (transfer and dequantization), the
+    relative error of the weights and of the outputs of the linear layers, and checks that compressing a layer leaves
+    its weights unchanged. On a CPU only machine, the load time only measures the dequantization.
+    """
+    if shapes is None:
+        shapes = TRANSFORMER_LAYER_SHAPES
+    if device is None:
+        device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+    generator = torch.Generator().manual_seed(42)
+    # weights with a few outliers, like the weights of trained models
+    weights = []
+    for shape in shapes:
+        weight = torch.empty(shape).normal_(generator=generator) * 0.02
+        weight.view(-1)[::997] *= 20
+        weights.append(weight.to(dtype=dtype))
+    inputs = [torch.empty((16, shape[1])).normal_(generator=generator).to(dtype=dtype) for shape in shapes]
+    original_weights = [weight.clone() for weight in weights]
+
+    results = {}
+    for compression in [OffloadCompression.NONE, OffloadCompression.INT8, OffloadCompression.FLOAT8]:
+        name = str(compression).lower()
+        targets = [torch.empty(weight.shape, dtype=dtype, device=device) for weight in weights]
+
+        if compression == OffloadCompression.NONE:
+            cache = None
+            stored_bytes = sum(weight.numel() * weight.element_size() for weight in weights)
+        else:
+            cache = CompressedLayerCache(compression, pin_memory=False)
+            cache.write_layer(0, weights, device)
+            stored_bytes = cache.compressed_bytes
+
+        __load(cache, weights, targets)
+        if device.type == "cuda":
+            torch.cuda.synchronize(device)
+        start_time = time.perf_counter()
+        for _ in range(repeats):
+            __load(cache, weights, targets)
+        if device.type == "cuda":
+            torch.cuda.synchronize(device)
+        load_time = (time.perf_counter() - start_time) / repeats
+
+        weight_errors = []
+        output_errors = []
+        for target, weight, x in zip(targets, original_weights, inputs, strict=True):
+            target = target.to(device="cpu", dtype=torch.float32)
+            weight = weight.float()
+            weight_errors.append(((target - weight).norm() / weight.norm()).item())
+            expected = x.float() @ weight.t()
+            output_errors.append(((x.float() @ target.t() - expected).norm() / expected.norm()).item())
+
+        results[f"{name}_stored_bytes"] = stored_bytes
+        results[f"{name}_load_time"] = load_time
+        results[f"{name}_load_throughput"] = sum(t.numel() * t.element_size() for t in targets) / load_time
+        results[f"{name}_weight_relative_error"] = max(weight_errors)
+        results[f"{name}_output_relative_error"] = max(output_errors)
+        results[f"{name}_input_unchanged"] = all(
+            torch.equal(weight, original) for weight, original in zip(weights, original_weights, strict=True))
+
+    return results
@@ -0,0 +1,117 @@
+import time
+from collections.abc import Callable
+
+from modules.util import bf16_stochastic_rounding
+from modules.util.optimizer.adafactor_extensions import patch_adafactor
+from modules.util.optimizer.adam_extensions import patch_adam
+from modules.util.optimizer.adamw_extensions import patch_adamw
+
+import torch
+
+from transformers import Adafactor
+
+# parameter shapes similar to a rank 16 LoRA on 300 linear layers, and to the linear layers of a small transformer
+LORA_PARAMETER_SHAPES = [(16, 3072), (3072, 16)] * 300
+FINE_TUNE_PARAMETER_SHAPES = [(3072, 3072), (3072,), (12288, 3072), (3072, 12288), (3072,)] * 4
+
+
+def create_adam(parameters: list[torch.nn.Parameter], foreach: bool) -> torch.optim.Optimizer:
+    optimizer = torch.optim.Adam(parameters, lr=1e-4)
+    patch_adam(optimizer, stochastic_rounding=True, foreach=foreach)
+    return optimizer
+
+
+def create_adamw(parameters: list[torch.nn.Parameter], foreach: bool) -> torch.optim.Optimizer:
+    optimizer = torch.optim.AdamW(parameters, lr=1e-4)
+    patch_adamw(optimizer, stochastic_rounding=True, foreach=foreach)
+    return optimizer
+
+
+def create_adafactor(parameters: list[torch.nn.Parameter], foreach: bool) -> torch.optim.Optimizer:
+    optimizer = Adafactor(parameters, lr=1e-4, scale_parameter=False, relative_step=False)
+    patch_adafactor(optimizer, stochastic_rounding=True, foreach=foreach)
+    return optimizer
+
+
+OPTIMIZER_FACTORIES = {
+    "adam": create_adam,
+    "adamw": create_adamw,
+    "adafactor": create_adafactor,
+}
+
+
+def __create_parameters(
+        shapes: list[tuple[int, ...]],
+        dtype: torch.dtype,
+        device: torch.device,
+        seed: int,
+) -> list[torch.nn.Parameter]:
+    generator = torch.Generator(device="cpu").manual_seed(seed)
+    parameters = []
+    for shape in shapes:
+        parameter = torch.nn.Parameter(torch.randn(shape, generator=generator).to(dtype=dtype, device=device))
+        parameter.grad = torch.randn(shape, generator=generator).to(dtype=dtype, device=device)
+        parameters.append(parameter)
+    return parameters
+
+
+def __run_steps(
+        factory: Callable[[list[torch.nn.Parameter], bool], torch.optim.Optimizer],
+        shapes: list[tuple[int, ...]],
+        foreach: bool,
+        steps: int,
+        dtype: torch.dtype,
+        device: torch.device,
+) -> tuple[list[torch.nn.Parameter], float]:
+    parameters = __create_parameters(shapes, dtype, device, seed=42)
+    optimizer = factory(parameters, foreach)
+
+    # warmup step, initializes the optimizer state
+    bf16_stochastic_rounding.set_seed(0, device)
+    optimizer.step()
+
+    if device.type == "cuda":
+        torch.cuda.synchronize(device)
+    start_time = time.perf_counter()
+    for step in range(steps):
+        bf16_stochastic_rounding.set_seed(step + 1, device)
+        optimizer.step()
+    if device.type == "cuda":
+        torch.cuda.synchronize(device)
+
+    return parameters, (time.perf_counter() - start_time) / steps
+
+
+def benchmark_optimizer_step(
+        optimizer_name: str,
+        shapes: list[tuple[int, ...]],
+        steps: int = 10,
+        dtype: torch.dtype = torch.bfloat16,
+        device: torch.device | None = None,
+) -> dict:
+    """
+    Compares the per-parameter step with the multi-tensor (foreach) step of a stochastic rounding optimizer.
+    Both variants start from the same parameters and use the same stochastic rounding seeds, so the resulting
+    parameters should match.
+    """
+    if device is None:
+        device = torch.device("cpu")
+    factory = OPTIMIZER_FACTORIES[optimizer_name]
+
+    single_parameters, single_step_time = __run_steps(factory, shapes, False, steps, dtype, device)
+    foreach_parameters, foreach_step_time = __run_steps(factory, shapes, True, steps, dtype, device)
+
+    max_difference = max(
+        (a.detach().float() - b.detach().float()).abs().max().item()
+        for a, b in zip(single_parameters, foreach_parameters, strict=True)
+    )
+
+    return {
+        "optimizer": optimizer_name,
+        "num_parameters": len(shapes),
+        "num_elements": sum(p.numel() for p in single_parameters),
+        "single_step_time": single_step_time,
+        "foreach_step_time": foreach_step_time,
+        "speedup": single_step_time / foreach_step_time if foreach_step_time > 0 else 0.0,
+        "max_difference": max_difference,
+    }
@@ -0,0 +1,157 @@
+import itertools
+import time
+
+from modules.util.optimizer.adamw_extensions import patch_adamw
+from modules.util.optimizer.CAME import CAME
+from modules.util.OptimizerStateOffloader import OptimizerStateOffloader
+
+import torch
+
+
+def __create_model(width: int, depth: int, device: torch.device) -> torch.nn.Module:
+    generator = torch.Generator().manual_seed(42)
+    layers = []
+    for _ in range(depth):
+        layer = torch.nn.Linear(width, width)
+        with torch.no_grad():
+            layer.weight.copy_(torch.randn(layer.weight.shape, generator=generator) / width ** 0.5)
+            layer.bias.zero_()
+        layers += [layer, torch.nn.GELU()]
+    return torch.nn.Sequential(*layers).to(device)
+
+
+def __state_bytes(optimizer: torch.optim.Optimizer, device: torch.device) -> int:
+    return sum(
+        value.numel() * value.element_size()
+        for state in optimizer.state.values()
+        for value in state.values()
+        if isinstance(value, torch.Tensor) and value.dim() > 0 and value.device == device
+    )
+
+
+def __run(
+        optimizer_name: str,
+        offload: bool,
+        fused_back_pass: bool,
+        train_device: torch.device,
+        steps: int,
+        width: int,
+        depth: int,
+) -> dict:
+    model = __create_model(width, depth, train_device)
+    # one param group per layer, like the param groups of separately trained model parts
+    param_groups = [{"params": list(layer.parameters())} for layer in model if isinstance(layer, torch.nn.Linear)]
+    if optimizer_name == "came":
+        # CAME calls step_parameter() from its own step()
+        optimizer = CAME(param_groups, lr=1e-3)
+    else:
+        optimizer = torch.optim.AdamW(param_groups, lr=1e-3)
+        patch_adamw(optimizer, stochastic_rounding=False)
+
+    offloader = None
+    if offload:
+        offloader = OptimizerStateOffloader(optimizer, train_device, torch.device("cpu"))
+
+    if fused_back_pass:
+        for group in optimizer.param_groups:
+            for i, parameter in enumerate(group["params"]):
+                def __grad_hook(tensor: torch.Tensor, group=group, i=i):
+                    optimizer.step_parameter(tensor, group, i)
+                    tensor.grad = None
+
+                parameter.register_post_accumulate_grad_hook(__grad_hook)
+
+    generator = torch.Generator().manual_seed(0)
+    inputs = [torch.randn(16, width, generator=generator).to(train_device) for _ in range(steps + 1)]
+
+    def __train_step(x: torch.Tensor):
+        model(x).pow(2).mean().backward()
+        if not fused_back_pass:
+            optimizer.step()
+            optimizer.zero_grad(set_to_none=True)
+
+    # the first step creates the optimizer state
+    __train_step(inputs[0])
+
+    if train_device.type == "cuda":
+        torch.cuda.synchronize(train_device)
+        torch.cuda.reset_peak_memory_stats(train_device)
+    memory_before = torch.cuda.memory_allocated(train_device) if train_device.type == "cuda" else 0
+    if offloader is not None:
+        offloader.max_device_state_bytes = offloader.device_state_bytes
+        offloader.transferred_bytes = 0
+
+    start_time = time.perf_counter()
+    for x in inputs[1:]:
+        __train_step(x)
+    if train_device.type == "cuda":
+        torch.cuda.synchronize(train_device)
+    step_time = (time.perf_counter() - start_time) / steps
+
+    if offloader is not None:
+        # on CUDA, the peak memory also includes the parameters, gradients and activations
+        peak_state_bytes = offloader.max_device_state_bytes
+        transferred_bytes = offloader.transferred_bytes / steps
+    else:
+        peak_state_bytes = __state_bytes(optimizer, train_device)
+        transferred_bytes = 0
+
+    result = {
+        "step_time": step_time,
+        "peak_device_state_bytes": peak_state_bytes,
+        "transferred_bytes_per_step": transferred_bytes,
+        "state_dict": optimizer.state_dict(),
+        "parameters": [p.detach().cpu() for p in model.parameters()],
+    }
+    if train_device.type == "cuda":
+        result["peak_device_memory"] = torch.cuda.max_memory_allocated(train_device) - memory_before
+    return result
+
+
+def benchmark_optimizer_offload(
+        train_device: torch.device | None = None,
+        steps: int = 10,
+        width: int = 1024,
+        depth: int = 8,
+) -> dict:
+    """
+    Trains a small MLP with AdamW and CAME, with and without offloaded optimizer state, and with and without the fused
+    back pass. On CUDA, the peak memory allocated during training is reported as well. On the CPU, the train device is
+    simulated: state tensors are still copied between the temp device and the train device, and the peak state bytes
+    are counted by the offloader. Offloading should not change the trained parameters. Without the fused back pass,
+    each state tensor should be transferred once in each direction per step, which is twice the state size.
+    """
+    if train_device is None:
+        train_device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+    results = {}
+    for optimizer_name, fused_back_pass in itertools.product(["adamw", "came"], [False, True]):
+        name = "fused_back_pass" if fused_back_pass else "step"
+        if optimizer_name != "adamw":
+            name = f"{optimizer_name}_{name}"
+        resident = __run(optimizer_name, False, fused_back_pass, train_device, steps, width, depth)
+        offloaded = __run(optimizer_name, True, fused_back_pass, train_device, steps, width, depth)
+
+        for key in ["step_time", "peak_device_state_bytes", "transferred_bytes_per_step", "peak_device_memory"]:
+            if key in resident:
+                results[f"{name}_resident_{key}"] = resident[key]
+                results[f"{name}_offloaded_{key}"] = offloaded[key]
+        results[f"{name}_max_parameter_difference"] = max(
+            (a - b).abs().max().item()
+            for a, b in zip(resident["parameters"], offloaded["parameters"], strict=True)
+        )
+        results[f"{name}_max_state_difference"] = max(
+            (a[key].cpu() - b[key].cpu()).abs().max().item()
+            for a, b in zip(resident["state_dict"]["state"].values(), offloaded["state_dict"]["state"].values(),
+                            strict=True)
+            for key in a
+            if isinstance(a[key], torch.Tensor) and a[key].dim() > 0
+        )
+        results[f"{name}_state_bytes"] = sum(
+            value.numel() * value.element_size()
+            for state in resident["state_dict"]["state"].values()
+            for value in state.values()
+            if isinstance(value, torch.Tensor) and value.dim() > 0
+        )
+
+    return results
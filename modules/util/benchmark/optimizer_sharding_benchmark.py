@@ -0,0 +1,122 @@
+import os
+import tempfile
+import time
+
+import modules.util.multi_gpu_util as multi
+from modules.util.enum.GradientReducePrecision import GradientReducePrecision
+
+import torch
+
+
+def __create_model(seed: int, width: int, depth: int) -> torch.nn.Module:
+    generator = torch.Generator().manual_seed(seed)
+    layers = []
+    for _ in range(depth):
+        layer = torch.nn.Linear(width, width)
+        with torch.no_grad():
+            layer.weight.copy_(torch.randn(layer.weight.shape, generator=generator) / width ** 0.5)
+            layer.bias.zero_()
+        layers += [layer, torch.nn.GELU()]
+    return torch.nn.Sequential(*layers)
+
+
+def __state_bytes(optimizer: torch.optim.Optimizer) -> int:
+    return sum(
+        value.numel() * value.element_size()
+        for state in optimizer.state.values()
+        for value in state.values()
+        if isinstance(value, torch.Tensor)
+    )
+
+
+def train_process(rank: int, world_size: int, directory: str, sharded: bool, steps: int, width: int, depth: int):
+    # must be public and on module level, otherwise the pickling done by torch.multiprocessing fails
+    torch.distributed.init_process_group(
+        backend='gloo', init_method=f"file://{os.path.join(directory, 'init')}", rank=rank, world_size=world_size
+    )
+    try:
+        device = torch.device("cpu")
+        model = __create_model(42, width, depth)
+        parameters = list(model.parameters())
+        optimizer = torch.optim.AdamW(parameters, lr=1e-3)
+        if sharded:
+            multi.shard_optimizer_state(optimizer)
+
+        # every rank trains on different data
+        generator = torch.Generator().manual_seed(rank)
+        inputs = [torch.randn(16, width, generator=generator) for _ in range(steps)]
+
+        start_time = time.perf_counter()
+        for x in inputs:
+            model(x).pow(2).mean().backward()
+            multi.reduce_grads_mean(parameters, GradientReducePrecision.FLOAT_32)
+            multi.clip_grad_norm_(parameters, 1.0, device)
+            optimizer.step()
+            multi.broadcast_sharded_parameters(device)
+            optimizer.zero_grad(set_to_none=True)
+        step_time = (time.perf_counter() - start_time) / steps
+
+        state_bytes = __state_bytes(optimizer)
+        with multi.gathered_optimizer_state(optimizer):
+            state_dict = optimizer.state_dict() if multi.is_master() else None
+
+        torch.save({
+            "step_time": step_time,
+            "state_bytes": state_bytes,
+            "parameters": [p.detach() for p in parameters],
+            "state_dict": state_dict,
+        }, os.path.join(directory, f"rank_{rank}.pt"))
+    finally:
+        multi.state_owners.clear()
+        torch.distributed.destroy_process_group()
+
+
+def __run(world_size: int, sharded: bool, steps: int, width: int, depth: int) -> list[dict]:
+    with tempfile.TemporaryDirectory() as directory:
+        torch.multiprocessing.spawn(
+            train_process,
+            args=(world_size, directory, sharded, steps, width, depth),
+            nprocs=world_size,
+        )
+        return [torch.load(os.path.join(directory, f"rank_{rank}.pt")) for rank in range(world_size)]
+
+
+def benchmark_optimizer_sharding(
+        world_size: int = 3,
+        steps: int = 10,
+        width: int = 512,
+        depth: int = 6,
+) -> dict:
+    """
+    Trains a small MLP with AdamW in several gloo processes on the CPU, with replicated and with sharded optimizer
+    state. Both should produce the same parameters. The complete state gathered from the sharded run is loaded into a
+    single process optimizer to check that checkpoints can be restored with a different world size.
+    """
+    replicated = __run(world_size, False, steps, width, depth)
+    sharded = __run(world_size, True, steps, width, depth)
+
+    # restore the sharded checkpoint without multi-GPU
+    model = __create_model(42, width, depth)
+    optimizer = torch.optim.AdamW(model.parameters(), lr=1e-3)
+    optimizer.load_state_dict(sharded[0]["state_dict"])
+    replicated_state = replicated[0]["state_dict"]["state"]
+    restored_state_difference = max(
+        (optimizer.state_dict()["state"][i][key] - replicated_state[i][key]).abs().max().item()
+        for i in replicated_state
+        for key in ["exp_avg", "exp_avg_sq"]
+    )
+
+    return {
+        "world_size": world_size,
+        "replicated_state_bytes_per_rank": [r["state_bytes"] for r in replicated],
+        "sharded_state_bytes_per_rank": [r["state_bytes"] for r in sharded],
+        "replicated_step_time": max(r["step_time"] for r in replicated),
+        "sharded_step_time": max(r["step_time"] for r in sharded),
+        "max_parameter_difference": max(
+            (a - b).abs().max().item()
+            for r in sharded
+            for a, b in zip(replicated[0]["parameters"], r["parameters"], strict=True)
+        ),
+        "restored_state_count": len(optimizer.state),
+        "restored_state_difference": restored_state_difference,
+    }
@@ -0,0 +1,98 @@
+import time
+
+from modules.util.PromptEmbeddingCache import PromptEmbeddingCache
+from modules.util.torch_util import torch_gc
+
+import torch
+from torch import nn
+
+from transformers import CLIPTextConfig, CLIPTextModel, T5Config, T5EncoderModel
+
+
+def __text_encoders_to(text_encoders: list[nn.Module], device: torch.device):
+    for text_encoder in text_encoders:
+        text_encoder.to(device=device)
+
+
+def __encode(text_encoders: list[nn.Module], tokens: list[torch.Tensor], device: torch.device):
+    with torch.no_grad():
+        return tuple(
+            text_encoder(t.to(device), output_hidden_states=True).hidden_states[-2]
+            for text_encoder, t in zip(text_encoders, tokens, strict=True)
+        )
+
+
+def __encode_prompt(
+        cache: PromptEmbeddingCache | None,
+        prompt_index: int,
+        text_encoders: list[nn.Module],
+        tokens: list[torch.Tensor],
+        train_device: torch.device,
+        temp_device: torch.device,
+):
+    # the same steps as BaseModelSampler._encode_prompt_cached()
+    if cache is not None:
+        output = cache.get(prompt_index, train_device)
+        if output is not None:
+            return output
+
+    __text_encoders_to(text_encoders, train_device)
+    output = __encode(text_encoders, tokens, train_device)
+    __text_encoders_to(text_encoders, temp_device)
+    torch_gc()
+
+    if cache is not None:
+        cache.put(prompt_index, output)
+    return output
+
+
+def benchmark_prompt_embedding_cache(
+        num_prompts: int = 2,
+        rounds: int = 3,
+        t5_layers: int = 1,
+        t5_sequence_length: int = 256,
+        train_device: torch.device | None = None,
+) -> dict:
+    """
+    Measures the time the prompt encoding adds to the pause of sampling during training, with and without the prompt
+    embedding cache. Uses the text encoders of flux with random weights: CLIP-L and a T5-XXL that is cut down to
+    t5_layers of its 24 layers. Each round samples every prompt once. Without the cache, every sample moves the text
+    encoders to the train device, encodes the prompt and moves them back. With the cache, only the first round does.
+    On a CPU only machine the text encoders are not moved, so the times only include the encoding.
+    """
+    if train_device is None:
+        train_device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    temp_device = torch.device("cpu")
+
+    torch.manual_seed(42)
+    text_encoders = [
+        CLIPTextModel(CLIPTextConfig(
+            hidden_size=768, intermediate_size=3072, num_hidden_layers=12, num_attention_heads=12,
+        )).eval(),
+        T5EncoderModel(T5Config(
+            vocab_size=32128, d_model=4096, d_ff=10240, d_kv=64, num_heads=64, num_layers=t5_layers,
+            feed_forward_proj="gated-gelu",
+        )).eval(),
+    ]
+    prompt_tokens = [
+        [torch.randint(0, 49408, (1, 77)), torch.randint(0, 32128, (1, t5_sequence_length))]
+        for _ in range(num_prompts)
+    ]
+
+    results = {}
+    for name, cache in [("uncached", None), ("cached", PromptEmbeddingCache())]:
+        round_times = []
+        for _ in range(rounds):
+            start_time = time.perf_counter()
+            for prompt_index, tokens in enumerate(prompt_tokens):
+                __encode_prompt(cache, prompt_index, text_encoders, tokens, train_device, temp_device)
+            if train_device.type == "cuda":
+                torch.cuda.synchronize(train_device)
+            round_times.append(time.perf_counter() - start_time)
+
+        results[f"{name}_first_round_time"] = round_times[0]
+        results[f"{name}_round_time"] = sum(round_times[1:]) / max(len(round_times) - 1, 1)
+
+    results["cache_hits"] = cache.hits
+    results["cache_misses"] = cache.misses
+    return results
@@ -0,0 +1,90 @@
+import time
+
+from modules.util.SharedTensorSnapshot import SharedTensorSnapshot
+
+import torch
+
+# parameter shapes of a tiny LoRA: (rank x in) down and (out x rank) up weights for a few linear layers
+TINY_LORA_PARAMETER_SHAPES = [(4, 64), (64, 4)] * 8 + [(768,)]
+
+
+def _receive_snapshot(snapshot: SharedTensorSnapshot, job_queue, result_queue, snapshot_consumed):
+    tensors = [torch.zeros_like(buffer) for buffer in snapshot.tensors]
+    while True:
+        job = job_queue.get()
+        if job is None:
+            break
+
+        snapshot.copy_to(tensors)
+        version = snapshot.version
+        snapshot_consumed.set()
+
+        result_queue.put((version, [tensor.clone() for tensor in tensors]))
+
+
+def benchmark_snapshot_transfer(
+        shapes: list[tuple[int, ...]] | None = None,
+        rounds: int = 5,
+        dtype: torch.dtype = torch.float32,
+) -> dict:
+    """
+    Sends snapshots of a tiny set of parameters to a spawned process through SharedTensorSnapshot, the same way the
+    sampling worker receives them, and checks that the received tensors match. Runs on the CPU.
+    """
+    if shapes is None:
+        shapes = TINY_LORA_PARAMETER_SHAPES
+
+    generator = torch.Generator().manual_seed(42)
+    parameters = [torch.nn.Parameter(torch.randn(shape, generator=generator, dtype=dtype)) for shape in shapes]
+
+    snapshot = SharedTensorSnapshot(parameters)
+
+    context = torch.multiprocessing.get_context("spawn")
+    job_queue = context.Queue()
+    result_queue = context.Queue()
+    snapshot_consumed = context.Event()
+    snapshot_consumed.set()
+
+    process = context.Process(
+        target=_receive_snapshot,
+        args=(snapshot, job_queue, result_queue, snapshot_consumed),
+        daemon=True,
+    )
+    process.start()
+
+    capture_times = []
+    round_trip_times = []
+    max_difference = 0.0
+    try:
+        for _ in range(rounds):
+            # simulate a training step
+            with torch.no_grad():
+                for parameter in parameters:
+                    parameter.add_(torch.randn(parameter.shape, generator=generator, dtype=dtype), alpha=0.01)
+
+            start_time = time.perf_counter()
+            snapshot_consumed.wait()
+            snapshot_consumed.clear()
+            snapshot.capture(parameters)
+            capture_times.append(time.perf_counter() - start_time)
+
+            job_queue.put(True)
+            version, received = result_queue.get(timeout=60)
+            round_trip_times.append(time.perf_counter() - start_time)
+
+            if version != snapshot.version:
+                raise RuntimeError(f"received snapshot version {version}, expected {snapshot.version}")
+            for parameter, tensor in zip(parameters, received, strict=True):
+                max_difference = max(max_difference, (parameter.detach() - tensor).abs().max().item())
+    finally:
+        job_queue.put(None)
+        process.join(timeout=30)
+        if process.is_alive():
+            process.terminate()
+
+    return {
+        "snapshot_bytes": snapshot.nbytes(),
+        "capture_time": sum(capture_times) / len(capture_times),
+        "round_trip_time": sum(round_trip_times) / len(round_trip_times),
+        "max_difference": max_difference,
+    }
@@ -0,0 +1,115 @@
+import time
+
+from modules.util import bf16_stochastic_rounding
+
+import torch
+
+# the linear layers of one block of a 3B parameter transformer, and a rank 16 LoRA on 300 linear layers
+TRANSFORMER_PARAMETER_SHAPES = [(12288, 3072), (3072, 12288), (3072, 3072), (3072,)]
+LORA_PARAMETER_SHAPES = [(16, 3072), (3072, 16)] * 300
+
+
+def __full_copy_stochastic_(target: torch.Tensor, source: torch.Tensor):
+    # how stochastic rounding worked before chunking: a full size random tensor for every call
+    result = torch.randint(
+        size=source.shape,
+        device=source.device,
+        dtype=torch.int32,
+        low=0,
+        high=(1 << 16),
+        generator=bf16_stochastic_rounding.generator,
+    )
+    result.add_(source.view(dtype=torch.int32))
+    result.bitwise_and_(-65536)
+    target.copy_(result.view(dtype=torch.float32))
+
+
+def __full_addcdiv_stochastic_(input: torch.Tensor, tensor1: torch.Tensor, tensor2: torch.Tensor, value: float):
+    # and a full size fp32 copy of the input before that
+    result = input.to(dtype=torch.float32)
+    result.addcdiv_(tensor1, tensor2, value=value)
+    __full_copy_stochastic_(input, result)
+
+
+def __create_tensors(shapes: list[tuple[int, ...]], seed: int) -> tuple[list[torch.Tensor], ...]:
+    # filled in place, so creating the tensors does not raise the peak memory above the memory of the tensors
+    generator = torch.Generator().manual_seed(seed)
+    sources = [torch.empty(shape).normal_(generator=generator) for shape in shapes]
+    targets = [source.to(dtype=torch.bfloat16) for source in sources]
+    denominators = [torch.empty(shape).uniform_(1.0, 2.0, generator=generator) for shape in shapes]
+    return targets, sources, denominators
+
+
+def __read_memory_status(key: str) -> int:
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith(f"{key}:"):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def __run(
+        operation: str,
+        implementation: str,
+        shapes: list[tuple[int, ...]],
+        steps: int,
+) -> tuple[list[torch.Tensor], float, int]:
+    targets, sources, denominators = __create_tensors(shapes, seed=42)
+
+    # resets the peak resident memory of the process (Linux only)
+    with open("/proc/self/clear_refs", "w") as clear_refs:
+        clear_refs.write("5")
+    memory_before = __read_memory_status("VmRSS")
+
+    start_time = time.perf_counter()
+    for step in range(steps):
+        bf16_stochastic_rounding.set_seed(step, torch.device("cpu"))
+        if operation == "copy" and implementation == "full":
+            for target, source in zip(targets, sources, strict=True):
+                __full_copy_stochastic_(target, source)
+        elif operation == "copy" and implementation == "chunked":
+            bf16_stochastic_rounding.copy_stochastic_list_(targets, sources)
+        elif operation == "addcdiv" and implementation == "full":
+            for target, source, denominator in zip(targets, sources, denominators, strict=True):
+                __full_addcdiv_stochastic_(target, source, denominator, -1e-3)
+        elif operation == "addcdiv" and implementation == "chunked":
+            bf16_stochastic_rounding.addcdiv_stochastic_list_(targets, sources, denominators, -1e-3)
+
+    step_time = (time.perf_counter() - start_time) / steps
+
+    return targets, step_time, __read_memory_status("VmHWM") - memory_before
+
+
+def benchmark_stochastic_rounding(
+        shapes: list[tuple[int, ...]] | None = None,
+        steps: int = 5,
+        chunk_numel: int = 1 << 20,
+) -> dict:
+    """
+    Compares stochastic rounding through full size temporary tensors with the chunked implementation on the CPU, for
+    copy_stochastic_ and addcdiv_stochastic_ over a list of parameters. Both use the same seeds, on the CPU the
+    results should be identical. The peak memory is the resident memory used in addition to the tensors, it can only
+    be measured on Linux.
+    """
+    if shapes is None:
+        shapes = TRANSFORMER_PARAMETER_SHAPES
+    bf16_stochastic_rounding.chunk_numel = chunk_numel
+
+    results = {
+        "num_elements": sum(torch.Size(shape).numel() for shape in shapes),
+        "largest_tensor_bytes": max(torch.Size(shape).numel() for shape in shapes) * 2,
+    }
+
+    for operation in ["copy", "addcdiv"]:
+        full_targets, full_step_time, full_peak_memory = __run(operation, "full", shapes, steps)
+        chunked_targets, chunked_step_time, chunked_peak_memory = __run(operation, "chunked", shapes, steps)
+
+        results[f"{operation}_max_difference"] = max(
+            (a.float() - b.float()).abs().max().item() for a, b in zip(full_targets, chunked_targets, strict=True)
+        )
+        results[f"{operation}_full_elements_per_second"] = results["num_elements"] / full_step_time
+        results[f"{operation}_chunked_elements_per_second"] = results["num_elements"] / chunked_step_time
+        results[f"{operation}_full_peak_memory"] = full_peak_memory
+        results[f"{operation}_chunked_peak_memory"] = chunked_peak_memory
+
+    return results
@@ -0,0 +1,426 @@
+import copy
+import io
+import json
+import os
+import statistics
+import string
+import tempfile
+import time
+from collections.abc import Callable
+
+from modules.util import create
+from modules.util.config.ConceptConfig import ConceptConfig
+from modules.util.config.SampleConfig import SampleConfig
+from modules.util.config.TrainConfig import TrainConfig
+from modules.util.enum.DataType import DataType
+from modules.util.enum.GradientCheckpointingMethod import GradientCheckpointingMethod
+from modules.util.enum.ModelFormat import ModelFormat
+from modules.util.enum.ModelType import ModelType
+from modules.util.enum.TrainingMethod import TrainingMethod
+
+import torch
+
+from diffusers import (
+    AutoencoderKL,
+    ChromaTransformer2DModel,
+    DDIMScheduler,
+    FlowMatchEulerDiscreteScheduler,
+    FluxTransformer2DModel,
+    PixArtTransformer2DModel,
+    SD3Transformer2DModel,
+    UNet2DConditionModel,
+)
+from transformers import (
+    CLIPTextConfig,
+    CLIPTextModel,
+    CLIPTextModelWithProjection,
+    CLIPTokenizer,
+    T5Config,
+    T5EncoderModel,
+    T5Tokenizer,
+)
+
+import numpy as np
+import sentencepiece
+from PIL import Image
+
+RESOLUTION = 64
+CLIP_DIM = 32
+CAPTION = "<embedding> a tiny image"
+
+TINY_MODEL_TRAINING_METHODS = [
+    TrainingMethod.FINE_TUNE,
+    TrainingMethod.LORA,
+    TrainingMethod.EMBEDDING,
+]
+
+
+def __save_clip_tokenizer(directory: str, subfolder: str) -> CLIPTokenizer:
+    # one token per character, without merges
+    characters = [chr(i) for i in range(33, 127)]
+    vocab = characters + [c + "</w>" for c in characters] + ["<|startoftext|>", "<|endoftext|>"]
+    files_dir = os.path.join(directory, "tokenizer_files", subfolder)
+    os.makedirs(files_dir)
+    with open(os.path.join(files_dir, "vocab.json"), "w") as f:
+        json.dump({token: i for i, token in enumerate(vocab)}, f)
+    with open(os.path.join(files_dir, "merges.txt"), "w") as f:
+        f.write("#version: 0.2\n")
+
+    tokenizer = CLIPTokenizer(
+        os.path.join(files_dir, "vocab.json"),
+        os.path.join(files_dir, "merges.txt"),
+        model_max_length=77,
+    )
+    tokenizer.save_pretrained(os.path.join(directory, subfolder))
+    return tokenizer
+
+
+def __save_t5_tokenizer(directory: str, subfolder: str) -> T5Tokenizer:
+    # a sentencepiece model with one token per character
+    model = io.BytesIO()
+    sentencepiece.SentencePieceTrainer.train(
+        sentence_iterator=iter([string.ascii_letters + string.digits + string.punctuation]),
+        model_writer=model,
+        model_type="char",
+        vocab_size=100,
+        hard_vocab_limit=False,
+        pad_id=0, eos_id=1, unk_id=2, bos_id=-1,
+        pad_piece="<pad>", eos_piece="</s>", unk_piece="<unk>",
+        minloglevel=2,
+    )
+    files_dir = os.path.join(directory, "tokenizer_files", subfolder)
+    os.makedirs(files_dir)
+    with open(os.path.join(files_dir, "spiece.model"), "wb") as f:
+        f.write(model.getvalue())
+
+    tokenizer = T5Tokenizer(os.path.join(files_dir, "spiece.model"), extra_ids=0, model_max_length=32)
+    tokenizer.save_pretrained(os.path.join(directory, subfolder))
+    return tokenizer
+
+
+def __save_clip_text_encoder(
+        directory: str,
+        subfolder: str,
+        tokenizer: CLIPTokenizer,
+        with_projection: bool,
+):
+    config = CLIPTextConfig(
+        vocab_size=len(tokenizer), hidden_size=CLIP_DIM, intermediate_size=64, num_hidden_layers=2,
+        num_attention_heads=4, max_position_embeddings=77, projection_dim=CLIP_DIM,
+        pad_token_id=tokenizer.pad_token_id, bos_token_id=tokenizer.bos_token_id,
+        eos_token_id=tokenizer.eos_token_id,
+    )
+    text_encoder = CLIPTextModelWithProjection(config) if with_projection else CLIPTextModel(config)
+    text_encoder.save_pretrained(os.path.join(directory, subfolder))
+
+
+def __save_t5_text_encoder(directory: str, subfolder: str, tokenizer: T5Tokenizer, dim: int):
+    config = T5Config(
+        vocab_size=len(tokenizer), d_model=dim, d_kv=8, d_ff=2 * dim, num_layers=2, num_heads=dim // 8,
+        relative_attention_num_buckets=8, pad_token_id=tokenizer.pad_token_id,
+        eos_token_id=tokenizer.eos_token_id, decoder_start_token_id=tokenizer.pad_token_id,
+    )
+    T5EncoderModel(config).save_pretrained(os.path.join(directory, subfolder))
+
+
+def __save_vae(directory: str, latent_channels: int, scaling_factor: float, shift_factor: float | None):
+    # four blocks, to keep the downscaling factor of 8
+    vae = AutoencoderKL(
+        in_channels=3, out_channels=3, latent_channels=latent_channels,
+        down_block_types=("DownEncoderBlock2D",) * 4, up_block_types=("UpDecoderBlock2D",) * 4,
+        block_out_channels=(8, 8, 8, 8), layers_per_block=1, norm_num_groups=8, sample_size=RESOLUTION,
+        scaling_factor=scaling_factor, shift_factor=shift_factor,
+        use_quant_conv=shift_factor is None, use_post_quant_conv=shift_factor is None,
+    )
+    vae.save_pretrained(os.path.join(directory, "vae"))
+
+
+def __save_flow_matching_scheduler(directory: str, dynamic_shifting: bool):
+    FlowMatchEulerDiscreteScheduler(
+        shift=3.0, use_dynamic_shifting=dynamic_shifting, base_shift=0.5, max_shift=1.15,
+        base_image_seq_len=256, max_image_seq_len=4096,
+    ).save_pretrained(os.path.join(directory, "scheduler"))
+
+
+def __save_ddim_scheduler(directory: str):
+    DDIMScheduler(
+        beta_start=0.00085, beta_end=0.012, beta_schedule="scaled_linear", clip_sample=False,
+        set_alpha_to_one=False, steps_offset=1,
+    ).save_pretrained(os.path.join(directory, "scheduler"))
+
+
+def save_tiny_stable_diffusion(directory: str):
+    tokenizer = __save_clip_tokenizer(directory, "tokenizer")
+    __save_clip_text_encoder(directory, "text_encoder", tokenizer, with_projection=False)
+    __save_ddim_scheduler(directory)
+    __save_vae(directory, 4, 0.18215, None)
+    UNet2DConditionModel(
+        sample_size=RESOLUTION // 8, in_channels=4, out_channels=4, block_out_channels=(32, 64), layers_per_block=1,
+        down_block_types=("CrossAttnDownBlock2D", "DownBlock2D"), up_block_types=("UpBlock2D", "CrossAttnUpBlock2D"),
+        cross_attention_dim=CLIP_DIM, attention_head_dim=8, norm_num_groups=8,
+    ).save_pretrained(os.path.join(directory, "unet"))
+
+
+def save_tiny_stable_diffusion_xl(directory: str):
+    tokenizer_1 = __save_clip_tokenizer(directory, "tokenizer")
+    tokenizer_2 = __save_clip_tokenizer(directory, "tokenizer_2")
+    __save_clip_text_encoder(directory, "text_encoder", tokenizer_1, with_projection=False)
+    __save_clip_text_encoder(directory, "text_encoder_2", tokenizer_2, with_projection=True)
+    __save_ddim_scheduler(directory)
+    __save_vae(directory, 4, 0.13025, None)
+    # the text encoder outputs are concatenated, the pooled output is combined with 6 embedded time ids
+    UNet2DConditionModel(
+        sample_size=RESOLUTION // 8, in_channels=4, out_channels=4, block_out_channels=(32, 64), layers_per_block=1,
+        down_block_types=("DownBlock2D", "CrossAttnDownBlock2D"), up_block_types=("CrossAttnUpBlock2D", "UpBlock2D"),
+        cross_attention_dim=2 * CLIP_DIM, attention_head_dim=8, norm_num_groups=8, transformer_layers_per_block=(1, 2),
+        use_linear_projection=True, addition_embed_type="text_time", addition_time_embed_dim=8,
+        projection_class_embeddings_input_dim=CLIP_DIM + 6 * 8,
+    ).save_pretrained(os.path.join(directory, "unet"))
+
+
+def save_tiny_stable_diffusion_3(directory: str):
+    tokenizer_1 = __save_clip_tokenizer(directory, "tokenizer")
+    tokenizer_2 = __save_clip_tokenizer(directory, "tokenizer_2")
+    tokenizer_3 = __save_t5_tokenizer(directory, "tokenizer_3")
+    __save_clip_text_encoder(directory, "text_encoder", tokenizer_1, with_projection=True)
+    __save_clip_text_encoder(directory, "text_encoder_2", tokenizer_2, with_projection=True)
+    # the concatenated clip outputs are padded to the t5 dimension
+    __save_t5_text_encoder(directory, "text_encoder_3", tokenizer_3, 2 * CLIP_DIM)
+    __save_flow_matching_scheduler(directory, dynamic_shifting=False)
+    __save_vae(directory, 16, 1.5305, 0.0609)
+    SD3Transformer2DModel(
+        sample_size=RESOLUTION // 8, patch_size=2, in_channels=16, out_channels=16, num_layers=2, attention_head_dim=8,
+        num_attention_heads=4, joint_attention_dim=2 * CLIP_DIM, caption_projection_dim=32,
+        pooled_projection_dim=2 * CLIP_DIM,
+    ).save_pretrained(os.path.join(directory, "transformer"))
+
+
+def save_tiny_flux(directory: str):
+    tokenizer_1 = __save_clip_tokenizer(directory, "tokenizer")
+    tokenizer_2 = __save_t5_tokenizer(directory, "tokenizer_2")
+    __save_clip_text_encoder(directory, "text_encoder", tokenizer_1, with_projection=False)
+    __save_t5_text_encoder(directory, "text_encoder_2", tokenizer_2, 32)
+    __save_flow_matching_scheduler(directory, dynamic_shifting=True)
+    __save_vae(directory, 16, 0.3611, 0.1159)
+    # latents are packed into 2x2 patches of 16 channels
+    FluxTransformer2DModel(
+        patch_size=1, in_channels=64, num_layers=1, num_single_layers=1, attention_head_dim=8, num_attention_heads=4,
+        joint_attention_dim=32, pooled_projection_dim=CLIP_DIM, guidance_embeds=True, axes_dims_rope=(2, 2, 4),
+    ).save_pretrained(os.path.join(directory, "transformer"))
+
+
+def save_tiny_chroma(directory: str):
+    tokenizer = __save_t5_tokenizer(directory, "tokenizer")
+    __save_t5_text_encoder(directory, "text_encoder", tokenizer, 32)
+    __save_flow_matching_scheduler(directory, dynamic_shifting=False)
+    __save_vae(directory, 16, 0.3611, 0.1159)
+    ChromaTransformer2DModel(
+        patch_size=1, in_channels=64, num_layers=1, num_single_layers=1, attention_head_dim=8, num_attention_heads=4,
+        joint_attention_dim=32, axes_dims_rope=(2, 2, 4), approximator_num_channels=8, approximator_hidden_dim=32,
+        approximator_layers=1,
+    ).save_pretrained(os.path.join(directory, "transformer"))
+
+
+def save_tiny_pixart_sigma(directory: str):
+    tokenizer = __save_t5_tokenizer(directory, "tokenizer")
+    __save_t5_text_encoder(directory, "text_encoder", tokenizer, 32)
+    __save_ddim_scheduler(directory)
+    __save_vae(directory, 4, 0.13025, None)
+    # the resolution embedding needs an inner dimension that is divisible by 3
+    PixArtTransformer2DModel(
+        num_attention_heads=3, attention_head_dim=16, in_channels=4, out_channels=8, num_layers=2,
+        sample_size=RESOLUTION // 8, patch_size=2, cross_attention_dim=48, caption_channels=32,
+        use_additional_conditions=True, norm_num_groups=8,
+    ).save_pretrained(os.path.join(directory, "transformer"))
+
+
+# model types with a tiny checkpoint. Each function saves a randomly initialized model in the diffusers format
+TINY_MODEL_FACTORIES: dict[ModelType, Callable[[str], None]] = {
+    ModelType.STABLE_DIFFUSION_15: save_tiny_stable_diffusion,
+    ModelType.STABLE_DIFFUSION_XL_10_BASE: save_tiny_stable_diffusion_xl,
+    ModelType.STABLE_DIFFUSION_3: save_tiny_stable_diffusion_3,
+    ModelType.FLUX_DEV_1: save_tiny_flux,
+    ModelType.CHROMA_1: save_tiny_chroma,
+    ModelType.PIXART_SIGMA: save_tiny_pixart_sigma,
+}
+
+
+def __save_concept(directory: str, num_images: int, generator: np.random.Generator):
+    for i in range(num_images):
+        pixels = generator.integers(0, 256, (RESOLUTION, RESOLUTION, 3), dtype=np.uint8)
+        Image.fromarray(pixels).save(os.path.join(directory, f"{i}.png"))
+        with open(os.path.join(directory, f"{i}.txt"), "w") as f:
+            f.write(CAPTION)
+
+
+def __create_config(
+        model_type: ModelType,
+        training_method: TrainingMethod,
+        batch_size: int,
+        directory: str,
+) -> TrainConfig:
+    config = TrainConfig.default_values()
+    config.model_type = model_type
+    config.training_method = training_method
+    config.base_model_name = os.path.join(directory, "model")
+    config.workspace_dir = os.path.join(directory, "workspace")
+    config.cache_dir = os.path.join(directory, "cache")
+    config.debug_dir = os.path.join(directory, "debug")
+    config.train_device = "cpu"
+    config.temp_device = "cpu"
+    config.train_dtype = DataType.FLOAT_32
+    config.fallback_train_dtype = DataType.FLOAT_32
+    config.gradient_checkpointing = GradientCheckpointingMethod.OFF
+    config.resolution = str(RESOLUTION)
+    config.batch_size = batch_size
+    config.dataloader_threads = 1
+    config.learning_rate = 1e-4
+    config.output_dtype = DataType.FLOAT_32
+
+    # a fine-tune is saved in the diffusers format, the single file format needs the full model architecture
+    if training_method == TrainingMethod.FINE_TUNE:
+        config.output_model_format = ModelFormat.DIFFUSERS
+        config.output_model_destination = os.path.join(directory, "output")
+    else:
+        config.output_model_format = ModelFormat.SAFETENSORS
+        config.output_model_destination = os.path.join(directory, "output.safetensors")
+
+    concept = ConceptConfig.default_values()
+    concept.name = "tiny"
+    concept.path = os.path.join(directory, "concept")
+    config.concepts = [concept]
+
+    return config
+
+
+def __trained_model_config(config: TrainConfig) -> TrainConfig:
+    # the config to load the saved model, like continuing from a backup
+    config = copy.deepcopy(config)
+    if config.training_method == TrainingMethod.LORA:
+        config.lora_model_name = config.output_model_destination
+    elif config.training_method == TrainingMethod.EMBEDDING:
+        config.embedding.model_name = config.output_model_destination
+    else:
+        config.base_model_name = config.output_model_destination
+    return config
+
+
+def benchmark_tiny_model(
+        model_type: ModelType,
+        training_method: TrainingMethod,
+        steps: int = 5,
+        batch_size: int = 2,
+) -> dict:
+    """
+    Trains a tiny, randomly initialized model of the given type on the CPU, the same way GenericTrainer does. A
+    checkpoint with tiny text encoders, VAE and denoiser is saved in the diffusers format, and loaded with the model
+    loader from modules.util.create. Training goes through the model setup, the data loader with latent caching on a
+    concept of random images, and the predict and calculate_loss methods of the setup. Only the model types in
+    TINY_MODEL_FACTORIES have a tiny checkpoint. Layer offloading, gradient checkpointing, EMA and lr schedulers are
+    not used.
+
+    Reports the caching time of the first epoch, and the median time of each phase of a training step over the given
+    number of steps, after one warmup step: fetching a batch from the data loader, predict, loss, backward and the
+    optimizer step. Sampling two diffusion steps with the model sampler, saving with the model saver and loading the
+    saved model with the model loader are each timed the same number of times after training.
+    """
+    torch.manual_seed(42)
+
+    with tempfile.TemporaryDirectory() as directory:
+        config = __create_config(model_type, training_method, batch_size, directory)
+        TINY_MODEL_FACTORIES[model_type](config.base_model_name)
+        os.makedirs(config.concepts[0].path)
+        __save_concept(config.concepts[0].path, (steps + 1) * batch_size, np.random.default_rng(42))
+
+        train_device = torch.device(config.train_device)
+        temp_device = torch.device(config.temp_device)
+
+        model_loader = create.create_model_loader(model_type, training_method)
+        model_setup = create.create_model_setup(model_type, train_device, temp_device, training_method)
+        model_saver = create.create_model_saver(model_type, training_method)
+
+        model = model_loader.load(
+            model_type=model_type,
+            model_names=config.model_names(),
+            weight_dtypes=config.weight_dtypes(),
+        )
+        model.train_config = config
+
+        model_setup.setup_optimizations(model, config)
+        model_setup.setup_train_device(model, config)
+        model_setup.setup_model(model, config)
+        model.to(temp_device)
+        model.eval()
+
+        train_progress = model.train_progress
+        data_loader = create.create_data_loader(
+            train_device, temp_device, model, model_type, training_method, config, train_progress,
+        )
+        model_sampler = create.create_model_sampler(train_device, temp_device, model, model_type, training_method)
+
+        times = {name: [] for name in [
+            "data_loading", "predict", "loss", "backward", "optimizer_step", "sampling", "save", "load",
+        ]}
+
+        def timed(name: str, step: int, fun: Callable, *args):
+            start_time = time.perf_counter()
+            result = fun(*args)
+            if step > 0:  # the first step is a warmup step
+                times[name].append(time.perf_counter() - start_time)
+            return result
+
+        start_time = time.perf_counter()
+        data_loader.get_data_set().start_next_epoch()
+        caching_time = time.perf_counter() - start_time
+
+        model_setup.setup_train_device(model, config)
+        batches = iter(data_loader.get_data_loader())
+        for step in range(steps + 1):
+            batch = timed("data_loading", step, next, batches)
+            model_output_data = timed("predict", step, model_setup.predict, model, batch, config, train_progress)
+            loss = timed("loss", step, model_setup.calculate_loss, model, batch, model_output_data, config)
+            timed("backward", step, loss.backward)
+            timed("optimizer_step", step, model.optimizer.step)
+            model.optimizer.zero_grad(set_to_none=True)
+            model_setup.after_optimizer_step(model, config, train_progress)
+            train_progress.next_step(batch_size)
+
+        sample_config = SampleConfig.default_values()
+        sample_config.prompt = CAPTION
+        sample_config.height = RESOLUTION
+        sample_config.width = RESOLUTION
+        sample_config.diffusion_steps = 2
+        sample_config.from_train_config(config)
+
+        model.to(temp_device)
+        model.eval()
+        trained_model_config = __trained_model_config(config)
+        for step in range(steps + 1):
+            timed("sampling", step, lambda: model_sampler.sample(
+                sample_config=sample_config,
+                destination=os.path.join(directory, "sample"),
+                image_format=config.sample_image_format,
+                video_format=config.sample_video_format,
+                audio_format=config.sample_audio_format,
+            ))
+            timed("save", step, lambda: model_saver.save(
+                model=model,
+                model_type=model_type,
+                output_model_format=config.output_model_format,
+                output_model_destination=config.output_model_destination,
+                dtype=config.output_dtype.torch_dtype(),
+            ))
+            timed("load", step, lambda: create.create_model_loader(model_type, training_method).load(
+                model_type=model_type,
+                model_names=trained_model_config.model_names(),
+                weight_dtypes=trained_model_config.weight_dtypes(),
+            ))
+
+    results = {f"{name}_time": statistics.median(values) for name, values in times.items()}
+    results["step_time"] = sum(results[f"{name}_time"] for name in [
+        "data_loading", "predict", "loss", "backward", "optimizer_step",
+    ])
+    results["caching_time"] = caching_time
+    results["trained_parameters"] = sum(parameter.numel() for parameter in model.parameters.parameters())
+    results["final_loss"] = loss.item()
+    return results
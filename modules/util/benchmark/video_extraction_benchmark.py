@@ -0,0 +1,122 @@
+import os
+import random
+import tempfile
+import time
+
+from modules.util import video_util
+
+import cv2
+import numpy as np
+
+
+def __create_video(path: str, frame_count: int, fps: int, width: int, height: int, scene_length: int):
+    # moving gradients with a hard cut every scene_length frames, and black borders at the top and bottom
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+    x = np.linspace(0, 255, width, dtype=np.float32)[None, :, None]
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None, None]
+    border = height // 8
+    for i in range(frame_count):
+        scene = i // scene_length
+        color = np.array([(scene * 70) % 256, (scene * 150) % 256, (scene * 30) % 256], dtype=np.float32)
+        frame = ((x + y + i * 4 + color) % 256).astype(np.uint8)
+        frame[:border] = 0
+        frame[-border:] = 0
+        writer.write(frame)
+    writer.release()
+
+
+def __seek_per_clip(video_path: str, max_length: float, output_dir: str) -> int:
+    # how clips were extracted before: every clip reopens the video, seeks to the middle and to five random frames
+    # to detect the borders, then seeks to the start of the clip
+    video = cv2.VideoCapture(video_path)
+    fps = video_util.read_fps(video, video_path)
+    total_frames = int(video.get(cv2.CAP_PROP_FRAME_COUNT))
+    video.release()
+    scenes = video_util.split_scenes([(0, total_frames - 1)], int(max_length * fps), max(int(0.25 * fps), 1))
+
+    basename, _ = os.path.splitext(os.path.basename(video_path))
+    for scene in scenes:
+        video = cv2.VideoCapture(video_path)
+        video.set(cv2.CAP_PROP_POS_FRAMES, (scene[1] + scene[0]) // 2)
+        _, frame_blend = video.read()
+        for i in range(5):
+            video.set(cv2.CAP_PROP_POS_FRAMES, random.randint(scene[0], scene[1]))
+            success, frame = video.read()
+            if success:
+                a = 1 / (i + 1)
+                frame_blend = cv2.addWeighted(frame, a, frame_blend, 1 - a, 0)
+        x1, y1, w1, h1 = video_util.find_main_contour(frame_blend)
+
+        writer = cv2.VideoWriter(f'{output_dir}{os.sep}{basename}_{scene[0]}-{scene[1]}.mp4',
+                                 cv2.VideoWriter_fourcc(*'mp4v'), fps, (w1, h1))
+        video.set(cv2.CAP_PROP_POS_FRAMES, scene[0])
+        frame_number = scene[0]
+        success, frame = video.read()
+        while success and frame_number < scene[1]:
+            writer.write(frame[y1:y1 + h1, x1:x1 + w1])
+            success, frame = video.read()
+            frame_number += 1
+        writer.release()
+        video.release()
+    return len(scenes)
+
+
+def benchmark_video_extraction(
+        video_count: int = 4,
+        duration: float = 20.0,
+        fps: int = 30,
+        width: int = 640,
+        height: int = 360,
+        max_length: float = 2.0,
+        capture_rate: float = 2.0,
+        max_workers: int = 4,
+) -> dict:
+    """
+    Generates synthetic videos and extracts clips and images from them with border removal. Compares the old per clip
+    seeking with the single pass extraction, run serially and in a process pool. Throughput is measured in clips and
+    images per minute of wall time.
+    """
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        video_paths = []
+        for i in range(video_count):
+            video_path = os.path.join(directory, f"video_{i}.mp4")
+            __create_video(video_path, int(duration * fps), fps, width, height, scene_length=fps * 3)
+            video_paths.append(video_path)
+
+        def output_dir(name: str, video_path: str) -> str:
+            path = os.path.join(directory, name, os.path.splitext(os.path.basename(video_path))[0])
+            os.makedirs(path, exist_ok=True)
+            return path
+
+        start_time = time.perf_counter()
+        clip_count = sum(__seek_per_clip(path, max_length, output_dir("seek", path)) for path in video_paths)
+        results["seek_per_clip_clips_per_minute"] = clip_count / (time.perf_counter() - start_time) * 60
+
+        for name, workers in [("single_pass", 1), ("single_pass_pool", max_workers)]:
+            jobs = [
+                (path, "00:00:00", "99:99:99", max_length, False, True, 0.0, 0, output_dir(name, path))
+                for path in video_paths
+            ]
+            start_time = time.perf_counter()
+            clip_count = sum(video_util.run_in_process_pool(video_util.extract_clips, jobs, workers))
+            results[f"{name}_clips_per_minute"] = clip_count / (time.perf_counter() - start_time) * 60
+
+            jobs = [
+                (path, "00:00:00", "99:99:99", capture_rate, 0.2, True, 0.0, output_dir(f"{name}_images", path))
+                for path in video_paths
+            ]
+            start_time = time.perf_counter()
+            image_count = sum(video_util.run_in_process_pool(video_util.extract_frames, jobs, workers))
+            results[f"{name}_images_per_minute"] = image_count / (time.perf_counter() - start_time) * 60
+
+        results["clip_count"] = clip_count
+        results["image_count"] = image_count
+
+        # check the border detection on one clip
+        clip_dir = output_dir("single_pass", video_paths[0])
+        clip = cv2.VideoCapture(os.path.join(clip_dir, sorted(os.listdir(clip_dir))[0]))
+        results["clip_size"] = (int(clip.get(cv2.CAP_PROP_FRAME_WIDTH)), int(clip.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        clip.release()
+
+    return results
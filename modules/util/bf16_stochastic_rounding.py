@@ -1,45 +1,117 @@
+from collections.abc import Iterator
+
 import torch
 from torch import Tensor
 
 generator = None
 
+# the maximum number of elements processed at once. larger tensors are split into chunks, smaller tensors are
+# batched together. temporary values are stored in a scratch buffer of this size for each device and dtype
+chunk_numel = 1 << 20
+
+scratch_buffers = {}
+
 def set_seed(seed: int, device: torch.device):
     global generator
     if generator is None or generator.device != device:
         generator = torch.Generator(device=device)
     generator.manual_seed(seed)
 
-def copy_stochastic_(target: Tensor, source: Tensor):
-    """
-    copies source into target using stochastic rounding
 
-    Args:
-        target: the target tensor with dtype=bfloat16
-        source: the target tensor with dtype=float32
-    """
+def clear_scratch_buffers():
+    scratch_buffers.clear()
+
+
+def __get_scratch_buffer(device: torch.device, dtype: torch.dtype) -> Tensor:
+    buffer = scratch_buffers.get((device, dtype))
+    if buffer is None or buffer.numel() != chunk_numel:
+        buffer = torch.empty(chunk_numel, device=device, dtype=dtype)
+        scratch_buffers[(device, dtype)] = buffer
+    return buffer
 
+
+def __batches(tensors: list[Tensor]) -> Iterator[list[tuple[int, int, int]]]:
+    """
+    Splits flat tensors into pieces of at most chunk_numel elements, and groups consecutive pieces on the same device
+    into batches of at most chunk_numel elements. Yields lists of (tensor index, start, end).
+    """
+    batch = []
+    batch_numel = 0
+    batch_device = None
+    for i, tensor in enumerate(tensors):
+        numel = tensor.numel()
+        for start in range(0, numel, chunk_numel):
+            end = min(start + chunk_numel, numel)
+            if len(batch) > 0 and (batch_numel + end - start > chunk_numel or tensor.device != batch_device):
+                yield batch
+                batch = []
+                batch_numel = 0
+            batch.append((i, start, end))
+            batch_numel += end - start
+            batch_device = tensor.device
+
+    if len(batch) > 0:
+        yield batch
+
+
+def __pieces(tensors: list[Tensor], batch: list[tuple[int, int, int]]) -> list[Tensor]:
+    return [tensors[i][start:end] for i, start, end in batch]
+
+
+def __scratch_pieces(buffer: Tensor, batch: list[tuple[int, int, int]]) -> list[Tensor]:
+    pieces = []
+    offset = 0
+    for _, start, end in batch:
+        pieces.append(buffer[offset:offset + end - start])
+        offset += end - start
+    return pieces
+
+
+def __round_batch_(targets: list[Tensor], sources: list[Tensor]):
     global generator
 
-    # create a random 16 bit integer
-    result = torch.randint(
-        size=source.shape,
-        device=source.device,
-        dtype=torch.int32,
-        low=0,
-        high=(1 << 16),
-        generator=generator,
-    )
+    buffer = __get_scratch_buffer(targets[0].device, torch.int32)
+    results = []
+    offset = 0
+    for source in sources:
+        result = buffer[offset:offset + source.numel()]
+        offset += source.numel()
+
+        # create a random 16 bit integer. each piece draws its own numbers, in the same order for every batching
+        result.random_(0, 1 << 16, generator=generator)
+        results.append(result)
 
     # add the random number to the lower 16 bit of the mantissa
-    result.add_(source.view(dtype=torch.int32))
+    torch._foreach_add_(results, [source.view(dtype=torch.int32) for source in sources])
 
     # mask off the lower 16 bit of the mantissa
-    result.bitwise_and_(-65536)  # -65536 = FFFF0000 as a signed int32
+    buffer[:offset].bitwise_and_(-65536)  # -65536 = FFFF0000 as a signed int32
+
+    # copy the higher 16 bit into the target tensors
+    torch._foreach_copy_(targets, [result.view(dtype=torch.float32) for result in results])
+
+
+def __flatten_targets(targets: list[Tensor]) -> tuple[list[Tensor], list[Tensor]]:
+    # targets are written through flat views, non-contiguous targets are written back after rounding
+    contiguous_targets = [target if target.is_contiguous() else target.contiguous() for target in targets]
+    return contiguous_targets, [target.view(-1) for target in contiguous_targets]
+
+
+def __write_back_targets(targets: list[Tensor], contiguous_targets: list[Tensor]):
+    for target, contiguous_target in zip(targets, contiguous_targets, strict=True):
+        if target is not contiguous_target:
+            target.copy_(contiguous_target)
+
 
-    # copy the higher 16 bit into the target tensor
-    target.copy_(result.view(dtype=torch.float32))
+def copy_stochastic_(target: Tensor, source: Tensor):
+    """
+    copies source into target using stochastic rounding
 
-    del result
+    Args:
+        target: the target tensor with dtype=bfloat16
+        source: the target tensor with dtype=float32
+    """
+    copy_stochastic_list_([target], [source])
 
 
 def add_stochastic_(input: Tensor, other: Tensor, alpha: float = 1.0):
@@ -51,10 +123,7 @@ def add_stochastic_(input: Tensor, other: Tensor, alpha: float = 1.0):
         other: the other tensor
         alpha: a multiplier for other
     """
-    result = other.clone() if other.dtype == torch.float32 else other.to(dtype=torch.float32)
-
-    result.add_(input, alpha=alpha)
-    copy_stochastic_(input, result)
+    add_stochastic_list_([input], [other], alpha)
 
 
 def addcdiv_stochastic_(input: Tensor, tensor1: Tensor, tensor2: Tensor, value: float = 1.0):
@@ -67,7 +136,94 @@ def addcdiv_stochastic_(input: Tensor, tensor1: Tensor, tensor2: Tensor, value:
         tensor2: the denominator tensor
         value: a multiplier for tensor1/tensor2
     """
-    result = input.clone() if input.dtype == torch.float32 else input.to(dtype=torch.float32)
+    addcdiv_stochastic_list_([input], [tensor1], [tensor2], value)
+
+
+def copy_stochastic_list_(targets: list[Tensor], sources: list[Tensor]):
+    """
+    copies each source into its target using stochastic rounding.
+    random numbers are drawn in list order, which produces the same results as calling copy_stochastic_ for each pair
+
+    Args:
+        targets: the target tensors with dtype=bfloat16
+        sources: the source tensors with dtype=float32
+    """
+    contiguous_targets, flat_targets = __flatten_targets(targets)
+    flat_sources = [source.reshape(-1) for source in sources]
+
+    for batch in __batches(flat_targets):
+        __round_batch_(__pieces(flat_targets, batch), __pieces(flat_sources, batch))
+
+    __write_back_targets(targets, contiguous_targets)
+
+
+def add_stochastic_list_(
+        inputs: list[Tensor],
+        others: list[Tensor],
+        alphas: list[float] | float = 1.0,
+):
+    """
+    adds each other tensor to its input using stochastic rounding
+
+    Args:
+        inputs: the input tensors with dtype=bfloat16
+        others: the other tensors
+        alphas: a multiplier for other, either for all tensors or one for each tensor
+    """
+    if not isinstance(alphas, list):
+        alphas = [alphas] * len(inputs)
+
+    contiguous_inputs, flat_inputs = __flatten_targets(inputs)
+    flat_others = [other.reshape(-1) for other in others]
+
+    for batch in __batches(flat_inputs):
+        input_pieces = __pieces(flat_inputs, batch)
+        results = __scratch_pieces(__get_scratch_buffer(input_pieces[0].device, torch.float32), batch)
+
+        other_pieces = __pieces(flat_others, batch)
+        batch_alphas = [alphas[i] for i, _, _ in batch]
+
+        torch._foreach_copy_(results, input_pieces)
+        if all(alpha == batch_alphas[0] for alpha in batch_alphas):
+            torch._foreach_add_(results, other_pieces, alpha=batch_alphas[0])
+        else:
+            for result, other, alpha in zip(results, other_pieces, batch_alphas, strict=True):
+                result.add_(other, alpha=alpha)
+        __round_batch_(input_pieces, results)
+
+    __write_back_targets(inputs, contiguous_inputs)
+
+
+def addcdiv_stochastic_list_(
+        inputs: list[Tensor],
+        tensors1: list[Tensor],
+        tensors2: list[Tensor],
+        values: list[float] | float = 1.0,
+):
+    """
+    adds (tensor1 / tensor2 * value) to each input using stochastic rounding
+
+    Args:
+        inputs: the input tensors with dtype=bfloat16
+        tensors1: the numerator tensors
+        tensors2: the denominator tensors
+        values: a multiplier for tensor1/tensor2, either for all tensors or one for each tensor
+    """
+    if not isinstance(values, list):
+        values = [values] * len(inputs)
+
+    contiguous_inputs, flat_inputs = __flatten_targets(inputs)
+    flat_tensors1 = [tensor1.reshape(-1) for tensor1 in tensors1]
+    flat_tensors2 = [tensor2.reshape(-1) for tensor2 in tensors2]
+
+    for batch in __batches(flat_inputs):
+        input_pieces = __pieces(flat_inputs, batch)
+        results = __scratch_pieces(__get_scratch_buffer(input_pieces[0].device, torch.float32), batch)
+
+        torch._foreach_copy_(results, input_pieces)
+        torch._foreach_addcdiv_(
+            results, __pieces(flat_tensors1, batch), __pieces(flat_tensors2, batch), [values[i] for i, _, _ in batch]
+        )
+        __round_batch_(input_pieces, results)
 
-    result.addcdiv_(tensor1, tensor2, value=value)
-    copy_stochastic_(input, result)
+    __write_back_targets(inputs, contiguous_inputs)
@@ -0,0 +1,96 @@
+import zlib
+
+from modules.util.enum.DataType import DataType
+
+import torch
+from torch import Tensor
+
+CACHE_TENSOR_KEY = "__cache_tensor__"
+
+
+def cache_storage_dtype(storage_dtype: DataType) -> torch.dtype | None:
+    match storage_dtype:
+        case DataType.FLOAT_16:
+            return torch.float16
+        case DataType.BFLOAT_16:
+            return torch.bfloat16
+        case DataType.FLOAT_8:
+            return torch.float8_e4m3fn
+        case _:
+            return None
+
+
+def __to_bytes(tensor: Tensor) -> Tensor:
+    return tensor.detach().contiguous().cpu().reshape(-1).view(dtype=torch.uint8)
+
+
+def encode_cache_tensor(
+        tensor: Tensor,
+        storage_dtype: DataType,
+        compress: bool,
+) -> Tensor | dict:
+    """
+    Converts a floating point tensor into the format stored in the cache. Float8 tensors are scaled into the float8
+    range with one scale per tensor. Float16 tensors are only scaled if they would overflow otherwise. If compress is
+    True, the bytes of the stored tensor are grouped by significance and compressed with zlib, which is lossless.
+    Returns the tensor unchanged if there is nothing to convert.
+    """
+    dtype = cache_storage_dtype(storage_dtype)
+    if not isinstance(tensor, Tensor) or not tensor.is_floating_point() or tensor.numel() == 0:
+        return tensor
+    if (dtype is None or dtype == tensor.dtype) and not compress:
+        return tensor
+
+    data = tensor.detach()
+    scale = 1.0
+    if dtype is not None and dtype != tensor.dtype:
+        abs_max = data.abs().max().item()
+        if dtype == torch.float8_e4m3fn or abs_max > torch.finfo(dtype).max:
+            scale = abs_max / torch.finfo(dtype).max if abs_max > 0 else 1.0
+        if scale != 1.0:
+            data = data.float() / scale
+        data = data.to(dtype=dtype)
+
+    data = __to_bytes(data)
+    element_size = data.numel() // tensor.numel()
+    if compress:
+        # byte shuffle: the high bytes of neighbouring values are similar, which makes them easier to compress
+        shuffled = data.view(-1, element_size).t().contiguous()
+        data = torch.frombuffer(bytearray(zlib.compress(shuffled.numpy().tobytes(), level=1)), dtype=torch.uint8)
+
+    return {
+        CACHE_TENSOR_KEY: True,
+        "data": data,
+        "dtype": str(tensor.dtype).removeprefix("torch."),
+        "storage_dtype": str(dtype if dtype is not None else tensor.dtype).removeprefix("torch."),
+        "shape": list(tensor.shape),
+        "scale": scale,
+        "compressed": compress,
+    }
+
+
+def is_encoded_cache_tensor(value) -> bool:
+    return isinstance(value, dict) and value.get(CACHE_TENSOR_KEY, False)
+
+
+def decode_cache_tensor(value: Tensor | dict) -> Tensor:
+    """
+    Reverses encode_cache_tensor. The tensor is returned with its original dtype. Values that are not encoded, for
+    example from caches that were created without reduced precision storage, are returned unchanged.
+    """
+    if not is_encoded_cache_tensor(value):
+        return value
+
+    dtype = getattr(torch, value["dtype"])
+    storage_dtype = getattr(torch, value["storage_dtype"])
+    data = value["data"]
+
+    if value["compressed"]:
+        element_size = torch.empty((), dtype=storage_dtype).element_size()
+        shuffled = torch.frombuffer(bytearray(zlib.decompress(__to_bytes(data).numpy().tobytes())), dtype=torch.uint8)
+        data = shuffled.view(element_size, -1).t().contiguous()
+
+    tensor = data.reshape(-1).view(dtype=storage_dtype).view(value["shape"])
+    if value["scale"] != 1.0:
+        return tensor.to(dtype=torch.float32).mul_(value["scale"]).to(dtype=dtype)
+    return tensor.to(dtype=dtype)
@@ -32,9 +32,12 @@ class CloudConfig(BaseConfig):
     enabled: bool
     type: CloudType
     file_sync : CloudFileSync
+    packed_upload : bool
+    packed_upload_chunk_size : int
     create : bool
     name: str
     tensorboard_tunnel: bool
+    message_channel: bool
     sub_type: str
     gpu_type: str
     volume_size: int
@@ -68,9 +71,12 @@ class CloudConfig(BaseConfig):
         data.append(("enabled", False, bool, False))
         data.append(("type", CloudType.RUNPOD, CloudType, False))
         data.append(("file_sync", CloudFileSync.NATIVE_SCP, CloudFileSync, False))
+        data.append(("packed_upload", False, bool, False))
+        data.append(("packed_upload_chunk_size", 256, int, False))
         data.append(("create", True, bool, False))
         data.append(("name", "OneTrainer", str, False))
         data.append(("tensorboard_tunnel", True, bool, False))
+        data.append(("message_channel", True, bool, False))
         data.append(("sub_type", "", str, False))
         data.append(("gpu_type", "", str, False))
         data.append(("volume_size", 100, int, False))
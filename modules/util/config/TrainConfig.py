@@ -14,6 +14,7 @@ from modules.util.enum.ConfigPart import ConfigPart
 from modules.util.enum.DataType import DataType
 from modules.util.enum.EMAMode import EMAMode
 from modules.util.enum.GradientCheckpointingMethod import GradientCheckpointingMethod
+from modules.util.enum.GradientCompression import GradientCompression
 from modules.util.enum.GradientReducePrecision import GradientReducePrecision
 from modules.util.enum.ImageFormat import ImageFormat
 from modules.util.enum.LearningRateScaler import LearningRateScaler
@@ -22,6 +23,7 @@ from modules.util.enum.LossScaler import LossScaler
 from modules.util.enum.LossWeight import LossWeight
 from modules.util.enum.ModelFormat import ModelFormat
 from modules.util.enum.ModelType import ModelType, PeftType
+from modules.util.enum.OffloadCompression import OffloadCompression
 from modules.util.enum.Optimizer import Optimizer
 from modules.util.enum.TimestepDistribution import TimestepDistribution
 from modules.util.enum.TimeUnit import TimeUnit
@@ -70,6 +72,7 @@ class TrainOptimizerConfig(BaseConfig):
     momentum: float
     nesterov: bool
     no_prox: bool
+    offload_state: bool
     optim_bits: int
     percentile_clipping: int
     r: float
@@ -170,6 +173,7 @@ class TrainOptimizerConfig(BaseConfig):
         data.append(("momentum", None, float, True))
         data.append(("nesterov", False, bool, False))
         data.append(("no_prox", False, bool, False))
+        data.append(("offload_state", False, bool, False))
         data.append(("optim_bits", None, int, True))
         data.append(("percentile_clipping", None, int, True))
         data.append(("r", None, float, True))
@@ -239,6 +243,7 @@ class TrainModelPartConfig(BaseConfig):
     train_embedding: bool
     attention_mask: bool
     guidance_scale: float
+    offload_compression: OffloadCompression
 
     def __init__(self, data: list[(str, Any, type, bool)]):
         super().__init__(data)
@@ -259,6 +264,7 @@ class TrainModelPartConfig(BaseConfig):
         data.append(("train_embedding", True, bool, False))
         data.append(("attention_mask", False, bool, False))
         data.append(("guidance_scale", 1.0, float, False))
+        data.append(("offload_compression", OffloadCompression.NONE, OffloadCompression, False))
 
         return TrainModelPartConfig(data)
 
@@ -319,6 +325,10 @@ class TrainConfig(BaseConfig):
     fused_gradient_reduce: bool
     async_gradient_reduce: bool
     async_gradient_reduce_buffer: int
+    optimizer_state_sharding: bool
+    gradient_compression: GradientCompression
+    gradient_compression_rank: int
+    gradient_compression_block_size: int
 
     # model settings
     base_model_name: str
@@ -330,6 +340,9 @@ class TrainConfig(BaseConfig):
     enable_async_offloading: bool
     enable_activation_offloading: bool
     layer_offload_fraction: float
+    layer_offload_disk_cache: bool
+    layer_offload_disk_prefetch_layers: int
+    layer_offload_plan: str
     force_circular_padding: bool
     compile: bool
 
@@ -339,6 +352,8 @@ class TrainConfig(BaseConfig):
     aspect_ratio_bucketing: bool
     latent_caching: bool
     clear_cache_before_training: bool
+    cache_dtype: DataType
+    cache_compression: bool
 
     # training settings
     learning_rate_scheduler: LearningRateScheduler
@@ -357,6 +372,8 @@ class TrainConfig(BaseConfig):
     ema_decay: float
     ema_update_step_interval: int
     dataloader_threads: int
+    model_loading_threads: int
+    model_loading_memory_budget: float
     train_device: str
     temp_device: str
     train_dtype: DataType
@@ -490,6 +507,9 @@ class TrainConfig(BaseConfig):
     sample_audio_format: AudioFormat
     samples_to_tensorboard: bool
     non_ema_sampling: bool
+    merged_lora_sampling: bool
+    sampling_worker: bool
+    sampling_worker_device: str
 
     # cloud settings
     cloud: CloudConfig
@@ -500,6 +520,7 @@ class TrainConfig(BaseConfig):
     rolling_backup: bool
     rolling_backup_count: int
     backup_before_save: bool
+    deduplicate_backups: bool
     save_every: int
     save_every_unit: TimeUnit
     save_skip_first: int
@@ -791,6 +812,37 @@ class TrainConfig(BaseConfig):
             or ((self.text_encoder_4.train_embedding or not self.model_type.has_multiple_text_encoders())
                 and self.train_any_embedding())
 
+    def train_any_text_encoder_or_embedding(self) -> bool:
+        return self.train_text_encoder_or_embedding() \
+            or self.train_text_encoder_2_or_embedding() \
+            or self.train_text_encoder_3_or_embedding() \
+            or self.train_text_encoder_4_or_embedding() \
+            or self.train_any_output_embedding()
+
+    def merge_lora_for_sampling(self) -> bool:
+        # merged weights are written into the base weights, which doesn't work with cached offloaded weights, because
+        # those are restored from the cache on every transfer. quantizing the merged weights again mostly erases small
+        # LoRA updates
+        if not self.merged_lora_sampling or self.training_method != TrainingMethod.LORA:
+            return False
+
+        model_parts = [
+            self.unet, self.prior, self.transformer, self.text_encoder, self.text_encoder_2, self.text_encoder_3,
+            self.text_encoder_4, self.vae, self.effnet_encoder, self.decoder, self.decoder_text_encoder,
+            self.decoder_vqgan,
+        ]
+        if self.gradient_checkpointing.offload() and self.layer_offload_fraction > 0 and (
+                self.layer_offload_disk_cache
+                or any(part.offload_compression != OffloadCompression.NONE for part in model_parts)):
+            return False
+
+        weight_dtypes = self.weight_dtypes()
+        return not any(
+            dtype.is_quantized() or dtype == DataType.GGUF
+            for dtype in weight_dtypes.all_dtypes()
+            if dtype not in (weight_dtypes.lora, weight_dtypes.embedding)
+        )
+
     def all_embedding_configs(self):
         if self.training_method == TrainingMethod.EMBEDDING:
             return self.additional_embeddings + [self.embedding]
@@ -881,6 +933,10 @@ class TrainConfig(BaseConfig):
         data.append(("fused_gradient_reduce", True, bool, False))
         data.append(("async_gradient_reduce", True, bool, False))
         data.append(("async_gradient_reduce_buffer", 100, int, False))
+        data.append(("optimizer_state_sharding", False, bool, False))
+        data.append(("gradient_compression", GradientCompression.NONE, GradientCompression, False))
+        data.append(("gradient_compression_rank", 4, int, False))
+        data.append(("gradient_compression_block_size", 256, int, False))
 
         # model settings
         data.append(("base_model_name", "stable-diffusion-v1-5/stable-diffusion-v1-5", str, False))
@@ -892,6 +948,9 @@ class TrainConfig(BaseConfig):
         data.append(("enable_async_offloading", True, bool, False))
         data.append(("enable_activation_offloading", True, bool, False))
         data.append(("layer_offload_fraction", 0.0, float, False))
+        data.append(("layer_offload_disk_cache", False, bool, False))
+        data.append(("layer_offload_disk_prefetch_layers", 4, int, False))
+        data.append(("layer_offload_plan", "", str, False))
         data.append(("force_circular_padding", False, bool, False))
         data.append(("compile", False, bool, False))
 
@@ -901,6 +960,8 @@ class TrainConfig(BaseConfig):
         data.append(("aspect_ratio_bucketing", True, bool, False))
         data.append(("latent_caching", True, bool, False))
         data.append(("clear_cache_before_training", True, bool, False))
+        data.append(("cache_dtype", DataType.NONE, DataType, False))
+        data.append(("cache_compression", False, bool, False))
 
         # training settings
         data.append(("learning_rate_scheduler", LearningRateScheduler.CONSTANT, LearningRateScheduler, False))
@@ -917,6 +978,8 @@ class TrainConfig(BaseConfig):
         data.append(("ema_decay", 0.999, float, False))
         data.append(("ema_update_step_interval", 5, int, False))
         data.append(("dataloader_threads", 2, int, False))
+        data.append(("model_loading_threads", 1, int, False))
+        data.append(("model_loading_memory_budget", 0.0, float, False))
         data.append(("train_device", default_device.type, str, False))
         data.append(("temp_device", "cpu", str, False))
         data.append(("train_dtype", DataType.FLOAT_16, DataType, False))
@@ -1104,6 +1167,9 @@ class TrainConfig(BaseConfig):
         data.append(("sample_audio_format", AudioFormat.MP3, AudioFormat, False))
         data.append(("samples_to_tensorboard", True, bool, False))
         data.append(("non_ema_sampling", True, bool, False))
+        data.append(("merged_lora_sampling", False, bool, False))
+        data.append(("sampling_worker", False, bool, False))
+        data.append(("sampling_worker_device", "cpu", str, False))
 
         # backup settings
         data.append(("backup_after", 30, int, False))
@@ -1111,6 +1177,7 @@ class TrainConfig(BaseConfig):
         data.append(("rolling_backup", False, bool, False))
         data.append(("rolling_backup_count", 3, int, False))
         data.append(("backup_before_save", True, bool, False))
+        data.append(("deduplicate_backups", False, bool, False))
         data.append(("save_every", 0, int, False))
         data.append(("save_every_unit", TimeUnit.NEVER, TimeUnit, False))
         data.append(("save_skip_first", 0, int, False))
@@ -3,131 +3,11 @@ import importlib
 from collections.abc import Iterable
 
 from modules.dataLoader.BaseDataLoader import BaseDataLoader
-from modules.dataLoader.ChromaBaseDataLoader import ChromaBaseDataLoader
-from modules.dataLoader.FluxBaseDataLoader import FluxBaseDataLoader
-from modules.dataLoader.HiDreamBaseDataLoader import HiDreamBaseDataLoader
-from modules.dataLoader.HunyuanVideoBaseDataLoader import HunyuanVideoBaseDataLoader
-from modules.dataLoader.PixArtAlphaBaseDataLoader import PixArtAlphaBaseDataLoader
-from modules.dataLoader.QwenBaseDataLoader import QwenBaseDataLoader
-from modules.dataLoader.SanaBaseDataLoader import SanaBaseDataLoader
-from modules.dataLoader.StableDiffusion3BaseDataLoader import StableDiffusion3BaseDataLoader
-from modules.dataLoader.StableDiffusionBaseDataLoader import StableDiffusionBaseDataLoader
-from modules.dataLoader.StableDiffusionFineTuneVaeDataLoader import StableDiffusionFineTuneVaeDataLoader
-from modules.dataLoader.StableDiffusionXLBaseDataLoader import StableDiffusionXLBaseDataLoader
-from modules.dataLoader.WuerstchenBaseDataLoader import WuerstchenBaseDataLoader
 from modules.model.BaseModel import BaseModel
 from modules.modelLoader.BaseModelLoader import BaseModelLoader
-from modules.modelLoader.ChromaEmbeddingModelLoader import ChromaEmbeddingModelLoader
-from modules.modelLoader.ChromaFineTuneModelLoader import ChromaFineTuneModelLoader
-from modules.modelLoader.ChromaLoRAModelLoader import ChromaLoRAModelLoader
-from modules.modelLoader.FluxEmbeddingModelLoader import FluxEmbeddingModelLoader
-from modules.modelLoader.FluxFineTuneModelLoader import FluxFineTuneModelLoader
-from modules.modelLoader.FluxLoRAModelLoader import FluxLoRAModelLoader
-from modules.modelLoader.HiDreamEmbeddingModelLoader import HiDreamEmbeddingModelLoader
-from modules.modelLoader.HiDreamFineTuneModelLoader import HiDreamFineTuneModelLoader
-from modules.modelLoader.HiDreamLoRAModelLoader import HiDreamLoRAModelLoader
-from modules.modelLoader.HunyuanVideoEmbeddingModelLoader import HunyuanVideoEmbeddingModelLoader
-from modules.modelLoader.HunyuanVideoFineTuneModelLoader import HunyuanVideoFineTuneModelLoader
-from modules.modelLoader.HunyuanVideoLoRAModelLoader import HunyuanVideoLoRAModelLoader
-from modules.modelLoader.PixArtAlphaEmbeddingModelLoader import PixArtAlphaEmbeddingModelLoader
-from modules.modelLoader.PixArtAlphaFineTuneModelLoader import PixArtAlphaFineTuneModelLoader
-from modules.modelLoader.PixArtAlphaLoRAModelLoader import PixArtAlphaLoRAModelLoader
-from modules.modelLoader.QwenFineTuneModelLoader import QwenFineTuneModelLoader
-from modules.modelLoader.QwenLoRAModelLoader import QwenLoRAModelLoader
-from modules.modelLoader.SanaEmbeddingModelLoader import SanaEmbeddingModelLoader
-from modules.modelLoader.SanaFineTuneModelLoader import SanaFineTuneModelLoader
-from modules.modelLoader.SanaLoRAModelLoader import SanaLoRAModelLoader
-from modules.modelLoader.StableDiffusion3EmbeddingModelLoader import StableDiffusion3EmbeddingModelLoader
-from modules.modelLoader.StableDiffusion3FineTuneModelLoader import StableDiffusion3FineTuneModelLoader
-from modules.modelLoader.StableDiffusion3LoRAModelLoader import StableDiffusion3LoRAModelLoader
-from modules.modelLoader.StableDiffusionEmbeddingModelLoader import StableDiffusionEmbeddingModelLoader
-from modules.modelLoader.StableDiffusionFineTuneModelLoader import StableDiffusionFineTuneModelLoader
-from modules.modelLoader.StableDiffusionLoRAModelLoader import StableDiffusionLoRAModelLoader
-from modules.modelLoader.StableDiffusionXLEmbeddingModelLoader import StableDiffusionXLEmbeddingModelLoader
-from modules.modelLoader.StableDiffusionXLFineTuneModelLoader import StableDiffusionXLFineTuneModelLoader
-from modules.modelLoader.StableDiffusionXLLoRAModelLoader import StableDiffusionXLLoRAModelLoader
-from modules.modelLoader.WuerstchenEmbeddingModelLoader import WuerstchenEmbeddingModelLoader
-from modules.modelLoader.WuerstchenFineTuneModelLoader import WuerstchenFineTuneModelLoader
-from modules.modelLoader.WuerstchenLoRAModelLoader import WuerstchenLoRAModelLoader
 from modules.modelSampler import BaseModelSampler
-from modules.modelSampler.ChromaSampler import ChromaSampler
-from modules.modelSampler.FluxSampler import FluxSampler
-from modules.modelSampler.HiDreamSampler import HiDreamSampler
-from modules.modelSampler.HunyuanVideoSampler import HunyuanVideoSampler
-from modules.modelSampler.PixArtAlphaSampler import PixArtAlphaSampler
-from modules.modelSampler.QwenSampler import QwenSampler
-from modules.modelSampler.SanaSampler import SanaSampler
-from modules.modelSampler.StableDiffusion3Sampler import StableDiffusion3Sampler
-from modules.modelSampler.StableDiffusionSampler import StableDiffusionSampler
-from modules.modelSampler.StableDiffusionVaeSampler import StableDiffusionVaeSampler
-from modules.modelSampler.StableDiffusionXLSampler import StableDiffusionXLSampler
-from modules.modelSampler.WuerstchenSampler import WuerstchenSampler
 from modules.modelSaver.BaseModelSaver import BaseModelSaver
-from modules.modelSaver.ChromaEmbeddingModelSaver import ChromaEmbeddingModelSaver
-from modules.modelSaver.ChromaFineTuneModelSaver import ChromaFineTuneModelSaver
-from modules.modelSaver.ChromaLoRAModelSaver import ChromaLoRAModelSaver
-from modules.modelSaver.FluxEmbeddingModelSaver import FluxEmbeddingModelSaver
-from modules.modelSaver.FluxFineTuneModelSaver import FluxFineTuneModelSaver
-from modules.modelSaver.FluxLoRAModelSaver import FluxLoRAModelSaver
-from modules.modelSaver.HiDreamEmbeddingModelSaver import HiDreamEmbeddingModelSaver
-from modules.modelSaver.HiDreamLoRAModelSaver import HiDreamLoRAModelSaver
-from modules.modelSaver.HunyuanVideoEmbeddingModelSaver import HunyuanVideoEmbeddingModelSaver
-from modules.modelSaver.HunyuanVideoFineTuneModelSaver import HunyuanVideoFineTuneModelSaver
-from modules.modelSaver.HunyuanVideoLoRAModelSaver import HunyuanVideoLoRAModelSaver
-from modules.modelSaver.PixArtAlphaEmbeddingModelSaver import PixArtAlphaEmbeddingModelSaver
-from modules.modelSaver.PixArtAlphaFineTuneModelSaver import PixArtAlphaFineTuneModelSaver
-from modules.modelSaver.PixArtAlphaLoRAModelSaver import PixArtAlphaLoRAModelSaver
-from modules.modelSaver.QwenFineTuneModelSaver import QwenFineTuneModelSaver
-from modules.modelSaver.QwenLoRAModelSaver import QwenLoRAModelSaver
-from modules.modelSaver.SanaEmbeddingModelSaver import SanaEmbeddingModelSaver
-from modules.modelSaver.SanaFineTuneModelSaver import SanaFineTuneModelSaver
-from modules.modelSaver.SanaLoRAModelSaver import SanaLoRAModelSaver
-from modules.modelSaver.StableDiffusion3EmbeddingModelSaver import StableDiffusion3EmbeddingModelSaver
-from modules.modelSaver.StableDiffusion3FineTuneModelSaver import StableDiffusion3FineTuneModelSaver
-from modules.modelSaver.StableDiffusion3LoRAModelSaver import StableDiffusion3LoRAModelSaver
-from modules.modelSaver.StableDiffusionEmbeddingModelSaver import StableDiffusionEmbeddingModelSaver
-from modules.modelSaver.StableDiffusionFineTuneModelSaver import StableDiffusionFineTuneModelSaver
-from modules.modelSaver.StableDiffusionLoRAModelSaver import StableDiffusionLoRAModelSaver
-from modules.modelSaver.StableDiffusionXLEmbeddingModelSaver import StableDiffusionXLEmbeddingModelSaver
-from modules.modelSaver.StableDiffusionXLFineTuneModelSaver import StableDiffusionXLFineTuneModelSaver
-from modules.modelSaver.StableDiffusionXLLoRAModelSaver import StableDiffusionXLLoRAModelSaver
-from modules.modelSaver.WuerstchenEmbeddingModelSaver import WuerstchenEmbeddingModelSaver
-from modules.modelSaver.WuerstchenFineTuneModelSaver import WuerstchenFineTuneModelSaver
-from modules.modelSaver.WuerstchenLoRAModelSaver import WuerstchenLoRAModelSaver
 from modules.modelSetup.BaseModelSetup import BaseModelSetup
-from modules.modelSetup.ChromaEmbeddingSetup import ChromaEmbeddingSetup
-from modules.modelSetup.ChromaFineTuneSetup import ChromaFineTuneSetup
-from modules.modelSetup.ChromaLoRASetup import ChromaLoRASetup
-from modules.modelSetup.FluxEmbeddingSetup import FluxEmbeddingSetup
-from modules.modelSetup.FluxFineTuneSetup import FluxFineTuneSetup
-from modules.modelSetup.FluxLoRASetup import FluxLoRASetup
-from modules.modelSetup.HiDreamEmbeddingSetup import HiDreamEmbeddingSetup
-from modules.modelSetup.HiDreamFineTuneSetup import HiDreamFineTuneSetup
-from modules.modelSetup.HiDreamLoRASetup import HiDreamLoRASetup
-from modules.modelSetup.HunyuanVideoEmbeddingSetup import HunyuanVideoEmbeddingSetup
-from modules.modelSetup.HunyuanVideoFineTuneSetup import HunyuanVideoFineTuneSetup
-from modules.modelSetup.HunyuanVideoLoRASetup import HunyuanVideoLoRASetup
-from modules.modelSetup.PixArtAlphaEmbeddingSetup import PixArtAlphaEmbeddingSetup
-from modules.modelSetup.PixArtAlphaFineTuneSetup import PixArtAlphaFineTuneSetup
-from modules.modelSetup.PixArtAlphaLoRASetup import PixArtAlphaLoRASetup
-from modules.modelSetup.QwenFineTuneSetup import QwenFineTuneSetup
-from modules.modelSetup.QwenLoRASetup import QwenLoRASetup
-from modules.modelSetup.SanaEmbeddingSetup import SanaEmbeddingSetup
-from modules.modelSetup.SanaFineTuneSetup import SanaFineTuneSetup
-from modules.modelSetup.SanaLoRASetup import SanaLoRASetup
-from modules.modelSetup.StableDiffusion3EmbeddingSetup import StableDiffusion3EmbeddingSetup
-from modules.modelSetup.StableDiffusion3FineTuneSetup import StableDiffusion3FineTuneSetup
-from modules.modelSetup.StableDiffusion3LoRASetup import StableDiffusion3LoRASetup
-from modules.modelSetup.StableDiffusionEmbeddingSetup import StableDiffusionEmbeddingSetup
-from modules.modelSetup.StableDiffusionFineTuneSetup import StableDiffusionFineTuneSetup
-from modules.modelSetup.StableDiffusionFineTuneVaeSetup import StableDiffusionFineTuneVaeSetup
-from modules.modelSetup.StableDiffusionLoRASetup import StableDiffusionLoRASetup
-from modules.modelSetup.StableDiffusionXLEmbeddingSetup import StableDiffusionXLEmbeddingSetup
-from modules.modelSetup.StableDiffusionXLFineTuneSetup import StableDiffusionXLFineTuneSetup
-from modules.modelSetup.StableDiffusionXLLoRASetup import StableDiffusionXLLoRASetup
-from modules.modelSetup.WuerstchenEmbeddingSetup import WuerstchenEmbeddingSetup
-from modules.modelSetup.WuerstchenFineTuneSetup import WuerstchenFineTuneSetup
-from modules.modelSetup.WuerstchenLoRASetup import WuerstchenLoRASetup
 from modules.module.EMAModule import EMAModuleWrapper
 from modules.util.callbacks.TrainCallbacks import TrainCallbacks
 from modules.util.commands.TrainCommands import TrainCommands
@@ -167,161 +47,236 @@ from diffusers import (
     UniPCMultistepScheduler,
 )
 
+# model families, used as keys of the registries below
+_MODEL_FAMILIES = [
+    ("STABLE_DIFFUSION", ModelType.is_stable_diffusion),
+    ("STABLE_DIFFUSION_XL", ModelType.is_stable_diffusion_xl),
+    ("WUERSTCHEN", ModelType.is_wuerstchen),
+    ("PIXART", ModelType.is_pixart),
+    ("STABLE_DIFFUSION_3", ModelType.is_stable_diffusion_3),
+    ("FLUX", ModelType.is_flux),
+    ("CHROMA", ModelType.is_chroma),
+    ("QWEN", ModelType.is_qwen),
+    ("SANA", ModelType.is_sana),
+    ("HUNYUAN_VIDEO", ModelType.is_hunyuan_video),
+    ("HI_DREAM", ModelType.is_hi_dream),
+]
+
+# the registries map a training method and model family to the module of the implementing class. the class has the
+# same name as its module. modules are only imported when they are needed, to avoid importing every model.
+_MODEL_LOADERS = {
+    TrainingMethod.FINE_TUNE: {
+        "STABLE_DIFFUSION": "modules.modelLoader.StableDiffusionFineTuneModelLoader",
+        "STABLE_DIFFUSION_XL": "modules.modelLoader.StableDiffusionXLFineTuneModelLoader",
+        "WUERSTCHEN": "modules.modelLoader.WuerstchenFineTuneModelLoader",
+        "PIXART": "modules.modelLoader.PixArtAlphaFineTuneModelLoader",
+        "STABLE_DIFFUSION_3": "modules.modelLoader.StableDiffusion3FineTuneModelLoader",
+        "FLUX": "modules.modelLoader.FluxFineTuneModelLoader",
+        "CHROMA": "modules.modelLoader.ChromaFineTuneModelLoader",
+        "QWEN": "modules.modelLoader.QwenFineTuneModelLoader",
+        "SANA": "modules.modelLoader.SanaFineTuneModelLoader",
+        "HUNYUAN_VIDEO": "modules.modelLoader.HunyuanVideoFineTuneModelLoader",
+        "HI_DREAM": "modules.modelLoader.HiDreamFineTuneModelLoader",
+    },
+    TrainingMethod.FINE_TUNE_VAE: {
+        "STABLE_DIFFUSION": "modules.modelLoader.StableDiffusionFineTuneModelLoader",
+    },
+    TrainingMethod.LORA: {
+        "STABLE_DIFFUSION": "modules.modelLoader.StableDiffusionLoRAModelLoader",
+        "STABLE_DIFFUSION_XL": "modules.modelLoader.StableDiffusionXLLoRAModelLoader",
+        "WUERSTCHEN": "modules.modelLoader.WuerstchenLoRAModelLoader",
+        "PIXART": "modules.modelLoader.PixArtAlphaLoRAModelLoader",
+        "STABLE_DIFFUSION_3": "modules.modelLoader.StableDiffusion3LoRAModelLoader",
+        "FLUX": "modules.modelLoader.FluxLoRAModelLoader",
+        "CHROMA": "modules.modelLoader.ChromaLoRAModelLoader",
+        "QWEN": "modules.modelLoader.QwenLoRAModelLoader",
+        "SANA": "modules.modelLoader.SanaLoRAModelLoader",
+        "HUNYUAN_VIDEO": "modules.modelLoader.HunyuanVideoLoRAModelLoader",
+        "HI_DREAM": "modules.modelLoader.HiDreamLoRAModelLoader",
+    },
+    TrainingMethod.EMBEDDING: {
+        "STABLE_DIFFUSION": "modules.modelLoader.StableDiffusionEmbeddingModelLoader",
+        "STABLE_DIFFUSION_XL": "modules.modelLoader.StableDiffusionXLEmbeddingModelLoader",
+        "WUERSTCHEN": "modules.modelLoader.WuerstchenEmbeddingModelLoader",
+        "PIXART": "modules.modelLoader.PixArtAlphaEmbeddingModelLoader",
+        "STABLE_DIFFUSION_3": "modules.modelLoader.StableDiffusion3EmbeddingModelLoader",
+        "FLUX": "modules.modelLoader.FluxEmbeddingModelLoader",
+        "CHROMA": "modules.modelLoader.ChromaEmbeddingModelLoader",
+        "SANA": "modules.modelLoader.SanaEmbeddingModelLoader",
+        "HUNYUAN_VIDEO": "modules.modelLoader.HunyuanVideoEmbeddingModelLoader",
+        "HI_DREAM": "modules.modelLoader.HiDreamEmbeddingModelLoader",
+    },
+}
+
+_MODEL_SAVERS = {
+    TrainingMethod.FINE_TUNE: {
+        "STABLE_DIFFUSION": "modules.modelSaver.StableDiffusionFineTuneModelSaver",
+        "STABLE_DIFFUSION_XL": "modules.modelSaver.StableDiffusionXLFineTuneModelSaver",
+        "WUERSTCHEN": "modules.modelSaver.WuerstchenFineTuneModelSaver",
+        "PIXART": "modules.modelSaver.PixArtAlphaFineTuneModelSaver",
+        "STABLE_DIFFUSION_3": "modules.modelSaver.StableDiffusion3FineTuneModelSaver",
+        "FLUX": "modules.modelSaver.FluxFineTuneModelSaver",
+        "CHROMA": "modules.modelSaver.ChromaFineTuneModelSaver",
+        "QWEN": "modules.modelSaver.QwenFineTuneModelSaver",
+        "SANA": "modules.modelSaver.SanaFineTuneModelSaver",
+        "HUNYUAN_VIDEO": "modules.modelSaver.HunyuanVideoFineTuneModelSaver",
+    },
+    TrainingMethod.FINE_TUNE_VAE: {
+        "STABLE_DIFFUSION": "modules.modelSaver.StableDiffusionFineTuneModelSaver",
+    },
+    TrainingMethod.LORA: {
+        "STABLE_DIFFUSION": "modules.modelSaver.StableDiffusionLoRAModelSaver",
+        "STABLE_DIFFUSION_XL": "modules.modelSaver.StableDiffusionXLLoRAModelSaver",
+        "WUERSTCHEN": "modules.modelSaver.WuerstchenLoRAModelSaver",
+        "PIXART": "modules.modelSaver.PixArtAlphaLoRAModelSaver",
+        "STABLE_DIFFUSION_3": "modules.modelSaver.StableDiffusion3LoRAModelSaver",
+        "FLUX": "modules.modelSaver.FluxLoRAModelSaver",
+        "CHROMA": "modules.modelSaver.ChromaLoRAModelSaver",
+        "QWEN": "modules.modelSaver.QwenLoRAModelSaver",
+        "SANA": "modules.modelSaver.SanaLoRAModelSaver",
+        "HUNYUAN_VIDEO": "modules.modelSaver.HunyuanVideoLoRAModelSaver",
+        "HI_DREAM": "modules.modelSaver.HiDreamLoRAModelSaver",
+    },
+    TrainingMethod.EMBEDDING: {
+        "STABLE_DIFFUSION": "modules.modelSaver.StableDiffusionEmbeddingModelSaver",
+        "STABLE_DIFFUSION_XL": "modules.modelSaver.StableDiffusionXLEmbeddingModelSaver",
+        "WUERSTCHEN": "modules.modelSaver.WuerstchenEmbeddingModelSaver",
+        "PIXART": "modules.modelSaver.PixArtAlphaEmbeddingModelSaver",
+        "STABLE_DIFFUSION_3": "modules.modelSaver.StableDiffusion3EmbeddingModelSaver",
+        "FLUX": "modules.modelSaver.FluxEmbeddingModelSaver",
+        "CHROMA": "modules.modelSaver.ChromaEmbeddingModelSaver",
+        "SANA": "modules.modelSaver.SanaEmbeddingModelSaver",
+        "HUNYUAN_VIDEO": "modules.modelSaver.HunyuanVideoEmbeddingModelSaver",
+        "HI_DREAM": "modules.modelSaver.HiDreamEmbeddingModelSaver",
+    },
+}
+
+_MODEL_SETUPS = {
+    TrainingMethod.FINE_TUNE: {
+        "STABLE_DIFFUSION": "modules.modelSetup.StableDiffusionFineTuneSetup",
+        "STABLE_DIFFUSION_XL": "modules.modelSetup.StableDiffusionXLFineTuneSetup",
+        "WUERSTCHEN": "modules.modelSetup.WuerstchenFineTuneSetup",
+        "PIXART": "modules.modelSetup.PixArtAlphaFineTuneSetup",
+        "STABLE_DIFFUSION_3": "modules.modelSetup.StableDiffusion3FineTuneSetup",
+        "FLUX": "modules.modelSetup.FluxFineTuneSetup",
+        "CHROMA": "modules.modelSetup.ChromaFineTuneSetup",
+        "QWEN": "modules.modelSetup.QwenFineTuneSetup",
+        "SANA": "modules.modelSetup.SanaFineTuneSetup",
+        "HUNYUAN_VIDEO": "modules.modelSetup.HunyuanVideoFineTuneSetup",
+        "HI_DREAM": "modules.modelSetup.HiDreamFineTuneSetup",
+    },
+    TrainingMethod.FINE_TUNE_VAE: {
+        "STABLE_DIFFUSION": "modules.modelSetup.StableDiffusionFineTuneVaeSetup",
+    },
+    TrainingMethod.LORA: {
+        "STABLE_DIFFUSION": "modules.modelSetup.StableDiffusionLoRASetup",
+        "STABLE_DIFFUSION_XL": "modules.modelSetup.StableDiffusionXLLoRASetup",
+        "WUERSTCHEN": "modules.modelSetup.WuerstchenLoRASetup",
+        "PIXART": "modules.modelSetup.PixArtAlphaLoRASetup",
+        "STABLE_DIFFUSION_3": "modules.modelSetup.StableDiffusion3LoRASetup",
+        "FLUX": "modules.modelSetup.FluxLoRASetup",
+        "CHROMA": "modules.modelSetup.ChromaLoRASetup",
+        "QWEN": "modules.modelSetup.QwenLoRASetup",
+        "SANA": "modules.modelSetup.SanaLoRASetup",
+        "HUNYUAN_VIDEO": "modules.modelSetup.HunyuanVideoLoRASetup",
+        "HI_DREAM": "modules.modelSetup.HiDreamLoRASetup",
+    },
+    TrainingMethod.EMBEDDING: {
+        "STABLE_DIFFUSION": "modules.modelSetup.StableDiffusionEmbeddingSetup",
+        "STABLE_DIFFUSION_XL": "modules.modelSetup.StableDiffusionXLEmbeddingSetup",
+        "WUERSTCHEN": "modules.modelSetup.WuerstchenEmbeddingSetup",
+        "PIXART": "modules.modelSetup.PixArtAlphaEmbeddingSetup",
+        "STABLE_DIFFUSION_3": "modules.modelSetup.StableDiffusion3EmbeddingSetup",
+        "FLUX": "modules.modelSetup.FluxEmbeddingSetup",
+        "CHROMA": "modules.modelSetup.ChromaEmbeddingSetup",
+        "SANA": "modules.modelSetup.SanaEmbeddingSetup",
+        "HUNYUAN_VIDEO": "modules.modelSetup.HunyuanVideoEmbeddingSetup",
+        "HI_DREAM": "modules.modelSetup.HiDreamEmbeddingSetup",
+    },
+}
+
+# samplers and data loaders don't depend on the training method, except for the VAE fine tune
+_BASE_MODEL_SAMPLERS = {
+    "STABLE_DIFFUSION": "modules.modelSampler.StableDiffusionSampler",
+    "STABLE_DIFFUSION_XL": "modules.modelSampler.StableDiffusionXLSampler",
+    "WUERSTCHEN": "modules.modelSampler.WuerstchenSampler",
+    "PIXART": "modules.modelSampler.PixArtAlphaSampler",
+    "STABLE_DIFFUSION_3": "modules.modelSampler.StableDiffusion3Sampler",
+    "FLUX": "modules.modelSampler.FluxSampler",
+    "CHROMA": "modules.modelSampler.ChromaSampler",
+    "QWEN": "modules.modelSampler.QwenSampler",
+    "SANA": "modules.modelSampler.SanaSampler",
+    "HUNYUAN_VIDEO": "modules.modelSampler.HunyuanVideoSampler",
+    "HI_DREAM": "modules.modelSampler.HiDreamSampler",
+}
+
+_MODEL_SAMPLERS = {
+    TrainingMethod.FINE_TUNE: _BASE_MODEL_SAMPLERS,
+    TrainingMethod.FINE_TUNE_VAE: {
+        "STABLE_DIFFUSION": "modules.modelSampler.StableDiffusionVaeSampler",
+    },
+    TrainingMethod.LORA: _BASE_MODEL_SAMPLERS,
+    TrainingMethod.EMBEDDING: _BASE_MODEL_SAMPLERS,
+}
+
+_BASE_DATA_LOADERS = {
+    "STABLE_DIFFUSION": "modules.dataLoader.StableDiffusionBaseDataLoader",
+    "STABLE_DIFFUSION_XL": "modules.dataLoader.StableDiffusionXLBaseDataLoader",
+    "WUERSTCHEN": "modules.dataLoader.WuerstchenBaseDataLoader",
+    "PIXART": "modules.dataLoader.PixArtAlphaBaseDataLoader",
+    "STABLE_DIFFUSION_3": "modules.dataLoader.StableDiffusion3BaseDataLoader",
+    "FLUX": "modules.dataLoader.FluxBaseDataLoader",
+    "CHROMA": "modules.dataLoader.ChromaBaseDataLoader",
+    "QWEN": "modules.dataLoader.QwenBaseDataLoader",
+    "SANA": "modules.dataLoader.SanaBaseDataLoader",
+    "HUNYUAN_VIDEO": "modules.dataLoader.HunyuanVideoBaseDataLoader",
+    "HI_DREAM": "modules.dataLoader.HiDreamBaseDataLoader",
+}
+
+_DATA_LOADERS = {
+    TrainingMethod.FINE_TUNE: _BASE_DATA_LOADERS,
+    TrainingMethod.FINE_TUNE_VAE: {
+        "STABLE_DIFFUSION": "modules.dataLoader.StableDiffusionFineTuneVaeDataLoader",
+    },
+    TrainingMethod.LORA: _BASE_DATA_LOADERS,
+    TrainingMethod.EMBEDDING: _BASE_DATA_LOADERS,
+}
+
+
+def _model_family(model_type: ModelType) -> str | None:
+    for family, is_family in _MODEL_FAMILIES:
+        if is_family(model_type):
+            return family
+    return None
+
+
+def _import_registered_class(
+        registry: dict[TrainingMethod, dict[str, str]],
+        model_type: ModelType,
+        training_method: TrainingMethod,
+) -> type | None:
+    module_name = registry.get(training_method, {}).get(_model_family(model_type))
+    if module_name is None:
+        return None
+
+    module = importlib.import_module(module_name)
+    return getattr(module, module_name.split(".")[-1])
+
 
 def create_model_loader(
         model_type: ModelType,
         training_method: TrainingMethod = TrainingMethod.FINE_TUNE,
 ) -> BaseModelLoader | None:
-    match training_method: #TODO simplify
-        case TrainingMethod.FINE_TUNE:
-            if model_type.is_stable_diffusion():
-                return StableDiffusionFineTuneModelLoader()
-            if model_type.is_stable_diffusion_xl():
-                return StableDiffusionXLFineTuneModelLoader()
-            if model_type.is_wuerstchen():
-                return WuerstchenFineTuneModelLoader()
-            if model_type.is_pixart():
-                return PixArtAlphaFineTuneModelLoader()
-            if model_type.is_stable_diffusion_3():
-                return StableDiffusion3FineTuneModelLoader()
-            if model_type.is_flux():
-                return FluxFineTuneModelLoader()
-            if model_type.is_chroma():
-                return ChromaFineTuneModelLoader()
-            if model_type.is_qwen():
-                return QwenFineTuneModelLoader()
-            if model_type.is_sana():
-                return SanaFineTuneModelLoader()
-            if model_type.is_hunyuan_video():
-                return HunyuanVideoFineTuneModelLoader()
-            if model_type.is_hi_dream():
-                return HiDreamFineTuneModelLoader()
-        case TrainingMethod.FINE_TUNE_VAE:
-            if model_type.is_stable_diffusion():
-                return StableDiffusionFineTuneModelLoader()
-        case TrainingMethod.LORA:
-            if model_type.is_stable_diffusion():
-                return StableDiffusionLoRAModelLoader()
-            if model_type.is_stable_diffusion_xl():
-                return StableDiffusionXLLoRAModelLoader()
-            if model_type.is_wuerstchen():
-                return WuerstchenLoRAModelLoader()
-            if model_type.is_pixart():
-                return PixArtAlphaLoRAModelLoader()
-            if model_type.is_stable_diffusion_3():
-                return StableDiffusion3LoRAModelLoader()
-            if model_type.is_flux():
-                return FluxLoRAModelLoader()
-            if model_type.is_chroma():
-                return ChromaLoRAModelLoader()
-            if model_type.is_qwen():
-                return QwenLoRAModelLoader()
-            if model_type.is_sana():
-                return SanaLoRAModelLoader()
-            if model_type.is_hunyuan_video():
-                return HunyuanVideoLoRAModelLoader()
-            if model_type.is_hi_dream():
-                return HiDreamLoRAModelLoader()
-        case TrainingMethod.EMBEDDING:
-            if model_type.is_stable_diffusion():
-                return StableDiffusionEmbeddingModelLoader()
-            if model_type.is_stable_diffusion_xl():
-                return StableDiffusionXLEmbeddingModelLoader()
-            if model_type.is_wuerstchen():
-                return WuerstchenEmbeddingModelLoader()
-            if model_type.is_pixart():
-                return PixArtAlphaEmbeddingModelLoader()
-            if model_type.is_stable_diffusion_3():
-                return StableDiffusion3EmbeddingModelLoader()
-            if model_type.is_flux():
-                return FluxEmbeddingModelLoader()
-            if model_type.is_chroma():
-                return ChromaEmbeddingModelLoader()
-            if model_type.is_sana():
-                return SanaEmbeddingModelLoader()
-            if model_type.is_hunyuan_video():
-                return HunyuanVideoEmbeddingModelLoader()
-            if model_type.is_hi_dream():
-                return HiDreamEmbeddingModelLoader()
-
-    return None
+    model_loader_class = _import_registered_class(_MODEL_LOADERS, model_type, training_method)
+    return model_loader_class() if model_loader_class is not None else None
 
 
 def create_model_saver(
         model_type: ModelType,
         training_method: TrainingMethod = TrainingMethod.FINE_TUNE,
 ) -> BaseModelSaver | None:
-    match training_method:
-        case TrainingMethod.FINE_TUNE:
-            if model_type.is_stable_diffusion():
-                return StableDiffusionFineTuneModelSaver()
-            if model_type.is_stable_diffusion_xl():
-                return StableDiffusionXLFineTuneModelSaver()
-            if model_type.is_wuerstchen():
-                return WuerstchenFineTuneModelSaver()
-            if model_type.is_pixart():
-                return PixArtAlphaFineTuneModelSaver()
-            if model_type.is_stable_diffusion_3():
-                return StableDiffusion3FineTuneModelSaver()
-            if model_type.is_flux():
-                return FluxFineTuneModelSaver()
-            if model_type.is_chroma():
-                return ChromaFineTuneModelSaver()
-            if model_type.is_qwen():
-                return QwenFineTuneModelSaver()
-            if model_type.is_sana():
-                return SanaFineTuneModelSaver()
-            if model_type.is_hunyuan_video():
-                return HunyuanVideoFineTuneModelSaver()
-        case TrainingMethod.FINE_TUNE_VAE:
-            if model_type.is_stable_diffusion():
-                return StableDiffusionFineTuneModelSaver()
-        case TrainingMethod.LORA:
-            if model_type.is_stable_diffusion():
-                return StableDiffusionLoRAModelSaver()
-            if model_type.is_stable_diffusion_xl():
-                return StableDiffusionXLLoRAModelSaver()
-            if model_type.is_wuerstchen():
-                return WuerstchenLoRAModelSaver()
-            if model_type.is_pixart():
-                return PixArtAlphaLoRAModelSaver()
-            if model_type.is_stable_diffusion_3():
-                return StableDiffusion3LoRAModelSaver()
-            if model_type.is_flux():
-                return FluxLoRAModelSaver()
-            if model_type.is_chroma():
-                return ChromaLoRAModelSaver()
-            if model_type.is_qwen():
-                return QwenLoRAModelSaver()
-            if model_type.is_sana():
-                return SanaLoRAModelSaver()
-            if model_type.is_hunyuan_video():
-                return HunyuanVideoLoRAModelSaver()
-            if model_type.is_hi_dream():
-                return HiDreamLoRAModelSaver()
-        case TrainingMethod.EMBEDDING:
-            if model_type.is_stable_diffusion():
-                return StableDiffusionEmbeddingModelSaver()
-            if model_type.is_stable_diffusion_xl():
-                return StableDiffusionXLEmbeddingModelSaver()
-            if model_type.is_wuerstchen():
-                return WuerstchenEmbeddingModelSaver()
-            if model_type.is_pixart():
-                return PixArtAlphaEmbeddingModelSaver()
-            if model_type.is_stable_diffusion_3():
-                return StableDiffusion3EmbeddingModelSaver()
-            if model_type.is_flux():
-                return FluxEmbeddingModelSaver()
-            if model_type.is_chroma():
-                return ChromaEmbeddingModelSaver()
-            if model_type.is_sana():
-                return SanaEmbeddingModelSaver()
-            if model_type.is_hunyuan_video():
-                return HunyuanVideoEmbeddingModelSaver()
-            if model_type.is_hi_dream():
-                return HiDreamEmbeddingModelSaver()
-
-    return None
+    model_saver_class = _import_registered_class(_MODEL_SAVERS, model_type, training_method)
+    return model_saver_class() if model_saver_class is not None else None
 
 
 def create_model_setup(
@@ -331,79 +286,8 @@ def create_model_setup(
         training_method: TrainingMethod = TrainingMethod.FINE_TUNE,
         debug_mode: bool = False,
 ) -> BaseModelSetup | None:
-    match training_method:
-        case TrainingMethod.FINE_TUNE:
-            if model_type.is_stable_diffusion():
-                return StableDiffusionFineTuneSetup(train_device, temp_device, debug_mode)
-            if model_type.is_stable_diffusion_xl():
-                return StableDiffusionXLFineTuneSetup(train_device, temp_device, debug_mode)
-            if model_type.is_wuerstchen():
-                return WuerstchenFineTuneSetup(train_device, temp_device, debug_mode)
-            if model_type.is_pixart():
-                return PixArtAlphaFineTuneSetup(train_device, temp_device, debug_mode)
-            if model_type.is_stable_diffusion_3():
-                return StableDiffusion3FineTuneSetup(train_device, temp_device, debug_mode)
-            if model_type.is_flux():
-                return FluxFineTuneSetup(train_device, temp_device, debug_mode)
-            if model_type.is_chroma():
-                return ChromaFineTuneSetup(train_device, temp_device, debug_mode)
-            if model_type.is_qwen():
-                return QwenFineTuneSetup(train_device, temp_device, debug_mode)
-            if model_type.is_sana():
-                return SanaFineTuneSetup(train_device, temp_device, debug_mode)
-            if model_type.is_hunyuan_video():
-                return HunyuanVideoFineTuneSetup(train_device, temp_device, debug_mode)
-            if model_type.is_hi_dream():
-                return HiDreamFineTuneSetup(train_device, temp_device, debug_mode)
-        case TrainingMethod.FINE_TUNE_VAE:
-            if model_type.is_stable_diffusion():
-                return StableDiffusionFineTuneVaeSetup(train_device, temp_device, debug_mode)
-        case TrainingMethod.LORA:
-            if model_type.is_stable_diffusion():
-                return StableDiffusionLoRASetup(train_device, temp_device, debug_mode)
-            if model_type.is_stable_diffusion_xl():
-                return StableDiffusionXLLoRASetup(train_device, temp_device, debug_mode)
-            if model_type.is_wuerstchen():
-                return WuerstchenLoRASetup(train_device, temp_device, debug_mode)
-            if model_type.is_pixart():
-                return PixArtAlphaLoRASetup(train_device, temp_device, debug_mode)
-            if model_type.is_stable_diffusion_3():
-                return StableDiffusion3LoRASetup(train_device, temp_device, debug_mode)
-            if model_type.is_flux():
-                return FluxLoRASetup(train_device, temp_device, debug_mode)
-            if model_type.is_chroma():
-                return ChromaLoRASetup(train_device, temp_device, debug_mode)
-            if model_type.is_qwen():
-                return QwenLoRASetup(train_device, temp_device, debug_mode)
-            if model_type.is_sana():
-                return SanaLoRASetup(train_device, temp_device, debug_mode)
-            if model_type.is_hunyuan_video():
-                return HunyuanVideoLoRASetup(train_device, temp_device, debug_mode)
-            if model_type.is_hi_dream():
-                return HiDreamLoRASetup(train_device, temp_device, debug_mode)
-        case TrainingMethod.EMBEDDING:
-            if model_type.is_stable_diffusion():
-                return StableDiffusionEmbeddingSetup(train_device, temp_device, debug_mode)
-            if model_type.is_stable_diffusion_xl():
-                return StableDiffusionXLEmbeddingSetup(train_device, temp_device, debug_mode)
-            if model_type.is_wuerstchen():
-                return WuerstchenEmbeddingSetup(train_device, temp_device, debug_mode)
-            if model_type.is_pixart():
-                return PixArtAlphaEmbeddingSetup(train_device, temp_device, debug_mode)
-            if model_type.is_stable_diffusion_3():
-                return StableDiffusion3EmbeddingSetup(train_device, temp_device, debug_mode)
-            if model_type.is_flux():
-                return FluxEmbeddingSetup(train_device, temp_device, debug_mode)
-            if model_type.is_chroma():
-                return ChromaEmbeddingSetup(train_device, temp_device, debug_mode)
-            if model_type.is_sana():
-                return SanaEmbeddingSetup(train_device, temp_device, debug_mode)
-            if model_type.is_hunyuan_video():
-                return HunyuanVideoEmbeddingSetup(train_device, temp_device, debug_mode)
-            if model_type.is_hi_dream():
-                return HiDreamEmbeddingSetup(train_device, temp_device, debug_mode)
-
-    return None
+    model_setup_class = _import_registered_class(_MODEL_SETUPS, model_type, training_method)
+    return model_setup_class(train_device, temp_device, debug_mode) if model_setup_class is not None else None
 
 
 def create_model_sampler(
@@ -413,35 +297,8 @@ def create_model_sampler(
         model_type: ModelType,
         training_method: TrainingMethod = TrainingMethod.FINE_TUNE,
 ) -> BaseModelSampler:
-    match training_method:
-        case TrainingMethod.FINE_TUNE | TrainingMethod.LORA | TrainingMethod.EMBEDDING:
-            if model_type.is_stable_diffusion():
-                return StableDiffusionSampler(train_device, temp_device, model, model_type)
-            if model_type.is_stable_diffusion_xl():
-                return StableDiffusionXLSampler(train_device, temp_device, model, model_type)
-            if model_type.is_wuerstchen():
-                return WuerstchenSampler(train_device, temp_device, model, model_type)
-            if model_type.is_pixart():
-                return PixArtAlphaSampler(train_device, temp_device, model, model_type)
-            if model_type.is_stable_diffusion_3():
-                return StableDiffusion3Sampler(train_device, temp_device, model, model_type)
-            if model_type.is_flux():
-                return FluxSampler(train_device, temp_device, model, model_type)
-            if model_type.is_chroma():
-                return ChromaSampler(train_device, temp_device, model, model_type)
-            if model_type.is_qwen():
-                return QwenSampler(train_device, temp_device, model, model_type)
-            if model_type.is_sana():
-                return SanaSampler(train_device, temp_device, model, model_type)
-            if model_type.is_hunyuan_video():
-                return HunyuanVideoSampler(train_device, temp_device, model, model_type)
-            if model_type.is_hi_dream():
-                return HiDreamSampler(train_device, temp_device, model, model_type)
-        case TrainingMethod.FINE_TUNE_VAE:
-            if model_type.is_stable_diffusion():
-                return StableDiffusionVaeSampler(train_device, temp_device, model, model_type)
-
-    return None
+    model_sampler_class = _import_registered_class(_MODEL_SAMPLERS, model_type, training_method)
+    return model_sampler_class(train_device, temp_device, model, model_type) if model_sampler_class is not None else None
 
 
 def create_data_loader(
@@ -460,35 +317,11 @@ def create_data_loader(
     if train_progress is None:
         train_progress = TrainProgress()
 
-    match training_method:
-        case TrainingMethod.FINE_TUNE | TrainingMethod.LORA | TrainingMethod.EMBEDDING:
-            if model_type.is_stable_diffusion():
-                return StableDiffusionBaseDataLoader(train_device, temp_device, config, model, train_progress, is_validation)
-            if model_type.is_stable_diffusion_xl():
-                return StableDiffusionXLBaseDataLoader(train_device, temp_device, config, model, train_progress, is_validation)
-            if model_type.is_wuerstchen():
-                return WuerstchenBaseDataLoader(train_device, temp_device, config, model, train_progress, is_validation)
-            if model_type.is_pixart():
-                return PixArtAlphaBaseDataLoader(train_device, temp_device, config, model, train_progress, is_validation)
-            if model_type.is_stable_diffusion_3():
-                return StableDiffusion3BaseDataLoader(train_device, temp_device, config, model, train_progress, is_validation)
-            if model_type.is_flux():
-                return FluxBaseDataLoader(train_device, temp_device, config, model, train_progress, is_validation)
-            if model_type.is_chroma():
-                return ChromaBaseDataLoader(train_device, temp_device, config, model, train_progress, is_validation)
-            if model_type.is_qwen():
-                return QwenBaseDataLoader(train_device, temp_device, config, model, train_progress, is_validation)
-            if model_type.is_sana():
-                return SanaBaseDataLoader(train_device, temp_device, config, model, train_progress, is_validation)
-            if model_type.is_hunyuan_video():
-                return HunyuanVideoBaseDataLoader(train_device, temp_device, config, model, train_progress, is_validation)
-            if model_type.is_hi_dream():
-                return HiDreamBaseDataLoader(train_device, temp_device, config, model, train_progress, is_validation)
-        case TrainingMethod.FINE_TUNE_VAE:
-            if model_type.is_stable_diffusion():
-                return StableDiffusionFineTuneVaeDataLoader(train_device, temp_device, config, model, train_progress, is_validation)
+    data_loader_class = _import_registered_class(_DATA_LOADERS, model_type, training_method)
+    if data_loader_class is None:
+        return None
 
-    return None
+    return data_loader_class(train_device, temp_device, config, model, train_progress, is_validation)
 
 
 def create_optimizer(
@@ -539,9 +372,8 @@ def create_optimizer(
 
         # ADAM Optimizer
         case Optimizer.ADAM:
-            if optimizer_config.stochastic_rounding \
-                    and (optimizer_config.fused or optimizer_config.foreach):
-                raise RuntimeError('"stochastic_rounding" is only allowed when "fused" and "foreach" are disabled')
+            if optimizer_config.stochastic_rounding and optimizer_config.fused:
+                raise RuntimeError('"stochastic_rounding" is only allowed when "fused" is disabled')
 
             if optimizer_config.fused_back_pass \
                     and (optimizer_config.fused or optimizer_config.foreach):
@@ -563,13 +395,12 @@ def create_optimizer(
             )
 
             if optimizer_config.stochastic_rounding or optimizer_config.fused_back_pass:
-                patch_adam(optimizer, optimizer_config.stochastic_rounding)
+                patch_adam(optimizer, optimizer_config.stochastic_rounding, bool(optimizer_config.foreach))
 
         # ADAMW Optimizer
         case Optimizer.ADAMW:
-            if optimizer_config.stochastic_rounding \
-                    and (optimizer_config.fused or optimizer_config.foreach):
-                raise RuntimeError('"stochastic_rounding" is only allowed when "fused" and "foreach" are disabled')
+            if optimizer_config.stochastic_rounding and optimizer_config.fused:
+                raise RuntimeError('"stochastic_rounding" is only allowed when "fused" is disabled')
 
             if optimizer_config.fused_back_pass \
                     and (optimizer_config.fused or optimizer_config.foreach):
@@ -591,7 +422,7 @@ def create_optimizer(
             )
 
             if optimizer_config.stochastic_rounding or optimizer_config.fused_back_pass:
-                patch_adamw(optimizer, optimizer_config.stochastic_rounding)
+                patch_adamw(optimizer, optimizer_config.stochastic_rounding, bool(optimizer_config.foreach))
 
         # ADAM_8BIT Optimizer
         case Optimizer.ADAM_8BIT:
@@ -996,7 +827,7 @@ def create_optimizer(
                 warmup_init=optimizer_config.warmup_init if optimizer_config.warmup_init is not None else False,
             )
 
-            patch_adafactor(optimizer, optimizer_config.stochastic_rounding)
+            patch_adafactor(optimizer, optimizer_config.stochastic_rounding, bool(optimizer_config.foreach))
 
         # CAME Optimizer
         case Optimizer.CAME:
@@ -0,0 +1,22 @@
+from enum import Enum
+
+import torch
+
+
+class GradientCompression(Enum):
+    NONE = 'NONE'
+    POWER_SGD = 'POWER_SGD'
+    INT8 = 'INT8'
+    FLOAT8 = 'FLOAT8'
+
+    def torch_dtype(self) -> torch.dtype | None:
+        match self:
+            case GradientCompression.INT8:
+                return torch.int8
+            case GradientCompression.FLOAT8:
+                return torch.float8_e4m3fn
+            case _:
+                return None
+
+    def __str__(self):
+        return self.value
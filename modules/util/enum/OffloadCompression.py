@@ -0,0 +1,23 @@
+from enum import Enum
+
+import torch
+
+
+class OffloadCompression(Enum):
+    NONE = 'NONE'
+    INT8 = 'INT8'
+    FLOAT8 = 'FLOAT8'
+
+    def torch_dtype(self) -> torch.dtype | None:
+        match self:
+            case OffloadCompression.NONE:
+                return None
+            case OffloadCompression.INT8:
+                return torch.int8
+            case OffloadCompression.FLOAT8:
+                return torch.float8_e4m3fn
+            case _:
+                raise ValueError
+
+    def __str__(self):
+        return self.value
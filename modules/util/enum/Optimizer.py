@@ -111,6 +111,40 @@ class Optimizer(Enum):
             Optimizer.LION_PRODIGY_ADV,
         ]
 
+    def supports_state_sharding(self):
+        # each parameter must be updated independently, without statistics shared by the whole param group
+        return self.supports_fused_back_pass() and not self.is_adaptive and not self.is_schedule_free
+
+    def supports_state_offloading(self):
+        # bitsandbytes optimizers can page their own state with is_paged, and schedule-free optimizers use their state
+        # outside of optimizer steps
+        return self in [
+            Optimizer.ADAFACTOR,
+            Optimizer.ADAM,
+            Optimizer.ADAMW,
+            Optimizer.ADAMW_ADV,
+            Optimizer.ADOPT,
+            Optimizer.ADOPT_ADV,
+            Optimizer.SIMPLIFIED_AdEMAMix,
+            Optimizer.LION,
+            Optimizer.LION_ADV,
+            Optimizer.SGD,
+            Optimizer.DADAPT_ADA_GRAD,
+            Optimizer.DADAPT_ADAM,
+            Optimizer.DADAPT_ADAN,
+            Optimizer.DADAPT_LION,
+            Optimizer.DADAPT_SGD,
+            Optimizer.PRODIGY,
+            Optimizer.PRODIGY_ADV,
+            Optimizer.LION_PRODIGY_ADV,
+            Optimizer.CAME,
+            Optimizer.CAME_8BIT,
+            Optimizer.ADABELIEF,
+            Optimizer.TIGER,
+            Optimizer.AIDA,
+            Optimizer.YOGI,
+        ]
+
     # Small helper for adjusting learning rates to adaptive optimizers.
     def maybe_adjust_lrs(self, lrs: dict[str, float], optimizer: torch.optim.Optimizer):
         if self.is_adaptive:
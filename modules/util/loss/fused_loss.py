@@ -0,0 +1,97 @@
+import math
+
+import torch
+import torch.nn.functional as F
+from torch import Tensor
+
+LOG_2 = math.log(2.0)
+
+
+def elementwise_losses(
+        diff: Tensor,
+        mse_strength: float,
+        mae_strength: float,
+        log_cosh_strength: float,
+        huber_strength: float,
+        huber_delta: float,
+) -> Tensor | None:
+    """
+    The weighted sum of all enabled elementwise loss terms of diff = predicted - target, in a single tensor.
+    Returns None if no term is enabled.
+    """
+    if mse_strength == 0 and mae_strength == 0 and log_cosh_strength == 0 and huber_strength == 0:
+        return None
+
+    # terms are added in place, so only diff, abs(diff) and the sum are kept in memory
+    losses = torch.zeros_like(diff)
+    abs_diff = diff.abs() if mae_strength != 0 or huber_strength != 0 else None
+
+    # MSE/L2 Loss
+    if mse_strength != 0:
+        losses.addcmul_(diff, diff, value=mse_strength)
+
+    # MAE/L1 Loss
+    if mae_strength != 0:
+        losses.add_(abs_diff, alpha=mae_strength)
+
+    # log-cosh Loss: diff + softplus(-2 * diff) - log(2)
+    if log_cosh_strength != 0:
+        log_cosh = F.softplus(-2.0 * diff).add_(diff).sub_(LOG_2)
+        losses.add_(log_cosh, alpha=log_cosh_strength)
+        del log_cosh
+
+    # Huber Loss: 0.5 * q^2 + delta * (abs(diff) - q), with q = min(abs(diff), delta)
+    if huber_strength != 0:
+        quadratic = abs_diff.clamp(max=huber_delta)
+        losses.addcmul_(quadratic, quadratic, value=0.5 * huber_strength)
+        # quadratic is saved for the backward pass of addcmul_, so it must not be modified in place
+        losses.add_(abs_diff, alpha=huber_delta * huber_strength)
+        losses.add_(quadratic, alpha=-huber_delta * huber_strength)
+        del quadratic
+
+    return losses
+
+
+def fused_losses(
+        predicted: Tensor,
+        target: Tensor,
+        prior_target: Tensor | None,
+        mask: Tensor | None,
+        mse_strength: float,
+        mae_strength: float,
+        log_cosh_strength: float,
+        huber_strength: float,
+        huber_delta: float,
+        unmasked_weight: float = 0.0,
+        normalize_masked_area_loss: bool = False,
+        masked_prior_preservation_weight: float = 0.0,
+) -> Tensor | None:
+    """
+    The per-sample mean of all enabled elementwise loss terms. Equivalent to calculating each term separately with
+    masked_losses_with_prior (if mask is not None) and adding the means, but inputs are converted to float32 once,
+    the mask is applied once, and the terms are accumulated into a single tensor. Returns None if no term is enabled.
+    """
+    mean_dim = list(range(1, predicted.ndim))
+    strengths = (mse_strength, mae_strength, log_cosh_strength, huber_strength, huber_delta)
+
+    predicted = predicted.to(dtype=torch.float32)
+    losses = elementwise_losses(predicted - target.to(dtype=torch.float32), *strengths)
+    if losses is None:
+        return None
+    if mask is None:
+        return losses.mean(mean_dim)
+
+    clamped_mask = torch.clamp(mask.to(dtype=torch.float32), unmasked_weight, 1)
+    losses *= clamped_mask
+    if normalize_masked_area_loss:
+        losses /= clamped_mask.mean(dim=(1, 2, 3), keepdim=True)
+
+    if masked_prior_preservation_weight != 0 and prior_target is not None:
+        prior_losses = elementwise_losses(predicted - prior_target.to(dtype=torch.float32), *strengths)
+        inverted_mask = 1 - clamped_mask
+        prior_losses *= inverted_mask * masked_prior_preservation_weight
+        if normalize_masked_area_loss:
+            prior_losses /= inverted_mask.mean(dim=(1, 2, 3), keepdim=True)
+        losses += prior_losses
+
+    return losses.mean(mean_dim)
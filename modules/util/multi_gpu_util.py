@@ -1,8 +1,11 @@
 from collections import deque
+from contextlib import contextmanager
 
 from modules.util.bf16_stochastic_rounding import copy_stochastic_
 from modules.util.commands.TrainCommands import TrainCommands
+from modules.util.enum.GradientCompression import GradientCompression
 from modules.util.enum.GradientReducePrecision import GradientReducePrecision
+from modules.util.PendingReduce import PendingReduce
 
 import torch
 
@@ -59,6 +62,32 @@ def reduce_tensor_mean(tensor):
 async_deque = deque()
 in_transfer = 0
 
+#rank that owns the optimizer state of each parameter, if optimizer state sharding is enabled. Insertion order is the
+#order of the parameters in the optimizer, which must be the same in all ranks:
+state_owners = {}
+
+gradient_compressor = None
+transferred_bytes = 0
+
+def set_gradient_compression(compression: GradientCompression, rank: int, block_size: int):
+    global gradient_compressor
+    if compression == GradientCompression.NONE:
+        gradient_compressor = None
+    else:
+        #imported here, because the quantization functions import diffusers
+        from modules.util.GradientCompressor import GradientCompressor
+        gradient_compressor = GradientCompressor(compression, rank, block_size)
+        if compression == GradientCompression.POWER_SGD and is_master():
+            print("PowerSGD gradient compression is experimental and can noticeably reduce training quality. "
+                  "INT8 gradient compression is usually more accurate at a similar bandwidth.")
+
+def get_and_reset_transferred_bytes() -> int:
+    #bytes sent by this rank for gradient reduction
+    global transferred_bytes
+    result = transferred_bytes
+    transferred_bytes = 0
+    return result
+
 
 def reduce_grads_mean(params: list[torch.Tensor], precision: GradientReducePrecision, after_reduce=None, async_op: bool=False, max_buffer: int=0):
     assert not async_op or max_buffer > 0
@@ -75,23 +104,14 @@ def reduce_grads_mean(params: list[torch.Tensor], precision: GradientReducePreci
                     size = grad.numel() * grad.element_size()
                     complete_previous_async_ops(precision, next_size=size, max_buffer=max_buffer)
 
-                    work = torch.distributed.all_reduce(grad, op=torch.distributed.ReduceOp.SUM, async_op=True)
-                    async_deque.append((work, param, grad, after_reduce))
+                    pending = _reduce(param, grad, async_op=True)
+                    async_deque.append((pending, param, size, after_reduce))
 
                     in_transfer += size
                 else:
                     grad = param.grad.to(precision.torch_dtype(param.grad.dtype))
-                    torch.distributed.all_reduce(grad, op=torch.distributed.ReduceOp.SUM, async_op=False)
-
-                    grad = grad.to(torch.float32) if precision.stochastic_rounding(param.grad.dtype) else grad
-                    grad /= world_size()
-                    if precision.stochastic_rounding(param.grad.dtype):
-                        copy_stochastic_(param.grad, grad)
-                    else:
-                        param.grad = grad.to(param.grad.dtype)
-
-                    if after_reduce is not None:
-                        after_reduce(param)
+                    grad = _reduce(param, grad, async_op=False).wait()
+                    _apply_reduced_grad(param, grad, precision, after_reduce)
             elif after_reduce is not None:
                 after_reduce(param)
 
@@ -102,23 +122,141 @@ def complete_previous_async_ops(precision: GradientReducePrecision, next_size: i
         in_transfer + next_size > max_buffer
         or async_deque[0][0].is_completed()
     ):
-        work, param, grad, after_reduce = async_deque.popleft()
-        work.wait()
-        in_transfer -= grad.numel() * grad.element_size()
-
-        grad = grad.to(torch.float32) if precision.stochastic_rounding(param.grad.dtype) else grad
-        grad /= world_size()
-        if precision.stochastic_rounding(param.grad.dtype):
-            copy_stochastic_(param.grad, grad)
-        else:
-            param.grad = grad.to(param.grad.dtype)
-
-        if after_reduce is not None:
-            after_reduce(param)
+        pending, param, size, after_reduce = async_deque.popleft()
+        grad = pending.wait()
+        in_transfer -= size
+        _apply_reduced_grad(param, grad, precision, after_reduce)
 
 def finish_async(precision: GradientReducePrecision):
     complete_previous_async_ops(precision, max_buffer=0)
 
+def _reduce(param: torch.Tensor, grad: torch.Tensor, async_op: bool) -> PendingReduce:
+    global transferred_bytes
+    grad_bytes = grad.numel() * grad.element_size()
+    if param in state_owners:
+        #with sharded optimizer state, only the owner of the parameter needs the reduced gradient
+        work = torch.distributed.reduce(grad, dst=state_owners[param], op=torch.distributed.ReduceOp.SUM, async_op=async_op)
+        pending = PendingReduce(work, lambda: grad, (world_size() - 1) * grad_bytes // world_size())
+    elif gradient_compressor is not None:
+        pending = gradient_compressor.reduce(param, grad, async_op)
+    else:
+        work = torch.distributed.all_reduce(grad, op=torch.distributed.ReduceOp.SUM, async_op=async_op)
+        pending = PendingReduce(work, lambda: grad, 2 * (world_size() - 1) * grad_bytes // world_size())
+    transferred_bytes += pending.transferred_bytes
+    return pending
+
+def _apply_reduced_grad(param: torch.Tensor, grad: torch.Tensor, precision: GradientReducePrecision, after_reduce):
+    if not owns_state(param):
+        #the parameter is updated by its owner, and broadcast after the optimizer step
+        param.grad = None
+        return
+
+    grad = grad.to(torch.float32) if precision.stochastic_rounding(param.grad.dtype) else grad
+    grad /= world_size()
+    if precision.stochastic_rounding(param.grad.dtype):
+        copy_stochastic_(param.grad, grad)
+    else:
+        param.grad = grad.to(param.grad.dtype)
+
+    if after_reduce is not None:
+        after_reduce(param)
+
+
+def shard_optimizer_state(optimizer: torch.optim.Optimizer):
+    """
+    ZeRO-1 style sharding: every parameter is assigned to one rank, balanced by the number of elements. Gradients are
+    only reduced to the owner, so the optimizer only creates state on the owner. After the optimizer step, the owner
+    broadcasts the updated parameter to all other ranks. State that was loaded for parameters owned by other ranks is
+    removed. Only works for optimizers that update each parameter independently.
+    """
+    state_owners.clear()
+    if not is_enabled():
+        return
+
+    params = [p for group in optimizer.param_groups for p in group['params'] if p.requires_grad]
+    rank_numels = [0] * world_size()
+    owners = {}
+    #largest parameters first, for a better balance:
+    for p in sorted(params, key=lambda p: p.numel(), reverse=True):
+        owner = rank_numels.index(min(rank_numels))
+        owners[p] = owner
+        rank_numels[owner] += p.numel()
+
+    for p in params:
+        state_owners[p] = owners[p]
+        if owners[p] != rank():
+            optimizer.state.pop(p, None)
+
+def owns_state(param: torch.Tensor) -> bool:
+    return state_owners.get(param, rank()) == rank()
+
+@torch.no_grad()
+def clip_grad_norm_(params: list[torch.Tensor], max_norm: float, train_device: torch.device) -> torch.Tensor:
+    #with sharded optimizer state, every rank only has the reduced gradients of its own parameters
+    if not state_owners:
+        return torch.nn.utils.clip_grad_norm_(params, max_norm)
+
+    grads = [p.grad for p in params if p.grad is not None and owns_state(p)]
+    total_norm = torch.zeros(1, device=train_device, dtype=torch.float32)
+    for grad in grads:
+        total_norm += grad.float().pow(2).sum().to(train_device)
+    torch.distributed.all_reduce(total_norm, op=torch.distributed.ReduceOp.SUM)
+    total_norm = total_norm.sqrt()
+
+    clip_coef = torch.clamp(max_norm / (total_norm + 1e-6), max=1.0)
+    for grad in grads:
+        grad.mul_(clip_coef.to(grad.device, grad.dtype))
+    return total_norm
+
+@torch.no_grad()
+def broadcast_sharded_parameters(train_device: torch.device):
+    works = []
+    for param, owner in state_owners.items():
+        gpu_param = param.to(train_device)
+        if gpu_param is param:
+            works.append(torch.distributed.broadcast(param, src=owner, async_op=True))
+        else:
+            torch.distributed.broadcast(gpu_param, src=owner)
+            if rank() != owner:
+                param.copy_(gpu_param)
+    for work in works:
+        work.wait()
+
+def _state_to_cpu(state):
+    if isinstance(state, torch.Tensor):
+        return state.cpu()
+    elif isinstance(state, dict):
+        return {key: _state_to_cpu(value) for key, value in state.items()}
+    elif isinstance(state, list | tuple):
+        return type(state)(_state_to_cpu(value) for value in state)
+    return state
+
+@contextmanager
+def gathered_optimizer_state(optimizer: torch.optim.Optimizer):
+    """
+    Temporarily copies the sharded optimizer state of all ranks into the optimizer of the master, so that a complete
+    optimizer state is saved. The copies are kept on the CPU. Must be entered by all ranks.
+    """
+    gathered_params = []
+    if state_owners:
+        params = list(state_owners)
+        for owner in range(1, world_size()):
+            if rank() == owner:
+                shard = {i: _state_to_cpu(optimizer.state[p])
+                         for i, p in enumerate(params) if state_owners[p] == owner and p in optimizer.state}
+                torch.distributed.send_object_list([shard], dst=0)
+            elif is_master():
+                object_list = [None]
+                torch.distributed.recv_object_list(object_list, src=owner)
+                for i, state in object_list[0].items():
+                    optimizer.state[params[i]] = state
+                    gathered_params.append(params[i])
+    try:
+        yield
+    finally:
+        for p in gathered_params:
+            optimizer.state.pop(p, None)
+
 
 
 @torch.no_grad()
@@ -6,23 +6,15 @@
 
 import math
 
-from modules.util.bf16_stochastic_rounding import copy_stochastic_
+from modules.util.bf16_stochastic_rounding import copy_stochastic_, copy_stochastic_list_
+from modules.util.optimizer.foreach_util import chunk_parameters
 
 import torch
 
 from transformers import Adafactor
 
 
-@torch.no_grad()
-def step_adafactor_parameter(self, p, group, i):
-    if p.grad is None:
-        return
-    grad = p.grad
-    if grad.dtype in {torch.float16, torch.bfloat16}:
-        grad = grad.float()
-    if grad.is_sparse:
-        raise RuntimeError("Adafactor does not support sparse gradients.")
-
+def _init_state(self, p, grad, group) -> tuple[dict, bool, bool]:
     state = self.state[p]
     grad_shape = grad.shape
 
@@ -50,6 +42,21 @@ def step_adafactor_parameter(self, p, group, i):
         else:
             state["exp_avg_sq"] = state["exp_avg_sq"].to(grad)
 
+    return state, factored, use_first_moment
+
+
+@torch.no_grad()
+def step_adafactor_parameter(self, p, group, i):
+    if p.grad is None:
+        return
+    grad = p.grad
+    if grad.dtype in {torch.float16, torch.bfloat16}:
+        grad = grad.float()
+    if grad.is_sparse:
+        raise RuntimeError("Adafactor does not support sparse gradients.")
+
+    state, factored, use_first_moment = _init_state(self, p, grad, group)
+
     p_data_fp32 = p
     if p.dtype in {torch.float16, torch.bfloat16}:
         p_data_fp32 = p_data_fp32.float()
@@ -97,6 +104,104 @@ def step_adafactor_parameter(self, p, group, i):
         assert p_data_fp32 is p
 
 
+@torch.no_grad()
+def _multi_tensor_adafactor_parameters(self, entries, group):
+    # all entries share the same device, dtype, options and step
+    factored = entries[0]["factored"]
+    use_first_moment = entries[0]["use_first_moment"]
+    beta2t = entries[0]["beta2t"]
+    grads = [e["grad"] for e in entries]
+
+    updates = torch._foreach_pow(grads, 2)
+    torch._foreach_add_(updates, group["eps"][0])
+    if factored:
+        exp_avg_sq_rows = [e["state"]["exp_avg_sq_row"] for e in entries]
+        exp_avg_sq_cols = [e["state"]["exp_avg_sq_col"] for e in entries]
+
+        torch._foreach_mul_(exp_avg_sq_rows, beta2t)
+        torch._foreach_add_(exp_avg_sq_rows, [update.mean(dim=-1) for update in updates], alpha=(1.0 - beta2t))
+        torch._foreach_mul_(exp_avg_sq_cols, beta2t)
+        torch._foreach_add_(exp_avg_sq_cols, [update.mean(dim=-2) for update in updates], alpha=(1.0 - beta2t))
+
+        # Approximation of exponential moving average of square of gradient
+        updates = [self._approx_sq_grad(row, col) for row, col in zip(exp_avg_sq_rows, exp_avg_sq_cols, strict=True)]
+        torch._foreach_mul_(updates, grads)
+    else:
+        exp_avg_sqs = [e["state"]["exp_avg_sq"] for e in entries]
+
+        torch._foreach_mul_(exp_avg_sqs, beta2t)
+        torch._foreach_add_(exp_avg_sqs, updates, alpha=(1.0 - beta2t))
+        updates = torch._foreach_rsqrt(exp_avg_sqs)
+        torch._foreach_mul_(updates, grads)
+
+    # the clipping and learning rate scaling depends on per parameter values
+    for update, e in zip(updates, entries, strict=True):
+        update.div_((self._rms(update) / group["clip_threshold"]).clamp_(min=1.0))
+        update.mul_(e["lr"])
+
+    if use_first_moment:
+        exp_avgs = [e["state"]["exp_avg"] for e in entries]
+        torch._foreach_mul_(exp_avgs, group["beta1"])
+        torch._foreach_add_(exp_avgs, updates, alpha=(1 - group["beta1"]))
+        updates = exp_avgs
+
+    p_data_fp32s = [e["p_data_fp32"] for e in entries]
+    if group["weight_decay"] != 0:
+        for p_data_fp32, e in zip(p_data_fp32s, entries, strict=True):
+            p_data_fp32.add_(p_data_fp32, alpha=(-group["weight_decay"] * e["lr"]))
+
+    torch._foreach_sub_(p_data_fp32s, updates)
+
+
+@torch.no_grad()
+def _multi_tensor_adafactor(self, group):
+    params = [p for p in group["params"] if p.grad is not None]
+    if any(p.grad.is_sparse for p in params):
+        raise RuntimeError("Adafactor does not support sparse gradients.")
+
+    # parameters are processed in their original order to keep stochastic rounding results reproducible
+    for chunk in chunk_parameters(params):
+        entries = []
+        buckets = {}
+        for p in chunk:
+            grad = p.grad
+            if grad.dtype in {torch.float16, torch.bfloat16}:
+                grad = grad.float()
+
+            state, factored, use_first_moment = _init_state(self, p, grad, group)
+
+            p_data_fp32 = p
+            if p.dtype in {torch.float16, torch.bfloat16}:
+                p_data_fp32 = p_data_fp32.float()
+
+            state["step"] += 1
+            state["RMS"] = self._rms(p_data_fp32)
+
+            entry = {
+                "p": p,
+                "grad": grad,
+                "state": state,
+                "factored": factored,
+                "use_first_moment": use_first_moment,
+                "p_data_fp32": p_data_fp32,
+                "lr": self._get_lr(group, state),
+                "beta2t": 1.0 - math.pow(state["step"], group["decay_rate"]),
+            }
+            entries.append(entry)
+            buckets.setdefault((p.device, p.dtype, factored, use_first_moment, state["step"]), []).append(entry)
+
+        for bucket in buckets.values():
+            _multi_tensor_adafactor_parameters(self, bucket, group)
+
+        stochastic_entries = [e for e in entries if e["p"].dtype == torch.bfloat16 and self.stochastic_rounding]
+        copy_entries = [e for e in entries if e["p"].dtype in {torch.float16, torch.bfloat16}
+                        and not (e["p"].dtype == torch.bfloat16 and self.stochastic_rounding)]
+
+        copy_stochastic_list_([e["p"] for e in stochastic_entries], [e["p_data_fp32"] for e in stochastic_entries])
+        if len(copy_entries) > 0:
+            torch._foreach_copy_([e["p"] for e in copy_entries], [e["p_data_fp32"] for e in copy_entries])
+
+
 @torch.no_grad()
 def step_adafactor(self, closure=None):
     """
@@ -111,13 +216,17 @@ def step_adafactor(self, closure=None):
         loss = closure()
 
     for group in self.param_groups:
-        for i, p in enumerate(group["params"]):
-            step_adafactor_parameter(self, p, group, i)
+        if self.use_foreach:
+            _multi_tensor_adafactor(self, group)
+        else:
+            for i, p in enumerate(group["params"]):
+                step_adafactor_parameter(self, p, group, i)
 
     return loss
 
 
-def patch_adafactor(optimizer: Adafactor, stochastic_rounding: bool):
+def patch_adafactor(optimizer: Adafactor, stochastic_rounding: bool, foreach: bool = False):
     optimizer.stochastic_rounding = stochastic_rounding
+    optimizer.use_foreach = foreach
     optimizer.step = step_adafactor.__get__(optimizer, Adafactor)
     optimizer.step_parameter = step_adafactor_parameter.__get__(optimizer, Adafactor)
@@ -6,7 +6,8 @@
 
 import math
 
-from modules.util.bf16_stochastic_rounding import addcdiv_stochastic_
+from modules.util.bf16_stochastic_rounding import addcdiv_stochastic_, addcdiv_stochastic_list_
+from modules.util.optimizer.foreach_util import chunk_parameters, group_by_device_and_dtype, supports_foreach
 
 import torch
 from torch import Tensor
@@ -14,14 +15,7 @@ from torch.optim import AdamW
 from torch.optim.optimizer import _use_grad_for_differentiable
 
 
-@torch.no_grad()
-def step_adamw_parameter(self, p, group, i):
-    if p.grad is None:
-        return
-    grad = p.grad
-    if p.grad.is_sparse:
-        raise RuntimeError("AdamW does not support sparse gradients")
-
+def _init_state(self, p, group) -> dict:
     state = self.state[p]
 
     # State initialization
@@ -47,6 +41,19 @@ def step_adamw_parameter(self, p, group, i):
                 p, memory_format=torch.preserve_format
             )
 
+    return state
+
+
+@torch.no_grad()
+def step_adamw_parameter(self, p, group, i):
+    if p.grad is None:
+        return
+    grad = p.grad
+    if p.grad.is_sparse:
+        raise RuntimeError("AdamW does not support sparse gradients")
+
+    state = _init_state(self, p, group)
+
     if group['differentiable'] and state['step'].requires_grad:
         raise RuntimeError('`requires_grad` is not supported for `step` in differentiable mode')
 
@@ -174,6 +181,74 @@ def _single_tensor_adamw(
         step_adamw_parameter(self, p, group, i)
 
 
+@torch.no_grad()
+def _multi_tensor_adamw_parameters(self, params, group):
+    grads = [p.grad for p in params]
+    if group["maximize"]:
+        grads = torch._foreach_neg(grads)
+
+    states = [self.state[p] for p in params]
+    exp_avgs = [state["exp_avg"] for state in states]
+    exp_avg_sqs = [state["exp_avg_sq"] for state in states]
+    beta1, beta2 = group["betas"]
+
+    # update step
+    steps = []
+    for state in states:
+        state["step"] += 1
+        steps.append(state["step"].item())
+
+    # Perform stepweight decay
+    torch._foreach_mul_(params, 1 - group["lr"] * group["weight_decay"])
+
+    # Decay the first and second moment running average coefficient
+    torch._foreach_lerp_(exp_avgs, grads, 1 - beta1)
+    torch._foreach_mul_(exp_avg_sqs, beta2)
+    torch._foreach_addcmul_(exp_avg_sqs, grads, grads, value=1 - beta2)
+
+    step_sizes = [-(group["lr"] / (1 - beta1 ** step)) for step in steps]
+    bias_correction2_sqrts = [math.sqrt(1 - beta2 ** step) for step in steps]
+
+    if group['amsgrad']:
+        # Maintains the maximum of all 2nd moment running avg. till now
+        max_exp_avg_sqs = [state["max_exp_avg_sq"] for state in states]
+        torch._foreach_maximum_(max_exp_avg_sqs, exp_avg_sqs)
+
+        # Use the max. for normalizing running avg. of gradient
+        denoms = torch._foreach_sqrt(max_exp_avg_sqs)
+    else:
+        denoms = torch._foreach_sqrt(exp_avg_sqs)
+    torch._foreach_div_(denoms, bias_correction2_sqrts)
+    torch._foreach_add_(denoms, group["eps"])
+
+    if params[0].dtype == torch.bfloat16 and self.stochastic_rounding:
+        addcdiv_stochastic_list_(params, exp_avgs, denoms, step_sizes)
+    else:
+        torch._foreach_addcdiv_(params, exp_avgs, denoms, step_sizes)
+
+
+def _multi_tensor_adamw(
+        self,
+        group,
+        grad_scale: Tensor | None,
+        found_inf: Tensor | None,
+):
+    assert grad_scale is None and found_inf is None
+
+    params = [p for p in group["params"] if p.grad is not None]
+    if not supports_foreach(group, params):
+        _single_tensor_adamw(self, group, grad_scale, found_inf)
+        return
+
+    # parameters are processed in their original order to keep stochastic rounding results reproducible
+    for chunk in chunk_parameters(params):
+        for p in chunk:
+            _init_state(self, p, group)
+
+        for grouped_params in group_by_device_and_dtype(chunk).values():
+            _multi_tensor_adamw_parameters(self, grouped_params, group)
+
+
 @_use_grad_for_differentiable
 def step_adamw(self, closure=None):
     """Performs a single optimization step.
@@ -190,7 +265,8 @@ def step_adamw(self, closure=None):
             loss = closure()
 
     for group in self.param_groups:
-        _single_tensor_adamw(
+        step_fn = _multi_tensor_adamw if self.use_foreach else _single_tensor_adamw
+        step_fn(
             self,
             group=group,
             grad_scale=getattr(self, "grad_scale", None),
@@ -199,7 +275,8 @@ def step_adamw(self, closure=None):
 
     return loss
 
-def patch_adamw(optimizer: AdamW, stochastic_rounding: bool):
+def patch_adamw(optimizer: AdamW, stochastic_rounding: bool, foreach: bool = False):
     optimizer.stochastic_rounding = stochastic_rounding
+    optimizer.use_foreach = foreach
     optimizer.step = step_adamw.__get__(optimizer, AdamW)
     optimizer.step_parameter = step_adamw_parameter.__get__(optimizer, AdamW)
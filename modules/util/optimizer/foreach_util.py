@@ -0,0 +1,41 @@
+from collections.abc import Iterator
+
+import torch
+from torch import Tensor
+
+
+def chunk_parameters(params: list[Tensor], max_chunk_numel: int = 1 << 26) -> Iterator[list[Tensor]]:
+    """
+    Splits parameters into consecutive chunks. The order of parameters is preserved, which keeps the order of random
+    numbers used for stochastic rounding the same as in the per-parameter implementations. The chunk size bounds the
+    memory needed for temporary tensors.
+    """
+    chunk = []
+    chunk_numel = 0
+    for p in params:
+        if len(chunk) > 0 and chunk_numel + p.numel() > max_chunk_numel:
+            yield chunk
+            chunk = []
+            chunk_numel = 0
+        chunk.append(p)
+        chunk_numel += p.numel()
+
+    if len(chunk) > 0:
+        yield chunk
+
+
+def group_by_device_and_dtype(params: list[Tensor]) -> dict[tuple[torch.device, torch.dtype], list[Tensor]]:
+    """
+    Groups parameters into lists that can be passed to a single foreach op. Parameters keep their relative order.
+    """
+    groups = {}
+    for p in params:
+        groups.setdefault((p.device, p.dtype), []).append(p)
+    return groups
+
+
+def supports_foreach(group: dict, params: list[Tensor]) -> bool:
+    if group.get("capturable", False) or group.get("differentiable", False):
+        return False
+
+    return not any(p.grad.is_sparse or torch.is_complex(p) for p in params)
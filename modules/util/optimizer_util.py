@@ -2,8 +2,12 @@ import modules.util.multi_gpu_util as multi
 from modules.model.BaseModel import BaseModel
 from modules.util import create
 from modules.util.config.TrainConfig import TrainConfig, TrainOptimizerConfig
+from modules.util.enum.EMAMode import EMAMode
+from modules.util.enum.GradientCompression import GradientCompression
 from modules.util.enum.Optimizer import Optimizer
 from modules.util.NamedParameterGroup import NamedParameterGroupCollection
+from modules.util.OptimizerStateOffloader import OptimizerStateOffloader
+from modules.util.state_dict_util import copy_state_dict
 from modules.util.torch_util import optimizer_to_device_
 
 import torch
@@ -58,9 +62,37 @@ def init_model_parameters(
     #to be safe, do that before the optimizer is created because the optimizer could take copies
     multi.broadcast_parameters(parameters.parameters(), train_device)
 
+    # loaded state dicts are memory-mapped from the backup files. state that stays on the cpu is copied, otherwise
+    # the optimizer and ema keep the files mapped for the whole run
+    optimizer_state_device = torch.device(model.train_config.temp_device) \
+        if model.train_config.optimizer.offload_state else train_device
+    if model.optimizer_state_dict is not None and optimizer_state_device.type == "cpu":
+        model.optimizer_state_dict = copy_state_dict(model.optimizer_state_dict)
+    if model.ema_state_dict is not None and (model.train_config.ema == EMAMode.CPU or train_device.type == "cpu"):
+        model.ema_state_dict = copy_state_dict(model.ema_state_dict)
+
     model.optimizer = create.create_optimizer(parameters, model.optimizer_state_dict, model.train_config)
     if model.optimizer is not None:
-        optimizer_to_device_(model.optimizer, train_device)
+        if model.train_config.multi_gpu and model.train_config.optimizer_state_sharding:
+            if not model.train_config.optimizer.optimizer.supports_state_sharding():
+                raise ValueError(f"optimizer state sharding is not supported by {model.train_config.optimizer.optimizer}")
+            if model.train_config.gradient_compression != GradientCompression.NONE:
+                raise ValueError("optimizer state sharding can not be combined with gradient compression")
+            #before moving to the train device, to drop state loaded for parameters of other ranks
+            multi.shard_optimizer_state(model.optimizer)
+        optimizer_config = model.train_config.optimizer
+        if optimizer_config.offload_state:
+            if not optimizer_config.optimizer.supports_state_offloading():
+                raise ValueError(f"optimizer state offloading is not supported by {optimizer_config.optimizer}")
+            #patches the optimizer, which keeps a reference to the offloader
+            OptimizerStateOffloader(
+                model.optimizer,
+                train_device,
+                torch.device(model.train_config.temp_device),
+                step_groups_separately=not optimizer_config.optimizer.is_adaptive,
+            )
+        else:
+            optimizer_to_device_(model.optimizer, train_device)
     model.optimizer_state_dict = None
 
     if multi.is_master():
@@ -86,6 +118,8 @@ OPTIMIZER_DEFAULT_PARAMETERS = {
         "warmup_init": False,
         "stochastic_rounding": True,
         "fused_back_pass": False,
+        "foreach": False,
+        "offload_state": False,
     },
     Optimizer.ADAGRAD: {
         "lr_decay": 0,
@@ -161,6 +195,7 @@ OPTIMIZER_DEFAULT_PARAMETERS = {
         "fixed_decay": False,
         "cautious": False,
         "eps": 1e-6,
+        "offload_state": False,
     },
     Optimizer.LAMB: {
         "bias_correction": True,
@@ -277,6 +312,7 @@ OPTIMIZER_DEFAULT_PARAMETERS = {
         "growth_rate": float('inf'),
         "fsdp_in_use": False,
         "slice_p": 11,
+        "offload_state": False,
     },
     Optimizer.PRODIGY_PLUS_SCHEDULE_FREE: {
         "beta1": 0.9,
@@ -312,6 +348,7 @@ OPTIMIZER_DEFAULT_PARAMETERS = {
         "eps": 0.0,
         "d0": 1e-6,
         "growth_rate": float('inf'),
+        "offload_state": False,
     },
     Optimizer.DADAPT_ADAN: {
         "beta1": 0.98,
@@ -323,6 +360,7 @@ OPTIMIZER_DEFAULT_PARAMETERS = {
         "log_every": 0,
         "d0": 1e-6,
         "growth_rate": float('inf'),
+        "offload_state": False,
     },
     Optimizer.DADAPT_ADAM: {
         "beta1": 0.9,
@@ -335,6 +373,7 @@ OPTIMIZER_DEFAULT_PARAMETERS = {
         "d0": 1e-6,
         "growth_rate": float('inf'),
         "fsdp_in_use": False,
+        "offload_state": False,
     },
     Optimizer.DADAPT_SGD: {
         "momentum": 0.0,
@@ -343,6 +382,7 @@ OPTIMIZER_DEFAULT_PARAMETERS = {
         "d0": 1e-6,
         "growth_rate": float('inf'),
         "fsdp_in_use": False,
+        "offload_state": False,
     },
     Optimizer.DADAPT_LION: {
         "beta1": 0.9,
@@ -351,6 +391,7 @@ OPTIMIZER_DEFAULT_PARAMETERS = {
         "log_every": 0,
         "d0": 1e-6,
         "fsdp_in_use": False,
+        "offload_state": False,
     },
     Optimizer.ADAM: {
         "beta1": 0.9,
@@ -365,6 +406,7 @@ OPTIMIZER_DEFAULT_PARAMETERS = {
         "fused": True,
         "stochastic_rounding": False,
         "fused_back_pass": False,
+        "offload_state": False,
     },
     Optimizer.ADAMW: {
         "beta1": 0.9,
@@ -379,6 +421,7 @@ OPTIMIZER_DEFAULT_PARAMETERS = {
         "fused": True,
         "stochastic_rounding": False,
         "fused_back_pass": False,
+        "offload_state": False,
     },
     Optimizer.SGD: {
         "momentum": 0,
@@ -388,12 +431,14 @@ OPTIMIZER_DEFAULT_PARAMETERS = {
         "foreach": False,
         "maximize": False,
         "differentiable": False,
+        "offload_state": False,
     },
     Optimizer.LION: {
         "beta1": 0.9,
         "beta2": 0.99,
         "weight_decay": 0.0,
         "use_triton": False,
+        "offload_state": False,
     },
     Optimizer.CAME: {
         "beta1": 0.9,
@@ -405,6 +450,7 @@ OPTIMIZER_DEFAULT_PARAMETERS = {
         "stochastic_rounding": False,
         "use_cautious": False,
         "fused_back_pass": False,
+        "offload_state": False,
     },
     Optimizer.CAME_8BIT: {
         "beta1": 0.9,
@@ -416,7 +462,8 @@ OPTIMIZER_DEFAULT_PARAMETERS = {
         "stochastic_rounding": False,
         "fused_back_pass": False,
         "min_8bit_size": 16384,
-        "quant_block_size": 2048
+        "quant_block_size": 2048,
+        "offload_state": False,
     },
     Optimizer.ADAMW_ADV: {
         "beta1": 0.9,
@@ -436,6 +483,7 @@ OPTIMIZER_DEFAULT_PARAMETERS = {
         "alpha": 5,
         "kourkoutas_beta": False,
         "k_warmup_steps": None,
+        "offload_state": False,
     },
     Optimizer.ADOPT_ADV: {
         "beta1": 0.9,
@@ -456,6 +504,7 @@ OPTIMIZER_DEFAULT_PARAMETERS = {
         "alpha_grad": 100.0,
         "kourkoutas_beta": False,
         "k_warmup_steps": None,
+        "offload_state": False,
     },
     Optimizer.PRODIGY_ADV: {
         "beta1": 0.9,
@@ -483,6 +532,7 @@ OPTIMIZER_DEFAULT_PARAMETERS = {
         "alpha_grad": 100.0,
         "kourkoutas_beta": False,
         "k_warmup_steps": None,
+        "offload_state": False,
     },
     Optimizer.SIMPLIFIED_AdEMAMix: {
         "beta1": 0.99,
@@ -499,6 +549,7 @@ OPTIMIZER_DEFAULT_PARAMETERS = {
         "orthogonal_gradient": False,
         "kourkoutas_beta": False,
         "k_warmup_steps": None,
+        "offload_state": False,
     },
     Optimizer.LION_ADV: {
         "beta1": 0.9,
@@ -510,6 +561,7 @@ OPTIMIZER_DEFAULT_PARAMETERS = {
         "fused_back_pass": False,
         "cautious_mask": False,
         "orthogonal_gradient": False,
+        "offload_state": False,
     },
     Optimizer.LION_PRODIGY_ADV: {
         "beta1": 0.9,
@@ -528,6 +580,7 @@ OPTIMIZER_DEFAULT_PARAMETERS = {
         "d_limiter": True,
         "cautious_mask": False,
         "orthogonal_gradient": False,
+        "offload_state": False,
     },
     Optimizer.ADABELIEF: {
         "beta1": 0.9,
@@ -539,12 +592,14 @@ OPTIMIZER_DEFAULT_PARAMETERS = {
         "fixed_decay": False,
         "rectify": True,
         "degenerated_to_sgd": True,
+        "offload_state": False,
     },
     Optimizer.TIGER: {
         "beta1": 0.965,
         "weight_decay": 0.01,
         "decoupled_decay": True,
         "fixed_decay": False,
+        "offload_state": False,
     },
     Optimizer.AIDA: {
         "beta1": 0.9,
@@ -562,6 +617,7 @@ OPTIMIZER_DEFAULT_PARAMETERS = {
         "adanorm": False,
         "adam_debias": False,
         "eps": 1e-8,
+        "offload_state": False,
     },
     Optimizer.YOGI: {
         "beta1": 0.9,
@@ -574,5 +630,6 @@ OPTIMIZER_DEFAULT_PARAMETERS = {
         "adam_debias": False,
         "initial_accumulator": 1e-6,
         "eps": 1e-3,
+        "offload_state": False,
     },
 }
@@ -258,3 +258,61 @@ def offload_quantized(
             new_tensor = allocator(tensor)
             new_tensor.copy_(tensor.data, non_blocking=non_blocking)
             tensor.data = new_tensor
+
+
+def quantize_blockwise(
+        tensor: Tensor,
+        dtype: torch.dtype,
+        block_size: int = 128,
+) -> tuple[Tensor, Tensor]:
+    # absmax scaling per block, similar to LinearFp8.quantize, but with one scale for every block_size values
+    blocks = tensor.detach().flatten().float()
+    padding = (block_size - (blocks.numel() % block_size)) % block_size
+    if padding > 0:
+        blocks = torch.nn.functional.pad(blocks, (0, padding))
+    blocks = blocks.view(-1, block_size)
+
+    abs_max = blocks.abs().amax(dim=1, keepdim=True).clamp_(min=1e-12)
+    # not in place, blocks is a view of the input if it is a contiguous fp32 tensor
+    if dtype == torch.int8:
+        scale = abs_max / 127.0
+        quantized = (blocks / scale).round_().clamp_(-127, 127).to(dtype=torch.int8)
+    else:
+        scale = abs_max / torch.finfo(dtype).max
+        quantized = (blocks / scale).to(dtype=dtype)
+
+    return quantized, scale.squeeze(1)
+
+
+def dequantize_blockwise_(
+        target: Tensor,
+        quantized: Tensor,
+        scale: Tensor,
+        non_blocking: bool = False,
+        chunk_numel: int = 1 << 20,
+):
+    # dequantized directly into the contiguous target, chunk by chunk. quantized and scale can be on another device,
+    # only one chunk of them is transferred and converted at a time
+    block_size = quantized.shape[1]
+    target_blocks = target.view(-1)
+    num_full_blocks = target_blocks.numel() // block_size
+    chunk_blocks = max(1, chunk_numel // block_size)
+
+    for start in range(0, quantized.shape[0], chunk_blocks):
+        end = min(start + chunk_blocks, quantized.shape[0])
+        blocks = quantized[start:end].to(device=target.device, non_blocking=non_blocking)
+        if blocks.is_floating_point():
+            # float8 types can't be promoted, int8 is converted by the multiplication itself
+            blocks = blocks.to(dtype=torch.float32)
+        block_scale = scale[start:end].to(device=target.device, dtype=torch.float32, non_blocking=non_blocking)
+
+        full_end = min(end, num_full_blocks)
+        if full_end > start:
+            torch.mul(
+                blocks[:full_end - start], block_scale[:full_end - start].unsqueeze(1),
+                out=target_blocks[start * block_size:full_end * block_size].view(-1, block_size),
+            )
+        if end > num_full_blocks:
+            # the padded last block
+            tail = blocks[-1].to(dtype=torch.float32) * block_scale[-1]
+            target_blocks[num_full_blocks * block_size:].copy_(tail[:target_blocks.numel() - num_full_blocks * block_size])
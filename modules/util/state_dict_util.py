@@ -0,0 +1,182 @@
+import json
+import mmap
+import os
+import struct
+
+import torch
+
+from safetensors.torch import save_file
+
+# internal state dicts (optimizer, ema) are saved as safetensors shards, and a json file with everything else.
+# tensors in the json structure are replaced by {"__tensor__": key}, tuples by {"__tuple__": [...]}, and dicts with
+# keys that are not strings by {"__items__": [[key, value], ...]}
+
+FORMAT_VERSION = 1
+
+DEFAULT_MAX_SHARD_BYTES = 2 * 1024 * 1024 * 1024
+
+SAFETENSORS_DTYPES = {
+    "F64": torch.float64,
+    "F32": torch.float32,
+    "F16": torch.float16,
+    "BF16": torch.bfloat16,
+    "F8_E4M3": torch.float8_e4m3fn,
+    "F8_E5M2": torch.float8_e5m2,
+    "I64": torch.int64,
+    "I32": torch.int32,
+    "I16": torch.int16,
+    "I8": torch.int8,
+    "U8": torch.uint8,
+    "BOOL": torch.bool,
+}
+
+
+def __encode(data, path: str, tensors: dict[str, torch.Tensor]):
+    if isinstance(data, torch.Tensor):
+        key = path
+        while key in tensors:
+            key += "_"
+        tensors[key] = data
+        return {"__tensor__": key}
+    elif isinstance(data, tuple):
+        return {"__tuple__": [__encode(value, f"{path}.{i}", tensors) for i, value in enumerate(data)]}
+    elif isinstance(data, list):
+        return [__encode(value, f"{path}.{i}", tensors) for i, value in enumerate(data)]
+    elif isinstance(data, dict):
+        if all(isinstance(key, str) and not key.startswith("__") for key in data):
+            return {key: __encode(value, f"{path}.{key}", tensors) for key, value in data.items()}
+        return {"__items__": [
+            [__encode(key, path, {}), __encode(value, f"{path}.{key}", tensors)] for key, value in data.items()
+        ]}
+    elif data is None or isinstance(data, bool | int | float | str):
+        return data
+    else:
+        raise TypeError(f"can't save values of type {type(data).__name__} in a state dict")
+
+
+def __decode(data, tensors: dict[str, torch.Tensor]):
+    if isinstance(data, dict):
+        if "__tensor__" in data:
+            return tensors[data["__tensor__"]]
+        if "__tuple__" in data:
+            return tuple(__decode(value, tensors) for value in data["__tuple__"])
+        if "__items__" in data:
+            return {__decode(key, tensors): __decode(value, tensors) for key, value in data["__items__"]}
+        return {key: __decode(value, tensors) for key, value in data.items()}
+    elif isinstance(data, list):
+        return [__decode(value, tensors) for value in data]
+    return data
+
+
+def __shard_tensors(tensors: dict[str, torch.Tensor], max_shard_bytes: int) -> list[list[str]]:
+    shards = [[]]
+    shard_bytes = 0
+    for key, tensor in tensors.items():
+        tensor_bytes = tensor.numel() * tensor.element_size()
+        if len(shards[-1]) > 0 and shard_bytes + tensor_bytes > max_shard_bytes:
+            shards.append([])
+            shard_bytes = 0
+        shards[-1].append(key)
+        shard_bytes += tensor_bytes
+    return shards
+
+
+def save_state_dict(
+        state_dict: dict,
+        directory: str,
+        name: str,
+        max_shard_bytes: int = DEFAULT_MAX_SHARD_BYTES,
+):
+    """
+    Saves a state dict as {name}.json and {name}-00001-of-0000n.safetensors in the directory. Only one shard is
+    copied to the CPU at a time. If the state dict contains values that can't be represented, it is saved as {name}.pt
+    instead.
+    """
+    tensors = {}
+    try:
+        structure = __encode(state_dict, name, tensors)
+    except TypeError:
+        torch.save(state_dict, os.path.join(directory, f"{name}.pt"))
+        return
+
+    shards = __shard_tensors(tensors, max_shard_bytes)
+    shard_names = [f"{name}-{i + 1:05d}-of-{len(shards):05d}.safetensors" for i in range(len(shards))]
+    for shard_name, shard_keys in zip(shard_names, shards, strict=True):
+        shard_tensors = {}
+        data_ptrs = set()
+        for key in shard_keys:
+            tensor = tensors[key].detach().to(device="cpu").contiguous()
+            # safetensors does not support tensors that share memory
+            if tensor.numel() > 0 and tensor.data_ptr() in data_ptrs:
+                tensor = tensor.clone()
+            data_ptrs.add(tensor.data_ptr())
+            shard_tensors[key] = tensor
+        save_file(shard_tensors, os.path.join(directory, shard_name))
+        del shard_tensors
+
+    with open(os.path.join(directory, f"{name}.json"), "w") as json_file:
+        json.dump({
+            "format_version": FORMAT_VERSION,
+            "shards": shard_names,
+            "state_dict": structure,
+        }, json_file)
+
+
+def __load_shard(path: str) -> dict[str, torch.Tensor]:
+    # every tensor is a view into a private memory map of the file. pages are only read when they are used, and
+    # in-place changes are not written back to the file
+    with open(path, "rb") as shard_file:
+        header_size = struct.unpack("<Q", shard_file.read(8))[0]
+        header = json.loads(shard_file.read(header_size))
+        if os.fstat(shard_file.fileno()).st_size == 8 + header_size:
+            buffer = None
+        else:
+            buffer = mmap.mmap(shard_file.fileno(), 0, access=mmap.ACCESS_COPY)
+
+    tensors = {}
+    for key, info in header.items():
+        if key == "__metadata__":
+            continue
+        dtype = SAFETENSORS_DTYPES[info["dtype"]]
+        start, end = info["data_offsets"]
+        if start == end:
+            tensors[key] = torch.empty(info["shape"], dtype=dtype)
+        else:
+            tensors[key] = torch.frombuffer(
+                buffer, dtype=dtype, count=(end - start) // dtype.itemsize, offset=8 + header_size + start
+            ).view(info["shape"])
+    return tensors
+
+
+def load_state_dict(directory: str, name: str) -> dict:
+    """
+    Loads a state dict saved by save_state_dict. Tensors are memory-mapped, they are read when they are moved to
+    their device. Falls back to {name}.pt for older backups. Raises FileNotFoundError if neither exists.
+    """
+    json_path = os.path.join(directory, f"{name}.json")
+    if not os.path.exists(json_path):
+        return torch.load(os.path.join(directory, f"{name}.pt"), weights_only=True)
+
+    with open(json_path, "r") as json_file:
+        saved = json.load(json_file)
+
+    tensors = {}
+    for shard_name in saved["shards"]:
+        tensors.update(__load_shard(os.path.join(directory, shard_name)))
+
+    return __decode(saved["state_dict"], tensors)
+
+
+def copy_state_dict(data):
+    """
+    Returns a copy of a state dict returned by load_state_dict, with every tensor copied out of its memory map. Needed
+    if the tensors are used on the CPU, where moving them to their device doesn't copy them. Otherwise, the files stay
+    mapped as long as the state is alive, and can't be deleted on Windows.
+    """
+    if isinstance(data, torch.Tensor):
+        return data.clone()
+    if isinstance(data, list | tuple):
+        return type(data)(copy_state_dict(value) for value in data)
+    if isinstance(data, dict):
+        return {key: copy_state_dict(value) for key, value in data.items()}
+    return data
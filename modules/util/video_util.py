@@ -0,0 +1,335 @@
+import concurrent.futures
+import math
+import multiprocessing
+import os
+import random
+import subprocess
+import traceback
+from collections.abc import Callable
+
+import cv2
+import numpy as np
+import scenedetect
+
+# number of frames blended to detect black borders of a clip
+BORDER_DETECTION_FRAMES = 6
+
+
+def timestamp_to_frame(timestamp: str, fps: float) -> int:
+    return int(sum(int(x) * 60 ** i for i, x in enumerate(reversed(timestamp.split(':')))) * fps)
+
+
+def read_fps(video: cv2.VideoCapture, video_path: str) -> float:
+    fps = video.get(cv2.CAP_PROP_FPS) or 0.0
+    if fps <= 0:
+        print(f'Warning: Could not read FPS for "{os.path.basename(video_path)}". Falling back to 30 FPS.')  # fallback to some sane FPS value
+        fps = 30.0
+    return fps
+
+
+def find_main_contour(frame: np.ndarray) -> tuple[int, int, int, int]:
+    frame_grayscale = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    _, frame_thresh = cv2.threshold(frame_grayscale, 15, 255, cv2.THRESH_BINARY)
+    frame_contours, _ = cv2.findContours(frame_thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if frame_contours:
+        frame_maincontour = max(frame_contours, key=cv2.contourArea)
+        x1, y1, w1, h1 = cv2.boundingRect(frame_maincontour)
+    else:   #fallback if no contours detected
+        x1 = 0
+        y1 = 0
+        h1, w1, _ = frame.shape
+    if not frame_contours or h1 < 10 or w1 < 10:  #if bounding box did not detect the correct area, likely due to black frame
+        x1 = 0
+        y1 = 0
+        h1, w1, _ = frame.shape
+    return x1, y1, w1, h1
+
+
+def get_random_aspect(height: int, width: int, variation: float) -> tuple[int, int, int, int]:
+    if variation == 0:
+        return 0, height, 0, width
+
+    old_aspect = height/width
+    variation_scaled = old_aspect*variation
+    if old_aspect > 1.2:
+        new_aspect = min(4.0, max(1.0, random.triangular(old_aspect-(variation_scaled*1.5), old_aspect+(variation_scaled/2), old_aspect)))
+    elif old_aspect < 0.85:
+        new_aspect = max(0.25, min(1.0, random.triangular(old_aspect-(variation_scaled/2), old_aspect+(variation_scaled*1.5), old_aspect)))
+    else:
+        new_aspect = random.triangular(old_aspect-variation_scaled, old_aspect+variation_scaled)
+
+    new_aspect = round(new_aspect, 2)
+    if new_aspect > old_aspect:
+        new_height = int(height)
+        new_width = int(width*(old_aspect/new_aspect))
+    elif new_aspect < old_aspect:
+        new_height = int(height*(new_aspect/old_aspect))
+        new_width = int(width)
+    else:
+        new_height = int(height)
+        new_width = int(width)
+
+    position_x = random.randint(0, width-new_width)
+    position_y = random.randint(0, height-new_height)
+    return position_y, new_height, position_x, new_width
+
+
+def split_scenes(scene_list: list[tuple[int, int]], max_length_frames: int, min_length_frames: int) -> list[tuple[int, int]]:
+    scene_list_split = []
+    for scene in scene_list:
+        length = scene[1]-scene[0]
+        if length > max_length_frames:  #check for any scenes longer than max length
+            n = math.ceil(length/max_length_frames) #divide into n new scenes
+            new_length = int(length/n)
+            new_splits = range(scene[0], scene[1]+min_length_frames, new_length)   #divide clip into closest chunks to max_length
+            for i, _n in enumerate(new_splits[:-1]):
+                if new_splits[i+1] - new_splits[i] > min_length_frames:
+                    scene_list_split += [(new_splits[i], new_splits[i+1])]
+        else:
+            if length > (min_length_frames+2):
+                scene_list_split += [(scene[0]+1, scene[1]-1)]      #trim first and last frame from detected scenes to avoid transition artifacts
+    return scene_list_split
+
+
+class FfmpegVideoWriter:
+    """
+    Encodes raw BGR frames with an ffmpeg subprocess. Used instead of cv2.VideoWriter if the frame rate is changed,
+    so the fps filter is applied in the same encode pass.
+    """
+
+    def __init__(self, path: str, fps: float, target_fps: int, size: tuple[int, int]):
+        self.path = path
+        width, height = size
+        self.process = subprocess.Popen([
+            "ffmpeg", "-y", "-loglevel", "error",
+            "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{width}x{height}", "-r", str(fps),
+            "-i", "-",
+            # yuv420p is the most compatible pixel format, but needs even dimensions
+            "-filter:v", f"fps={target_fps},crop=trunc(iw/2)*2:trunc(ih/2)*2",
+            "-pix_fmt", "yuv420p",
+            "-an",
+            path,
+        ], stdin=subprocess.PIPE, stdout=subprocess.DEVNULL)
+
+    def write(self, frame: np.ndarray):
+        self.process.stdin.write(frame.tobytes())
+
+    def release(self):
+        self.process.stdin.close()
+        if self.process.wait() != 0:
+            print(f"ffmpeg failed to encode {self.path}")
+
+
+def __open_clip_writer(output_name: str, fps: float, target_fps: int, size: tuple[int, int]):
+    if target_fps > 0 and int(round(fps)) != target_fps:
+        try:
+            return FfmpegVideoWriter(f'{output_name}_{target_fps}fps.mp4', fps, target_fps, size)
+        except FileNotFoundError:
+            print("ffmpeg not found, saving the clip without changing the frame rate")
+    return cv2.VideoWriter(f'{output_name}.mp4', cv2.VideoWriter_fourcc(*'mp4v'), fps, size)
+
+
+def __skip_to(video: cv2.VideoCapture, frame_number: int, target_frame_number: int) -> int:
+    # seeking decodes from the previous key frame anyway. Grabbing without retrieving skips the color conversion
+    while frame_number < target_frame_number and video.grab():
+        frame_number += 1
+    return frame_number
+
+
+def __write_clips(video: cv2.VideoCapture, video_path: str, fps: float, scene_list: list[tuple[int, int]],
+                  target_fps: int, remove_borders: bool, crop_variation: float, output_dir: str) -> int:
+    basename, _ = os.path.splitext(os.path.basename(video_path))
+    clip_count = 0
+
+    scene_list = sorted(scene_list)
+    video.set(cv2.CAP_PROP_POS_FRAMES, scene_list[0][0])
+    frame_number = int(video.get(cv2.CAP_PROP_POS_FRAMES))
+
+    for scene in scene_list:
+        frame_number = __skip_to(video, frame_number, scene[0])
+
+        #the start of the scene is buffered to find the borders before the first frame is written.
+        #blends frames spread over up to half a second, because a single frame may be all black or otherwise detect incorrect borders
+        buffer_length = min(scene[1] - scene[0], max(int(fps / 2), BORDER_DETECTION_FRAMES)) if remove_borders else 1
+        frames = []
+        while frame_number < scene[1] and len(frames) < buffer_length:
+            success, frame = video.read()
+            if not success or frame is None:
+                break
+            frames.append(frame)
+            frame_number += 1
+
+        if len(frames) == 0:
+            print(f'Failed to read frame from "{os.path.basename(video_path)}" at {frame_number}. Skipping clip.')
+            break
+
+        if remove_borders:
+            sample_step = max(len(frames) // BORDER_DETECTION_FRAMES, 1)
+            frame_blend = frames[0]
+            for i, frame in enumerate(frames[sample_step::sample_step][:BORDER_DETECTION_FRAMES - 1]):
+                a = 1/(i+2)
+                frame_blend = cv2.addWeighted(frame, a, frame_blend, 1-a, 0)
+            x1, y1, w1, h1 = find_main_contour(frame_blend)
+        else:
+            x1 = 0
+            y1 = 0
+            h1, w1, _ = frames[0].shape
+
+        y2, h2, x2, w2 = get_random_aspect(h1, w1, crop_variation)
+        border_crop = (slice(y1, y1+h1), slice(x1, x1+w1))   # cut out black borders if applicable
+        aspect_crop = (slice(y2, y2+h2), slice(x2, x2+w2))   # random crop variation if applicable
+        writer = __open_clip_writer(f'{output_dir}{os.sep}{basename}_{scene[0]}-{scene[1]}', fps, target_fps, (w2, h2))
+
+        for frame in frames:
+            writer.write(frame[border_crop][aspect_crop])
+        frames = None
+
+        while frame_number < scene[1]:    # loop through frames within each scene
+            success, frame = video.read()
+            if not success or frame is None:
+                break
+            writer.write(frame[border_crop][aspect_crop])
+            frame_number += 1
+
+        writer.release()
+        clip_count += 1
+
+    return clip_count
+
+
+def extract_clips(video_path: str, timestamp_min: str, timestamp_max: str, max_length: float, split_at_cuts: bool,
+                  remove_borders: bool, crop_variation: float, target_fps: int, output_dir: str) -> int:
+    """
+    Splits a video into clips of at most max_length seconds, optionally at scene cuts. All clips are written during a
+    single forward pass through the video. If target_fps is set, the frame rate is changed while encoding.
+    Returns the number of clips.
+    """
+    video = cv2.VideoCapture(video_path)
+    try:
+        fps = read_fps(video, video_path)
+        max_length_frames = int(max_length * fps)   #convert max length from seconds to frames
+        min_length_frames = max(int(0.25*fps), 1)   #minimum clip length of 1/4 second or 1 frame
+        total_frames = int(video.get(cv2.CAP_PROP_FRAME_COUNT)) or 0
+        timestamp_max_frame = min(timestamp_to_frame(timestamp_max, fps), max(total_frames - 1, 0))
+        timestamp_min_frame = min(timestamp_to_frame(timestamp_min, fps), timestamp_max_frame)
+
+        if split_at_cuts:
+            #use scenedetect to find cuts, based on start/end frame number
+            timecode_list = scenedetect.detect(
+                str(video_path),
+                scenedetect.AdaptiveDetector(),
+                start_time=int(timestamp_min_frame),
+                end_time=int(timestamp_max_frame))
+            scene_list = [(x[0].get_frames(), x[1].get_frames()) for x in timecode_list]
+            if len(scene_list) == 0:
+                scene_list = [(timestamp_min_frame, timestamp_max_frame)]    # use start/end frames if no scenes detected
+        else:
+            scene_list = [(timestamp_min_frame, timestamp_max_frame)]  # default if not using cuts, start and end of time range
+
+        scene_list_split = split_scenes(scene_list, max_length_frames, min_length_frames)
+
+        print(f'Video "{os.path.basename(video_path)}" being split into {len(scene_list_split)} clips in {output_dir}...')
+        if len(scene_list_split) == 0:
+            return 0
+
+        os.makedirs(output_dir, exist_ok=True)
+        return __write_clips(video, video_path, fps, scene_list_split, target_fps, remove_borders, crop_variation, output_dir)
+    finally:
+        video.release()
+
+
+def extract_frames(video_path: str, timestamp_min: str, timestamp_max: str, capture_rate: float,
+                   blur_threshold: float, remove_borders: bool, crop_variation: float, output_dir: str) -> int:
+    """
+    Saves capture_rate images per second of a video, then deletes the blurriest blur_threshold portion of them.
+    All images are captured during a single forward pass through the video. Returns the number of images.
+    """
+    video = cv2.VideoCapture(video_path)
+    try:
+        fps = read_fps(video, video_path)
+        image_rate = max(int(fps / capture_rate), 1)   # frames between captures (min 1)
+        total_frames = int(video.get(cv2.CAP_PROP_FRAME_COUNT)) or 0
+        timestamp_max_frame = min(timestamp_to_frame(timestamp_max, fps), max(total_frames - 1, 0))
+        timestamp_min_frame = min(timestamp_to_frame(timestamp_min, fps), timestamp_max_frame)
+        frame_range = range(timestamp_min_frame, timestamp_max_frame, image_rate)
+        frame_list = set()
+
+        for n in frame_range:
+            frame = abs(int(random.triangular(n-(image_rate/2), n+(image_rate/2))))     #random triangular distribution around center
+            frame = max(0, min(frame, max(total_frames - 1, 0)))
+            frame_list.add(frame)
+        frame_list = sorted(frame_list)
+
+        print(f'Video "{os.path.basename(video_path)}" will be split into {len(frame_list)} images in {output_dir}...')
+        if len(frame_list) == 0:
+            return 0
+
+        basename, _ = os.path.splitext(os.path.basename(video_path))
+        os.makedirs(output_dir, exist_ok=True)
+
+        #images are saved as they are decoded. The blurriest ones are deleted afterwards,
+        #keeping every decoded frame in memory until then would not scale to long videos
+        output_list = []
+        video.set(cv2.CAP_PROP_POS_FRAMES, frame_list[0])
+        frame_number = int(video.get(cv2.CAP_PROP_POS_FRAMES))
+        for f in frame_list:
+            frame_number = __skip_to(video, frame_number, f)
+            success, frame = video.read()
+            if not success or frame is None:
+                break
+            frame_number += 1
+
+            frame_grayscale = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            frame_sharpness = cv2.Laplacian(frame_grayscale, cv2.CV_64F).var()  #get sharpness of greyscale pic
+
+            #crop out borders of frame
+            if remove_borders:
+                x1, y1, w1, h1 = find_main_contour(frame)
+            else:
+                x1 = 0
+                y1 = 0
+                h1, w1, _ = frame.shape
+            frame_cropped = frame[y1:y1+h1, x1:x1+w1]
+            y2, h2, x2, w2 = get_random_aspect(h1, w1, crop_variation)
+
+            filename = f'{output_dir}{os.sep}{basename}_{f}.jpg'
+            cv2.imwrite(filename, frame_cropped[y2:y2+h2, x2:x2+w2])    #save images
+            output_list.append((filename, frame_sharpness))
+
+        if not output_list:
+            print(f'No frames extracted from {os.path.basename(video_path)} in the selected range.')
+            return 0
+
+        output_list_sorted = sorted(output_list, key=lambda x: x[1])
+        cutoff = int(blur_threshold*len(output_list_sorted))     #calculate cutoff as portion of total frames
+        for filename, _ in output_list_sorted[:cutoff]:
+            os.remove(filename)
+        print(f'{cutoff} blurriest images have been dropped from {os.path.basename(video_path)}')
+
+        return len(output_list_sorted) - cutoff
+    finally:
+        video.release()
+
+
+def _run_job(function: Callable, args: tuple) -> int:  # no __ prefix, it's pickled for the worker processes
+    try:
+        return function(*args)
+    except Exception:
+        traceback.print_exc()
+        return 0
+
+
+def run_in_process_pool(function: Callable, jobs: list[tuple], max_workers: int | None = None) -> list[int]:
+    """
+    Runs function once for every tuple of arguments in jobs, each video in its own process.
+    Returns the result of every job, or 0 if a job failed.
+    """
+    if max_workers is None:
+        max_workers = max(min(len(jobs), (os.cpu_count() or 1) // 2), 1)
+
+    if max_workers == 1:
+        return [_run_job(function, args) for args in jobs]
+
+    # spawn, so the worker processes don't inherit the state of the UI thread
+    with concurrent.futures.ProcessPoolExecutor(max_workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        return list(executor.map(_run_job, [function] * len(jobs), jobs))
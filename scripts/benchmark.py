@@ -0,0 +1,43 @@
+from util.import_util import script_imports
+
+script_imports()
+
+import json
+import sys
+
+from modules.util.args.BenchmarkArgs import BenchmarkArgs
+from modules.util.benchmark.benchmark_suite import find_regressions, run_benchmark_suite
+from modules.util.enum.ModelType import ModelType
+from modules.util.enum.TrainingMethod import TrainingMethod
+
+
+def main():
+    args = BenchmarkArgs.parse_args()
+
+    results = run_benchmark_suite(
+        model_types=[ModelType[x] for x in args.model_types],
+        training_methods=[TrainingMethod[x] for x in args.training_methods],
+        component_benchmarks=args.component_benchmarks,
+        steps=args.steps,
+        batch_size=args.batch_size,
+    )
+
+    with open(args.output_path, "w") as f:
+        json.dump(results, f, indent=4)
+    print(f"Results written to {args.output_path}")
+
+    if args.baseline_path:
+        with open(args.baseline_path, "r") as f:
+            baseline = json.load(f)
+
+        regressions = find_regressions(results, baseline, args.regression_threshold)
+        if regressions:
+            print(f"{len(regressions)} regressions compared to {args.baseline_path}:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print(f"No regressions compared to {args.baseline_path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -15,6 +15,7 @@ from modules.util.callbacks.TrainCallbacks import TrainCallbacks
 from modules.util.commands.TrainCommands import TrainCommands
 from modules.util.config.SecretsConfig import SecretsConfig
 from modules.util.config.TrainConfig import TrainConfig
+from modules.util.MessageChannelServer import MessageChannelServer
 
 
 def write_request(filename,name, *params):
@@ -30,6 +31,16 @@ def write_request(filename,name, *params):
         traceback.print_exc()
         raise
 
+def create_callbacks(send_callback) -> TrainCallbacks:
+    return TrainCallbacks(
+        on_update_train_progress=lambda *fargs:send_callback("on_update_train_progress",*fargs),
+        on_update_status=lambda *fargs:send_callback("on_update_status",*fargs),
+        on_sample_default=lambda *fargs:send_callback("on_sample_default",*fargs),
+        on_update_sample_default_progress=lambda *fargs:send_callback("on_update_sample_default_progress",*fargs),
+        on_sample_custom=lambda *fargs:send_callback("on_sample_custom",*fargs),
+        on_update_sample_custom_progress=lambda *fargs:send_callback("on_update_sample_custom_progress",*fargs),
+    )
+
 def close_pipe(filename):
     with open(filename, 'wb'): #send EOF by closing
         os.remove(filename)
@@ -51,18 +62,17 @@ def command_thread_function(commands: TrainCommands,filename : str,stop_event):
 
 def main():
     args = TrainArgs.parse_args()
-    if args.callback_path:
-        callbacks = TrainCallbacks(
-            on_update_train_progress=lambda *fargs:write_request(args.callback_path,"on_update_train_progress",*fargs),
-            on_update_status=lambda *fargs:write_request(args.callback_path,"on_update_status",*fargs),
-            on_sample_default=lambda *fargs:write_request(args.callback_path,"on_sample_default",*fargs),
-            on_update_sample_default_progress=lambda *fargs:write_request(args.callback_path,"on_update_sample_default_progress",*fargs),
-            on_sample_custom=lambda *fargs:write_request(args.callback_path,"on_sample_custom",*fargs),
-            on_update_sample_custom_progress=lambda *fargs:write_request(args.callback_path,"on_update_sample_custom_progress",*fargs),
-        )
+    commands = TrainCommands()
+    channel_server = None
+    if args.channel_port_path:
+        #callbacks and commands are streamed through a message channel:
+        channel_server = MessageChannelServer(args.channel_port_path, commands)
+        channel_server.start()
+        callbacks = create_callbacks(channel_server.send_callback)
+    elif args.callback_path:
+        callbacks = create_callbacks(lambda name,*fargs:write_request(args.callback_path,name,*fargs))
     else:
         callbacks = TrainCallbacks()
-    commands = TrainCommands()
 
     train_config = TrainConfig.default_values()
     with open(args.config_path, "r") as f:
@@ -94,7 +104,13 @@ def main():
             close_pipe(args.command_path)
             command_thread.join()
 
-        trainer.end()
+        try:
+            trainer.end()
+        finally:
+            if channel_server is not None and not channel_server.close() and args.callback_path:
+                #callbacks that were not delivered mean the client is detached. Signal this to the
+                #detached actions the same way as the callback file that is never read:
+                open(args.callback_path, 'ab').close()
 
 
 